@@ -423,6 +423,11 @@ export default class PyHandler {
         if (Object.prototype.hasOwnProperty.call(jsondata, 'sleep-secs')) {
           args.push('--sleep-secs', jsondata['sleep-secs']);
         }
+        if (Object.prototype.hasOwnProperty.call(jsondata, 'sqlite-wal')) {
+          if (jsondata['sqlite-wal'] === true) {
+            args.push('--sqlite-wal');
+          }
+        }
       } catch (e) {
         // do nothing, act as if there is no config given
         // TODO: Perhaps in the future warn the user inside
@@ -4,9 +4,16 @@ from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union, cast
 
 import gevent
 
+from rotkehlchen.accounting.checkpoints import (
+    PNL_CHECKPOINTS_TO_KEEP,
+    PnlCheckpointPoint,
+    find_pnl_checkpoint_points,
+    pnl_settings_hash,
+)
 from rotkehlchen.accounting.events import TaxableEvents
 from rotkehlchen.accounting.ledger_actions import LedgerAction
 from rotkehlchen.accounting.structures import ActionType, DefiEvent
+from rotkehlchen.assets.asset import Asset
 from rotkehlchen.assets.unknown_asset import UnknownEthereumToken
 from rotkehlchen.chain.ethereum.trades import AMMTrade
 from rotkehlchen.constants.assets import A_BTC, A_ETH
@@ -14,6 +21,7 @@ from rotkehlchen.constants.misc import ZERO
 from rotkehlchen.csv_exporter import CSVExporter
 from rotkehlchen.db.settings import DBSettings
 from rotkehlchen.errors import (
+    DeserializationError,
     NoPriceForGivenTimestamp,
     PriceQueryUnsupportedAsset,
     RemoteError,
@@ -40,6 +48,7 @@ from rotkehlchen.utils.accounting import (
     action_get_timestamp,
     action_get_type,
 )
+from rotkehlchen.utils.serialization import jsonloads_dict, rlk_jsondumps
 
 if TYPE_CHECKING:
     from rotkehlchen.db.dbhandler import DBHandler
@@ -116,6 +125,8 @@ class Accountant():
         if settings.account_for_assets_movements is not None:
             self.events.account_for_assets_movements = settings.account_for_assets_movements
 
+        self.events.fixed_point_cost_basis = settings.fixed_point_cost_basis
+
     def get_fee_in_profit_currency(self, trade: Trade) -> Fee:
         """Get the profit_currency rate of the fee of the given trade
 
@@ -129,11 +140,7 @@ class Accountant():
         if trade.fee_currency is None or trade.fee is None:
             return Fee(ZERO)
 
-        fee_rate = PriceHistorian().query_historical_price(
-            from_asset=trade.fee_currency,
-            to_asset=self.profit_currency,
-            timestamp=trade.timestamp,
-        )
+        fee_rate = self.events.get_rate_in_profit_currency(trade.fee_currency, trade.timestamp)
         return Fee(fee_rate * trade.fee)
 
     def add_asset_movement_to_events(self, movement: AssetMovement) -> None:
@@ -276,6 +283,193 @@ class Accountant():
                 is_virtual=False,
             )
 
+    def _rates_needed_by_action(
+            self,
+            action: TaxableAction,
+            start_ts: Timestamp,
+            db_settings: DBSettings,
+            ignored_assets: List[Asset],
+            ignored_actionids_mapping: Dict[ActionType, List[str]],
+    ) -> List[Asset]:
+        """Returns the assets whose profit currency rate processing the action will query
+
+        Follows the same skip rules as _process_action and the methods it calls, so that
+        no rate is prefetched that processing will not ask for. Rates that are only
+        queried under conditions that depend on processing state are left out and are
+        queried when processing reaches them.
+        """
+        timestamp = action_get_timestamp(action)
+        if not db_settings.calculate_past_cost_basis and timestamp < start_ts:
+            return []
+
+        try:
+            action_assets = action_get_assets(action)
+        except (UnknownAsset, UnsupportedAsset, UnprocessableTradePair):
+            return []
+
+        if any(isinstance(x, UnknownEthereumToken) for x in action_assets):
+            return []
+        if any(x in ignored_assets for x in action_assets):
+            return []
+
+        action_type = action_get_type(action)
+        should_ignore, _ = self._should_ignore_action(
+            action=action,
+            action_type=action_type,
+            ignored_actionids_mapping=ignored_actionids_mapping,
+        )
+        if should_ignore:
+            return []
+
+        if action_type == 'loan':
+            return [cast(Loan, action).currency]
+        if action_type == 'asset_movement':
+            movement = cast(AssetMovement, action)
+            if (
+                    timestamp < start_ts or movement.asset.identifier == 'KFEE' or
+                    not self.events.account_for_assets_movements
+            ):
+                return []
+            return [movement.fee_asset]
+        if action_type == 'margin_position':
+            return [cast(MarginPosition, action).pl_currency]
+        if action_type == 'ethereum_transaction':
+            if not db_settings.include_gas_costs or timestamp < start_ts:
+                return []
+            return [A_ETH]
+        if action_type == 'defi_event':
+            return []
+        if action_type == 'ledger_action':
+            ledger_action = cast(LedgerAction, action)
+            if ledger_action.rate is None or ledger_action.rate_asset is None:
+                return [ledger_action.asset]
+            return [ledger_action.rate_asset]
+
+        # else it's a trade
+        trade = cast(Trade, action)
+        if trade.rate == ZERO:
+            return []
+
+        assets = []
+        if trade.fee_currency is not None and trade.fee is not None:
+            assets.append(trade.fee_currency)
+        include_crypto2crypto = self.events.include_crypto2crypto
+        base_is_fiat = trade.base_asset.is_fiat()
+        quote_is_fiat = trade.quote_asset.is_fiat()
+        if trade.trade_type == TradeType.BUY:
+            if include_crypto2crypto or base_is_fiat or quote_is_fiat:
+                assets.append(trade.quote_asset)
+            if include_crypto2crypto and not quote_is_fiat:
+                assets.append(trade.base_asset)
+        elif trade.trade_type in (TradeType.SELL, TradeType.SETTLEMENT_SELL):
+            assets.append(trade.quote_asset)
+            if trade.trade_type == TradeType.SELL and include_crypto2crypto and not quote_is_fiat:  # noqa: E501
+                # the virtual buy of the received asset is paid with the sold asset
+                assets.append(trade.base_asset)
+        elif trade.trade_type == TradeType.SETTLEMENT_BUY:
+            assets.append(A_BTC)
+
+        return assets
+
+    def _prefetch_rates(
+            self,
+            actions: List[TaxableAction],
+            start_ts: Timestamp,
+            end_ts: Timestamp,
+            events_limit: int,
+            db_settings: DBSettings,
+            ignored_actionids_mapping: Dict[ActionType, List[str]],
+    ) -> None:
+        """Query in bulk the profit currency rates that processing the actions will need
+
+        Only the actions that processing will actually reach are taken into account
+        """
+        ignored_assets = self.db.get_ignored_assets()
+        entries: List[Tuple[Asset, Timestamp]] = []
+        for idx, action in enumerate(actions):
+            if events_limit != -1 and idx > events_limit:
+                break
+            timestamp = action_get_timestamp(action)
+            if timestamp > end_ts:
+                break
+
+            assets = self._rates_needed_by_action(
+                action=action,
+                start_ts=start_ts,
+                db_settings=db_settings,
+                ignored_assets=ignored_assets,
+                ignored_actionids_mapping=ignored_actionids_mapping,
+            )
+            entries.extend((asset, timestamp) for asset in assets)
+
+        self.events.prefetch_rates_in_profit_currency(entries)
+
+    def _reset(self, start_ts: Timestamp, end_ts: Timestamp) -> None:
+        profit_currency = self.db.get_main_currency()
+        self.events.reset(profit_currency=profit_currency, start_ts=start_ts, end_ts=end_ts)
+        self.last_gas_price = 2000000000
+        self.start_ts = start_ts
+        self.eth_transactions_gas_costs = FVal(0)
+        self.asset_movement_fees = FVal(0)
+        self.csvexporter.reset()
+
+    def _save_checkpoint(
+            self,
+            point: PnlCheckpointPoint,
+            settings_hash: str,
+            count: int,
+            prev_time: Timestamp,
+    ) -> None:
+        """Save the processing state right before the action of the given point"""
+        data = {
+            'events': self.events.serialize_for_checkpoint(),
+            'csv': self.csvexporter.serialize_for_checkpoint(),
+            'last_gas_price': self.last_gas_price,
+            'eth_transactions_gas_costs': str(self.eth_transactions_gas_costs),
+            'asset_movement_fees': str(self.asset_movement_fees),
+            'currently_processing_timestamp': self.currently_processing_timestamp,
+            'count': count,
+            'prev_time': prev_time,
+        }
+        self.db.add_pnl_checkpoint(
+            checkpoint_key=point.key,
+            settings_hash=settings_hash,
+            timestamp=point.timestamp,
+            data=rlk_jsondumps(data),
+        )
+        log.debug(f'Saved PnL checkpoint at {point.timestamp}', action_index=point.action_index)
+
+    def _restore_from_checkpoint(
+            self,
+            point: PnlCheckpointPoint,
+    ) -> Optional[Tuple[int, Timestamp]]:
+        """Restore the processing state saved for the given point
+
+        Returns the processed events count and the previous action timestamp at the
+        checkpoint or None if the checkpoint could not be restored. In that case the
+        processing state may be partially restored and needs to be reset.
+        """
+        raw_data = self.db.get_pnl_checkpoint_data(point.key)
+        if raw_data is None:
+            return None
+
+        try:
+            data = jsonloads_dict(raw_data)
+            self.events.restore_from_checkpoint(data['events'])
+            self.csvexporter.restore_from_checkpoint(data['csv'])
+            self.last_gas_price = int(data['last_gas_price'])
+            self.eth_transactions_gas_costs = FVal(data['eth_transactions_gas_costs'])
+            self.asset_movement_fees = FVal(data['asset_movement_fees'])
+            self.currently_processing_timestamp = Timestamp(data['currently_processing_timestamp'])  # noqa: E501
+            count = int(data['count'])
+            prev_time = Timestamp(data['prev_time'])
+        except (DeserializationError, UnknownAsset, KeyError, ValueError, TypeError) as e:
+            log.error(f'Could not restore PnL checkpoint {point.key}: {str(e)}')
+            return None
+
+        log.debug(f'Resuming PnL report from checkpoint at {point.timestamp}')
+        return count, prev_time
+
     def process_history(
             self,
             start_ts: Timestamp,
@@ -303,13 +497,7 @@ class Accountant():
             active_premium=active_premium,
         )
         events_limit = -1 if active_premium else FREE_PNL_EVENTS_LIMIT
-        profit_currency = self.db.get_main_currency()
-        self.events.reset(profit_currency=profit_currency, start_ts=start_ts, end_ts=end_ts)
-        self.last_gas_price = 2000000000
-        self.start_ts = start_ts
-        self.eth_transactions_gas_costs = FVal(0)
-        self.asset_movement_fees = FVal(0)
-        self.csvexporter.reset()
+        self._reset(start_ts=start_ts, end_ts=end_ts)
 
         # Ask the DB for the settings once at the start of processing so we got the
         # same settings through the entire task
@@ -342,7 +530,62 @@ class Accountant():
         prev_time = Timestamp(0)
         count = 0
         ignored_actionids_mapping = self.db.get_ignored_action_ids(action_type=None)
-        for action in actions:
+        checkpoints_to_write: Dict[int, PnlCheckpointPoint] = {}
+        settings_hash = ''
+        resume_idx = 0
+        if db_settings.pnl_checkpoint_frequency > 0:
+            settings_hash = pnl_settings_hash(
+                db_settings=db_settings,
+                start_ts=start_ts,
+                create_csv=self.csvexporter.create_csv,
+                ignored_assets=self.db.get_ignored_assets(),
+                ignored_actionids_mapping=ignored_actionids_mapping,
+            )
+            points = find_pnl_checkpoint_points(
+                actions=actions,
+                settings_hash=settings_hash,
+                frequency_days=db_settings.pnl_checkpoint_frequency,
+                end_ts=end_ts,
+            )
+            kept_points = points[-PNL_CHECKPOINTS_TO_KEEP:]
+            existing_keys = self.db.get_pnl_checkpoint_keys(settings_hash)
+            for point in reversed(kept_points):
+                if point.key not in existing_keys:
+                    continue
+                restored = self._restore_from_checkpoint(point)
+                if restored is not None:
+                    count, prev_time = restored
+                    resume_idx = point.action_index
+                    break
+
+                existing_keys.discard(point.key)  # unusable so overwrite it
+                self._reset(start_ts=start_ts, end_ts=end_ts)
+                self._customize(db_settings)
+
+            checkpoints_to_write = {
+                x.action_index: x for x in kept_points
+                if x.action_index > resume_idx and x.key not in existing_keys
+            }
+            self.db.delete_pnl_checkpoints(keep_keys=[x.key for x in kept_points])
+
+        self._prefetch_rates(
+            actions=actions[resume_idx:],
+            start_ts=start_ts,
+            end_ts=end_ts,
+            events_limit=-1 if events_limit == -1 else events_limit - count,
+            db_settings=db_settings,
+            ignored_actionids_mapping=ignored_actionids_mapping,
+        )
+        for idx in range(resume_idx, len(actions)):
+            action = actions[idx]
+            if idx in checkpoints_to_write:
+                self._save_checkpoint(
+                    point=checkpoints_to_write[idx],
+                    settings_hash=settings_hash,
+                    count=count,
+                    prev_time=prev_time,
+                )
+
             try:
                 (
                     should_continue,
@@ -422,6 +665,7 @@ class Accountant():
             self.eth_transactions_gas_costs
         )
         total_taxable_pl = self.events.taxable_trade_profit_loss + sum_other_actions
+        price_memo = PriceHistorian().get_price_memo()
         return {
             'overview': {
                 'ledger_actions_profit_loss': str(self.events.ledger_actions_profit_loss),
@@ -442,6 +686,8 @@ class Accountant():
             'first_processed_timestamp': self.first_processed_timestamp,
             'events_processed': count,
             'events_limit': events_limit,
+            'resumed_from_checkpoint': resume_idx != 0,
+            'price_memo': None if price_memo is None else price_memo.serialize(),
             'all_events': self.csvexporter.all_events,
         }
 
@@ -0,0 +1,93 @@
+import hashlib
+from typing import Dict, List, NamedTuple
+
+from rotkehlchen.accounting.structures import ActionType
+from rotkehlchen.assets.asset import Asset
+from rotkehlchen.constants.timing import DAY_IN_SECONDS
+from rotkehlchen.db.settings import DBSettings
+from rotkehlchen.typing import Timestamp
+from rotkehlchen.utils.accounting import TaxableAction, action_get_timestamp
+
+# How many of the most recent checkpoints of a history to keep in the DB
+PNL_CHECKPOINTS_TO_KEEP = 6
+
+# The DB settings that affect the outcome of history processing
+ACCOUNTING_SETTINGS = (
+    'include_crypto2crypto',
+    'taxfree_after_period',
+    'include_gas_costs',
+    'main_currency',
+    'account_for_assets_movements',
+    'calculate_past_cost_basis',
+    'taxable_ledger_actions',
+    'historical_price_oracles',
+    'date_display_format',
+    'display_date_in_localtime',
+)
+
+
+class PnlCheckpointPoint(NamedTuple):
+    """A point in the sorted actions at which the processing state can be saved
+
+    The state saved for a point is the state right before processing the action
+    at `action_index`. The key identifies the settings and all the actions before it.
+    """
+    timestamp: Timestamp
+    action_index: int
+    key: str
+
+
+def pnl_settings_hash(
+        db_settings: DBSettings,
+        start_ts: Timestamp,
+        create_csv: bool,
+        ignored_assets: List[Asset],
+        ignored_actionids_mapping: Dict[ActionType, List[str]],
+) -> str:
+    """Hash everything other than the actions themselves that affects processing"""
+    hasher = hashlib.sha256()
+    for name in ACCOUNTING_SETTINGS:
+        hasher.update(f'{name}:{repr(getattr(db_settings, name))};'.encode())
+    hasher.update(f'start_ts:{start_ts};create_csv:{create_csv};'.encode())
+    hasher.update(f'ignored_assets:{sorted(x.identifier for x in ignored_assets)};'.encode())
+    for action_type in sorted(ignored_actionids_mapping, key=lambda x: x.value):
+        ids = sorted(ignored_actionids_mapping[action_type])
+        hasher.update(f'ignored_{action_type.value}:{ids};'.encode())
+    return hasher.hexdigest()
+
+
+def find_pnl_checkpoint_points(
+        actions: List[TaxableAction],
+        settings_hash: str,
+        frequency_days: int,
+        end_ts: Timestamp,
+) -> List[PnlCheckpointPoint]:
+    """Find the points at which to checkpoint the processing of the sorted actions
+
+    A point is placed at the first action of each period of `frequency_days` days.
+    Its key is a running hash of the settings hash and of all preceding actions so
+    that editing, adding or removing any earlier action invalidates the checkpoint.
+    """
+    period = frequency_days * DAY_IN_SECONDS
+    hasher = hashlib.sha256(settings_hash.encode())
+    points = []
+    next_boundary = None
+    for idx, action in enumerate(actions):
+        timestamp = action_get_timestamp(action)
+        if timestamp > end_ts:
+            break
+
+        if next_boundary is None:
+            next_boundary = timestamp - timestamp % period + period
+        elif timestamp >= next_boundary:
+            boundary = Timestamp(timestamp - timestamp % period)
+            points.append(PnlCheckpointPoint(
+                timestamp=boundary,
+                action_index=idx,
+                key=hasher.hexdigest(),
+            ))
+            next_boundary = boundary + period
+
+        hasher.update(repr(action).encode())
+
+    return points
@@ -8,6 +8,7 @@ from rotkehlchen.constants.misc import ZERO
 from rotkehlchen.csv_exporter import CSVExporter
 from rotkehlchen.fval import FVal
 from rotkehlchen.logging import RotkehlchenLogsAdapter
+from rotkehlchen.serialization.deserialize import deserialize_location
 from rotkehlchen.typing import Location, Timestamp
 from rotkehlchen.user_messages import MessagesAggregator
 from rotkehlchen.utils.misc import ts_now
@@ -47,6 +48,29 @@ class AssetAcquisitionEvent:
             'fee_rate': str(self.fee_rate),
         }
 
+    def serialize_for_checkpoint(self) -> Dict[str, Any]:
+        result = self.serialize()
+        result['remaining_amount'] = str(self.remaining_amount)
+        return result
+
+    @classmethod
+    def deserialize_from_checkpoint(cls, data: Dict[str, Any]) -> 'AssetAcquisitionEvent':
+        """May raise:
+        - DeserializationError
+        - KeyError
+        - ValueError
+        """
+        event = cls(
+            timestamp=Timestamp(data['time']),
+            location=deserialize_location(data['location']),
+            description=data['description'],
+            amount=FVal(data['amount']),
+            rate=FVal(data['rate']),
+            fee_rate=FVal(data['fee_rate']),
+        )
+        event.remaining_amount = FVal(data['remaining_amount'])
+        return event
+
     @property
     def acquisition_cost(self) -> FVal:
         """The acquisition cost of this event is:
@@ -71,6 +95,32 @@ class AssetSpendEvent:
             f'gain_in_profit_currency: {self.gain} '
         )
 
+    def serialize_for_checkpoint(self) -> Dict[str, Any]:
+        return {
+            'time': self.timestamp,
+            'location': str(self.location),
+            'amount': str(self.amount),
+            'rate': str(self.rate),
+            'fee_rate': str(self.fee_rate),
+            'gain': str(self.gain),
+        }
+
+    @classmethod
+    def deserialize_from_checkpoint(cls, data: Dict[str, Any]) -> 'AssetSpendEvent':
+        """May raise:
+        - DeserializationError
+        - KeyError
+        - ValueError
+        """
+        return cls(
+            timestamp=Timestamp(data['time']),
+            location=deserialize_location(data['location']),
+            amount=FVal(data['amount']),
+            rate=FVal(data['rate']),
+            fee_rate=FVal(data['fee_rate']),
+            gain=FVal(data['gain']),
+        )
+
 
 @dataclass(init=True, repr=True, eq=True, order=False, unsafe_hash=False, frozen=False)
 class CostBasisEvents:
@@ -84,6 +134,9 @@ class CostBasisEvents:
         self.acquisitions = []
         self.spends = []
 
+    def add_acquisition(self, event: AssetAcquisitionEvent) -> None:
+        self.acquisitions.append(event)
+
 
 class MatchedAcquisition(NamedTuple):
     amount: FVal
@@ -251,7 +304,7 @@ class CostBasisCalculator():
             rate=rate,
             fee_rate=fee_in_profit_currency / amount,
         )
-        self.events[asset].acquisitions.append(event)
+        self.events[asset].add_acquisition(event)
         logger.debug(event)
 
     def spend_asset(
@@ -437,6 +490,42 @@ class CostBasisCalculator():
 
         return self.details
 
+    def serialize_for_checkpoint(self) -> Dict[str, Any]:
+        """Serialize the acquisitions and spends of all assets for a PnL checkpoint"""
+        return {
+            asset.identifier: {
+                'acquisitions': [x.serialize_for_checkpoint() for x in events.acquisitions],
+                'used_acquisitions': [
+                    x.serialize_for_checkpoint() for x in events.used_acquisitions
+                ],
+                'spends': [x.serialize_for_checkpoint() for x in events.spends],
+            } for asset, events in self.events.items()
+        }
+
+    def restore_from_checkpoint(self, data: Dict[str, Any]) -> None:
+        """Restore the acquisitions and spends of all assets from a PnL checkpoint
+
+        May raise:
+        - DeserializationError
+        - UnknownAsset
+        - KeyError
+        - ValueError
+        """
+        self.reset(self.profit_currency)
+        for identifier, entry in data.items():
+            events = self.events[Asset(identifier)]
+            events.acquisitions = [
+                AssetAcquisitionEvent.deserialize_from_checkpoint(x)
+                for x in entry['acquisitions']
+            ]
+            events.used_acquisitions = [
+                AssetAcquisitionEvent.deserialize_from_checkpoint(x)
+                for x in entry['used_acquisitions']
+            ]
+            events.spends = [
+                AssetSpendEvent.deserialize_from_checkpoint(x) for x in entry['spends']
+            ]
+
     def get_calculated_asset_amount(self, asset: Asset) -> Optional[FVal]:
         """Get the amount of asset accounting has calculated we should have after
         the history has been processed
@@ -1,7 +1,8 @@
 import logging
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from rotkehlchen.accounting.cost_basis import CostBasisCalculator
+from rotkehlchen.accounting.fixed_point_cost_basis import FixedPointCostBasisCalculator
 from rotkehlchen.accounting.ledger_actions import LedgerAction, LedgerActionType
 from rotkehlchen.accounting.structures import DefiEvent
 from rotkehlchen.assets.asset import Asset
@@ -11,15 +12,30 @@ from rotkehlchen.csv_exporter import CSVExporter
 from rotkehlchen.errors import NoPriceForGivenTimestamp, PriceQueryUnsupportedAsset
 from rotkehlchen.exchanges.data_structures import MarginPosition
 from rotkehlchen.fval import FVal
-from rotkehlchen.history.price import PriceHistorian, get_balance_asset_rate_at_time_zero_if_error
+from rotkehlchen.history.price import (
+    HistoricalPriceQuery,
+    PriceHistorian,
+    get_balance_asset_rate_at_time_zero_if_error,
+)
 from rotkehlchen.logging import RotkehlchenLogsAdapter
-from rotkehlchen.typing import Fee, Location, Timestamp
+from rotkehlchen.typing import Fee, Location, Price, Timestamp
 from rotkehlchen.user_messages import MessagesAggregator
 from rotkehlchen.utils.misc import taxable_gain_for_sell, timestamp_to_date
 
 logger = logging.getLogger(__name__)
 log = RotkehlchenLogsAdapter(logger)
 
+# The profit/loss totals that are accumulated while processing the history
+TAXABLE_EVENTS_TOTALS = (
+    'general_trade_profit_loss',
+    'taxable_trade_profit_loss',
+    'loan_profit',
+    'defi_profit_loss',
+    'settlement_losses',
+    'margin_positions_profit_loss',
+    'ledger_actions_profit_loss',
+)
+
 
 class TaxableEvents():
 
@@ -40,6 +56,10 @@ class TaxableEvents():
         # loan/margin settlement then profit/loss is also calculated before the entire
         # amount is taken as a loss
         self.count_profit_for_settlements = False
+        # Rates in profit currency queried in bulk before processing starts and the
+        # errors of those for which no rate was found
+        self.prefetched_rates: Dict[Tuple[Asset, Timestamp], Price] = {}
+        self.prefetch_errors: Dict[Tuple[Asset, Timestamp], Exception] = {}
 
     def reset(self, profit_currency: Asset, start_ts: Timestamp, end_ts: Timestamp) -> None:
         self.cost_basis.reset(profit_currency)
@@ -53,6 +73,28 @@ class TaxableEvents():
         self.margin_positions_profit_loss = ZERO
         self.defi_profit_loss = ZERO
         self.ledger_actions_profit_loss = ZERO
+        self.prefetched_rates = {}
+        self.prefetch_errors = {}
+
+    def serialize_for_checkpoint(self) -> Dict[str, Any]:
+        """Serialize the cost basis state and the running totals for a PnL checkpoint"""
+        return {
+            'cost_basis': self.cost_basis.serialize_for_checkpoint(),
+            'totals': {x: str(getattr(self, x)) for x in TAXABLE_EVENTS_TOTALS},
+        }
+
+    def restore_from_checkpoint(self, data: Dict[str, Any]) -> None:
+        """Restore the cost basis state and the running totals from a PnL checkpoint
+
+        May raise:
+        - DeserializationError
+        - UnknownAsset
+        - KeyError
+        - ValueError
+        """
+        self.cost_basis.restore_from_checkpoint(data['cost_basis'])
+        for name in TAXABLE_EVENTS_TOTALS:
+            setattr(self, name, FVal(data['totals'][name]))
 
     @property
     def include_crypto2crypto(self) -> Optional[bool]:
@@ -70,6 +112,26 @@ class TaxableEvents():
     def taxfree_after_period(self, value: Optional[int]) -> None:
         self.cost_basis.taxfree_after_period = value
 
+    @property
+    def fixed_point_cost_basis(self) -> bool:
+        return isinstance(self.cost_basis, FixedPointCostBasisCalculator)
+
+    @fixed_point_cost_basis.setter
+    def fixed_point_cost_basis(self, value: bool) -> None:
+        """Switch the cost basis engine. The acquisitions so far are not carried over
+        so this should only happen before processing starts."""
+        if value == self.fixed_point_cost_basis:
+            return
+
+        calculator_class = FixedPointCostBasisCalculator if value else CostBasisCalculator
+        cost_basis = calculator_class(
+            self.csv_exporter,
+            self.cost_basis.profit_currency,
+            self.msg_aggregator,
+        )
+        cost_basis.taxfree_after_period = self.cost_basis.taxfree_after_period
+        self.cost_basis = cost_basis
+
     @property
     def account_for_assets_movements(self) -> Optional[bool]:
         return self._account_for_assets_movements
@@ -90,6 +152,10 @@ class TaxableEvents():
         """
         if asset == self.profit_currency:
             rate = FVal(1)
+        elif (asset, timestamp) in self.prefetched_rates:
+            rate = self.prefetched_rates[(asset, timestamp)]
+        elif (asset, timestamp) in self.prefetch_errors:
+            raise self.prefetch_errors[(asset, timestamp)]
         else:
             rate = PriceHistorian().query_historical_price(
                 from_asset=asset,
@@ -98,6 +164,22 @@ class TaxableEvents():
             )
         return rate
 
+    def prefetch_rates_in_profit_currency(self, entries: List[Tuple[Asset, Timestamp]]) -> None:
+        """Query in bulk the profit currency rates of the given (asset, timestamp) entries
+
+        This way the price oracles are queried once per pair instead of once per event.
+        For entries with no rate the error is kept and get_rate_in_profit_currency raises
+        it when processing reaches them, without querying the oracles again.
+        """
+        queries = [
+            (asset, self.profit_currency, timestamp) for asset, timestamp in entries
+            if asset != self.profit_currency
+        ]
+        errors: Dict[HistoricalPriceQuery, Exception] = {}
+        prices = PriceHistorian().query_historical_prices(queries, errors=errors)
+        self.prefetched_rates = {(x[0], x[2]): price for x, price in prices.items()}
+        self.prefetch_errors = {(x[0], x[2]): error for x, error in errors.items()}
+
     def handle_prefork_asset_buys(
             self,
             location: Location,
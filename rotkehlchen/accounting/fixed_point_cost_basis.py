@@ -0,0 +1,403 @@
+"""A cost basis calculator that keeps the acquisition amounts as fixed-point integers
+
+The amounts of the acquisitions of each asset are kept as a prefix sum of integers
+scaled by 10**FIXED_POINT_DECIMALS, next to a head pointer to the first acquisition
+that is not fully consumed. Finding the acquisitions a spend consumes is a bisect over
+the prefix sums. Consumed acquisitions are not deleted from the front of a list on every
+spend, they are dropped in bulk once they are the majority of the list.
+
+Amounts are only turned back into FVals when they are returned. Adding and subtracting
+amounts that fit in the decimal context precision is exact, and the exponent of the
+result is the smallest exponent of the operands. So the value and that exponent give
+exactly the Decimal the FVal arithmetic of CostBasisCalculator would give. Costs still
+use the FVal arithmetic in the same order, so the results are identical. Assets with
+an amount that can't be represented like this fall back to the CostBasisCalculator code.
+"""
+import logging
+from bisect import bisect_right
+from decimal import Decimal
+from typing import List, Optional, Tuple, cast
+
+from rotkehlchen.accounting.cost_basis import (
+    AssetAcquisitionEvent,
+    CostBasisCalculator,
+    CostBasisEvents,
+    CostBasisInfo,
+    MatchedAcquisition,
+)
+from rotkehlchen.assets.asset import Asset
+from rotkehlchen.constants.misc import ZERO
+from rotkehlchen.fval import FVal
+from rotkehlchen.logging import RotkehlchenLogsAdapter
+from rotkehlchen.typing import Timestamp
+
+logger = logging.getLogger(__name__)
+log = RotkehlchenLogsAdapter(logger)
+
+FIXED_POINT_DECIMALS = 18
+# Amounts with more digits than the decimal context precision (28) are not added exactly
+FIXED_POINT_MAX_DIGITS = 28
+FIXED_POINT_MAX = 10 ** FIXED_POINT_MAX_DIGITS
+# Consumed acquisitions are dropped once at least this many and half the list are consumed
+DROP_CONSUMED_MIN = 1024
+
+
+def to_fixed_point(value: FVal) -> Optional[Tuple[int, int]]:
+    """Returns the value scaled by 10**FIXED_POINT_DECIMALS along with its exponent
+
+    Returns None if the value is negative, has too many decimals or is too big
+    """
+    sign, digits, exponent = value.num.as_tuple()
+    if sign == 1 or not isinstance(exponent, int) or exponent < -FIXED_POINT_DECIMALS:
+        return None
+    # Values below 10**(FIXED_POINT_MAX_DIGITS - FIXED_POINT_DECIMALS) make scaleb exact
+    if len(digits) + exponent > FIXED_POINT_MAX_DIGITS - FIXED_POINT_DECIMALS:
+        return None
+    return int(value.num.scaleb(FIXED_POINT_DECIMALS)), exponent
+
+
+def from_fixed_point(value: int, exponent: int) -> FVal:
+    """Turns a fixed-point value back to an FVal with the given exponent"""
+    return FVal(Decimal(value // 10 ** (exponent + FIXED_POINT_DECIMALS)).scaleb(exponent))
+
+
+class FixedPointCostBasisEvents(CostBasisEvents):
+    """Cost basis events of an asset that consume acquisitions by moving a head pointer
+
+    - `all_acquisitions`: All acquisitions. The ones before `head` are fully consumed.
+    - `cumulative_amounts`: The sum of the fixed-point amounts of the acquisitions up to
+    and including each index.
+    - `consumed_amount`: How much of the cumulative amounts has been consumed.
+    - `exponents`: The exponent of the remaining amount of each acquisition.
+    """
+
+    def __init__(self) -> None:  # pylint: disable=super-init-not-called
+        self.used_acquisitions = []
+        self.spends = []
+        self.fixed_point = True
+        self.all_acquisitions: List[AssetAcquisitionEvent] = []
+        self.head = 0
+        self.consumed_amount = 0
+        self.cumulative_amounts: List[int] = []
+        self.exponents: List[int] = []
+
+    @property
+    def acquisitions(self) -> List[AssetAcquisitionEvent]:
+        """The acquisitions that are not fully consumed
+
+        Acquisitions appended to the returned list are picked up by the next operation
+        like the ones added with add_acquisition().
+        """
+        self.drop_consumed()
+        return self.all_acquisitions
+
+    @acquisitions.setter
+    def acquisitions(self, value: List[AssetAcquisitionEvent]) -> None:
+        self.all_acquisitions = value
+        self.head = 0
+        self.consumed_amount = 0
+        self.cumulative_amounts = []
+        self.exponents = []
+
+    def add_acquisition(self, event: AssetAcquisitionEvent) -> None:
+        self.all_acquisitions.append(event)
+
+    def sync(self) -> None:
+        """Add the fixed-point amounts of the acquisitions appended since the last operation"""
+        if not self.fixed_point:
+            return
+
+        cumulative_amounts = self.cumulative_amounts
+        previous = cumulative_amounts[-1] if len(cumulative_amounts) != 0 else 0
+        for event in self.all_acquisitions[len(cumulative_amounts):]:
+            fixed_point_amount = to_fixed_point(event.remaining_amount)
+            if fixed_point_amount is None:
+                self.disable_fixed_point()
+                return
+
+            previous += fixed_point_amount[0]
+            cumulative_amounts.append(previous)
+            self.exponents.append(fixed_point_amount[1])
+
+    def disable_fixed_point(self) -> None:
+        """Keep only the acquisitions list and process it with CostBasisCalculator from now on"""
+        del self.all_acquisitions[:self.head]
+        self.head = 0
+        self.consumed_amount = 0
+        self.cumulative_amounts = []
+        self.exponents = []
+        self.fixed_point = False
+
+    def drop_consumed(self, force: bool = True) -> None:
+        """Delete the fully consumed acquisitions from the front of the list
+
+        Without force this only happens if enough acquisitions are consumed for the
+        deletion to be amortized over the spends that consumed them.
+        """
+        if self.head == 0:
+            return
+        if not force and (
+            self.head < DROP_CONSUMED_MIN or
+            self.head * 2 < len(self.all_acquisitions)
+        ):
+            return
+
+        shift = self.cumulative_amounts[self.head - 1]
+        del self.all_acquisitions[:self.head]
+        del self.exponents[:self.head]
+        self.cumulative_amounts = [x - shift for x in self.cumulative_amounts[self.head:]]
+        self.consumed_amount -= shift
+        self.head = 0
+
+    def fixed_point_amount(self, amount: FVal) -> Optional[Tuple[int, int]]:
+        """Get the fixed-point value and exponent of an amount to consume
+
+        Returns None if the asset is processed by CostBasisCalculator. That is also
+        the case from now on if the given amount can't be represented in fixed-point.
+        """
+        self.sync()
+        if not self.fixed_point:
+            return None
+
+        result = to_fixed_point(amount)
+        if result is None:
+            self.disable_fixed_point()
+        return result
+
+    def stop_index(self, amount: int) -> int:
+        """The index of the first acquisition that consuming amount does not fully use up"""
+        return bisect_right(
+            self.cumulative_amounts,
+            self.consumed_amount + amount,
+            lo=self.head,
+        )
+
+    def consume(self, stop_index: int, amount: int) -> None:
+        """Mark all acquisitions before stop_index and amount out of the one at it as consumed
+
+        The remaining amount of a partially consumed acquisition is to be set by the caller.
+        """
+        if stop_index > self.head:
+            self.consumed_amount = self.cumulative_amounts[stop_index - 1]
+        self.consumed_amount += amount
+        self.head = stop_index
+        self.drop_consumed(force=False)
+
+    def set_remaining_amount(self, index: int, remaining_amount: FVal) -> None:
+        self.all_acquisitions[index].remaining_amount = remaining_amount
+        self.exponents[index] = remaining_amount.num.as_tuple().exponent  # type: ignore
+
+
+class FixedPointCostBasisCalculator(CostBasisCalculator):
+    """A CostBasisCalculator that gives identical results with fixed-point FIFO consumption
+
+    Faster for assets with many acquisitions consumed by few spends, like DCA purchases
+    or staking rewards.
+    """
+
+    def reset(self, profit_currency: Asset) -> None:
+        super().reset(profit_currency)
+        self.events.default_factory = FixedPointCostBasisEvents
+
+    def _get_events(self, asset: Asset) -> FixedPointCostBasisEvents:
+        return cast(FixedPointCostBasisEvents, self.events[asset])
+
+    def reduce_asset_amount(self, asset: Asset, amount: FVal) -> bool:
+        if amount == ZERO:
+            return True
+
+        if asset not in self.events:
+            return False
+
+        events = self._get_events(asset)
+        fixed_point_amount = events.fixed_point_amount(amount)
+        if fixed_point_amount is None:
+            return super().reduce_asset_amount(asset=asset, amount=amount)
+
+        if events.head == len(events.all_acquisitions):
+            return False
+
+        value, remaining_exponent = fixed_point_amount
+        head = events.head
+        stop_index = events.stop_index(value)
+        remaining_amount = value
+        if stop_index != head:
+            remaining_amount -= events.cumulative_amounts[stop_index - 1] - events.consumed_amount
+            remaining_exponent = min(remaining_exponent, min(events.exponents[head:stop_index]))
+
+        if stop_index == len(events.all_acquisitions):
+            events.consume(stop_index=stop_index, amount=0)
+            return remaining_amount == 0
+
+        acquisition_event = events.all_acquisitions[stop_index]
+        events.consume(stop_index=stop_index, amount=remaining_amount)
+        events.set_remaining_amount(
+            index=events.head,
+            remaining_amount=(
+                acquisition_event.remaining_amount -
+                from_fixed_point(remaining_amount, remaining_exponent)
+            ),
+        )
+        return True
+
+    def calculate_spend_cost_basis(
+            self,
+            spending_amount: FVal,
+            spending_asset: Asset,
+            timestamp: Timestamp,
+    ) -> CostBasisInfo:
+        events = self._get_events(spending_asset)
+        fixed_point_amount = events.fixed_point_amount(spending_amount)
+        if fixed_point_amount is None:
+            return super().calculate_spend_cost_basis(
+                spending_amount=spending_amount,
+                spending_asset=spending_asset,
+                timestamp=timestamp,
+            )
+
+        acquisitions = events.all_acquisitions
+        head = events.head
+        if head == len(acquisitions):
+            self.inform_user_missing_acquisition(spending_asset, timestamp)
+            return CostBasisInfo(
+                taxable_amount=spending_amount,
+                taxable_bought_cost=ZERO,
+                taxfree_bought_cost=ZERO,
+                matched_acquisitions=[],
+                is_complete=False,
+            )
+
+        value, remaining_exponent = fixed_point_amount
+        stop_index = events.stop_index(value)
+        debug_logging = logger.isEnabledFor(logging.DEBUG)
+        taxfree_bought_cost = ZERO
+        taxable_bought_cost = ZERO
+        # Fixed-point amounts and exponents of the sums. They start from ZERO, exponent 0
+        taxfree_amount, taxfree_exponent = 0, 0
+        taxable_amount, taxable_exponent = 0, 0
+        matched_acquisitions = []
+        previous_cumulative = events.consumed_amount
+        for idx in range(head, stop_index):
+            acquisition_event = acquisitions[idx]
+            amount = events.cumulative_amounts[idx] - previous_cumulative
+            previous_cumulative = events.cumulative_amounts[idx]
+            exponent = events.exponents[idx]
+            remaining_exponent = min(remaining_exponent, exponent)
+            at_taxfree_period = (
+                self.taxfree_after_period is not None and
+                acquisition_event.timestamp + self.taxfree_after_period < timestamp
+            )
+            if at_taxfree_period:
+                taxfree_amount += amount
+                taxfree_exponent = min(taxfree_exponent, exponent)
+                taxfree_bought_cost += acquisition_event.acquisition_cost
+            else:
+                taxable_amount += amount
+                taxable_exponent = min(taxable_exponent, exponent)
+                taxable_bought_cost += acquisition_event.acquisition_cost
+
+            if debug_logging:
+                log.debug(
+                    'Spend uses up entire historical acquisition',
+                    sensitive_log=True,
+                    tax_status='TAX-FREE' if at_taxfree_period else 'TAXABLE',
+                    bought_amount=acquisition_event.remaining_amount,
+                    asset=spending_asset,
+                    acquisition_rate=acquisition_event.rate,
+                    profit_currency=self.profit_currency,
+                    time=self.csv_exporter.timestamp_to_date(acquisition_event.timestamp),
+                )
+            matched_acquisitions.append(MatchedAcquisition(
+                amount=acquisition_event.remaining_amount,
+                event=acquisition_event,
+            ))
+            # and since this events is going to be removed, reduce its remaining to zero
+            acquisition_event.remaining_amount = ZERO
+
+        remaining_sold_amount = value - (previous_cumulative - events.consumed_amount)
+        events.used_acquisitions.extend(acquisitions[head:stop_index])
+        if stop_index < len(acquisitions):
+            acquisition_event = acquisitions[stop_index]
+            used_amount = from_fixed_point(remaining_sold_amount, remaining_exponent)
+            buying_cost = used_amount.fma(
+                acquisition_event.rate,
+                (acquisition_event.fee_rate * used_amount),
+            )
+            at_taxfree_period = (
+                self.taxfree_after_period is not None and
+                acquisition_event.timestamp + self.taxfree_after_period < timestamp
+            )
+            if at_taxfree_period:
+                taxfree_amount += remaining_sold_amount
+                taxfree_exponent = min(taxfree_exponent, remaining_exponent)
+                taxfree_bought_cost += buying_cost
+            else:
+                taxable_amount += remaining_sold_amount
+                taxable_exponent = min(taxable_exponent, remaining_exponent)
+                taxable_bought_cost += buying_cost
+
+            if debug_logging:
+                log.debug(
+                    'Spend uses up part of historical acquisition',
+                    sensitive_log=True,
+                    tax_status='TAX-FREE' if at_taxfree_period else 'TAXABLE',
+                    used_amount=used_amount,
+                    from_amount=acquisition_event.amount,
+                    asset=spending_asset,
+                    acquisition_rate=acquisition_event.rate,
+                    profit_currency=self.profit_currency,
+                    time=self.csv_exporter.timestamp_to_date(acquisition_event.timestamp),
+                )
+            matched_acquisitions.append(MatchedAcquisition(
+                amount=used_amount,
+                event=acquisition_event,
+            ))
+            events.consume(stop_index=stop_index, amount=remaining_sold_amount)
+            events.set_remaining_amount(
+                index=events.head,
+                remaining_amount=acquisition_event.remaining_amount - used_amount,
+            )
+            remaining_sold_amount = 0
+        else:
+            events.consume(stop_index=stop_index, amount=0)
+
+        is_complete = True
+        taxable_amount_fval = from_fixed_point(taxable_amount, taxable_exponent)
+        if remaining_sold_amount != 0:
+            # if we still have sold amount but no acquisitions to satisfy it then we only
+            # found acquisitions to partially satisfy the sell
+            taxfree_amount_fval = from_fixed_point(taxfree_amount, taxfree_exponent)
+            adjusted_amount = spending_amount - taxfree_amount_fval
+            self.inform_user_missing_acquisition(
+                asset=spending_asset,
+                time=timestamp,
+                found_amount=taxable_amount_fval + taxfree_amount_fval,
+                missing_amount=from_fixed_point(remaining_sold_amount, remaining_exponent),
+            )
+            taxable_amount_fval = adjusted_amount
+            is_complete = False
+
+        return CostBasisInfo(
+            taxable_amount=taxable_amount_fval,
+            taxable_bought_cost=taxable_bought_cost,
+            taxfree_bought_cost=taxfree_bought_cost,
+            matched_acquisitions=matched_acquisitions,
+            is_complete=is_complete,
+        )
+
+    def get_calculated_asset_amount(self, asset: Asset) -> Optional[FVal]:
+        if asset not in self.events:
+            return None
+
+        events = self._get_events(asset)
+        events.sync()
+        if not events.fixed_point or len(events.cumulative_amounts) == 0:
+            return super().get_calculated_asset_amount(asset)
+
+        amount = events.cumulative_amounts[-1] - events.consumed_amount
+        if amount >= FIXED_POINT_MAX:
+            return super().get_calculated_asset_amount(asset)
+
+        # The sum starts from FVal(0) which has exponent 0
+        exponent = min(0, min(events.exponents[events.head:], default=0))
+        return from_fixed_point(amount, exponent)
@@ -13,7 +13,10 @@ from typing import (
     Callable,
     DefaultDict,
     Dict,
+    Iterable,
+    Iterator,
     List,
+    NamedTuple,
     Optional,
     Tuple,
     Union,
@@ -49,6 +52,7 @@ from rotkehlchen.chain.ethereum.typing import CustomEthereumToken
 from rotkehlchen.constants.assets import A_ETH
 from rotkehlchen.constants.misc import ZERO
 from rotkehlchen.constants.resolver import ETHEREUM_DIRECTIVE
+from rotkehlchen.db.filtering import HistoryFilterQuery
 from rotkehlchen.db.ledger_actions import DBLedgerActions
 from rotkehlchen.db.queried_addresses import QueriedAddresses
 from rotkehlchen.db.settings import ModifiableDBSettings
@@ -108,6 +112,25 @@ if TYPE_CHECKING:
 
 
 OK_RESULT = {'result': True, 'message': ''}
+# Size of the chunks in which streamed responses are sent
+RESPONSE_CHUNK_SIZE = 64 * 1024
+JSON_ENCODER = json.JSONEncoder()
+
+
+class CachedResponse(NamedTuple):
+    """The JSON body of a response kept in memory along with the ETag identifying it"""
+    etag: str
+    body: bytes
+
+
+class StreamedEntries(NamedTuple):
+    """The entries of a JSON array, or the key/value pairs of a JSON object if is_mapping
+    is True, which are encoded one by one while the response is being sent.
+
+    Entries should be already processed for serialization.
+    """
+    entries: Iterable[Any]
+    is_mapping: bool = False
 
 
 def _wrap_in_ok_result(result: Any) -> Dict[str, Any]:
@@ -151,6 +174,117 @@ def api_response(
     return response
 
 
+def _encode_json_key(key: Any) -> str:
+    """Encodes a key of a JSON object, turning non string keys to strings like json.dumps()"""
+    return JSON_ENCODER.encode(key if isinstance(key, str) else JSON_ENCODER.encode(key))
+
+
+def _iterencode_json(data: Any) -> Iterator[str]:
+    """Encodes the data to JSON piece by piece, exactly as json.dumps() encodes it at once
+
+    Dictionaries containing other dictionaries or StreamedEntries are encoded value by
+    value so that StreamedEntries are found and encoded as their entries are produced.
+    """
+    if isinstance(data, StreamedEntries):
+        yield '{' if data.is_mapping else '['
+        for idx, entry in enumerate(data.entries):
+            if idx != 0:
+                yield ', '
+            if data.is_mapping:
+                key, entry = entry
+                yield f'{_encode_json_key(key)}: '
+            yield JSON_ENCODER.encode(entry)
+        yield '}' if data.is_mapping else ']'
+    elif isinstance(data, dict) and any(isinstance(x, (dict, StreamedEntries)) for x in data.values()):  # noqa: E501
+        yield '{'
+        for idx, (key, value) in enumerate(data.items()):
+            if idx != 0:
+                yield ', '
+            yield f'{_encode_json_key(key)}: '
+            yield from _iterencode_json(value)
+        yield '}'
+    else:
+        yield from JSON_ENCODER.iterencode(data)
+
+
+def _chunk_response(parts: Iterable[str]) -> Iterator[bytes]:
+    """Groups the encoded parts of a response into chunks of about RESPONSE_CHUNK_SIZE"""
+    chunk: List[str] = []
+    chunk_size = 0
+    for part in parts:
+        chunk.append(part)
+        chunk_size += len(part)
+        if chunk_size >= RESPONSE_CHUNK_SIZE:
+            yield ''.join(chunk).encode()
+            chunk = []
+            chunk_size = 0
+
+    if len(chunk) != 0:
+        yield ''.join(chunk).encode()
+
+
+def streamed_api_response(
+        result: Dict[str, Any],
+        status_code: HTTPStatus = HTTPStatus.OK,
+        on_complete: Optional[Callable[[bytes], None]] = None,
+) -> Response:
+    """Like api_response() but the JSON body is sent in chunks while it is encoded
+
+    Used for endpoints returning large collections. The body is never built whole in
+    memory and if it contains StreamedEntries neither is the collection. Sending
+    starts as soon as the first chunk is encoded.
+
+    If on_complete is given it is called with the whole body after it has been sent.
+    """
+    log.debug("Request successful", response='<streamed>', status_code=status_code)
+    chunks = _chunk_response(_iterencode_json(result))
+    if on_complete is not None:
+        chunks = _record_chunks(chunks, on_complete)
+    return Response(chunks, status=status_code, mimetype='application/json')
+
+
+def _record_chunks(
+        chunks: Iterator[bytes],
+        on_complete: Callable[[bytes], None],
+) -> Iterator[bytes]:
+    """Passes the chunks through and calls on_complete with the whole body once all are sent"""
+    sent_chunks = []
+    for chunk in chunks:
+        sent_chunks.append(chunk)
+        yield chunk
+
+    on_complete(b''.join(sent_chunks))
+
+
+def make_cached_response(result: Dict[str, Any]) -> CachedResponse:
+    """Serializes the result of a response whose data never changes while rotki runs"""
+    body = json.dumps(result).encode()
+    return CachedResponse(etag=hashlib.md5(body).hexdigest(), body=body)
+
+
+def not_modified_response(etag: str) -> Response:
+    """The empty response for a client whose If-None-Match header matched the ETag"""
+    log.debug("Request successful", response='<not modified>', status_code=HTTPStatus.NOT_MODIFIED)  # noqa: E501
+    response = make_response(
+        (b'', HTTPStatus.NOT_MODIFIED, {"mimetype": "application/json", "Content-Type": "application/json"}),  # noqa: E501
+    )
+    response.set_etag(etag)
+    return response
+
+
+def cached_api_response(cached: CachedResponse, match_header: Optional[str]) -> Response:
+    """Sends the cached body, or nothing if the client already has it"""
+    if match_header == cached.etag:
+        return not_modified_response(cached.etag)
+
+    log.debug("Request successful", response='<cached>', status_code=HTTPStatus.OK)
+    response = make_response(
+        (cached.body, HTTPStatus.OK, {"mimetype": "application/json", "Content-Type": "application/json"}),  # noqa: E501
+    )
+    response.set_etag(cached.etag)
+    return response
+
+
 def require_loggedin_user() -> Callable:
     """ This is a decorator for the RestAPI class's methods requiring a logged in user.
     """
@@ -220,6 +354,16 @@ class RestAPI():
         self.task_results: Dict[int, Any] = {}
 
         self.trade_schema = TradeSchema()
+        # Identifies this run of rotki in the ETags of the all assets responses since the
+        # assets version they contain starts over at every run
+        self.run_id = uuid4().hex
+        self.all_assets_response: Optional[CachedResponse] = None
+        self.supported_modules_response = make_cached_response(_wrap_in_ok_result(
+            [{'id': x, 'name': y} for x, y in AVAILABLE_MODULES_MAP.items()],
+        ))
+        self.asset_types_response = make_cached_response(
+            _wrap_in_ok_result([str(x) for x in AssetType]),
+        )
 
     # - Private functions not exposed to the API
     def _new_task_id(self) -> int:
@@ -349,7 +493,11 @@ class RestAPI():
                         }
                         # Also remove the greenlet from the api tasks
                         self.rotkehlchen.api_task_greenlets.pop(idx)
-                        return api_response(result=result_dict, status_code=HTTPStatus.OK)
+                        # Outcomes of long running tasks can be large collections
+                        return streamed_api_response(
+                            result=result_dict,
+                            status_code=HTTPStatus.OK,
+                        )
                     # else task is still pending and the greenlet is running
                     result_dict = {
                         'result': {'status': 'pending', 'outcome': None},
@@ -628,47 +776,41 @@ class RestAPI():
 
     def _get_trades(
             self,
-            from_ts: Timestamp,
-            to_ts: Timestamp,
-            location: Optional[Location],
+            filter_query: HistoryFilterQuery,
             only_cache: bool,
     ) -> Dict[str, Any]:
         try:
-            trades = self.rotkehlchen.query_trades(
-                from_ts=from_ts,
-                to_ts=to_ts,
-                location=location,
+            trades, entries_found = self.rotkehlchen.query_trades(
+                filter_query=filter_query,
                 only_cache=only_cache,
             )
         except RemoteError as e:
             return {'result': None, 'message': str(e), 'status_code': HTTPStatus.BAD_GATEWAY}
 
-        trades_result = []
+        mapping = self.rotkehlchen.data.db.get_ignored_action_ids(ActionType.TRADE)
+        ignored_ids = set(mapping.get(ActionType.TRADE, []))
+        entries_result = []
         for trade in trades:
             if isinstance(trade, AMMTrade):
                 serialized_trade = trade.serialize()
             else:
                 serialized_trade = self.trade_schema.dump(trade)
                 serialized_trade['trade_id'] = trade.identifier
-            trades_result.append(serialized_trade)
+            entries_result.append({
+                'entry': serialized_trade,
+                'ignored_in_accounting': trade.identifier in ignored_ids,
+            })
 
         entry_table: Literal['amm_swaps', 'trades']
-        if location in AMMTradeLocations:
+        if filter_query.location in AMMTradeLocations:
             entry_table = 'amm_swaps'
         else:
             entry_table = 'trades'
 
-        mapping = self.rotkehlchen.data.db.get_ignored_action_ids(ActionType.TRADE)
-        ignored_ids = mapping.get(ActionType.TRADE, [])
-        entries_result = []
-        for entry in trades_result:
-            entries_result.append(
-                {'entry': entry, 'ignored_in_accounting': entry['trade_id'] in ignored_ids},
-            )
-
         result = {
             'entries': entries_result,
-            'entries_found': self.rotkehlchen.data.db.get_entries_count(entry_table),
+            'entries_found': entries_found,
+            'entries_total': self.rotkehlchen.data.db.get_entries_count(entry_table),
             'entries_limit': FREE_TRADES_LIMIT if self.rotkehlchen.premium is None else -1,
         }
 
@@ -677,30 +819,21 @@ class RestAPI():
     @require_loggedin_user()
     def get_trades(
             self,
-            from_ts: Timestamp,
-            to_ts: Timestamp,
-            location: Optional[Location],
+            filter_query: HistoryFilterQuery,
             async_query: bool,
             only_cache: bool,
     ) -> Response:
         if async_query:
             return self._query_async(
                 command='_get_trades',
-                from_ts=from_ts,
-                to_ts=to_ts,
-                location=location,
+                filter_query=filter_query,
                 only_cache=only_cache,
             )
 
-        response = self._get_trades(
-            from_ts=from_ts,
-            to_ts=to_ts,
-            location=location,
-            only_cache=only_cache,
-        )
+        response = self._get_trades(filter_query=filter_query, only_cache=only_cache)
         status_code = _get_status_code_from_async_response(response)
         result_dict = {'result': response['result'], 'message': response['message']}
-        return api_response(process_result(result_dict), status_code=status_code)
+        return streamed_api_response(process_result(result_dict), status_code=status_code)
 
     @require_loggedin_user()
     def add_trade(
@@ -786,87 +919,62 @@ class RestAPI():
 
     def _get_asset_movements(
             self,
-            from_timestamp: Timestamp,
-            to_timestamp: Timestamp,
-            location: Optional[Location],
+            filter_query: HistoryFilterQuery,
             only_cache: bool,
     ) -> Dict[str, Any]:
-        msg = ''
-        status_code = HTTPStatus.OK
-        result = None
         try:
-            movements = self.rotkehlchen.query_asset_movements(
-                from_ts=from_timestamp,
-                to_ts=to_timestamp,
-                location=location,
+            movements, entries_found = self.rotkehlchen.query_asset_movements(
+                filter_query=filter_query,
                 only_cache=only_cache,
             )
         except RemoteError as e:
             return {'result': None, 'message': str(e), 'status_code': HTTPStatus.BAD_GATEWAY}
 
-        serialized_movements = process_result_list([x.serialize() for x in movements])
-        limit = FREE_ASSET_MOVEMENTS_LIMIT if self.rotkehlchen.premium is None else -1
-
         mapping = self.rotkehlchen.data.db.get_ignored_action_ids(ActionType.ASSET_MOVEMENT)
-        ignored_ids = mapping.get(ActionType.ASSET_MOVEMENT, [])
+        ignored_ids = set(mapping.get(ActionType.ASSET_MOVEMENT, []))
         entries_result = []
-        for entry in serialized_movements:
+        for movement in movements:
             entries_result.append({
-                'entry': entry,
-                'ignored_in_accounting': entry['identifier'] in ignored_ids,
+                'entry': movement.serialize(),
+                'ignored_in_accounting': movement.identifier in ignored_ids,
             })
 
         result = {
             'entries': entries_result,
-            'entries_found': self.rotkehlchen.data.db.get_entries_count('asset_movements'),
-            'entries_limit': limit,
+            'entries_found': entries_found,
+            'entries_total': self.rotkehlchen.data.db.get_entries_count('asset_movements'),
+            'entries_limit': FREE_ASSET_MOVEMENTS_LIMIT if self.rotkehlchen.premium is None else -1,  # noqa: E501
         }
 
-        return {'result': result, 'message': msg, 'status_code': status_code}
+        return {'result': result, 'message': '', 'status_code': HTTPStatus.OK}
 
     @require_loggedin_user()
     def get_asset_movements(
             self,
-            from_timestamp: Timestamp,
-            to_timestamp: Timestamp,
-            location: Optional[Location],
+            filter_query: HistoryFilterQuery,
             async_query: bool,
             only_cache: bool,
     ) -> Response:
         if async_query:
             return self._query_async(
                 command='_get_asset_movements',
-                from_timestamp=from_timestamp,
-                to_timestamp=to_timestamp,
-                location=location,
+                filter_query=filter_query,
                 only_cache=only_cache,
             )
 
-        response = self._get_asset_movements(
-            from_timestamp=from_timestamp,
-            to_timestamp=to_timestamp,
-            location=location,
-            only_cache=only_cache,
-        )
+        response = self._get_asset_movements(filter_query=filter_query, only_cache=only_cache)
         result_dict = {'result': response['result'], 'message': response['message']}
         status_code = _get_status_code_from_async_response(response)
         return api_response(process_result(result_dict), status_code=status_code)
 
-    def _get_ledger_actions(
-            self,
-            from_ts: Optional[Timestamp],
-            to_ts: Optional[Timestamp],
-            location: Optional[Location],
-    ) -> Dict[str, Any]:
-        actions, original_length = self.rotkehlchen.events_historian.query_ledger_actions(
+    def _get_ledger_actions(self, filter_query: HistoryFilterQuery) -> Dict[str, Any]:
+        actions, entries_found = self.rotkehlchen.events_historian.query_filtered_ledger_actions(
+            filter_query=filter_query,
             has_premium=True,
-            from_ts=from_ts,
-            to_ts=to_ts,
-            location=location,
         )
 
         mapping = self.rotkehlchen.data.db.get_ignored_action_ids(ActionType.LEDGER_ACTION)
-        ignored_ids = mapping.get(ActionType.LEDGER_ACTION, [])
+        ignored_ids = set(mapping.get(ActionType.LEDGER_ACTION, []))
         entries_result = []
         for action in actions:
             entries_result.append({
@@ -876,7 +984,8 @@ class RestAPI():
 
         result = {
             'entries': entries_result,
-            'entries_found': original_length,
+            'entries_found': entries_found,
+            'entries_total': self.rotkehlchen.data.db.get_entries_count('ledger_actions'),
             'entries_limit': FREE_LEDGER_ACTIONS_LIMIT if self.rotkehlchen.premium is None else -1,
         }
 
@@ -885,24 +994,16 @@ class RestAPI():
     @require_loggedin_user()
     def get_ledger_actions(
             self,
-            from_ts: Timestamp,
-            to_ts: Timestamp,
-            location: Optional[Location],
+            filter_query: HistoryFilterQuery,
             async_query: bool,
     ) -> Response:
         if async_query:
             return self._query_async(
                 command='_get_ledger_actions',
-                from_ts=from_ts,
-                to_ts=to_ts,
-                location=location,
+                filter_query=filter_query,
             )
 
-        response = self._get_ledger_actions(
-            from_ts=from_ts,
-            to_ts=to_ts,
-            location=location,
-        )
+        response = self._get_ledger_actions(filter_query=filter_query)
         status_code = _get_status_code_from_async_response(response)
         result_dict = {'result': response['result'], 'message': response['message']}
         return api_response(process_result(result_dict), status_code=status_code)
@@ -922,11 +1023,7 @@ class RestAPI():
             return api_response(wrap_in_fail_result(error_msg), status_code=HTTPStatus.CONFLICT)
 
         # Success - return all ledger actions after the edit
-        response = self._get_ledger_actions(
-            from_ts=None,
-            to_ts=None,
-            location=None,
-        )
+        response = self._get_ledger_actions(filter_query=HistoryFilterQuery())
         result_dict = {'result': response['result'], 'message': response['message']}
         return api_response(process_result(result_dict), status_code=HTTPStatus.OK)
 
@@ -938,11 +1035,7 @@ class RestAPI():
             return api_response(wrap_in_fail_result(error_msg), status_code=HTTPStatus.CONFLICT)
 
         # Success - return all ledger actions after the removal
-        response = self._get_ledger_actions(
-            from_ts=None,
-            to_ts=None,
-            location=None,
-        )
+        response = self._get_ledger_actions(filter_query=HistoryFilterQuery())
         result_dict = {'result': response['result'], 'message': response['message']}
         return api_response(process_result(result_dict), status_code=HTTPStatus.OK)
 
@@ -1213,26 +1306,43 @@ class RestAPI():
         # else
         return api_response(OK_RESULT, status_code=HTTPStatus.OK)
 
-    @staticmethod
-    def query_all_assets() -> Response:
-        """Returns all supported assets"""
-        # type ignore is due to: https://github.com/python/mypy/issues/7781
-        assets = GlobalDBHandler().get_all_asset_data(mapping=True)  # type: ignore
-        return api_response(
+    def query_all_assets(self, match_header: Optional[str]) -> Response:
+        """Returns all supported assets
+
+        The response body is kept in memory and sent again as long as no asset changes.
+        Clients that already have it get an empty response by its ETag.
+        """
+        assets = StreamedEntries(
+            entries=((x.identifier, x.serialize()) for x in GlobalDBHandler().iterate_all_asset_data()),  # noqa: E501
+            is_mapping=True,
+        )
+        version = GlobalDBHandler().get_assets_version()
+        if version is None:
+            # Assets are being written. Don't cache what may still be rolled back.
+            return streamed_api_response(_wrap_in_ok_result(assets), status_code=HTTPStatus.OK)
+
+        etag = f'{self.run_id}-{version}'
+        if self.all_assets_response is not None and self.all_assets_response.etag == etag:
+            return cached_api_response(self.all_assets_response, match_header)
+        if match_header == etag:
+            return not_modified_response(etag)
+
+        def cache_response(body: bytes) -> None:
+            # Only keep it if no asset changed while it was being sent
+            if GlobalDBHandler().get_assets_version() == version:
+                self.all_assets_response = CachedResponse(etag=etag, body=body)
+
+        response = streamed_api_response(
             _wrap_in_ok_result(assets),
             status_code=HTTPStatus.OK,
-            log_result=False,
+            on_complete=cache_response,
         )
+        response.set_etag(etag)
+        return response
 
-    @staticmethod
-    def supported_modules() -> Response:
+    def supported_modules(self, match_header: Optional[str]) -> Response:
         """Returns all supported modules"""
-        data = [{'id': x, 'name': y} for x, y in AVAILABLE_MODULES_MAP.items()]
-        return api_response(
-            _wrap_in_ok_result(data),
-            status_code=HTTPStatus.OK,
-            log_result=False,
-        )
+        return cached_api_response(self.supported_modules_response, match_header)
 
     @require_loggedin_user()
     def query_owned_assets(self) -> Response:
@@ -1242,10 +1352,8 @@ class RestAPI():
             status_code=HTTPStatus.OK,
         )
 
-    @staticmethod
-    def get_asset_types() -> Response:
-        types = [str(x) for x in AssetType]
-        return api_response(_wrap_in_ok_result(types), status_code=HTTPStatus.OK)
+    def get_asset_types(self, match_header: Optional[str]) -> Response:
+        return cached_api_response(self.asset_types_response, match_header)
 
     @staticmethod
     def add_custom_asset(asset_type: AssetType, **kwargs: Any) -> Response:
@@ -1473,7 +1581,7 @@ class RestAPI():
         msg = response['message']
         status_code = _get_status_code_from_async_response(response)
         result_dict = _wrap_in_result(result=process_result(result), message=msg)
-        return api_response(result_dict, status_code=status_code)
+        return streamed_api_response(result_dict, status_code=status_code)
 
     @require_loggedin_user()
     def export_processed_history_csv(self, directory_path: Path) -> Response:
@@ -1514,6 +1622,11 @@ class RestAPI():
         result = self.rotkehlchen.get_history_query_status()
         return api_response(_wrap_in_ok_result(result), status_code=HTTPStatus.OK)
 
+    @require_loggedin_user()
+    def get_cryptocompare_prefetch_status(self) -> Response:
+        result = self.rotkehlchen.get_cryptocompare_prefetch_status()
+        return api_response(_wrap_in_ok_result(result), status_code=HTTPStatus.OK)
+
     @require_loggedin_user()
     def query_periodic_data(self) -> Response:
         data = self.rotkehlchen.query_periodic_data()
@@ -2539,7 +2652,7 @@ class RestAPI():
 
         # success
         result_dict = _wrap_in_result(result, msg)
-        return api_response(process_result(result_dict), status_code=status_code)
+        return streamed_api_response(process_result(result_dict), status_code=status_code)
 
     def get_asset_icon(
             self,
@@ -35,6 +35,7 @@ from rotkehlchen.api.v1.resources import (
     BTCXpubResource,
     CompoundBalancesResource,
     CompoundHistoryResource,
+    CryptocomparePrefetchResource,
     CurrentAssetsPriceResource,
     DataImportResource,
     DefiBalancesResource,
@@ -118,6 +119,7 @@ URLS_V1: URLS = [
     ('/external_services/', ExternalServicesResource),
     ('/oracles', OraclesResource),
     ('/oracles/<string:oracle>/cache', NamedOracleCacheResource),
+    ('/oracles/cryptocompare/prefetch', CryptocomparePrefetchResource),
     ('/exchanges', ExchangesResource),
     ('/exchanges/balances', ExchangeBalancesResource),
     (
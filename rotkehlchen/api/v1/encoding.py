@@ -30,6 +30,11 @@ from rotkehlchen.chain.substrate.utils import (
     is_valid_kusama_address,
 )
 from rotkehlchen.constants.misc import ZERO
+from rotkehlchen.db.filtering import (
+    ASSET_MOVEMENTS_FILTER_TABLE,
+    LEDGER_ACTIONS_FILTER_TABLE,
+    TRADES_FILTER_TABLE,
+)
 from rotkehlchen.db.settings import ModifiableDBSettings
 from rotkehlchen.errors import DeserializationError, EncodingError, UnknownAsset, XPUBError
 from rotkehlchen.exchanges.kraken import KrakenAccountType
@@ -42,17 +47,20 @@ from rotkehlchen.inquirer import CurrentPriceOracle
 from rotkehlchen.serialization.deserialize import (
     deserialize_action_type,
     deserialize_asset_amount,
+    deserialize_asset_movement_category,
     deserialize_fee,
     deserialize_hex_color_code,
     deserialize_location,
     deserialize_timestamp,
     deserialize_trade_type,
 )
+from rotkehlchen.tasks.price_prefetch import MAX_CRYPTOCOMPARE_PREFETCH_CONCURRENCY
 from rotkehlchen.typing import (
     AVAILABLE_MODULES_MAP,
     ApiKey,
     ApiSecret,
     AssetAmount,
+    AssetMovementCategory,
     BTCAddress,
     ChecksumEthAddress,
     ExternalService,
@@ -427,6 +435,32 @@ class TradeTypeField(fields.Field):
         return trade_type
 
 
+class AssetMovementCategoryField(fields.Field):
+
+    @staticmethod
+    def _serialize(
+            value: AssetMovementCategory,
+            attr: str,  # pylint: disable=unused-argument
+            obj: Any,  # pylint: disable=unused-argument
+            **_kwargs: Any,
+    ) -> str:
+        return str(value)
+
+    def _deserialize(
+            self,
+            value: str,
+            attr: Optional[str],  # pylint: disable=unused-argument
+            data: Optional[Mapping[str, Any]],  # pylint: disable=unused-argument
+            **_kwargs: Any,
+    ) -> AssetMovementCategory:
+        try:
+            category = deserialize_asset_movement_category(value)
+        except DeserializationError as e:
+            raise ValidationError(str(e)) from e
+
+        return category
+
+
 class AssetTypeField(fields.Field):
 
     def __init__(self, *, exclude_types: Optional[Sequence[AssetType]] = None, **kwargs: Any) -> None:  # noqa: E501
@@ -816,17 +850,51 @@ class EthereumTransactionQuerySchema(Schema):
     only_cache = fields.Boolean(missing=False)
 
 
-class TimerangeLocationQuerySchema(Schema):
+class HistoryFilterQuerySchema(Schema):
+    """Filtering, ordering and pagination arguments of the history entry endpoints"""
     from_timestamp = TimestampField(missing=Timestamp(0))
     to_timestamp = TimestampField(missing=ts_now)
     location = LocationField(missing=None)
+    asset = AssetField(missing=None)
+    ignored_in_accounting = fields.Boolean(missing=None)
+    offset = fields.Integer(validate=webargs.validate.Range(min=0), missing=0)
+    limit = fields.Integer(validate=webargs.validate.Range(min=1), missing=None)
     async_query = fields.Boolean(missing=False)
 
 
-class TimerangeLocationCacheQuerySchema(TimerangeLocationQuerySchema):
+class TradesQuerySchema(HistoryFilterQuerySchema):
+    trade_type = TradeTypeField(missing=None)
+    order_by_attribute = fields.String(
+        validate=webargs.validate.OneOf(choices=list(TRADES_FILTER_TABLE.order_by_columns)),
+        missing='timestamp',
+    )
+    ascending = fields.Boolean(missing=False)
+    only_cache = fields.Boolean(missing=False)
+
+
+class AssetMovementsQuerySchema(HistoryFilterQuerySchema):
+    category = AssetMovementCategoryField(missing=None)
+    order_by_attribute = fields.String(
+        validate=webargs.validate.OneOf(
+            choices=list(ASSET_MOVEMENTS_FILTER_TABLE.order_by_columns),
+        ),
+        missing='timestamp',
+    )
+    ascending = fields.Boolean(missing=False)
     only_cache = fields.Boolean(missing=False)
 
 
+class LedgerActionsQuerySchema(HistoryFilterQuerySchema):
+    action_type = LedgerActionTypeField(missing=None)
+    order_by_attribute = fields.String(
+        validate=webargs.validate.OneOf(
+            choices=list(LEDGER_ACTIONS_FILTER_TABLE.order_by_columns),
+        ),
+        missing='timestamp',
+    )
+    ascending = fields.Boolean(missing=True)
+
+
 class TradeSchema(Schema):
     timestamp = TimestampField(required=True)
     location = LocationField(required=True)
@@ -1018,6 +1086,27 @@ class ModifiableSettingsSchema(Schema):
         missing=None,
     )
     taxable_ledger_actions = fields.List(LedgerActionTypeField, missing=None)
+    cryptocompare_prefetch_concurrency = fields.Integer(
+        strict=True,
+        validate=webargs.validate.Range(
+            min=1,
+            max=MAX_CRYPTOCOMPARE_PREFETCH_CONCURRENCY,
+            error=(
+                f'The cryptocompare prefetch concurrency should be between 1 and '
+                f'{MAX_CRYPTOCOMPARE_PREFETCH_CONCURRENCY}'
+            ),
+        ),
+        missing=None,
+    )
+    fixed_point_cost_basis = fields.Bool(missing=None)
+    pnl_checkpoint_frequency = fields.Integer(
+        strict=True,
+        validate=webargs.validate.Range(
+            min=0,
+            error='The PnL checkpoint frequency should be a non-negative number of days',
+        ),
+        missing=None,
+    )
 
     @validates_schema  # type: ignore
     def validate_settings_schema(  # pylint: disable=no-self-use
@@ -1062,6 +1151,9 @@ class ModifiableSettingsSchema(Schema):
             historical_price_oracles=data['historical_price_oracles'],
             current_price_oracles=data['current_price_oracles'],
             taxable_ledger_actions=data['taxable_ledger_actions'],
+            cryptocompare_prefetch_concurrency=data['cryptocompare_prefetch_concurrency'],
+            fixed_point_cost_basis=data['fixed_point_cost_basis'],
+            pnl_checkpoint_frequency=data['pnl_checkpoint_frequency'],
         )
 
 
@@ -18,6 +18,7 @@ from rotkehlchen.api.v1.encoding import (
     AllBalancesQuerySchema,
     AssetIconsSchema,
     AssetIconUploadSchema,
+    AssetMovementsQuerySchema,
     AssetSchema,
     AssetSchemaWithIdentifier,
     AssetUpdatesRequestSchema,
@@ -51,6 +52,7 @@ from rotkehlchen.api.v1.encoding import (
     IntegerIdentifierSchema,
     LedgerActionEditSchema,
     LedgerActionSchema,
+    LedgerActionsQuerySchema,
     ManuallyTrackedBalancesDeleteSchema,
     ManuallyTrackedBalancesSchema,
     ModifyEthereumTokenSchema,
@@ -68,11 +70,10 @@ from rotkehlchen.api.v1.encoding import (
     TagDeleteSchema,
     TagEditSchema,
     TagSchema,
-    TimerangeLocationCacheQuerySchema,
-    TimerangeLocationQuerySchema,
     TradeDeleteSchema,
     TradePatchSchema,
     TradeSchema,
+    TradesQuerySchema,
     UserActionSchema,
     UserPasswordChangeSchema,
     UserPremiumSyncSchema,
@@ -87,12 +88,14 @@ from rotkehlchen.assets.asset import Asset
 from rotkehlchen.assets.typing import AssetType
 from rotkehlchen.balances.manual import ManuallyTrackedBalance
 from rotkehlchen.chain.bitcoin.xpub import XpubData
+from rotkehlchen.db.filtering import HistoryFilterQuery
 from rotkehlchen.db.settings import ModifiableDBSettings
 from rotkehlchen.history.typing import HistoricalPriceOracle
 from rotkehlchen.typing import (
     ApiKey,
     ApiSecret,
     AssetAmount,
+    AssetMovementCategory,
     BlockchainAccountData,
     ChecksumEthAddress,
     ExternalService,
@@ -184,6 +187,17 @@ def load_view_args_file_data(request: Request, schema: Schema) -> Dict[str, Any]
     return data
 
 
+def _get_match_header() -> Optional[str]:
+    """Returns the ETag given in the if-match or if-none-match header without its quotes"""
+    match_header = flask_request.headers.get('If-Match', None)
+    if not match_header:
+        match_header = flask_request.headers.get('If-None-Match', None)
+    if match_header:
+        match_header = match_header[1:-1]  # remove enclosing quotes
+
+    return match_header
+
+
 def create_blueprint() -> Blueprint:
     # Take a look at this SO question on hints how to organize versioned
     # API with flask:
@@ -354,7 +368,7 @@ class AllAssetsResource(BaseResource):
     delete_schema = StringIdentifierSchema()
 
     def get(self) -> Response:
-        return self.rest_api.query_all_assets()
+        return self.rest_api.query_all_assets(_get_match_header())
 
     @use_kwargs(add_schema, location='json')  # type: ignore
     def put(self, asset_type: AssetType, **kwargs: Any) -> Response:
@@ -372,7 +386,7 @@ class AllAssetsResource(BaseResource):
 class AssetsTypesResource(BaseResource):
 
     def get(self) -> Response:
-        return self.rest_api.get_asset_types()
+        return self.rest_api.get_asset_types(_get_match_header())
 
 
 class EthereumAssetsResource(BaseResource):
@@ -463,7 +477,7 @@ class ManuallyTrackedBalancesResource(BaseResource):
 
 class TradesResource(BaseResource):
 
-    get_schema = TimerangeLocationCacheQuerySchema()
+    get_schema = TradesQuerySchema()
     put_schema = TradeSchema()
     patch_schema = TradePatchSchema()
     delete_schema = TradeDeleteSchema()
@@ -474,13 +488,30 @@ class TradesResource(BaseResource):
             from_timestamp: Timestamp,
             to_timestamp: Timestamp,
             location: Optional[Location],
+            asset: Optional[Asset],
+            trade_type: Optional[TradeType],
+            ignored_in_accounting: Optional[bool],
+            order_by_attribute: str,
+            ascending: bool,
+            offset: int,
+            limit: Optional[int],
             async_query: bool,
             only_cache: bool,
     ) -> Response:
-        return self.rest_api.get_trades(
+        filter_query = HistoryFilterQuery(
             from_ts=from_timestamp,
             to_ts=to_timestamp,
             location=location,
+            asset=asset,
+            entry_type=trade_type,
+            ignored=ignored_in_accounting,
+            order_by_attribute=order_by_attribute,
+            ascending=ascending,
+            offset=offset,
+            limit=limit,
+        )
+        return self.rest_api.get_trades(
+            filter_query=filter_query,
             async_query=async_query,
             only_cache=only_cache,
         )
@@ -552,7 +583,7 @@ class TradesResource(BaseResource):
 
 class AssetMovementsResource(BaseResource):
 
-    get_schema = TimerangeLocationCacheQuerySchema()
+    get_schema = AssetMovementsQuerySchema()
 
     @use_kwargs(get_schema, location='json_and_query')  # type: ignore
     def get(
@@ -560,13 +591,30 @@ class AssetMovementsResource(BaseResource):
             from_timestamp: Timestamp,
             to_timestamp: Timestamp,
             location: Optional[Location],
+            asset: Optional[Asset],
+            category: Optional[AssetMovementCategory],
+            ignored_in_accounting: Optional[bool],
+            order_by_attribute: str,
+            ascending: bool,
+            offset: int,
+            limit: Optional[int],
             async_query: bool,
             only_cache: bool,
     ) -> Response:
-        return self.rest_api.get_asset_movements(
-            from_timestamp=from_timestamp,
-            to_timestamp=to_timestamp,
+        filter_query = HistoryFilterQuery(
+            from_ts=from_timestamp,
+            to_ts=to_timestamp,
             location=location,
+            asset=asset,
+            entry_type=category,
+            ignored=ignored_in_accounting,
+            order_by_attribute=order_by_attribute,
+            ascending=ascending,
+            offset=offset,
+            limit=limit,
+        )
+        return self.rest_api.get_asset_movements(
+            filter_query=filter_query,
             async_query=async_query,
             only_cache=only_cache,
         )
@@ -618,7 +666,7 @@ class TagsResource(BaseResource):
 
 class LedgerActionsResource(BaseResource):
 
-    get_schema = TimerangeLocationQuerySchema()
+    get_schema = LedgerActionsQuerySchema()
     put_schema = LedgerActionSchema()
     patch_schema = LedgerActionEditSchema()
     delete_schema = IntegerIdentifierSchema()
@@ -629,12 +677,29 @@ class LedgerActionsResource(BaseResource):
             from_timestamp: Timestamp,
             to_timestamp: Timestamp,
             location: Optional[Location],
+            asset: Optional[Asset],
+            action_type: Optional[LedgerActionType],
+            ignored_in_accounting: Optional[bool],
+            order_by_attribute: str,
+            ascending: bool,
+            offset: int,
+            limit: Optional[int],
             async_query: bool,
     ) -> Response:
-        return self.rest_api.get_ledger_actions(
+        filter_query = HistoryFilterQuery(
             from_ts=from_timestamp,
             to_ts=to_timestamp,
             location=location,
+            asset=asset,
+            entry_type=action_type,
+            ignored=ignored_in_accounting,
+            order_by_attribute=order_by_attribute,
+            ascending=ascending,
+            offset=offset,
+            limit=limit,
+        )
+        return self.rest_api.get_ledger_actions(
+            filter_query=filter_query,
             async_query=async_query,
         )
 
@@ -1121,7 +1186,7 @@ class EthereumModuleDataResource(BaseResource):
 class EthereumModuleResource(BaseResource):
 
     def get(self) -> Response:
-        return self.rest_api.supported_modules()
+        return self.rest_api.supported_modules(_get_match_header())
 
 
 class MakerdaoDSRBalanceResource(BaseResource):
@@ -1412,14 +1477,7 @@ class AssetIconsResource(BaseResource):
 
     @use_kwargs(get_schema, location='view_args')  # type: ignore
     def get(self, asset: Asset, size: Literal['thumb', 'small', 'large']) -> Response:
-        # Process the if-match and if-none-match headers so that comparison with etag can be done
-        match_header = flask_request.headers.get('If-Match', None)
-        if not match_header:
-            match_header = flask_request.headers.get('If-None-Match', None)
-        if match_header:
-            match_header = match_header[1:-1]  # remove enclosing quotes
-
-        return self.rest_api.get_asset_icon(asset, size, match_header)
+        return self.rest_api.get_asset_icon(asset, size, _get_match_header())
 
     @use_kwargs(upload_schema, location='json_and_view_args')  # type: ignore
     def put(self, asset: Asset, file: Path) -> Response:
@@ -1515,6 +1573,12 @@ class NamedOracleCacheResource(BaseResource):
         )
 
 
+class CryptocomparePrefetchResource(BaseResource):
+
+    def get(self) -> Response:
+        return self.rest_api.get_cryptocompare_prefetch_status()
+
+
 class OraclesResource(BaseResource):
 
     def get(self) -> Response:
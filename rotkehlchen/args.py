@@ -98,6 +98,14 @@ def app_args(prog: str, description: str) -> argparse.ArgumentParser:
         ),
         action='store_true',
     )
+    p.add_argument(
+        '--sqlite-wal',
+        help=(
+            'If given then the user DB is used in WAL journal mode. Writes are faster '
+            'but the last ones may be lost, without corrupting the DB, on power loss.'
+        ),
+        action='store_true',
+    )
     p.add_argument(
         'version',
         help='Shows the rotkehlchen version',
@@ -1,54 +1,229 @@
-from typing import Dict, List, Tuple
+import json
+import logging
+from http import HTTPStatus
+from typing import Any, Dict, Iterator, List, Tuple
 
+import gevent
 import requests
+from gevent.event import Event
+from gevent.pool import Pool
 
+from rotkehlchen.constants.timing import GLOBAL_REQUESTS_TIMEOUT, QUERY_RETRY_TIMES
 from rotkehlchen.errors import RemoteError, UnableToDecryptRemoteData
 from rotkehlchen.fval import FVal
+from rotkehlchen.logging import RotkehlchenLogsAdapter
 from rotkehlchen.typing import BTCAddress
 from rotkehlchen.utils.misc import satoshis_to_btc
-from rotkehlchen.utils.network import request_get_dict
+from rotkehlchen.utils.network import request_get_dict, retry_calls
 
+logger = logging.getLogger(__name__)
+log = RotkehlchenLogsAdapter(logger)
 
-def _have_bc1_accounts(accounts: List[BTCAddress]) -> bool:
-    return any(account.lower()[0:3] == 'bc1' for account in accounts)
+BLOCKCHAININFO_BASE_URL = 'https://blockchain.info'
+BLOCKSTREAM_BASE_URL = 'https://blockstream.info/api'
+# Keep the multiaddr URLs under the 8KB request line limit most servers have
+BLOCKCHAININFO_MAX_URL_LENGTH = 8000
+# How many addresses to query from blockstream at the same time
+BLOCKSTREAM_QUERY_CONCURRENCY = 8
+BLOCKSTREAM_BACKOFF_SECONDS = 4
+
+
+def _split_by_address_type(
+        accounts: List[BTCAddress],
+) -> Tuple[List[BTCAddress], List[BTCAddress]]:
+    """Splits the accounts to the legacy/P2SH ones and the bech32 ones"""
+    legacy_accounts, bech32_accounts = [], []
+    for account in accounts:
+        if account.lower()[0:3] == 'bc1':
+            bech32_accounts.append(account)
+        else:
+            legacy_accounts.append(account)
+
+    return legacy_accounts, bech32_accounts
+
+
+def _multiaddr_chunks(accounts: List[BTCAddress]) -> Iterator[List[BTCAddress]]:
+    """Splits the accounts so that the multiaddr URL of each chunk fits the URL length limit"""
+    base_length = len(f'{BLOCKCHAININFO_BASE_URL}/multiaddr?active=')
+    chunk: List[BTCAddress] = []
+    length = base_length
+    for account in accounts:
+        # +1 for the '|' separator. Counted for the first one too but that does not matter
+        if chunk and length + len(account) + 1 > BLOCKCHAININFO_MAX_URL_LENGTH:
+            yield chunk
+            chunk = []
+            length = base_length
+        chunk.append(account)
+        length += len(account) + 1
+
+    if chunk:
+        yield chunk
+
+
+def _query_blockchaininfo_multiaddr(
+        accounts: List[BTCAddress],
+        backoff_in_seconds: int,
+) -> List[Dict[str, Any]]:
+    """Queries the multiaddr endpoint of blockchain.info for the accounts in as few
+    queries as the URL length limit allows. Returns the responses of all queries
+
+    May raise:
+    - RemoteError, requests.exceptions.RequestException or UnableToDecryptRemoteData
+    """
+    responses = []
+    for chunk in _multiaddr_chunks(accounts):
+        params = '|'.join(chunk)
+        responses.append(request_get_dict(
+            url=f'{BLOCKCHAININFO_BASE_URL}/multiaddr?active={params}',
+            handle_429=True,
+            backoff_in_seconds=backoff_in_seconds,
+        ))
+
+    return responses
+
+
+def _query_blockstream_address(
+        account: BTCAddress,
+        not_rate_limited: Event,
+) -> Dict[str, Any]:
+    """Queries blockstream for an address
+
+    The backoff after a 429 is shared by all the queries waiting on not_rate_limited,
+    since they are all rate limited together. The query that gets the 429 first
+    clears it for the duration of the backoff and the rest wait for it to be set again.
+
+    May raise:
+    - RemoteError if blockstream can't be reached, keeps rate limiting us for
+    QUERY_RETRY_TIMES tries or returns an error response
+    - UnableToDecryptRemoteData if blockstream returns invalid json
+    """
+    url = f'{BLOCKSTREAM_BASE_URL}/address/{account}'
+    tries = QUERY_RETRY_TIMES
+    while True:
+        not_rate_limited.wait()
+        log.debug('Querying blockstream', url=url)
+        response = retry_calls(
+            times=QUERY_RETRY_TIMES,
+            location='blockstream',
+            handle_429=False,
+            backoff_in_seconds=0,
+            method_name=url,
+            function=requests.get,
+            # function's arguments
+            url=url,
+            timeout=GLOBAL_REQUESTS_TIMEOUT,
+        )
+        tries -= 1
+        if response.status_code != HTTPStatus.TOO_MANY_REQUESTS:
+            break
+
+        if tries == 0:
+            raise RemoteError(f'blockstream query for {url} failed after {QUERY_RETRY_TIMES} tries')  # noqa: E501
+        if not_rate_limited.is_set():
+            log.debug(
+                'Got 429 from blockstream. Backing off all queries',
+                url=url,
+                backoff_seconds=BLOCKSTREAM_BACKOFF_SECONDS,
+            )
+            not_rate_limited.clear()
+            gevent.sleep(BLOCKSTREAM_BACKOFF_SECONDS)
+            not_rate_limited.set()
+
+    if response.status_code != HTTPStatus.OK:
+        raise RemoteError(
+            f'blockstream query for {url} failed with status code '
+            f'{response.status_code} and text {response.text}',
+        )
+
+    try:
+        result = json.loads(response.text)
+    except json.decoder.JSONDecodeError as e:
+        raise UnableToDecryptRemoteData(f'{url} returned malformed json. Error: {str(e)}') from e
+
+    if not isinstance(result, dict):
+        raise UnableToDecryptRemoteData(f'{url} returned unexpected json {result}')
+
+    return result
+
+
+def _query_bitcoin_addresses(
+        accounts: List[BTCAddress],
+        blockchaininfo_backoff: int,
+) -> Tuple[List[Dict[str, Any]], Dict[BTCAddress, Dict[str, Any]]]:
+    """Queries the legacy and P2SH accounts from blockchain.info in multiaddr batches
+    and the bech32 accounts, which blockchain.info does not support, from blockstream
+    one by one. The batches run alongside up to BLOCKSTREAM_QUERY_CONCURRENCY
+    blockstream queries at a time.
+
+    Returns the multiaddr responses and the blockstream response of each bech32 account
+
+    May raise:
+    - RemoteError, requests.exceptions.RequestException or UnableToDecryptRemoteData
+    """
+    legacy_accounts, bech32_accounts = _split_by_address_type(accounts)
+    not_rate_limited = Event()
+    not_rate_limited.set()
+    # +1 for the greenlet querying all the multiaddr batches one after the other
+    pool = Pool(size=BLOCKSTREAM_QUERY_CONCURRENCY + 1)
+    greenlets = []
+    multiaddr_greenlet = None
+    blockstream_greenlets = []
+    try:
+        if len(legacy_accounts) != 0:
+            multiaddr_greenlet = pool.spawn(
+                _query_blockchaininfo_multiaddr,
+                legacy_accounts,
+                blockchaininfo_backoff,
+            )
+            greenlets.append(multiaddr_greenlet)
+        for account in bech32_accounts:
+            greenlet = pool.spawn(_query_blockstream_address, account, not_rate_limited)
+            blockstream_greenlets.append(greenlet)
+            greenlets.append(greenlet)
+        gevent.joinall(greenlets, raise_error=True)
+    finally:
+        pool.kill()
+
+    multiaddr_responses = multiaddr_greenlet.value if multiaddr_greenlet is not None else []
+    blockstream_responses = {
+        account: greenlet.value
+        for account, greenlet in zip(bech32_accounts, blockstream_greenlets)
+    }
+    return multiaddr_responses, blockstream_responses
 
 
 def get_bitcoin_addresses_balances(accounts: List[BTCAddress]) -> Dict[BTCAddress, FVal]:
-    """Queries blockchain.info or blockstream for the balances of accounts
+    """Queries blockchain.info and blockstream for the balances of accounts
 
     May raise:
     - RemotError if there is a problem querying blockchain.info or blockstream
     """
-    source = 'blockchain.info'
-    balances: Dict[BTCAddress, FVal] = {}
     try:
-        if _have_bc1_accounts(accounts):
-            # if 1 account is bech32 we have to query blockstream. blockchaininfo won't work
-            source = 'blockstream'
-            balances = {}
-            for account in accounts:
-                url = f'https://blockstream.info/api/address/{account}'
-                response_data = request_get_dict(url=url, handle_429=True, backoff_in_seconds=4)
-                stats = response_data['chain_stats']
-                balance = int(stats['funded_txo_sum']) - int(stats['spent_txo_sum'])
-                balances[account] = satoshis_to_btc(balance)
-        else:
-            params = '|'.join(accounts)
-            btc_resp = request_get_dict(
-                url=f'https://blockchain.info/multiaddr?active={params}',
-                handle_429=True,
-                # If we get a 429 then their docs suggest 10 seconds
-                # https://blockchain.info/q
-                backoff_in_seconds=10,
-            )
-            for entry in btc_resp['addresses']:
-                balances[entry['address']] = satoshis_to_btc(FVal(entry['final_balance']))
+        multiaddr_responses, blockstream_responses = _query_bitcoin_addresses(
+            accounts=accounts,
+            # If we get a 429 then their docs suggest 10 seconds
+            # https://blockchain.info/q
+            blockchaininfo_backoff=10,
+        )
     except (
             requests.exceptions.RequestException,
             UnableToDecryptRemoteData,
             requests.exceptions.Timeout,
     ) as e:
         raise RemoteError(f'bitcoin external API request for balances failed due to {str(e)}') from e  # noqa: E501
+
+    source = 'blockchain.info'
+    balances: Dict[BTCAddress, FVal] = {}
+    try:
+        for btc_resp in multiaddr_responses:
+            for entry in btc_resp['addresses']:
+                balances[entry['address']] = satoshis_to_btc(FVal(entry['final_balance']))
+
+        source = 'blockstream'
+        for account, response_data in blockstream_responses.items():
+            stats = response_data['chain_stats']
+            balance = int(stats['funded_txo_sum']) - int(stats['spent_txo_sum'])
+            balances[account] = satoshis_to_btc(balance)
     except KeyError as e:
         raise RemoteError(
             f'Malformed response when querying bitcoin blockchain via {source}.'
@@ -58,42 +233,6 @@ def get_bitcoin_addresses_balances(accounts: List[BTCAddress]) -> Dict[BTCAddres
     return balances
 
 
-def _check_blockstream_for_transactions(
-        accounts: List[BTCAddress],
-) -> Dict[BTCAddress, Tuple[bool, FVal]]:
-    """May raise connection errors or KeyError"""
-    have_transactions = {}
-    for account in accounts:
-        url = f'https://blockstream.info/api/address/{account}'
-        response_data = request_get_dict(url=url, handle_429=True, backoff_in_seconds=4)
-        stats = response_data['chain_stats']
-        balance = satoshis_to_btc(int(stats['funded_txo_sum']) - int(stats['spent_txo_sum']))
-        have_txs = stats['tx_count'] != 0
-        have_transactions[account] = (have_txs, balance)
-
-    return have_transactions
-
-
-def _check_blockchaininfo_for_transactions(
-        accounts: List[BTCAddress],
-) -> Dict[BTCAddress, Tuple[bool, FVal]]:
-    """May raise RemotError or KeyError"""
-    have_transactions = {}
-    params = '|'.join(accounts)
-    btc_resp = request_get_dict(
-        url=f'https://blockchain.info/multiaddr?active={params}',
-        handle_429=True,
-        # If we get a 429 then their docs suggest 10 seconds
-        # https://blockchain.infoq/
-        backoff_in_seconds=15,
-    )
-    for entry in btc_resp['addresses']:
-        balance = satoshis_to_btc(entry['final_balance'])
-        have_transactions[entry['address']] = (entry['n_tx'] != 0, balance)
-
-    return have_transactions
-
-
 def have_bitcoin_transactions(accounts: List[BTCAddress]) -> Dict[BTCAddress, Tuple[bool, FVal]]:
     """
     Takes a list of addresses and returns a mapping of which addresses have had transactions
@@ -103,18 +242,30 @@ def have_bitcoin_transactions(accounts: List[BTCAddress]) -> Dict[BTCAddress, Tu
     - RemoteError if any of the queried websites fail to be queried
     """
     try:
-        if _have_bc1_accounts(accounts):
-            source = 'blockstream'
-            have_transactions = _check_blockstream_for_transactions(accounts)
-        else:
-            source = 'blockchain.info'
-            have_transactions = _check_blockchaininfo_for_transactions(accounts)
+        multiaddr_responses, blockstream_responses = _query_bitcoin_addresses(
+            accounts=accounts,
+            blockchaininfo_backoff=15,
+        )
     except (
             requests.exceptions.RequestException,
             UnableToDecryptRemoteData,
             requests.exceptions.Timeout,
     ) as e:
         raise RemoteError(f'bitcoin external API request for transactions failed due to {str(e)}') from e  # noqa: E501
+
+    source = 'blockchain.info'
+    have_transactions = {}
+    try:
+        for btc_resp in multiaddr_responses:
+            for entry in btc_resp['addresses']:
+                balance = satoshis_to_btc(entry['final_balance'])
+                have_transactions[entry['address']] = (entry['n_tx'] != 0, balance)
+
+        source = 'blockstream'
+        for account, response_data in blockstream_responses.items():
+            stats = response_data['chain_stats']
+            balance = satoshis_to_btc(int(stats['funded_txo_sum']) - int(stats['spent_txo_sum']))
+            have_transactions[account] = (stats['tx_count'] != 0, balance)
     except KeyError as e:
         raise RemoteError(
             f'Malformed response when querying bitcoin blockchain via {source}.'
@@ -1,6 +1,8 @@
 import logging
+from functools import lru_cache
 from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Tuple
 
+import gevent
 from gevent.lock import Semaphore
 
 from rotkehlchen.chain.bitcoin import have_bitcoin_transactions
@@ -16,6 +18,11 @@ if TYPE_CHECKING:
 
 log = logging.getLogger(__name__)
 
+# Derived addresses are kept in memory so that the periodic checks for new xpub addresses
+# do not derive the unused addresses after the last used one again every time
+XPUB_DERIVED_ADDRESSES_CACHE_SIZE = 10000
+XPUB_CHAIN_ROOTS_CACHE_SIZE = 256
+
 
 class XpubData(NamedTuple):
     xpub: HDKey
@@ -62,54 +69,82 @@ class XpubDerivedAddressData(NamedTuple):
     balance: FVal
 
 
+@lru_cache(maxsize=XPUB_CHAIN_ROOTS_CACHE_SIZE)
+def _derive_chain_root(xpub_data: XpubData, account_index: int) -> HDKey:
+    """Derives the root of the receiving (0) or change (1) addresses of the xpub"""
+    if xpub_data.derivation_path is not None:
+        account_xpub = xpub_data.xpub.derive_path(xpub_data.derivation_path)
+    else:
+        account_xpub = xpub_data.xpub
+
+    return account_xpub.derive_child(account_index)
+
+
+@lru_cache(maxsize=XPUB_DERIVED_ADDRESSES_CACHE_SIZE)
+def _derive_address(xpub_data: XpubData, account_index: int, index: int) -> BTCAddress:
+    return _derive_chain_root(xpub_data, account_index).derive_child(index).address()
+
+
+def _derive_addresses(
+        xpub_data: XpubData,
+        account_index: int,
+        start_index: int,
+        end_index: int,
+) -> List[Tuple[int, BTCAddress]]:
+    return [
+        (idx, _derive_address(xpub_data, account_index, idx))
+        for idx in range(start_index, end_index)
+    ]
+
+
 def _derive_addresses_loop(
+        xpub_data: XpubData,
         account_index: int,
         start_index: int,
-        root: HDKey,
         gap_limit: int,
 ) -> List[XpubDerivedAddressData]:
-    """May raise:
+    """Derives and checks batches of gap_limit addresses until a batch has no address
+    with transactions. The derivation runs in a thread of the gevent hub's threadpool
+    so that deriving large batches does not block the other greenlets.
+
+    May raise:
     - RemoteError: if blockstream/blockchain.info can't be reached
     """
     step_index = start_index
-    addresses: List[XpubDerivedAddressData] = []
+    used_addresses: List[XpubDerivedAddressData] = []
+    unused_addresses: List[XpubDerivedAddressData] = []
     should_continue = True
     while should_continue:
-        batch_addresses: List[Tuple[int, BTCAddress]] = []
-        for idx in range(step_index, step_index + gap_limit):
-            child = root.derive_child(idx)
-            batch_addresses.append((idx, child.address()))
-
+        batch_addresses = gevent.get_hub().threadpool.apply(
+            _derive_addresses,
+            (xpub_data, account_index, step_index, step_index + gap_limit),
+        )
         have_tx_mapping = have_bitcoin_transactions([x[1] for x in batch_addresses])
         should_continue = False
         for idx, address in batch_addresses:
             have_tx, balance = have_tx_mapping[address]
+            entry = XpubDerivedAddressData(
+                account_index=account_index,
+                derived_index=idx,
+                address=address,
+                balance=balance,
+            )
             if have_tx:
-                addresses.append(XpubDerivedAddressData(
-                    account_index=account_index,
-                    derived_index=idx,
-                    address=address,
-                    balance=balance,
-                ))
+                used_addresses.append(entry)
                 should_continue = True
-
-        # do one more pass and add any addresses with no transactions before the max index
-        # this is so we can start new address generation from the max index later
-        if len(addresses) != 0:
-            max_index = max(x[0] for x in addresses)
-            for idx, address in batch_addresses[:max_index]:
-                have_tx, balance = have_tx_mapping[address]
-                if not have_tx:
-                    addresses.append(XpubDerivedAddressData(
-                        account_index=account_index,
-                        derived_index=idx,
-                        address=address,
-                        balance=balance,
-                    ))
+            else:
+                unused_addresses.append(entry)
 
         step_index += gap_limit
 
-    return addresses
+    if len(used_addresses) == 0:
+        return []
+
+    # also add any addresses with no transactions before the max index of all batches.
+    # This is so we can start new address generation from the max index later
+    max_index = used_addresses[-1].derived_index
+    addresses = used_addresses + [x for x in unused_addresses if x.derived_index < max_index]
+    return sorted(addresses, key=lambda x: x.derived_index)
 
 
 def _derive_addresses_from_xpub_data(
@@ -125,27 +160,20 @@ def _derive_addresses_from_xpub_data(
     May raise:
     - RemoteError: if blockstream/blockchain.info and others can't be reached
     """
-    if xpub_data.derivation_path is not None:
-        account_xpub = xpub_data.xpub.derive_path(xpub_data.derivation_path)
-    else:
-        account_xpub = xpub_data.xpub
-
     addresses = []
-    receiving_xpub = account_xpub.derive_child(0)
     addresses.extend(
         _derive_addresses_loop(
+            xpub_data=xpub_data,
             account_index=0,
             start_index=start_receiving_index,
-            root=receiving_xpub,
             gap_limit=gap_limit,
         ),
     )
-    change_xpub = account_xpub.derive_child(1)
     addresses.extend(
         _derive_addresses_loop(
+            xpub_data=xpub_data,
             account_index=1,
             start_index=start_change_index,
-            root=change_xpub,
             gap_limit=gap_limit,
         ),
     )
@@ -1,15 +1,18 @@
 import json
 import logging
 import random
+import time
 from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union, overload
 from urllib.parse import urlparse
 
+import gevent
 import requests
 from ens import ENS
 from ens.abis import ENS as ENS_ABI, RESOLVER as ENS_RESOLVER_ABI
 from ens.main import ENS_MAINNET_ADDR
 from ens.utils import is_none_or_zero_address, normal_name_to_hash, normalize_name
 from eth_typing import BlockNumber, HexStr
+from gevent.pool import Pool
 from typing_extensions import Literal
 from web3 import HTTPProvider, Web3
 from web3._utils.abi import get_abi_output_types
@@ -76,6 +79,28 @@ def _is_synchronized(current_block: int, latest_block: int) -> Tuple[bool, str]:
 
 
 WEB3_LOGQUERY_BLOCK_RANGE = 250000
+ETHERSCAN_LOGS_BLOCK_RANGE = 300000
+ETHERSCAN_LOGS_LIMIT = 1000  # etherscan returns at most this many logs per query
+# Etherscan allows 5 calls per second with an API key
+ETHERSCAN_CALLS_PER_SECOND = 5
+ETHERSCAN_LOGS_CONCURRENCY = 4
+
+
+def _deserialize_etherscan_log(event: Dict[str, Any]) -> None:
+    """Turn all hex ints of a log returned by etherscan to ints
+
+    May raise:
+    - RemoteError if the log can't be decoded
+    """
+    try:
+        event['address'] = deserialize_ethereum_address(event['address'])
+        for key in ('blockNumber', 'timeStamp', 'gasPrice', 'gasUsed', 'logIndex', 'transactionIndex'):  # noqa: E501
+            event[key] = deserialize_int_from_hex(
+                symbol=event[key],
+                location='etherscan log query',
+            )
+    except (DeserializationError, KeyError) as e:
+        raise RemoteError(f'Couldnt decode an etherscan event due to {str(e)}') from e
 
 
 def _query_web3_get_logs(
@@ -832,8 +857,6 @@ class EthereumManager():
         if event_abi['anonymous']:
             # web3.py does not handle the anonymous events correctly and adds the first topic
             filter_args['topics'] = filter_args['topics'][1:]
-        events: List[Dict[str, Any]] = []
-        start_block = from_block
         if web3 is not None:
             events = _query_web3_get_logs(
                 web3=web3,
@@ -848,73 +871,106 @@ class EthereumManager():
             until_block = (
                 self.etherscan.get_latest_block_number() if to_block == 'latest' else to_block
             )
-            while start_block <= until_block:
-                end_block = min(start_block + 300000, until_block)
-                new_events = self.etherscan.get_logs(
-                    contract_address=contract_address,
-                    topics=filter_args['topics'],  # type: ignore
-                    from_block=start_block,
-                    to_block=end_block,
-                )
+            events = self._get_etherscan_logs(
+                contract_address=contract_address,
+                topics=filter_args['topics'],  # type: ignore
+                from_block=from_block,
+                to_block=until_block,
+            )
 
-                # Turn all Hex ints to ints
-                for e_idx, event in enumerate(new_events):
-                    try:
-                        block_number = deserialize_int_from_hex(
-                            symbol=event['blockNumber'],
-                            location='etherscan log query',
-                        )
-                        log_index = deserialize_int_from_hex(
-                            symbol=event['logIndex'],
-                            location='etherscan log query',
-                        )
-                        # Try to see if the event is a duplicate that got returned
-                        # in the previous iteration
-                        for previous_event in reversed(events):
-                            if previous_event['blockNumber'] < block_number:
-                                break
-
-                            same_event = (
-                                previous_event['logIndex'] == log_index and
-                                previous_event['transactionHash'] == event['transactionHash']
-                            )
-                            if same_event:
-                                events.pop()
+        return events
 
-                        new_events[e_idx]['address'] = deserialize_ethereum_address(
-                            event['address'],
-                        )
-                        new_events[e_idx]['blockNumber'] = block_number
-                        new_events[e_idx]['timeStamp'] = deserialize_int_from_hex(
-                            symbol=event['timeStamp'],
-                            location='etherscan log query',
-                        )
-                        new_events[e_idx]['gasPrice'] = deserialize_int_from_hex(
-                            symbol=event['gasPrice'],
-                            location='etherscan log query',
-                        )
-                        new_events[e_idx]['gasUsed'] = deserialize_int_from_hex(
-                            symbol=event['gasUsed'],
-                            location='etherscan log query',
-                        )
-                        new_events[e_idx]['logIndex'] = log_index
-                        new_events[e_idx]['transactionIndex'] = deserialize_int_from_hex(
-                            symbol=event['transactionIndex'],
-                            location='etherscan log query',
-                        )
-                    except DeserializationError as e:
-                        raise RemoteError(
-                            'Couldnt decode an etherscan event due to {str(e)}}',
-                        ) from e
-
-                # etherscan will only return 1000 events in one go. If more than 1000
-                # are returned such as when no filter args are provided then continue
-                # the query from the last block
-                if len(new_events) == 1000:
-                    start_block = new_events[-1]['blockNumber']
-                else:
-                    start_block = end_block + 1
-                events.extend(new_events)
+    def _get_etherscan_logs(
+            self,
+            contract_address: ChecksumEthAddress,
+            topics: List[str],
+            from_block: int,
+            to_block: int,
+    ) -> List[Dict[str, Any]]:
+        """Queries etherscan for the logs of a contract in a block range
+
+        The range is split in windows that are queried concurrently within the rate
+        limits of etherscan. Etherscan returns at most 1000 logs per query, sorted by
+        block. So when a window hits that cap its logs before the last returned block
+        are kept and the rest of the window is halved and queried again.
+
+        May raise:
+        - RemoteError if there is a problem with reaching etherscan or with the
+        returned result
+        """
+        if self.etherscan.has_api_key():
+            concurrency = ETHERSCAN_LOGS_CONCURRENCY
+            min_interval = 1 / ETHERSCAN_CALLS_PER_SECOND
+        else:  # without an API key etherscan is slow no matter what
+            concurrency, min_interval = 1, 0.0
+
+        windows = [
+            (start, min(start + ETHERSCAN_LOGS_BLOCK_RANGE, to_block))
+            for start in range(from_block, to_block + 1, ETHERSCAN_LOGS_BLOCK_RANGE + 1)
+        ]
+
+        def query_window(window: Tuple[int, int]) -> List[Dict[str, Any]]:
+            window_events = self.etherscan.get_logs(
+                contract_address=contract_address,
+                topics=topics,
+                from_block=window[0],
+                to_block=window[1],
+            )
+            for event in window_events:
+                _deserialize_etherscan_log(event)
+            return window_events
+
+        window_logs: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+        pool = Pool(size=concurrency)
+        last_query_start = 0.0
+        try:
+            while len(windows) != 0:
+                greenlets = {}
+                for window in windows:
+                    pool.wait_available()
+                    wait_secs = last_query_start + min_interval - time.monotonic()
+                    if wait_secs > 0:
+                        gevent.sleep(wait_secs)
+                    last_query_start = time.monotonic()
+                    greenlets[window] = pool.spawn(query_window, window)
+                # any error of a window query is raised here so that no logs go missing
+                gevent.joinall(list(greenlets.values()), raise_error=True)
+
+                windows = []
+                for window, greenlet in sorted(greenlets.items()):
+                    result = greenlet.value
+                    if len(result) < ETHERSCAN_LOGS_LIMIT or window[0] == window[1]:
+                        if len(result) >= ETHERSCAN_LOGS_LIMIT:
+                            log.warning(
+                                f'Etherscan returned {len(result)} logs of {contract_address} '
+                                f'for block {window[0]}. Some of them may be missing',
+                            )
+                        window_logs[window] = result
+                        continue
+
+                    # hit the cap. All logs before the last returned block are complete
+                    last_block = result[-1]['blockNumber']
+                    if last_block > window[0]:
+                        window_logs[(window[0], last_block - 1)] = [
+                            x for x in result if x['blockNumber'] < last_block
+                        ]
+                    if last_block == window[1]:
+                        windows.append((last_block, last_block))
+                    else:
+                        middle = (last_block + window[1]) // 2
+                        windows.extend([(last_block, middle), (middle + 1, window[1])])
+        finally:
+            pool.kill()
+
+        events = []
+        seen_logs = set()
+        for window in sorted(window_logs):
+            for event in window_logs[window]:
+                log_id = (event['transactionHash'], event['logIndex'])
+                if log_id in seen_logs:
+                    continue
+                seen_logs.add(log_id)
+                events.append(event)
 
         return events
 
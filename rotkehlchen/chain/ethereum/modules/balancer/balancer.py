@@ -901,8 +901,7 @@ class Balancer(EthereumModule):
     def _get_known_token_to_prices(self, known_tokens: Set[EthereumToken]) -> TokenToPrices:
         """Get a mapping of known token addresses to USD price"""
         token_to_prices: TokenToPrices = {}
-        for token in known_tokens:
-            usd_price = Inquirer().find_usd_price(token)
+        for token, usd_price in Inquirer().find_usd_prices(known_tokens).items():
             if usd_price == Price(ZERO):
                 self.msg_aggregator.add_error(
                     f"Failed to request the USD price of {token.identifier}. "
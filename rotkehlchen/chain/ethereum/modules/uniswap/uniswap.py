@@ -351,14 +351,12 @@ class Uniswap(EthereumModule):
     ) -> AssetPrice:
         """Get the tokens prices via Inquirer
 
-        Given an asset, if `find_usd_price()` returns zero, it will be added
+        Given an asset, if `find_usd_prices()` returns zero for it, it will be added
         into `unknown_assets`.
         """
         asset_price: AssetPrice = {}
-
-        for known_asset in known_assets:
-            asset_usd_price = Inquirer().find_usd_price(known_asset)
-
+        known_asset_prices = Inquirer().find_usd_prices(known_assets)
+        for known_asset, asset_usd_price in known_asset_prices.items():
             if asset_usd_price != Price(ZERO):
                 asset_price[known_asset.ethereum_address] = asset_usd_price
             else:
@@ -1,6 +1,7 @@
 import logging
 import random
 from collections import defaultdict
+from math import ceil
 from typing import Dict, List, Optional, Sequence, Tuple
 
 from rotkehlchen.chain.ethereum.typing import string_to_ethereum_address
@@ -9,9 +10,7 @@ from rotkehlchen.chain.ethereum.manager import EthereumManager, NodeName
 from rotkehlchen.chain.ethereum.typing import CustomEthereumTokenWithIdentifier
 from rotkehlchen.chain.ethereum.utils import token_normalized_value
 from rotkehlchen.constants.ethereum import ETH_SCAN
-from rotkehlchen.constants.misc import ZERO
 from rotkehlchen.db.dbhandler import DBHandler
-from rotkehlchen.errors import RemoteError
 from rotkehlchen.fval import FVal
 from rotkehlchen.globaldb.handler import GlobalDBHandler
 from rotkehlchen.inquirer import Inquirer
@@ -56,6 +55,45 @@ TokensReturn = Tuple[
 
 ETHERSCAN_MAX_TOKEN_CHUNK_LENGTH = 120
 OTHER_MAX_TOKEN_CHUNK_LENGTH = 590
+# A tokensBalances call checks the balance of every given token for every given account.
+# The chunk lengths above bound the tokens of a call. The accounts of a call are bound by
+# the gas cap nodes put on eth_call. Geth's default cap is 25M gas. Each balance check
+# costs a call to the token contract and a cold storage read. With proxy tokens that can
+# add up to about 10k gas, so a call can do at most 2500 checks.
+ETH_CALL_GAS_LIMIT = 25000000
+TOKEN_BALANCE_CHECK_GAS = 10000
+MAX_TOKEN_BALANCE_CHECKS = ETH_CALL_GAS_LIMIT // TOKEN_BALANCE_CHECK_GAS
+# For etherscan the limit is the request URI length. It grows by one ABI word per account
+# or token address and a single account call can have ETHERSCAN_MAX_TOKEN_CHUNK_LENGTH tokens
+
+
+def get_token_chunk_sizes(
+        accounts_num: int,
+        tokens_num: int,
+        max_tokens: int,
+        max_addresses: Optional[int],
+) -> Tuple[int, int]:
+    """Find the account and token chunk lengths that need the fewest tokensBalances calls
+
+    Each call can have at most `max_tokens` tokens, check at most MAX_TOKEN_BALANCE_CHECKS
+    balances (accounts x tokens) and if given, have at most `max_addresses` account and
+    token addresses in total.
+    """
+    best_sizes = (1, 1)
+    best_calls = None
+    for accounts_chunk in range(1, accounts_num + 1):
+        tokens_chunk = min(tokens_num, max_tokens, MAX_TOKEN_BALANCE_CHECKS // accounts_chunk)
+        if max_addresses is not None:
+            tokens_chunk = min(tokens_chunk, max_addresses - accounts_chunk)
+        if tokens_chunk < 1:
+            break
+
+        calls = ceil(accounts_num / accounts_chunk) * ceil(tokens_num / tokens_chunk)
+        if best_calls is None or calls < best_calls:
+            best_sizes = (accounts_chunk, tokens_chunk)
+            best_calls = calls
+
+    return best_sizes
 
 
 class EthTokens():
@@ -64,44 +102,6 @@ class EthTokens():
         self.db = database
         self.ethereum = ethereum
 
-    def detect_tokens_for_address(
-            self,
-            address: ChecksumEthAddress,
-            token_usd_price: Dict[EthereumToken, Price],
-            etherscan_chunks: List[List[CustomEthereumTokenWithIdentifier]],
-            other_chunks: List[List[CustomEthereumTokenWithIdentifier]],
-    ) -> Dict[EthereumToken, FVal]:
-        balances: Dict[EthereumToken, FVal] = defaultdict(FVal)
-        if self.ethereum.connected_to_any_web3():
-            call_order = []
-            if NodeName.OWN in self.ethereum.web3_mapping:
-                call_order = [NodeName.OWN]
-            for chunk in other_chunks:
-                self._get_tokens_balance_and_price(
-                    address=address,
-                    tokens=chunk,
-                    balances=balances,
-                    token_usd_price=token_usd_price,
-                    call_order=call_order + random.sample(
-                        (NodeName.MYCRYPTO, NodeName.BLOCKSCOUT, NodeName.AVADO_POOL),
-                        3,
-                    ),
-                )
-        else:
-            for chunk in etherscan_chunks:
-                self._get_tokens_balance_and_price(
-                    address=address,
-                    tokens=chunk,
-                    balances=balances,
-                    token_usd_price=token_usd_price,
-                    call_order=(NodeName.ETHERSCAN,),
-                )
-
-        # now that detection happened we also have to save it in the DB for the address
-        self.db.save_tokens_for_address(address, list(balances.keys()))
-
-        return balances
-
     def query_tokens_for_addresses(
             self,
             addresses: List[ChecksumEthAddress],
@@ -125,75 +125,122 @@ class EthTokens():
             # can be 1 CRV locked for 4 years or 4 CRV locked for 1 year etc.
             string_to_ethereum_address('0x5f3b5DfEb7B28CDbD7FAba78963EE202a494e2A2'),
         ])
-        # With etherscan with chunks > 120, we get request uri too large
-        # so the limitation is not in the gas, but in the request uri length
-        etherscan_chunks = list(get_chunks(all_tokens, n=ETHERSCAN_MAX_TOKEN_CHUNK_LENGTH))
-        other_chunks = list(get_chunks(all_tokens, n=OTHER_MAX_TOKEN_CHUNK_LENGTH))
         now = ts_now()
-        token_usd_price: Dict[EthereumToken, Price] = {}
-        result = {}
-
+        detect_addresses = []
+        saved_tokens: Dict[ChecksumEthAddress, List[EthereumToken]] = {}
         for address in addresses:
             saved_list = self.db.get_tokens_for_address_if_time(address=address, current_time=now)
             if force_detection or saved_list is None:
-                balances = self.detect_tokens_for_address(
-                    address=address,
-                    token_usd_price=token_usd_price,
-                    etherscan_chunks=etherscan_chunks,
-                    other_chunks=other_chunks,
-                )
-            else:
-                if len(saved_list) == 0:
-                    continue  # Do not query if we know the address has no tokens
-
-                balances = defaultdict(FVal)
-                self._get_tokens_balance_and_price(
-                    address=address,
-                    tokens=[x.to_custom_ethereum_token() for x in saved_list],
-                    balances=balances,
-                    token_usd_price=token_usd_price,
-                    call_order=None,  # use defaults
-                )
+                detect_addresses.append(address)
+            elif len(saved_list) != 0:  # Do not query if we know the address has no tokens
+                saved_tokens[address] = saved_list
+
+        balances = self._get_tokens_balances(addresses=detect_addresses, tokens=all_tokens)
+        for address in detect_addresses:
+            # now that detection happened we also have to save it in the DB for the address
+            self.db.save_tokens_for_address(address, list(balances[address].keys()))
+
+        # Query the union of all saved tokens so that the addresses can be batched
+        # and only keep the balances of the tokens saved for each address
+        saved_union = {token for tokens in saved_tokens.values() for token in tokens}
+        saved_balances = self._get_tokens_balances(
+            addresses=list(saved_tokens.keys()),
+            tokens=[
+                x.to_custom_ethereum_token()
+                for x in sorted(saved_union, key=lambda x: x.identifier)
+            ],
+        )
+        for address, tokens in saved_tokens.items():
+            address_tokens = set(tokens)
+            balances[address] = defaultdict(FVal, {
+                token: value for token, value in saved_balances[address].items()
+                if token in address_tokens
+            })
+
+        result = {}
+        for address in addresses:
+            if address not in balances:
+                continue
 
-            result[address] = balances
+            result[address] = balances[address]
 
+        token_usd_price = Inquirer().find_usd_prices(
+            token for address_balances in result.values() for token in address_balances
+        )
         return result, token_usd_price
 
-    def _get_tokens_balance_and_price(
+    def _get_tokens_balances(
             self,
-            address: ChecksumEthAddress,
+            addresses: List[ChecksumEthAddress],
             tokens: List[CustomEthereumTokenWithIdentifier],
-            balances: Dict[EthereumToken, FVal],
-            token_usd_price: Dict[EthereumToken, Price],
-            call_order: Optional[Sequence[NodeName]],
-    ) -> None:
-        ret = self._get_multitoken_account_balance(
-            tokens=tokens,
-            account=address,
-            call_order=call_order,
+    ) -> Dict[ChecksumEthAddress, Dict[EthereumToken, FVal]]:
+        """Queries the balances of all given tokens for all given addresses
+
+        The accounts and tokens are packed into as few tokensBalances calls as the
+        gas limit of the nodes and the request URI length limit of etherscan allow.
+
+        May raise:
+        - RemoteError if no node could be queried
+        - BadFunctionCallOutput if a local node is used and the contract for the
+          token has no code. That means the chain is not synced
+        """
+        balances: Dict[ChecksumEthAddress, Dict[EthereumToken, FVal]] = {
+            x: defaultdict(FVal) for x in addresses
+        }
+        if len(addresses) == 0 or len(tokens) == 0:
+            return balances
+
+        own_call_order = []
+        if self.ethereum.connected_to_any_web3():
+            if NodeName.OWN in self.ethereum.web3_mapping:
+                own_call_order = [NodeName.OWN]
+            max_tokens = OTHER_MAX_TOKEN_CHUNK_LENGTH
+            max_addresses = None
+        else:
+            # With etherscan with chunks > 120, we get request uri too large
+            # so the limitation is not in the gas, but in the request uri length
+            max_tokens = ETHERSCAN_MAX_TOKEN_CHUNK_LENGTH
+            max_addresses = ETHERSCAN_MAX_TOKEN_CHUNK_LENGTH + 1
+
+        accounts_chunk, tokens_chunk = get_token_chunk_sizes(
+            accounts_num=len(addresses),
+            tokens_num=len(tokens),
+            max_tokens=max_tokens,
+            max_addresses=max_addresses,
         )
-        for token_identifier, value in ret.items():
-            token = EthereumToken.from_identifier(token_identifier)
-            if token is None:  # should not happen
-                log.warning(
-                    f'Could not initialize token with identifier {token_identifier}. '
-                    f'Should not happen. Skipping its token balance query',
+        for accounts in get_chunks(addresses, n=accounts_chunk):
+            for tokens_part in get_chunks(tokens, n=tokens_chunk):
+                if max_addresses is None:
+                    call_order = own_call_order + random.sample(
+                        (NodeName.MYCRYPTO, NodeName.BLOCKSCOUT, NodeName.AVADO_POOL),
+                        3,
+                    )
+                else:
+                    call_order = [NodeName.ETHERSCAN]
+
+                ret = self._get_multitoken_multiaccount_balance(
+                    tokens=tokens_part,
+                    accounts=accounts,
+                    call_order=call_order,
                 )
-                continue
-            balances[token] += value
-            if token in token_usd_price:
-                continue
-            # else get the price
-            try:
-                usd_price = Inquirer().find_usd_price(token)
-            except RemoteError:
-                usd_price = Price(ZERO)
-            token_usd_price[token] = usd_price
+                for token_identifier, account_balances in ret.items():
+                    token = EthereumToken.from_identifier(token_identifier)
+                    if token is None:  # should not happen
+                        log.warning(
+                            f'Could not initialize token with identifier {token_identifier}. '
+                            f'Should not happen. Skipping its token balance query',
+                        )
+                        continue
+                    for account, value in account_balances.items():
+                        balances[account][token] += value
+
+        return balances
 
     def _get_multitoken_multiaccount_balance(
             self,
             tokens: List[CustomEthereumTokenWithIdentifier],
             accounts: List[ChecksumEthAddress],
+            call_order: Optional[Sequence[NodeName]],
     ) -> Dict[str, Dict[ChecksumEthAddress, FVal]]:
         """Queries a list of accounts for balances of multiple tokens
 
@@ -216,6 +263,7 @@ class EthTokens():
             ethereum=self.ethereum,
             method_name='tokensBalances',
             arguments=[accounts, [x.address for x in tokens]],
+            call_order=call_order,
         )
         for acc_idx, account in enumerate(accounts):
             for tk_idx, token in enumerate(tokens):
@@ -225,43 +273,3 @@ class EthTokens():
                         token_amount=token_amount, token=token,
                     )
         return balances
-
-    def _get_multitoken_account_balance(
-            self,
-            tokens: List[CustomEthereumTokenWithIdentifier],
-            account: ChecksumEthAddress,
-            call_order: Optional[Sequence[NodeName]],
-    ) -> Dict[str, FVal]:
-        """Queries balances of multiple tokens for an account
-
-        Return a dictionary with keys being tokens and value a dictionary of
-        account to balances
-
-        May raise:
-        - RemoteError if an external service such as Etherscan is queried and
-          there is a problem with its query.
-        - BadFunctionCallOutput if a local node is used and the contract for the
-          token has no code. That means the chain is not synced
-        """
-        log.debug(
-            'Querying ethereum chain for multi token account balances',
-            eth_address=account,
-            tokens_num=len(tokens),
-        )
-        balances: Dict[str, FVal] = {}
-        result = ETH_SCAN.call(
-            ethereum=self.ethereum,
-            method_name='tokensBalance',
-            arguments=[account, [x.address for x in tokens]],
-            call_order=call_order,
-        )
-        for tk_idx, token in enumerate(tokens):
-            token_amount = result[tk_idx]
-            if token_amount != 0:
-                normalized_amount = token_normalized_value(token_amount, token)
-                log.debug(
-                    f'Found {token.symbol}({token.address}) token balance for '
-                    f'{account} and amount {normalized_amount}',
-                )
-                balances[token.identifier] = normalized_amount
-        return balances
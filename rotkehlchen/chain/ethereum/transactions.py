@@ -93,26 +93,27 @@ class EthTransactions(LockableQueryMixIn):
                         f'internal: {internal}',
                     )
 
-        # add new transactions to the DB
-        if new_transactions != []:
-            self.database.add_ethereum_transactions(new_transactions, from_etherscan=True)
-            # And since at least for now the increasingly negative nonce for the internal
-            # transactions happens only in the DB writing, requery the entire batch from
-            # the DB to get the updated transactions
-            transactions = self.database.get_ethereum_transactions(
-                from_ts=start_ts,
-                to_ts=end_ts,
-                address=address,
+        with self.database.unit_of_work():
+            # add new transactions to the DB
+            if new_transactions != []:
+                self.database.add_ethereum_transactions(new_transactions, from_etherscan=True)
+                # And since at least for now the increasingly negative nonce for the internal
+                # transactions happens only in the DB writing, requery the entire batch from
+                # the DB to get the updated transactions
+                transactions = self.database.get_ethereum_transactions(
+                    from_ts=start_ts,
+                    to_ts=end_ts,
+                    address=address,
+                )
+
+            # and also set the last queried timestamps for the address
+            ranges.update_used_query_range(
+                location_string=f'ethtxs_{address}',
+                start_ts=start_ts,
+                end_ts=end_ts,
+                ranges_to_query=ranges_to_query,
             )
 
-        # and also set the last queried timestamps for the address
-        ranges.update_used_query_range(
-            location_string=f'ethtxs_{address}',
-            start_ts=start_ts,
-            end_ts=end_ts,
-            ranges_to_query=ranges_to_query,
-        )
-
         return self._return_transactions_maybe_limit(
             address=address,
             transactions=transactions,
@@ -5,6 +5,7 @@ BCH_BSV_FORK_TS = 1542304352  # 2018-11-15 18:52:00 UTC
 ROTKEHLCHEN_SERVER_TIMEOUT = 5
 GLOBAL_REQUESTS_TIMEOUT = 5  # perhaps consolidate this and the one above?
 
+HOUR_IN_SECONDS = 3600
 DAY_IN_SECONDS = 24 * 3600
 WEEK_IN_SECONDS = DAY_IN_SECONDS * 7
 MONTH_IN_SECONDS = WEEK_IN_SECONDS * 4
@@ -1,5 +1,6 @@
 import base64
 from binascii import hexlify
+from typing import Iterable, Iterator
 
 from coincurve import PrivateKey
 from Crypto import Random
@@ -14,13 +15,8 @@ from rotkehlchen.typing import BinaryEthAddress, EthAddress
 def encrypt(key: bytes, source: bytes) -> str:
     assert isinstance(key, bytes), 'key should be given in bytes'
     assert isinstance(source, bytes), 'source should be given in bytes'
-    key = SHA256.new(key).digest()  # use SHA-256 over our key to get a proper-sized AES key
-    iv = Random.new().read(AES.block_size)  # generate iv
-    encryptor = AES.new(key, AES.MODE_CBC, iv)
-    padding = AES.block_size - len(source) % AES.block_size  # calculate needed padding
-    source += bytes([padding]) * padding  # Python 2.x: source += chr(padding) * padding
-    data = iv + encryptor.encrypt(source)  # store the iv at the beginning and encrypt
-    return base64.b64encode(data).decode("latin-1")
+    data = b''.join(b64encode_stream(encrypt_stream(key, [source])))
+    return data.decode("latin-1")
 
 
 def decrypt(key: bytes, given_source: str) -> bytes:
@@ -32,19 +28,98 @@ def decrypt(key: bytes, given_source: str) -> bytes:
     """
     assert isinstance(key, bytes), 'key should be given in bytes'
     assert isinstance(given_source, str), 'source should be given in string'
-    source = base64.b64decode(given_source.encode("latin-1"))
+    source = b64decode_stream([given_source.encode("latin-1")])
+    return b''.join(decrypt_stream(key, source))
+
+
+def encrypt_stream(key: bytes, source: Iterable[bytes]) -> Iterator[bytes]:
+    """Encrypts the chunks of source data with the given key as they are read
+
+    The output is the same as that of `encrypt` before its b64 encoding. Only the
+    chunk being encrypted and less than a block of the data are kept in memory.
+    """
+    key = SHA256.new(key).digest()  # use SHA-256 over our key to get a proper-sized AES key
+    iv = Random.new().read(AES.block_size)  # generate iv
+    encryptor = AES.new(key, AES.MODE_CBC, iv)
+    yield iv  # store the iv at the beginning
+    remainder = b''
+    for chunk in source:
+        data = remainder + chunk
+        cut = len(data) - len(data) % AES.block_size
+        remainder = data[cut:]
+        if cut != 0:
+            yield encryptor.encrypt(data[:cut])
+
+    padding = AES.block_size - len(remainder)  # calculate needed padding
+    yield encryptor.encrypt(remainder + bytes([padding]) * padding)
+
+
+def decrypt_stream(key: bytes, source: Iterable[bytes]) -> Iterator[bytes]:
+    """Decrypts the chunks of data encrypted by `encrypt_stream` as they are read
+
+    The last block is held back until the end of the source since it contains
+    the padding. May raise UnableToDecryptRemoteData, but only once all other
+    data has been decrypted, so consumers should not use it before that.
+    """
     key = SHA256.new(key).digest()  # use SHA-256 over our key to get a proper-sized AES key
-    iv = source[:AES.block_size]  # extract the iv from the beginning
-    decryptor = AES.new(key, AES.MODE_CBC, iv)
-    data = decryptor.decrypt(source[AES.block_size:])  # decrypt
-    padding = data[-1]  # pick the padding value from the end; Python 2.x: ord(data[-1])
-    if data[-padding:] != bytes([padding]) * padding:  # Python 2.x: chr(padding) * padding
-        raise UnableToDecryptRemoteData(
-            'Invalid padding when decrypting the DB data we received from the server. '
-            'Are you using a new user and if yes have you used the same password as before? '
-            'If you have then please open a bug report.',
-        )
-    return data[:-padding]  # remove the padding
+    decryptor = None
+    data = b''
+    for chunk in source:
+        data += chunk
+        if decryptor is None:
+            if len(data) < AES.block_size:
+                continue
+            # extract the iv from the beginning
+            decryptor = AES.new(key, AES.MODE_CBC, data[:AES.block_size])
+            data = data[AES.block_size:]
+
+        cut = len(data) - len(data) % AES.block_size
+        if cut == len(data):
+            cut -= AES.block_size
+        if cut > 0:
+            yield decryptor.decrypt(data[:cut])
+            data = data[cut:]
+
+    if decryptor is not None and len(data) == AES.block_size:
+        data = decryptor.decrypt(data)
+        padding = data[-1]  # pick the padding value from the end
+        if 0 < padding <= AES.block_size and data[-padding:] == bytes([padding]) * padding:
+            yield data[:-padding]  # remove the padding
+            return
+
+    raise UnableToDecryptRemoteData(
+        'Invalid padding when decrypting the DB data we received from the server. '
+        'Are you using a new user and if yes have you used the same password as before? '
+        'If you have then please open a bug report.',
+    )
+
+
+def b64encode_stream(source: Iterable[bytes]) -> Iterator[bytes]:
+    """B64 encodes the chunks of source data as they are read"""
+    remainder = b''
+    for chunk in source:
+        data = remainder + chunk
+        cut = len(data) - len(data) % 3
+        remainder = data[cut:]
+        if cut != 0:
+            yield base64.b64encode(data[:cut])
+
+    if len(remainder) != 0:
+        yield base64.b64encode(remainder)
+
+
+def b64decode_stream(source: Iterable[bytes]) -> Iterator[bytes]:
+    """B64 decodes the chunks of b64 encoded data as they are read"""
+    remainder = b''
+    for chunk in source:
+        data = remainder + chunk
+        cut = len(data) - len(data) % 4
+        remainder = data[cut:]
+        if cut != 0:
+            yield base64.b64decode(data[:cut])
+
+    if len(remainder) != 0:
+        yield base64.b64decode(remainder)
 
 
 def sha3(data: bytes) -> bytes:
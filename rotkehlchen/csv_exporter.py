@@ -51,6 +51,27 @@ FILENAME_LOAN_SETTLEMENTS_CSV = 'loan_settlements.csv'
 FILENAME_DEFI_EVENTS_CSV = 'defi_events.csv'
 FILENAME_LEDGER_ACTIONS_CSV = 'ledger_actions.csv'
 FILENAME_ALL_CSV = 'all_events.csv'
+# The keys of the all events entries that have FVal values
+ALL_EVENTS_FVAL_KEYS = (
+    'paid_in_profit_currency',
+    'paid_in_asset',
+    'taxable_amount',
+    'taxable_bought_cost_in_profit_currency',
+    'taxable_received_in_profit_currency',
+    'received_in_asset',
+    'net_profit_or_loss',
+)
+CSV_LISTS = (
+    'trades_csv',
+    'loan_profits_csv',
+    'asset_movements_csv',
+    'tx_gas_costs_csv',
+    'margin_positions_csv',
+    'loan_settlements_csv',
+    'defi_events_csv',
+    'ledger_actions_csv',
+    'all_events_csv',
+)
 
 
 class CSVWriteError(Exception):
@@ -112,6 +133,37 @@ class CSVExporter():
             self.all_events_csv: List[Dict[str, Any]] = []
             self.all_events = []
 
+    def serialize_for_checkpoint(self) -> Dict[str, Any]:
+        """Serialize the events gathered so far for a PnL checkpoint
+
+        The values of the CSV rows are only ever written out as strings so they are
+        kept as strings. The FVals of the all events entries are restored.
+        """
+        if not self.create_csv:
+            return {}
+
+        result: Dict[str, Any] = {'all_events': self.all_events}
+        for name in CSV_LISTS:
+            result[name] = getattr(self, name)
+        return result
+
+    def restore_from_checkpoint(self, data: Dict[str, Any]) -> None:
+        """Restore the events gathered up to a PnL checkpoint
+
+        May raise:
+        - KeyError
+        - ValueError
+        """
+        if not self.create_csv:
+            return
+
+        for entry in data['all_events']:
+            for key in ALL_EVENTS_FVAL_KEYS:
+                entry[key] = FVal(entry[key])
+        self.all_events = data['all_events']
+        for name in CSV_LISTS:
+            setattr(self, name, data[name])
+
     def timestamp_to_date(self, timestamp: Timestamp) -> str:
         return timestamp_to_date(
             timestamp,
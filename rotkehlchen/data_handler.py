@@ -6,13 +6,22 @@ import tempfile
 import time
 import zlib
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from rotkehlchen.assets.asset import Asset
-from rotkehlchen.crypto import decrypt, encrypt
+from rotkehlchen.crypto import (
+    b64decode_stream,
+    b64encode_stream,
+    decrypt_stream,
+    encrypt_stream,
+)
 from rotkehlchen.db.dbhandler import DBHandler
 from rotkehlchen.db.settings import ModifiableDBSettings
-from rotkehlchen.errors import AuthenticationError, SystemPermissionError
+from rotkehlchen.errors import (
+    AuthenticationError,
+    SystemPermissionError,
+    UnableToDecryptRemoteData,
+)
 from rotkehlchen.logging import RotkehlchenLogsAdapter
 from rotkehlchen.typing import B64EncodedBytes, B64EncodedString, Timestamp
 from rotkehlchen.user_messages import MessagesAggregator
@@ -21,13 +30,53 @@ from rotkehlchen.utils.misc import timestamp_to_date, ts_now
 logger = logging.getLogger(__name__)
 log = RotkehlchenLogsAdapter(logger)
 
+# Size of the chunks the DB is streamed in when exporting and importing it
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def _read_file_chunks(path: Path) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+            yield chunk
+
+
+def _compress_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level=9)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if len(compressed) != 0:
+            yield compressed
+    yield compressor.flush()
+
+
+def _decompress_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """May raise zlib.error if the data is not valid zlib compressed data"""
+    decompressor = zlib.decompressobj()
+    for chunk in chunks:
+        # Bound the output of each step since compressed data can expand a lot
+        data = chunk
+        while len(data) != 0:
+            decompressed = decompressor.decompress(data, STREAM_CHUNK_SIZE)
+            if len(decompressed) != 0:
+                yield decompressed
+            data = decompressor.unconsumed_tail
+    yield decompressor.flush()
+    if not decompressor.eof:
+        raise zlib.error('Incomplete or truncated compressed data')
+
 
 class DataHandler():
 
-    def __init__(self, data_directory: Path, msg_aggregator: MessagesAggregator):
+    def __init__(
+            self,
+            data_directory: Path,
+            msg_aggregator: MessagesAggregator,
+            sqlite_wal: bool = False,
+    ):
 
         self.logged_in = False
         self.data_directory = data_directory
+        self.sqlite_wal = sqlite_wal
         self.username = 'no_user'
         self.password = ''
         self.msg_aggregator = msg_aggregator
@@ -112,6 +161,7 @@ class DataHandler():
             password=password,
             msg_aggregator=self.msg_aggregator,
             initial_settings=initial_settings,
+            sqlite_wal=self.sqlite_wal,
         )
         self.user_data_dir = user_data_dir
         self.logged_in = True
@@ -183,25 +233,63 @@ class DataHandler():
 
         return users
 
-    def compress_and_encrypt_db(self, password: str) -> Tuple[B64EncodedBytes, str]:
+    def export_encrypted_db(self, password: str, destination: Path) -> Tuple[str, int]:
         """Decrypt the DB, dump in temporary plaintextdb, compress it,
-        and then re-encrypt it
+        and then re-encrypt it into a b64 encoded blob saved at the destination file
+
+        The plaintext DB is streamed through compression, encryption and b64 encoding
+        in chunks so memory use does not depend on the DB size.
 
-        Returns a b64 encoded binary blob"""
+        Returns the b64 encoded hash of the plaintext DB and the size of the
+        encrypted blob before its b64 encoding"""
         log.info('Compress and encrypt DB')
+        hasher = hashlib.sha256()
+        encrypted_size = 0
+
+        def hash_plaintext(chunks: Iterator[bytes]) -> Iterator[bytes]:
+            for chunk in chunks:
+                hasher.update(chunk)
+                yield chunk
+
+        def count_encrypted(chunks: Iterator[bytes]) -> Iterator[bytes]:
+            nonlocal encrypted_size
+            for chunk in chunks:
+                encrypted_size += len(chunk)
+                yield chunk
+
         with tempfile.TemporaryDirectory() as tmpdirname:
             tempdb = Path(tmpdirname) / 'temp.db'
             self.db.export_unencrypted(tempdb)
-            with open(tempdb, 'rb') as f:
-                data_blob = f.read()
+            compressed = _compress_stream(hash_plaintext(_read_file_chunks(tempdb)))
+            encrypted = count_encrypted(encrypt_stream(password.encode(), compressed))
+            with open(destination, 'wb') as f:
+                for chunk in b64encode_stream(encrypted):
+                    f.write(chunk)
 
-        original_data_hash = base64.b64encode(
-            hashlib.sha256(data_blob).digest(),
-        ).decode()
-        compressed_data = zlib.compress(data_blob, level=9)
-        encrypted_data = encrypt(password.encode(), compressed_data)
+        original_data_hash = base64.b64encode(hasher.digest()).decode()
+        self.db.cache_data_hash(original_data_hash, encrypted_size)
+        return original_data_hash, encrypted_size
 
-        return B64EncodedBytes(encrypted_data.encode()), original_data_hash
+    def compress_and_encrypt_db(self, password: str) -> Tuple[B64EncodedBytes, str]:
+        """Same as export_encrypted_db but returns the b64 encoded blob in memory
+        along with the hash of the plaintext DB"""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            blob_path = Path(tmpdirname) / 'blob'
+            original_data_hash, _ = self.export_encrypted_db(password, blob_path)
+            with open(blob_path, 'rb') as f:
+                return B64EncodedBytes(f.read()), original_data_hash
+
+    def get_db_hash_and_size(self, password: str) -> Tuple[str, int]:
+        """Returns the hash of the DB data and the size of its compressed and encrypted blob
+
+        The DB is only exported again if its data changed since the last export"""
+        cached_data_hash = self.db.get_cached_data_hash()
+        if cached_data_hash is not None:
+            return cached_data_hash
+
+        log.debug('DB data changed since last export', tables=self.db.get_changed_tables())
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            return self.export_encrypted_db(password, Path(tmpdirname) / 'blob')
 
     def decompress_and_decrypt_db(self, password: str, encrypted_data: B64EncodedString) -> None:
         """Decrypt and decompress the encrypted data we receive from the server
@@ -209,7 +297,8 @@ class DataHandler():
         If successful then replace our local Database
 
         May Raise:
-        - UnableToDecryptRemoteData due to decrypt()
+        - UnableToDecryptRemoteData due to decrypt_stream() or if the decrypted
+        data can't be decompressed
         - DBUpgradeError if the rotki DB version is newer than the software or
         there is a DB upgrade and there is an error.
         - SystemPermissionError if the DB file permissions are not correct
@@ -217,12 +306,32 @@ class DataHandler():
         log.info('Decompress and decrypt DB')
 
         # First make a backup of the DB we are about to replace
+        self.db.checkpoint_wal()
         date = timestamp_to_date(ts=ts_now(), formatstr='%Y_%m_%d_%H_%M_%S', treat_as_local=True)
         shutil.copyfile(
             self.data_directory / self.username / 'rotkehlchen.db',
             self.data_directory / self.username / f'rotkehlchen_db_{date}.backup',
         )
 
-        decrypted_data = decrypt(password.encode(), encrypted_data)
-        decompressed_data = zlib.decompress(decrypted_data)
-        self.db.import_unencrypted(decompressed_data, password)
+        encoded_chunks = (
+            encrypted_data[i:i + STREAM_CHUNK_SIZE].encode('latin-1')
+            for i in range(0, len(encrypted_data), STREAM_CHUNK_SIZE)
+        )
+        decrypted = decrypt_stream(password.encode(), b64decode_stream(encoded_chunks))
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            tempdb = Path(tmpdirname) / 'temp.db'
+            # The whole data is decrypted before importing so that a wrong password
+            # or corrupt data can never replace the local DB
+            try:
+                with open(tempdb, 'wb') as f:
+                    for chunk in _decompress_stream(decrypted):
+                        f.write(chunk)
+            except zlib.error as e:
+                # With a wrong password the decrypted data is garbage that fails to
+                # decompress before the decryption gets to check the padding
+                raise UnableToDecryptRemoteData(
+                    f'Could not decompress the DB data we received from the server: {str(e)}. '
+                    f'Are you using the same password as when the data was uploaded?',
+                ) from e
+
+            self.db.import_unencrypted(tempdb, password)
@@ -0,0 +1,22 @@
+from pysqlcipher3 import dbapi2 as sqlcipher
+
+
+class DBConnection(sqlcipher.Connection):  # pylint: disable=no-member
+    """The connection to the user DB
+
+    Commits are deferred while a unit of work is open so that all writes of one
+    logical operation are committed together at the end of the outermost unit.
+    See DBHandler.unit_of_work()
+    """
+
+    def __init__(self, *args: object, **kwargs: object) -> None:
+        super().__init__(*args, **kwargs)
+        self.unit_of_work_depth = 0
+
+    def commit(self) -> None:
+        if self.unit_of_work_depth == 0:
+            super().commit()
+
+    def commit_unit_of_work(self) -> None:
+        """Commits regardless of the unit of work. Called at the end of the outermost one"""
+        super().commit()
@@ -1,13 +1,14 @@
+import hashlib
 import json
 import logging
 import os
 import re
 import shutil
-import tempfile
 from collections import defaultdict
+from contextlib import contextmanager
 from json.decoder import JSONDecodeError
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union, cast
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union, cast
 
 from pysqlcipher3 import dbapi2 as sqlcipher
 from typing_extensions import Literal
@@ -51,9 +52,16 @@ from rotkehlchen.chain.ethereum.structures import (
 from rotkehlchen.chain.ethereum.trades import AMMSwap
 from rotkehlchen.constants.assets import A_USD
 from rotkehlchen.constants.ethereum import YEARN_VAULTS_PREFIX
+from rotkehlchen.db.connection import DBConnection
 from rotkehlchen.db.eth2 import ETH2_DEPOSITS_PREFIX
+from rotkehlchen.db.filtering import (
+    ASSET_MOVEMENTS_FILTER_TABLE,
+    TRADES_FILTER_TABLE,
+    HistoryFilterQuery,
+    HistoryFilterTable,
+)
 from rotkehlchen.db.loopring import DBLoopring
-from rotkehlchen.db.schema import DB_SCRIPT_CREATE_TABLES
+from rotkehlchen.db.schema import DB_SCRIPT_CREATE_INDEXES, DB_SCRIPT_CREATE_TABLES
 from rotkehlchen.db.settings import (
     DEFAULT_PREMIUM_SHOULD_SYNC,
     ROTKEHLCHEN_DB_VERSION,
@@ -131,6 +139,9 @@ log = RotkehlchenLogsAdapter(logger)
 
 KDF_ITER = 64000
 DBINFO_FILENAME = 'dbinfo.json'
+# Settings that only keep track of the DB's own writes and uploads. Writing them does not
+# count as a change of the data, or else every sync would invalidate its own data hash.
+UNTRACKED_SETTINGS = ('last_write_ts', 'last_data_upload_ts')
 
 DBTupleType = Literal[
     'trade',
@@ -164,44 +175,6 @@ def detect_sqlcipher_version() -> int:
     return sqlcipher_version
 
 
-def db_tuple_to_str(
-        data: Tuple[Any, ...],
-        tuple_type: DBTupleType,
-) -> str:
-    """Turns a tuple DB entry for trade, or asset_movement into a user readable string
-
-    This is only intended for error messages.
-
-    TODO: Add some unit tests
-    """
-    if tuple_type == 'trade':
-        return (
-            f'{deserialize_trade_type_from_db(data[5])} trade with id {data[0]} '
-            f'in {deserialize_location_from_db(data[2])} and base/quote asset {data[3]} / '
-            f'{data[4]} at timestamp {data[1]}'
-        )
-    if tuple_type == 'asset_movement':
-        return (
-            f'{deserialize_asset_movement_category_from_db(data[2])} of '
-            f'{data[4]} with id {data[0]} '
-            f'in {deserialize_location_from_db(data[1])} at timestamp {data[3]}'
-        )
-    if tuple_type == 'margin_position':
-        return (
-            f'Margin position with id {data[0]} in  {deserialize_location_from_db(data[1])} '
-            f'for {data[5]} closed at timestamp {data[3]}'
-        )
-    if tuple_type == 'ethereum_transaction':
-        return f'Ethereum transaction with hash "{data[0].hex()}"'
-    if tuple_type == 'amm_swap':
-        return (
-            f'AMM swap with id {data[0]}-{data[1]} '
-            f'in {deserialize_location_from_db(data[6])} '
-        )
-
-    raise AssertionError('db_tuple_to_str() called with invalid tuple_type {tuple_type}')
-
-
 # https://stackoverflow.com/questions/4814167/storing-time-series-data-relational-or-non
 # http://www.sql-join.com/sql-join-types
 class DBHandler:
@@ -211,9 +184,12 @@ class DBHandler:
             password: str,
             msg_aggregator: MessagesAggregator,
             initial_settings: Optional[ModifiableDBSettings],
+            sqlite_wal: bool = False,
     ):
         """Database constructor
 
+        If sqlite_wal is True the DB is used in WAL journal mode while the user is logged in
+
         May raise:
         - DBUpgradeError if the rotki DB version is newer than the software or
         there is a DB upgrade and there is an error.
@@ -223,7 +199,15 @@ class DBHandler:
         self.msg_aggregator = msg_aggregator
         self.user_data_dir = user_data_dir
         self.sqlcipher_version = detect_sqlcipher_version()
+        self.sqlite_wal = sqlite_wal
         self.last_write_ts: Optional[Timestamp] = None
+        # Set when the last write timestamp is to be saved at the end of the unit of work
+        self.last_write_pending = False
+        # Hash of the DB data and size of its compressed and encrypted blob, as computed
+        # at the last export. Valid only while no table changes.
+        self.data_hash: Optional[Tuple[str, int]] = None
+        # The data hash saved in dbinfo.json at the last logout, with the schema it was for
+        self.data_hash_at_start: Optional[Tuple[str, int, str]] = None
         action = self.read_info_at_start()
         if action == DBStartupAction.UPGRADE_3_4:
             result, msg = self.upgrade_db_sqlcipher_3_to_4(password)
@@ -252,15 +236,26 @@ class DBHandler:
         self.update_owned_assets_in_globaldb()
 
     def __del__(self) -> None:
+        data_hash, schema_hash = None, None
         if hasattr(self, 'conn') and self.conn:
+            data_hash = self.get_cached_data_hash()
+            if data_hash is not None:
+                schema_hash = self._get_schema_hash()
             self.disconnect()
         try:
-            dbinfo = {'sqlcipher_version': self.sqlcipher_version, 'md5_hash': self.get_md5hash()}
+            dbinfo: Dict[str, Any] = {
+                'sqlcipher_version': self.sqlcipher_version,
+                'md5_hash': self.get_md5hash(),
+            }
         except (SystemPermissionError, FileNotFoundError) as e:
             # If there is problems opening the DB at destruction just log and exit
             log.error(f'At DB teardown could not open the DB: {str(e)}')
             return
 
+        if data_hash is not None:
+            dbinfo['data_hash'], dbinfo['data_size'] = data_hash
+            dbinfo['schema_hash'] = schema_hash
+
         with open(self.user_data_dir / DBINFO_FILENAME, 'w') as f:
             f.write(rlk_jsondumps(dbinfo))
 
@@ -295,8 +290,94 @@ class DBHandler:
                     'Wrong password or invalid/corrupt database for user',
                 ) from e
 
+        # A DB without a version is new and gets the latest indexes along with its
+        # tables. Existing DBs get them from the upgrade that introduced them.
+        cursor = self.conn.execute('SELECT COUNT(*) FROM settings WHERE name=?;', ('version',))
+        if cursor.fetchone()[0] == 0:
+            self.conn.executescript(DB_SCRIPT_CREATE_INDEXES)
+
+        # Upgrades back up the DB by copying its file, so all of it has to be in the file
+        self.conn.execute('PRAGMA journal_mode=DELETE;')
         # Run upgrades if needed
         DBUpgradeManager(self).run_upgrades()
+        self._track_data_changes()
+
+        if self.data_hash_at_start is not None:
+            data_hash, data_size, schema_hash = self.data_hash_at_start
+            self.data_hash_at_start = None
+            # The data hash of the last logout still holds if opening the DB changed nothing
+            total_changes = self.conn.execute('SELECT total_changes()').fetchone()[0]
+            if total_changes == 0 and schema_hash == self._get_schema_hash():
+                self.data_hash = (data_hash, data_size)
+
+        if self.sqlite_wal:
+            # Each commit only appends to the WAL and with synchronous=NORMAL it is
+            # synced to disk only at checkpoints. A power loss may lose the last commits
+            # but can not corrupt the DB.
+            self.conn.execute('PRAGMA journal_mode=WAL;')
+            self.conn.execute('PRAGMA synchronous=NORMAL;')
+
+    def _track_data_changes(self) -> None:
+        """Keep track of the tables modified since the DB data hash was last computed
+
+        The changed tables are recorded by triggers in a temporary table. Temporary
+        triggers and tables only exist for the connection and are not part of the DB
+        data, so keeping track of the changes does not change the data hash.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS changed_tables (name TEXT NOT NULL PRIMARY KEY);',
+        )
+        tables = cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';",
+        ).fetchall()
+        untracked_settings = ', '.join(f"'{x}'" for x in UNTRACKED_SETTINGS)
+        script = 'BEGIN TRANSACTION;'
+        for (table,) in tables:
+            for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+                # Skip the insert for tables already marked. Bulk writes mark them once.
+                condition = f"NOT EXISTS (SELECT 1 FROM changed_tables WHERE name='{table}')"
+                if table == 'settings':
+                    condition += f' AND {row}.name NOT IN ({untracked_settings})'
+                script += (
+                    f'CREATE TEMP TRIGGER IF NOT EXISTS track_{event.lower()}_{table} '
+                    f'AFTER {event} ON main.{table} WHEN {condition} BEGIN '
+                    f"INSERT OR IGNORE INTO changed_tables(name) VALUES ('{table}'); END;"
+                )
+        script += 'COMMIT;'
+        self.conn.executescript(script)
+
+    def _get_schema_hash(self) -> str:
+        cursor = self.conn.cursor()
+        query = cursor.execute(
+            'SELECT sql FROM sqlite_master WHERE sql IS NOT NULL ORDER BY type, name;',
+        )
+        hasher = hashlib.sha256()
+        for (sql,) in query:
+            hasher.update(sql.encode())
+        return hasher.hexdigest()
+
+    def get_changed_tables(self) -> List[str]:
+        """Returns the tables modified since the DB data hash was last computed"""
+        cursor = self.conn.cursor()
+        query = cursor.execute('SELECT name FROM changed_tables ORDER BY name;')
+        return [x[0] for x in query]
+
+    def get_cached_data_hash(self) -> Optional[Tuple[str, int]]:
+        """Returns the DB data hash and the size of the compressed and encrypted DB blob
+
+        Returns None if they were not computed or if the data changed since they were.
+        """
+        if self.data_hash is None:
+            return None
+
+        if len(self.get_changed_tables()) != 0:
+            self.data_hash = None
+        return self.data_hash
+
+    def cache_data_hash(self, data_hash: str, data_size: int) -> None:
+        """Keeps the data hash and blob size of the last `export_unencrypted`"""
+        self.data_hash = (data_hash, data_size)
 
     def get_md5hash(self) -> str:
         """Get the md5hash of the DB
@@ -342,6 +423,13 @@ class DBHandler:
             )
             return action
 
+        if all(x in dbinfo for x in ('data_hash', 'data_size', 'schema_hash')):
+            self.data_hash_at_start = (
+                dbinfo['data_hash'],
+                dbinfo['data_size'],
+                dbinfo['schema_hash'],
+            )
+
         if dbinfo['sqlcipher_version'] == 3 and self.sqlcipher_version == 3:
             return DBStartupAction.NOTHING
 
@@ -385,12 +473,17 @@ class DBHandler:
         """
         fullpath = self.user_data_dir / 'rotkehlchen.db'
         try:
-            self.conn = sqlcipher.connect(str(fullpath))  # pylint: disable=no-member
+            self.conn = sqlcipher.connect(  # pylint: disable=no-member
+                str(fullpath),
+                factory=DBConnection,
+            )
         except sqlcipher.OperationalError as e:  # pylint: disable=no-member
             raise SystemPermissionError(
                 f'Could not open database file: {fullpath}. Permission errors?',
             ) from e
 
+        # Changes of the data are tracked per connection so the data hash is lost with it
+        self.data_hash = None
         self.conn.text_factory = str
         password_for_sqlcipher = _protect_password_sqlcipher(password)
         script = f'PRAGMA key="{password_for_sqlcipher}";'
@@ -440,14 +533,16 @@ class DBHandler:
             self.conn = None
 
     def export_unencrypted(self, temppath: Path) -> None:
+        # The exported data is the base against which later changes are tracked
         self.conn.executescript(
+            'DELETE FROM changed_tables;'
             'ATTACH DATABASE "{}" AS plaintext KEY "";'
             'SELECT sqlcipher_export("plaintext");'
             'DETACH DATABASE plaintext;'.format(temppath),
         )
 
-    def import_unencrypted(self, unencrypted_db_data: bytes, password: str) -> None:
-        """Imports an unencrypted DB from raw data
+    def import_unencrypted(self, unencrypted_db_path: Path, password: str) -> None:
+        """Imports an unencrypted DB from the given file
 
         May raise:
         - DBUpgradeError if the rotki DB version is newer than the software or
@@ -462,21 +557,15 @@ class DBHandler:
         )
         rdbpath.unlink()
 
-        # dump the unencrypted data into a temporary file
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            tempdbpath = os.path.join(tmpdirname, 'temp.db')
-            with open(tempdbpath, 'wb') as f:
-                f.write(unencrypted_db_data)
-
-            # Now attach to the unencrypted DB and copy it to our DB and encrypt it
-            self.conn = sqlcipher.connect(tempdbpath)  # pylint: disable=no-member
-            password_for_sqlcipher = _protect_password_sqlcipher(password)
-            script = f'ATTACH DATABASE "{rdbpath}" AS encrypted KEY "{password_for_sqlcipher}";'
-            if self.sqlcipher_version == 3:
-                script += f'PRAGMA encrypted.kdf_iter={KDF_ITER};'
-            script += 'SELECT sqlcipher_export("encrypted");DETACH DATABASE encrypted;'
-            self.conn.executescript(script)
-            self.disconnect()
+        # Now attach to the unencrypted DB and copy it to our DB and encrypt it
+        self.conn = sqlcipher.connect(str(unencrypted_db_path))  # pylint: disable=no-member
+        password_for_sqlcipher = _protect_password_sqlcipher(password)
+        script = f'ATTACH DATABASE "{rdbpath}" AS encrypted KEY "{password_for_sqlcipher}";'
+        if self.sqlcipher_version == 3:
+            script += f'PRAGMA encrypted.kdf_iter={KDF_ITER};'
+        script += 'SELECT sqlcipher_export("encrypted");DETACH DATABASE encrypted;'
+        self.conn.executescript(script)
+        self.disconnect()
 
         try:
             self.connect(password)
@@ -488,15 +577,51 @@ class DBHandler:
         # all went okay, remove the original temp backup
         (self.user_data_dir / 'rotkehlchen_temp_backup.db').unlink()
 
+    def checkpoint_wal(self) -> None:
+        """Moves all writes from the WAL to the DB file so that the file can be copied"""
+        if self.sqlite_wal:
+            self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE);')
+
+    @contextmanager
+    def unit_of_work(self) -> Iterator[None]:
+        """Groups all the writes made inside the context in a single commit
+
+        The commits of the DB writes are deferred until the outermost unit of work
+        exits and so is the update of the last write timestamp. Units of work can
+        be nested.
+
+        The connection is shared by all greenlets so writes of other greenlets
+        while inside the context are also deferred. Keep remote queries out of it.
+        Whatever was written is committed even if the context exits with an
+        exception, just as without a unit of work each write would have been.
+        """
+        self.conn.unit_of_work_depth += 1
+        try:
+            yield
+        finally:
+            self.conn.unit_of_work_depth -= 1
+            if self.conn.unit_of_work_depth == 0:
+                if self.last_write_pending:
+                    self.last_write_pending = False
+                    self._write_last_write_ts()
+                self.conn.commit_unit_of_work()
+
     def update_last_write(self) -> None:
         # Also keep it in memory for faster querying
         self.last_write_ts = ts_now()
+        if self.conn.unit_of_work_depth != 0:
+            self.last_write_pending = True
+            return
+
+        self._write_last_write_ts()
+        self.conn.commit()
+
+    def _write_last_write_ts(self) -> None:
         cursor = self.conn.cursor()
         cursor.execute(
             'INSERT OR REPLACE INTO settings(name, value) VALUES(?, ?)',
             ('last_write_ts', str(self.last_write_ts)),
         )
-        self.conn.commit()
 
     def get_last_write_ts(self) -> Timestamp:
         cursor = self.conn.cursor()
@@ -1571,7 +1696,8 @@ class DBHandler:
         """
         cursor = self.conn.cursor()
         query = cursor.execute(
-            f'SELECT start_ts, end_ts from used_query_ranges WHERE name="{name}";',
+            'SELECT start_ts, end_ts from used_query_ranges WHERE name=?;',
+            (name,),
         )
         query = query.fetchall()
         if len(query) == 0 or query[0][0] is None:
@@ -1586,9 +1712,90 @@ class DBHandler:
             'DELETE FROM used_query_ranges WHERE name LIKE ? ESCAPE ?;',
             (f'{exchange_name}\\_%', '\\'),
         )
+        # the trade cursors are only valid together with the trades query range
+        cursor.execute(
+            'DELETE FROM binance_trade_cursors WHERE location = ?;',
+            (exchange_name,),
+        )
         self.conn.commit()
         self.update_last_write()
 
+    def get_binance_trade_cursors(self, location: str) -> Dict[str, Tuple[int, Timestamp]]:
+        """Get the next trade id and covered until timestamp of each symbol of a binance location
+
+        Location is the exchange name, binance or binance_us
+        """
+        cursor = self.conn.cursor()
+        query = cursor.execute(
+            'SELECT symbol, next_id, covered_until FROM binance_trade_cursors '
+            'WHERE location = ?;',
+            (location,),
+        )
+        return {x[0]: (int(x[1]), Timestamp(int(x[2]))) for x in query}
+
+    def set_binance_trade_cursors(
+            self,
+            location: str,
+            cursors: List[Tuple[str, int, Timestamp]],
+    ) -> None:
+        """Save the (symbol, next_id, covered_until) trade cursors of a binance location"""
+        cursor = self.conn.cursor()
+        cursor.executemany(
+            'INSERT OR REPLACE INTO binance_trade_cursors('
+            'location, symbol, next_id, covered_until) VALUES(?, ?, ?, ?);',
+            [(location, *x) for x in cursors],
+        )
+        self.conn.commit()
+        self.update_last_write()
+
+    def get_pnl_checkpoint_keys(self, settings_hash: str) -> Set[str]:
+        """Get the keys of all PnL checkpoints created with the given settings hash"""
+        cursor = self.conn.cursor()
+        query = cursor.execute(
+            'SELECT checkpoint_key FROM pnl_checkpoints WHERE settings_hash=?;',
+            (settings_hash,),
+        )
+        return {x[0] for x in query}
+
+    def get_pnl_checkpoint_data(self, checkpoint_key: str) -> Optional[str]:
+        cursor = self.conn.cursor()
+        query = cursor.execute(
+            'SELECT data FROM pnl_checkpoints WHERE checkpoint_key=?;',
+            (checkpoint_key,),
+        ).fetchone()
+        return None if query is None else query[0]
+
+    def add_pnl_checkpoint(
+            self,
+            checkpoint_key: str,
+            settings_hash: str,
+            timestamp: Timestamp,
+            data: str,
+    ) -> None:
+        """Save a PnL checkpoint
+
+        Checkpoints can always be recreated from the history so they don't count
+        as a user data write for premium sync.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            'INSERT OR REPLACE INTO pnl_checkpoints('
+            'checkpoint_key, settings_hash, timestamp, data) VALUES (?, ?, ?, ?);',
+            (checkpoint_key, settings_hash, timestamp, data),
+        )
+        self.conn.commit()
+
+    def delete_pnl_checkpoints(self, keep_keys: Optional[List[str]] = None) -> None:
+        """Delete all PnL checkpoints except for the ones with the given keys"""
+        cursor = self.conn.cursor()
+        keep_keys = [] if keep_keys is None else keep_keys
+        cursor.execute(
+            f'DELETE FROM pnl_checkpoints WHERE checkpoint_key NOT IN '
+            f'({",".join(["?"] * len(keep_keys))});',
+            keep_keys,
+        )
+        self.conn.commit()
+
     def purge_exchange_data(self, exchange_name: str) -> None:
         self.delete_used_query_range_for_exchange(exchange_name)
         cursor = self.conn.cursor()
@@ -2221,73 +2428,34 @@ class DBHandler:
             tuples: List[Tuple[Any, ...]],
             **kwargs: Any,
     ) -> None:
-        cursor = self.conn.cursor()
-        try:
-            cursor.executemany(query, tuples)
-        except sqlcipher.IntegrityError:  # pylint: disable=no-member
-            # That means that one of the tuples hit a constraint, most probably
-            # already existing in the DB, in which case we resort to writing them
-            # one by one to only reject the duplicates
+        """Writes the tuples to the DB with the given INSERT ... ON CONFLICT DO NOTHING query
 
-            nonces_set: Set[int] = set()
-            if tuple_type == 'ethereum_transaction':
-                nonces_set = set(range(len([t for t in tuples if t[10] == -1])))
-
-            for entry in tuples:
-                try:
-                    cursor.execute(query, entry)
-                except sqlcipher.IntegrityError:  # pylint: disable=no-member
-                    if tuple_type == 'ethereum_transaction':
-                        nonce = entry[10]
-                        # If it's not an internal transaction with the same hash
-                        # ignore it. That is since it's indeed a duplicate because
-                        # when we query etherscan we get all transactions where
-                        # the given address is either the from or the to.
-                        if nonce != -1:
-                            continue
-
-                        if 'from_etherscan' in kwargs and kwargs['from_etherscan'] is True:
-                            # If it's an internal transaction with the same hash then
-                            # still input it as there is no way to distinguish between
-                            # multiple etherscan internal transactions with the same
-                            # original transaction hash. Here we trust the data source.
-                            # To differentiate between them in Rotkehlchen we use a
-                            # more negative nonce
-                            entry_list = list(entry)
-                            # Make sure that the internal etherscan transaction nonce
-                            # is increasingly negative (> -1)
-                            # If a key error is thrown here due to popping from an empty
-                            # set then something is really wrong so not catching it
-                            entry_list[10] = -1 - nonces_set.pop() - 1
-                            entry = tuple(entry_list)
-                            try:
-                                cursor.execute(query, entry)
-                                # Success so just go to the next entry
-                                continue
-                            except sqlcipher.IntegrityError:  # pylint: disable=no-member
-                                # the error is logged right below
-                                pass
-
-                        # if we reach here it means the transaction is already in the DB
-                        # But this can't be avoided with the way we query etherscan
-                        # right now since we don't query transactions in a specific
-                        # time range, so duplicate addition attempts can happen.
-                        # Also if we have transactions of one account sending to the
-                        # other and both accounts are being tracked.
-                        string_repr = db_tuple_to_str(entry, tuple_type)
-                        logger.debug(
-                            f'Did not add "{string_repr}" to the DB since'
-                            f'it already exists.',
-                        )
-                        continue
-
-                    string_repr = db_tuple_to_str(entry, tuple_type)
-                    logger.warning(
-                        f'Did not add "{string_repr}" to the DB. It already exists.',
-                    )
-                except sqlcipher.InterfaceError:  # pylint: disable=no-member
-                    log.critical(f'Interface error with tuple: {entry}')
+        Tuples of entries already in the DB are skipped by the DB itself so the whole
+        batch is written with one statement and only the number of skipped entries
+        is logged. The conflict clause only covers the unique key of the table. If an
+        entry violates any other constraint, such as a NOT NULL or a foreign key, the
+        tuples are written one by one to reject and log just that entry.
+        """
+        cursor = self.conn.cursor()
+        internal_txs: List[Tuple[Any, ...]] = []
+        if tuple_type == 'ethereum_transaction' and kwargs.get('from_etherscan') is True:
+            internal_txs = [x for x in tuples if x[10] == -1]
+            tuples = [x for x in tuples if x[10] != -1]
 
+        skipped = 0
+        try:
+            try:
+                cursor.executemany(query, tuples)
+                skipped = len(tuples) - cursor.rowcount
+            except sqlcipher.IntegrityError:  # pylint: disable=no-member
+                # The entries before the one violating the constraint are already
+                # written and can't be told apart from duplicates. So in this case
+                # only the rejected entries are logged.
+                self._write_tuples_one_by_one(tuple_type, query, tuples)
+
+            if len(internal_txs) != 0:
+                written = self._write_etherscan_internal_transactions(query, internal_txs)
+                skipped += len(internal_txs) - written
         except OverflowError:
             self.msg_aggregator.add_error(
                 f'Failed to add "{tuple_type}" to the DB with overflow error. '
@@ -2298,9 +2466,65 @@ class DBHandler:
                 f' DB. Tuples: {tuples} with query: {query}',
             )
 
+        if skipped != 0:
+            msg = (
+                f'Did not add {skipped} out of {len(tuples) + len(internal_txs)} '
+                f'"{tuple_type}" entries to the DB since they already exist.'
+            )
+            if tuple_type == 'ethereum_transaction':
+                # This can't be avoided with the way we query etherscan since we
+                # get all transactions where the address is either the from or the
+                # to, so transactions between tracked accounts come up twice.
+                logger.debug(msg)
+            else:
+                logger.warning(msg)
+
         self.conn.commit()
         self.update_last_write()
 
+    def _write_tuples_one_by_one(
+            self,
+            tuple_type: DBTupleType,
+            query: str,
+            tuples: List[Tuple[Any, ...]],
+    ) -> None:
+        """Writes the tuples one by one, rejecting those that violate a DB constraint"""
+        cursor = self.conn.cursor()
+        for entry in tuples:
+            try:
+                cursor.execute(query, entry)
+            except sqlcipher.IntegrityError as e:  # pylint: disable=no-member
+                logger.warning(f'Did not add "{tuple_type}" {entry} to the DB due to {str(e)}')
+                continue
+            except sqlcipher.InterfaceError:  # pylint: disable=no-member
+                log.critical(f'Interface error with tuple: {entry}')
+
+    def _write_etherscan_internal_transactions(
+            self,
+            query: str,
+            internal_txs: List[Tuple[Any, ...]],
+    ) -> int:
+        """Writes the internal transactions from etherscan, which all have a nonce of -1
+
+        There is no way to distinguish between multiple etherscan internal transactions
+        with the same original transaction hash, so we trust the data source and write
+        those that are already in the DB again with an increasingly negative nonce (< -1).
+
+        Returns the number of transactions written
+        """
+        cursor = self.conn.cursor()
+        nonces = iter(range(-2, -2 - len(internal_txs), -1))
+        written = 0
+        for entry in internal_txs:
+            cursor.execute(query, entry)
+            if cursor.rowcount == 0:
+                entry_list = list(entry)
+                entry_list[10] = next(nonces)
+                cursor.execute(query, tuple(entry_list))
+            written += cursor.rowcount
+
+        return written
+
     def add_margin_positions(self, margin_positions: List[MarginPosition]) -> None:
         margin_tuples: List[Tuple[Any, ...]] = []
         for margin in margin_positions:
@@ -2331,6 +2555,7 @@ class DBHandler:
               link,
               notes)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO NOTHING
         """
         self.write_tuples(tuple_type='margin_position', query=query, tuples=margin_tuples)
 
@@ -2357,10 +2582,12 @@ class DBHandler:
             '  link,'
             '  notes FROM margin_positions '
         )
+        location_bindings: Tuple = ()
         if location is not None:
-            query += f'WHERE location="{deserialize_location(location).serialize_for_db()}" '
+            query += 'WHERE location=? '
+            location_bindings = (deserialize_location(location).serialize_for_db(),)
         query, bindings = form_query_to_filter_timestamps(query, 'close_time', from_ts, to_ts)
-        results = cursor.execute(query, bindings)
+        results = cursor.execute(query, location_bindings + bindings)
 
         margin_positions = []
         for result in results:
@@ -2428,6 +2655,7 @@ class DBHandler:
               transaction_id
 )
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO NOTHING
         """
         self.write_tuples(tuple_type='asset_movement', query=query, tuples=movement_tuples)
 
@@ -2441,6 +2669,16 @@ class DBHandler:
 
         The returned list is ordered from oldest to newest
         """
+        return self.get_filtered_asset_movements(
+            HistoryFilterQuery(from_ts=from_ts, to_ts=to_ts, location=location),
+        )
+
+    def get_filtered_asset_movements(
+            self,
+            filter_query: HistoryFilterQuery,
+    ) -> List[AssetMovement]:
+        """Returns the asset movements matching the filter query in the order and page
+        it specifies"""
         cursor = self.conn.cursor()
         query = (
             'SELECT id,'
@@ -2455,10 +2693,8 @@ class DBHandler:
             '  address,'
             '  transaction_id FROM asset_movements '
         )
-        if location is not None:
-            query += f'WHERE location="{location.serialize_for_db()}" '
-        query, bindings = form_query_to_filter_timestamps(query, 'time', from_ts, to_ts)
-        results = cursor.execute(query, bindings)
+        filters, bindings = filter_query.prepare(ASSET_MOVEMENTS_FILTER_TABLE)
+        results = cursor.execute(query + filters, bindings)
 
         asset_movements = []
         for result in results:
@@ -2515,6 +2751,20 @@ class DBHandler:
         query = cursor.execute(cursorstr)
         return query.fetchone()[0]
 
+    def count_filtered_entries(
+            self,
+            table: HistoryFilterTable,
+            filter_query: HistoryFilterQuery,
+    ) -> int:
+        """Returns how many entries of the table match the filters of the filter query
+
+        The ordering and pagination of the filter query are disregarded
+        """
+        cursor = self.conn.cursor()
+        filters, bindings = filter_query.where_clause(table)
+        query = cursor.execute(f'SELECT COUNT(*) FROM {table.name} {filters};', bindings)
+        return query.fetchone()[0]
+
     def add_ethereum_transactions(
             self,
             ethereum_transactions: List[EthereumTransaction],
@@ -2557,6 +2807,7 @@ class DBHandler:
               input_data,
               nonce)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(tx_hash, nonce, from_address) DO NOTHING
         """
         self.write_tuples(
             tuple_type='ethereum_transaction',
@@ -2589,10 +2840,12 @@ class DBHandler:
               input_data,
               nonce FROM ethereum_transactions
         """
+        address_bindings: Tuple = ()
         if address is not None:
-            query += f'WHERE (from_address="{address}" OR to_address="{address}") '
+            query += 'WHERE (from_address=? OR to_address=?) '
+            address_bindings = (address, address)
         query, bindings = form_query_to_filter_timestamps(query, 'timestamp', from_ts, to_ts)
-        results = cursor.execute(query, bindings)
+        results = cursor.execute(query, address_bindings + bindings)
 
         ethereum_transactions = []
         for result in results:
@@ -2715,6 +2968,7 @@ class DBHandler:
               link,
               notes)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO NOTHING
         """
         self.write_tuples(tuple_type='trade', query=query, tuples=trade_tuples)
 
@@ -2771,6 +3025,12 @@ class DBHandler:
 
         The returned list is ordered from oldest to newest
         """
+        return self.get_filtered_trades(
+            HistoryFilterQuery(from_ts=from_ts, to_ts=to_ts, location=location),
+        )
+
+    def get_filtered_trades(self, filter_query: HistoryFilterQuery) -> List[Trade]:
+        """Returns the trades matching the filter query in the order and page it specifies"""
         cursor = self.conn.cursor()
         query = (
             'SELECT id,'
@@ -2786,10 +3046,8 @@ class DBHandler:
             '  link,'
             '  notes FROM trades '
         )
-        if location is not None:
-            query += f'WHERE location="{location.serialize_for_db()}" '
-        query, bindings = form_query_to_filter_timestamps(query, 'time', from_ts, to_ts)
-        results = cursor.execute(query, bindings)
+        filters, bindings = filter_query.prepare(TRADES_FILTER_TABLE)
+        results = cursor.execute(query + filters, bindings)
 
         trades = []
         for result in results:
@@ -2861,6 +3119,7 @@ class DBHandler:
                 amount1_out
             )
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(tx_hash, log_index) DO NOTHING
             """
         )
         self.write_tuples(tuple_type='amm_swap', query=query, tuples=swap_tuples)
@@ -2903,17 +3162,20 @@ class DBHandler:
         )
         # Timestamp filters are omitted, done via `form_query_to_filter_timestamps`
         filters = []
+        filter_bindings: List[str] = []
         if location is not None:
-            filters.append(f'location="{location.serialize_for_db()}" ')
+            filters.append('location=? ')
+            filter_bindings.append(location.serialize_for_db())
         if address is not None:
-            filters.append(f'address="{address}" ')
+            filters.append('address=? ')
+            filter_bindings.append(address)
 
         if filters:
             query += 'WHERE '
             query += 'AND '.join(filters)
 
         query, bindings = form_query_to_filter_timestamps(query, 'timestamp', from_ts, to_ts)
-        results = cursor.execute(query, bindings)
+        results = cursor.execute(query, tuple(filter_bindings) + bindings)
 
         swaps = []
         for result in results:
@@ -3027,15 +3289,17 @@ class DBHandler:
             to_ts = ts_now()
 
         querystr = (
-            f'SELECT time, amount, usd_value, category FROM timed_balances '
-            f'WHERE time BETWEEN {from_ts} AND {to_ts} AND currency="{asset.identifier}"'
+            'SELECT time, amount, usd_value, category FROM timed_balances '
+            'WHERE time BETWEEN ? AND ? AND currency=?'
         )
+        bindings: Tuple = (from_ts, to_ts, asset.identifier)
         if balance_type is not None:
-            querystr += f' AND category="{balance_type.serialize_for_db()}"'
+            querystr += ' AND category=?'
+            bindings += (balance_type.serialize_for_db(),)
         querystr += ' ORDER BY time ASC;'
 
         cursor = self.conn.cursor()
-        results = cursor.execute(querystr)
+        results = cursor.execute(querystr, bindings)
         results = results.fetchall()
         balances = []
         for result in results:
@@ -3485,7 +3749,7 @@ class DBHandler:
         for acc_idx in (0, 1):
             query = cursor.execute(
                 'SELECT derived_index from xpub_mappings WHERE xpub=? AND '
-                'derivation_path IS ? AND account_index=?;',
+                'derivation_path IS ? AND account_index=? ORDER BY derived_index ASC;',
                 (xpub_data.xpub.xpub, xpub_data.serialize_derivation_path_for_db(), acc_idx),
             )
             prev_index = -1
@@ -0,0 +1,146 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from rotkehlchen.accounting.ledger_actions import LedgerActionType
+from rotkehlchen.accounting.structures import ActionType
+from rotkehlchen.assets.asset import Asset
+from rotkehlchen.typing import AssetMovementCategory, Location, Timestamp, TradeType
+
+HistoryEntryType = Union[TradeType, AssetMovementCategory, LedgerActionType]
+
+
+class HistoryFilterTable(NamedTuple):
+    """Describes the columns of a history table that a HistoryFilterQuery filters by"""
+    name: str
+    timestamp_column: str
+    asset_columns: Tuple[str, ...]
+    type_column: str
+    # Expression of the entry's identifier as saved in the ignored_actions table
+    identifier_column: str
+    action_type: ActionType
+    # Mapping of the attributes entries can be ordered by to their columns
+    order_by_columns: Dict[str, str]
+
+
+TRADES_FILTER_TABLE = HistoryFilterTable(
+    name='trades',
+    timestamp_column='time',
+    asset_columns=('base_asset', 'quote_asset'),
+    type_column='type',
+    identifier_column='id',
+    action_type=ActionType.TRADE,
+    order_by_columns={
+        'timestamp': 'time',
+        'location': 'location',
+        'trade_type': 'type',
+        'base_asset': 'base_asset',
+        'quote_asset': 'quote_asset',
+    },
+)
+ASSET_MOVEMENTS_FILTER_TABLE = HistoryFilterTable(
+    name='asset_movements',
+    timestamp_column='time',
+    asset_columns=('asset',),
+    type_column='category',
+    identifier_column='id',
+    action_type=ActionType.ASSET_MOVEMENT,
+    order_by_columns={
+        'timestamp': 'time',
+        'location': 'location',
+        'category': 'category',
+        'asset': 'asset',
+    },
+)
+LEDGER_ACTIONS_FILTER_TABLE = HistoryFilterTable(
+    name='ledger_actions',
+    timestamp_column='timestamp',
+    asset_columns=('asset',),
+    type_column='type',
+    identifier_column='CAST(identifier AS TEXT)',
+    action_type=ActionType.LEDGER_ACTION,
+    order_by_columns={
+        'timestamp': 'timestamp',
+        'location': 'location',
+        'action_type': 'type',
+        'asset': 'asset',
+    },
+)
+
+
+class HistoryFilterQuery(NamedTuple):
+    """Filtering, ordering and pagination of the entries of a history table
+
+    All filters are optional. `ignored` filters for entries that are (True) or
+    are not (False) ignored in accounting. A `limit` of None returns all entries
+    from `offset` onwards.
+    """
+    from_ts: Optional[Timestamp] = None
+    to_ts: Optional[Timestamp] = None
+    location: Optional[Location] = None
+    asset: Optional[Asset] = None
+    entry_type: Optional[HistoryEntryType] = None
+    ignored: Optional[bool] = None
+    order_by_attribute: str = 'timestamp'
+    ascending: bool = True
+    offset: int = 0
+    limit: Optional[int] = None
+
+    def restrict_to_first(self, entries_num: int) -> 'HistoryFilterQuery':
+        """Returns the filter query with its page restricted to the first `entries_num`
+        matching entries. Used to apply the limits of the free version."""
+        remaining = max(entries_num - self.offset, 0)
+        limit = remaining if self.limit is None else min(self.limit, remaining)
+        return self._replace(limit=limit)
+
+    def where_clause(self, table: HistoryFilterTable) -> Tuple[str, List[Any]]:
+        """Returns the WHERE clause of the filters (or an empty string) and its bindings"""
+        filters = []
+        bindings: List[Any] = []
+        if self.from_ts is not None:
+            filters.append(f'{table.timestamp_column} >= ?')
+            bindings.append(self.from_ts)
+        if self.to_ts is not None:
+            filters.append(f'{table.timestamp_column} <= ?')
+            bindings.append(self.to_ts)
+        if self.location is not None:
+            filters.append('location = ?')
+            bindings.append(self.location.serialize_for_db())
+        if self.asset is not None:
+            filters.append('(' + ' OR '.join(f'{x} = ?' for x in table.asset_columns) + ')')
+            bindings.extend([self.asset.identifier] * len(table.asset_columns))
+        if self.entry_type is not None:
+            filters.append(f'{table.type_column} = ?')
+            bindings.append(self.entry_type.serialize_for_db())
+        if self.ignored is not None:
+            filters.append(
+                f'{table.identifier_column} {"IN" if self.ignored else "NOT IN"} '
+                f'(SELECT identifier FROM ignored_actions WHERE type = ?)',
+            )
+            bindings.append(table.action_type.serialize_for_db())
+
+        if len(filters) == 0:
+            return '', bindings
+        return 'WHERE ' + ' AND '.join(filters), bindings
+
+    def order_clause(self, table: HistoryFilterTable) -> str:
+        """Returns the ORDER BY clause. Ties are ordered by timestamp and then by insertion
+        so that consecutive pages neither repeat nor skip entries"""
+        direction = 'ASC' if self.ascending else 'DESC'
+        columns = [table.order_by_columns[self.order_by_attribute]]
+        if columns[0] != table.timestamp_column:
+            columns.append(table.timestamp_column)
+        columns.append('rowid')
+        return 'ORDER BY ' + ', '.join(f'{x} {direction}' for x in columns)
+
+    def limit_clause(self) -> Tuple[str, List[int]]:
+        """Returns the LIMIT/OFFSET clause of the pagination and its bindings"""
+        if self.limit is None:
+            if self.offset == 0:
+                return '', []
+            return 'LIMIT -1 OFFSET ?', [self.offset]
+        return 'LIMIT ? OFFSET ?', [self.limit, self.offset]
+
+    def prepare(self, table: HistoryFilterTable) -> Tuple[str, List[Any]]:
+        """Returns everything following `FROM <table>` in the query and its bindings"""
+        where, bindings = self.where_clause(table)
+        limit, limit_bindings = self.limit_clause()
+        return ' '.join(x for x in (where, self.order_clause(table), limit) if x), bindings + limit_bindings  # noqa: E501
@@ -1,7 +1,7 @@
 from typing import TYPE_CHECKING, List, Optional
 
 from rotkehlchen.accounting.ledger_actions import LedgerAction
-from rotkehlchen.db.utils import form_query_to_filter_timestamps
+from rotkehlchen.db.filtering import LEDGER_ACTIONS_FILTER_TABLE, HistoryFilterQuery
 from rotkehlchen.errors import DeserializationError, UnknownAsset
 from rotkehlchen.typing import Location, Timestamp
 from rotkehlchen.user_messages import MessagesAggregator
@@ -22,6 +22,13 @@ class DBLedgerActions():
             to_ts: Optional[Timestamp],
             location: Optional[Location],
     ) -> List[LedgerAction]:
+        return self.get_filtered_ledger_actions(
+            HistoryFilterQuery(from_ts=from_ts, to_ts=to_ts, location=location),
+        )
+
+    def get_filtered_ledger_actions(self, filter_query: HistoryFilterQuery) -> List[LedgerAction]:
+        """Returns the ledger actions matching the filter query in the order and page
+        it specifies"""
         cursor = self.db.conn.cursor()
         query = (
             'SELECT identifier,'
@@ -35,10 +42,8 @@ class DBLedgerActions():
             '  link,'
             '  notes FROM ledger_actions '
         )
-        if location is not None:
-            query += f'WHERE location="{location.serialize_for_db()}" '
-        query, bindings = form_query_to_filter_timestamps(query, 'timestamp', from_ts, to_ts)
-        results = cursor.execute(query, bindings)
+        filters, bindings = filter_query.prepare(LEDGER_ACTIONS_FILTER_TABLE)
+        results = cursor.execute(query + filters, bindings)
         actions = []
         for result in results:
             try:
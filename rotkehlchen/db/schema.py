@@ -386,6 +386,27 @@ CREATE TABLE IF NOT EXISTS used_query_ranges (
 );
 """
 
+DB_CREATE_PNL_CHECKPOINTS = """
+CREATE TABLE IF NOT EXISTS pnl_checkpoints (
+    checkpoint_key TEXT NOT NULL PRIMARY KEY,
+    settings_hash TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+# The id of the next trade to query per binance symbol. All trades of the symbol up to
+# covered_until have an id smaller than next_id and are already saved in the DB
+DB_CREATE_BINANCE_TRADE_CURSORS = """
+CREATE TABLE IF NOT EXISTS binance_trade_cursors (
+    location VARCHAR[24] NOT NULL,
+    symbol TEXT NOT NULL,
+    next_id INTEGER NOT NULL,
+    covered_until INTEGER NOT NULL,
+    PRIMARY KEY(location, symbol)
+);
+"""
+
 DB_CREATE_SETTINGS = """
 CREATE TABLE IF NOT EXISTS settings (
     name VARCHAR[24] NOT NULL PRIMARY KEY,
@@ -586,7 +607,7 @@ CREATE TABLE IF NOT EXISTS balancer_events (
 DB_SCRIPT_CREATE_TABLES = """
 PRAGMA foreign_keys=off;
 BEGIN TRANSACTION;
-{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}
+{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}{}
 COMMIT;
 PRAGMA foreign_keys=on;
 """.format(
@@ -625,4 +646,30 @@ PRAGMA foreign_keys=on;
     DB_CREATE_IGNORED_ACTIONS,
     DB_CREATE_BALANCER_POOLS,
     DB_CREATE_BALANCER_EVENTS,
+    DB_CREATE_PNL_CHECKPOINTS,
+    DB_CREATE_BINANCE_TRADE_CURSORS,
 )
+
+# Secondary indexes of the history tables for their time range queries, optionally
+# filtered by location, address or asset. The timed_balances one covers the whole
+# query of an asset's balances so that it never reads the table itself. They are
+# only created here for new DBs. Existing DBs get them via the v25 -> v26 upgrade.
+DB_CREATE_INDEXES = """
+CREATE INDEX IF NOT EXISTS trades_time ON trades(time);
+CREATE INDEX IF NOT EXISTS trades_location_time ON trades(location, time);
+CREATE INDEX IF NOT EXISTS margin_positions_location_close_time ON margin_positions(location, close_time);
+CREATE INDEX IF NOT EXISTS asset_movements_time ON asset_movements(time);
+CREATE INDEX IF NOT EXISTS asset_movements_location_time ON asset_movements(location, time);
+CREATE INDEX IF NOT EXISTS timed_balances_currency_time ON timed_balances(currency, time, category, amount, usd_value);
+CREATE INDEX IF NOT EXISTS ethereum_transactions_timestamp ON ethereum_transactions(timestamp);
+CREATE INDEX IF NOT EXISTS ethereum_transactions_from_timestamp ON ethereum_transactions(from_address, timestamp);
+CREATE INDEX IF NOT EXISTS ethereum_transactions_to_timestamp ON ethereum_transactions(to_address, timestamp);
+CREATE INDEX IF NOT EXISTS amm_swaps_location_timestamp ON amm_swaps(location, timestamp);
+CREATE INDEX IF NOT EXISTS amm_swaps_address_timestamp ON amm_swaps(address, timestamp);
+"""  # noqa: E501
+
+DB_SCRIPT_CREATE_INDEXES = """
+BEGIN TRANSACTION;
+{}
+COMMIT;
+""".format(DB_CREATE_INDEXES)
@@ -16,7 +16,7 @@ from rotkehlchen.inquirer import DEFAULT_CURRENT_PRICE_ORACLES_ORDER, CurrentPri
 from rotkehlchen.typing import AVAILABLE_MODULES_MAP, ModuleName, Timestamp
 from rotkehlchen.user_messages import MessagesAggregator
 
-ROTKEHLCHEN_DB_VERSION = 25
+ROTKEHLCHEN_DB_VERSION = 26
 DEFAULT_TAXFREE_AFTER_PERIOD = YEAR_IN_SECONDS
 DEFAULT_INCLUDE_CRYPTO2CRYPTO = True
 DEFAULT_INCLUDE_GAS_COSTS = True
@@ -31,7 +31,10 @@ DEFAULT_KRAKEN_ACCOUNT_TYPE = KrakenAccountType.STARTER
 DEFAULT_ACTIVE_MODULES = list(AVAILABLE_MODULES_MAP.keys())
 DEFAULT_ACCOUNT_FOR_ASSETS_MOVEMENTS = True
 DEFAULT_BTC_DERIVATION_GAP_LIMIT = 20
+DEFAULT_CRYPTOCOMPARE_PREFETCH_CONCURRENCY = 3
 DEFAULT_CALCULATE_PAST_COST_BASIS = True
+DEFAULT_FIXED_POINT_COST_BASIS = False
+DEFAULT_PNL_CHECKPOINT_FREQUENCY = 0
 DEFAULT_DISPLAY_DATE_IN_LOCALTIME = True
 DEFAULT_CURRENT_PRICE_ORACLES = DEFAULT_CURRENT_PRICE_ORACLES_ORDER
 DEFAULT_HISTORICAL_PRICE_ORACLES = DEFAULT_HISTORICAL_PRICE_ORACLES_ORDER
@@ -55,12 +58,15 @@ BOOLEAN_KEYS = (
     'account_for_assets_movements',
     'calculate_past_cost_basis',
     'display_date_in_localtime',
+    'fixed_point_cost_basis',
 )
 INTEGER_KEYS = (
     'version',
     'ui_floating_precision',
     'balance_save_frequency',
     'btc_derivation_gap_limit',
+    'cryptocompare_prefetch_concurrency',
+    'pnl_checkpoint_frequency',
 )
 STRING_KEYS = (
     'eth_rpc_endpoint',
@@ -99,6 +105,9 @@ class DBSettings(NamedTuple):
     current_price_oracles: List[CurrentPriceOracle] = DEFAULT_CURRENT_PRICE_ORACLES
     historical_price_oracles: List[HistoricalPriceOracle] = DEFAULT_HISTORICAL_PRICE_ORACLES
     taxable_ledger_actions: List[LedgerActionType] = DEFAULT_TAXABLE_LEDGER_ACTIONS
+    cryptocompare_prefetch_concurrency: int = DEFAULT_CRYPTOCOMPARE_PREFETCH_CONCURRENCY
+    fixed_point_cost_basis: bool = DEFAULT_FIXED_POINT_COST_BASIS
+    pnl_checkpoint_frequency: int = DEFAULT_PNL_CHECKPOINT_FREQUENCY
 
 
 class ModifiableDBSettings(NamedTuple):
@@ -124,6 +133,9 @@ class ModifiableDBSettings(NamedTuple):
     current_price_oracles: Optional[List[CurrentPriceOracle]] = None
     historical_price_oracles: Optional[List[HistoricalPriceOracle]] = None
     taxable_ledger_actions: Optional[List[LedgerActionType]] = None
+    cryptocompare_prefetch_concurrency: Optional[int] = None
+    fixed_point_cost_basis: Optional[bool] = None
+    pnl_checkpoint_frequency: Optional[int] = None
 
     def serialize(self) -> Dict[str, Any]:
         settings_dict = {}
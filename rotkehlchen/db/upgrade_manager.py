@@ -27,6 +27,7 @@ from rotkehlchen.db.upgrades.v21_v22 import upgrade_v21_to_v22
 from rotkehlchen.db.upgrades.v22_v23 import upgrade_v22_to_v23
 from rotkehlchen.db.upgrades.v23_v24 import upgrade_v23_to_v24
 from rotkehlchen.db.upgrades.v24_v25 import upgrade_v24_to_v25
+from rotkehlchen.db.upgrades.v25_v26 import upgrade_v25_to_v26
 from rotkehlchen.errors import DBUpgradeError
 from rotkehlchen.logging import RotkehlchenLogsAdapter
 from rotkehlchen.utils.misc import ts_now
@@ -179,6 +180,10 @@ UPGRADES_LIST = [
         from_version=24,
         function=upgrade_v24_to_v25,
     ),
+    UpgradeRecord(
+        from_version=25,
+        function=upgrade_v25_to_v26,
+    ),
 ]
 
 
@@ -206,12 +211,17 @@ class DBUpgradeManager():
         for upgrade in UPGRADES_LIST:
             self._perform_single_upgrade(upgrade)
 
-        # Finally make sure to always have latest version in the DB
+        # Finally make sure to always have latest version in the DB. Only write it
+        # if it's not already there so that opening an up to date DB changes nothing.
         cursor = self.db.conn.cursor()
         cursor.execute(
-            'INSERT OR REPLACE INTO settings(name, value) VALUES(?, ?)',
+            'INSERT OR IGNORE INTO settings(name, value) VALUES(?, ?)',
             ('version', str(ROTKEHLCHEN_DB_VERSION)),
         )
+        cursor.execute(
+            'UPDATE settings SET value=? WHERE name=? AND value!=?',
+            (str(ROTKEHLCHEN_DB_VERSION), 'version', str(ROTKEHLCHEN_DB_VERSION)),
+        )
         self.db.conn.commit()
 
     def _perform_single_upgrade(self, upgrade: UpgradeRecord) -> None:
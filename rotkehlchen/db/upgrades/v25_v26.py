@@ -0,0 +1,52 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from rotkehlchen.db.dbhandler import DBHandler
+
+
+def upgrade_v25_to_v26(db: 'DBHandler') -> None:
+    """Upgrades the DB from v25 to v26
+
+    - Creates the secondary indexes of the trades, margin_positions, asset_movements,
+    timed_balances, ethereum_transactions and amm_swaps tables for their time range
+    queries.
+    """
+    cursor = db.conn.cursor()
+    cursor.execute('CREATE INDEX IF NOT EXISTS trades_time ON trades(time);')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS trades_location_time ON trades(location, time);',
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS margin_positions_location_close_time '
+        'ON margin_positions(location, close_time);',
+    )
+    cursor.execute('CREATE INDEX IF NOT EXISTS asset_movements_time ON asset_movements(time);')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS asset_movements_location_time '
+        'ON asset_movements(location, time);',
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS timed_balances_currency_time '
+        'ON timed_balances(currency, time, category, amount, usd_value);',
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS ethereum_transactions_timestamp '
+        'ON ethereum_transactions(timestamp);',
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS ethereum_transactions_from_timestamp '
+        'ON ethereum_transactions(from_address, timestamp);',
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS ethereum_transactions_to_timestamp '
+        'ON ethereum_transactions(to_address, timestamp);',
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS amm_swaps_location_timestamp '
+        'ON amm_swaps(location, timestamp);',
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS amm_swaps_address_timestamp '
+        'ON amm_swaps(address, timestamp);',
+    )
+    db.conn.commit()
@@ -12,6 +12,7 @@ from typing import (
     List,
     NamedTuple,
     Optional,
+    Set,
     Tuple,
     Type,
     Union,
@@ -21,6 +22,7 @@ from urllib.parse import urlencode
 import gevent
 import requests
 from gevent.lock import Semaphore
+from gevent.pool import Pool
 from typing_extensions import Literal
 
 from rotkehlchen.accounting.structures import Balance
@@ -93,6 +95,17 @@ RETRY_AFTER_LIMIT = 60
 # https://binance-docs.github.io/apidocs/delivery/en/#error-codes-2
 REJECTED_MBX_KEY = -2015
 
+# Request weight of a myTrades query and the request weight per minute that the trade
+# history query allows itself out of the 1200 that binance allows, so that other
+# queries can still run at the same time. https://binance-docs.github.io/apidocs/spot/en/#limits
+# Binance returns the weight used in the current minute in the x-mbx-used-weight-1m header
+MY_TRADES_WEIGHT = 10
+MY_TRADES_WEIGHT_PER_MINUTE = 1000
+# How many symbols to query the trades of at the same time
+MY_TRADES_CONCURRENCY = 5
+# Limit of results to return. 1000 is max limit according to docs
+MY_TRADES_LIMIT = 1000
+
 
 BINANCE_API_TYPE = Literal['api', 'sapi', 'wapi', 'dapi', 'fapi']
 
@@ -236,6 +249,11 @@ class Binance(ExchangeInterface):  # lgtm[py/missing-call-to-init]
         self.msg_aggregator = msg_aggregator
         self.nonce_lock = Semaphore()
         self.offset_ms = 0
+        # The request weight used in the current minute as returned by binance
+        self.used_weight_1m = 0
+        self._binance_assets: Dict[str, Optional[Asset]] = {}
+        # Trade cursors found by the running trade history query. Saved only with its trades
+        self._pending_trade_cursors: Optional[Dict[str, Tuple[int, Timestamp]]] = None
 
     def first_connection(self) -> None:
         if self.first_connection_made:
@@ -294,7 +312,7 @@ class Binance(ExchangeInterface):  # lgtm[py/missing-call-to-init]
 
         while True:
             with self.nonce_lock:
-                # Protect this region with a lock since binance will reject
+                # Protect the signing with a lock since binance will reject
                 # non-increasing nonces. So if two greenlets come in here at
                 # the same time one of them will fail
                 if 'signature' in call_options:
@@ -341,13 +359,20 @@ class Binance(ExchangeInterface):  # lgtm[py/missing-call-to-init]
                     f'https://{api_subdomain}.{self.uri}{api_type}/v{str(api_version)}/{method}?'
                 )
                 request_url += urlencode(call_options)
-                log.debug(f'{self.name} API request', request_url=request_url)
-                try:
-                    response = self.session.get(request_url)
-                except requests.exceptions.RequestException as e:
-                    raise RemoteError(
-                        f'{self.name} API request failed due to {str(e)}',
-                    ) from e
+
+            # Only the signing needs the lock. Requests themselves can run concurrently
+            log.debug(f'{self.name} API request', request_url=request_url)
+            try:
+                response = self.session.get(request_url)
+            except requests.exceptions.RequestException as e:
+                raise RemoteError(
+                    f'{self.name} API request failed due to {str(e)}',
+                ) from e
+
+            try:
+                self.used_weight_1m = int(response.headers.get('x-mbx-used-weight-1m', '0'))
+            except ValueError:
+                pass
 
             if response.status_code not in (200, 418, 429):
                 code = 'no code found'
@@ -804,61 +829,249 @@ class Binance(ExchangeInterface):  # lgtm[py/missing-call-to-init]
         )
         return dict(returned_balances), ''
 
+    def _wait_for_request_weight(self, weight: int) -> None:
+        """Waits for the next minute if querying the given weight from all concurrent
+        trade queries could exceed the trade history request weight budget"""
+        while self.used_weight_1m + weight * MY_TRADES_CONCURRENCY > MY_TRADES_WEIGHT_PER_MINUTE:
+            server_ms = ts_now_in_ms() + self.offset_ms
+            wait_secs = (60000 - server_ms % 60000) / 1000
+            log.debug(f'{self.name} request weight budget is used up. Waiting', seconds=wait_secs)
+            gevent.sleep(wait_secs)
+            self.used_weight_1m = 0
+
+    def _binance_asset(self, binance_asset: str) -> Optional[Asset]:
+        """Returns the asset of a binance asset symbol or None if it's not known"""
+        if binance_asset not in self._binance_assets:
+            try:
+                asset: Optional[Asset] = asset_from_binance(binance_asset)
+            except (UnknownAsset, UnsupportedAsset, DeserializationError):
+                asset = None
+            self._binance_assets[binance_asset] = asset
+
+        return self._binance_assets[binance_asset]
+
+    def _symbols_with_assets(self, assets: Set[Asset], exclude: Set[str]) -> List[str]:
+        """Returns the symbols not in exclude whose base or quote asset is in the assets"""
+        symbols = []
+        for symbol, pair in self._symbols_to_pair.items():
+            if symbol in exclude:
+                continue
+            if (
+                self._binance_asset(pair.binance_base_asset) in assets or
+                self._binance_asset(pair.binance_quote_asset) in assets
+            ):
+                symbols.append(symbol)
+
+        return symbols
+
+    def _symbols_assets(self, symbols: List[str]) -> Set[Asset]:
+        """Returns the known base and quote assets of the given symbols"""
+        assets = set()
+        for symbol in symbols:
+            pair = self._symbols_to_pair.get(symbol)
+            if pair is None:
+                continue
+            for binance_asset in (pair.binance_base_asset, pair.binance_quote_asset):
+                asset = self._binance_asset(binance_asset)
+                if asset is not None:
+                    assets.add(asset)
+
+        return assets
+
+    def _query_trade_candidate_assets(self, end_ts: Timestamp) -> Set[Asset]:
+        """Returns the assets the user held or moved in or out of the exchange
+
+        Any trade of the user has to start from one of those or from an asset bought
+        with one of those. The deposits/withdrawals query is cached so it also
+        serves the asset movements query of the exchange that follows.
+
+        May raise:
+        - RemoteError
+        - BinancePermissionError
+        """
+        assets = set()
+        account_data = self.api_query_dict('api', 'account')
+        for entry in account_data.get('balances', []):
+            try:
+                amount = deserialize_asset_amount(entry['free']) + deserialize_asset_amount(entry['locked'])  # noqa: E501
+                asset = self._binance_asset(str(entry['asset']))
+            except (KeyError, DeserializationError):
+                continue
+            if asset is not None and amount != ZERO:
+                assets.add(asset)
+
+        movements = self.query_deposits_withdrawals(
+            start_ts=Timestamp(0),
+            end_ts=end_ts,
+            only_cache=False,
+        )
+        assets.update(x.asset for x in movements)
+        return assets
+
+    def _query_symbol_trades(self, symbol: str, from_id: int) -> List[Dict[str, Any]]:
+        """Query all trades of a symbol starting from the trade with the given id
+
+        May raise due to api query and unexpected id:
+        - RemoteError
+        - BinancePermissionError
+        """
+        raw_data = []
+        last_trade_id = from_id
+        len_result = MY_TRADES_LIMIT
+        while len_result == MY_TRADES_LIMIT:
+            self._wait_for_request_weight(MY_TRADES_WEIGHT)
+            # We know that myTrades returns a list from the api docs
+            result = self.api_query_list(
+                'api',
+                'myTrades',
+                options={
+                    'symbol': symbol,
+                    'fromId': last_trade_id,
+                    'limit': MY_TRADES_LIMIT,
+                    # Not specifying them since binance does not seem to
+                    # respect them and always return all trades
+                    # 'startTime': start_ts * 1000,
+                    # 'endTime': end_ts * 1000,
+                })
+            if result:
+                try:
+                    last_trade_id = int(result[-1]['id']) + 1
+                except (ValueError, KeyError, IndexError) as e:
+                    raise RemoteError(
+                        f'Could not parse id from Binance myTrades api query result: {result}',
+                    ) from e
+
+            len_result = len(result)
+            log.debug(f'{self.name} myTrades query result', results_num=len_result)
+            for r in result:
+                r['symbol'] = symbol
+            raw_data.extend(result)
+
+        return raw_data
+
+    @staticmethod
+    def _next_trade_cursor(
+            raw_trades: List[Dict[str, Any]],
+            from_id: int,
+            end_ts: Timestamp,
+    ) -> int:
+        """Returns the id of the first trade after end_ts or that can't be read.
+        All trades before it are in the queried range or before it"""
+        next_id = from_id
+        for raw_trade in raw_trades:
+            try:
+                if deserialize_timestamp_from_binance(raw_trade['time']) > end_ts:
+                    break
+                next_id = int(raw_trade['id']) + 1
+            except (KeyError, ValueError, DeserializationError):
+                break
+
+        return next_id
+
+    def query_trade_history(
+            self,
+            start_ts: Timestamp,
+            end_ts: Timestamp,
+            only_cache: bool,
+    ) -> List[Trade]:
+        """Same as the ExchangeInterface trade history query but also saves the trade
+        cursors of the queried symbols along with the newly found trades"""
+        self._pending_trade_cursors = {}
+        try:
+            trades = super().query_trade_history(
+                start_ts=start_ts,
+                end_ts=end_ts,
+                only_cache=only_cache,
+            )
+            if len(self._pending_trade_cursors) != 0:
+                self.db.set_binance_trade_cursors(
+                    location=self.name,
+                    cursors=[(x, *y) for x, y in self._pending_trade_cursors.items()],
+                )
+        finally:
+            self._pending_trade_cursors = None
+
+        return trades
+
     def query_online_trade_history(
             self,
             start_ts: Timestamp,
             end_ts: Timestamp,
             markets: Optional[List[str]] = None,
     ) -> List[Trade]:
-        """
+        """Queries the trades of the given markets or of all the markets the user
+        may have traded in.
+
+        Without given markets, the markets of the assets the user holds or moved in
+        or out of binance are queried first. Then also those of the assets found in
+        the trades of the previous round until no new asset is found.
+
+        Each symbol is queried starting from its saved trade cursor if the cursor
+        covers everything up to start_ts. Otherwise from its first trade.
 
         May raise due to api query and unexpected id:
         - RemoteError
         - BinancePermissionError
         """
         self.first_connection()
-
-        if not markets:
-            iter_markets = list(self._symbols_to_pair.keys())
+        cursors = self.db.get_binance_trade_cursors(self.name)
+        if self._pending_trade_cursors is not None:
+            cursors.update(self._pending_trade_cursors)
+        if markets:
+            candidates = markets
         else:
-            iter_markets = markets
+            candidates = [x for x in cursors if x in self._symbols_to_pair]
+            assets = self._query_trade_candidate_assets(end_ts)
+            assets.update(self._symbols_assets(candidates))
+            candidates.extend(self._symbols_with_assets(assets=assets, exclude=set(candidates)))
 
         raw_data = []
-        # Limit of results to return. 1000 is max limit according to docs
-        limit = 1000
-        for symbol in iter_markets:
-            last_trade_id = 0
-            len_result = limit
-            while len_result == limit:
-                # We know that myTrades returns a list from the api docs
-                result = self.api_query_list(
-                    'api',
-                    'myTrades',
-                    options={
-                        'symbol': symbol,
-                        'fromId': last_trade_id,
-                        'limit': limit,
-                        # Not specifying them since binance does not seem to
-                        # respect them and always return all trades
-                        # 'startTime': start_ts * 1000,
-                        # 'endTime': end_ts * 1000,
-                    })
-                if result:
-                    try:
-                        last_trade_id = int(result[-1]['id']) + 1
-                    except (ValueError, KeyError, IndexError) as e:
-                        raise RemoteError(
-                            f'Could not parse id from Binance myTrades api query result: {result}',
-                        ) from e
-
-                len_result = len(result)
-                log.debug(f'{self.name} myTrades query result', results_num=len_result)
-                for r in result:
-                    r['symbol'] = symbol
+        queried_symbols: Set[str] = set()
+        pool = Pool(size=MY_TRADES_CONCURRENCY)
+        while len(candidates) != 0:
+            queried_symbols.update(candidates)
+            from_ids = {}
+            for symbol in candidates:
+                cursor = cursors.get(symbol)
+                if cursor is not None and cursor[1] >= end_ts:
+                    continue  # all trades of this range are already saved
+                if cursor is not None and cursor[1] >= start_ts - 1:
+                    from_ids[symbol] = cursor[0]
+                elif start_ts <= BINANCE_LAUNCH_TS:
+                    from_ids[symbol] = 0  # querying all trades so can create a cursor
+                else:
+                    from_ids[symbol] = -1  # trades before start_ts are dropped. No cursor
+
+            symbols = list(from_ids)
+            try:
+                results = pool.map(
+                    lambda x: self._query_symbol_trades(symbol=x, from_id=max(from_ids[x], 0)),
+                    symbols,
+                )
+            finally:
+                pool.kill()
+            traded_symbols = []
+            for symbol, result in zip(symbols, results):
                 raw_data.extend(result)
+                if len(result) != 0:
+                    traded_symbols.append(symbol)
+                if self._pending_trade_cursors is None or from_ids[symbol] < 0:
+                    # the trades are not saved by the caller or did not start from a cursor
+                    continue
+                if len(result) != 0 or symbol in cursors:
+                    self._pending_trade_cursors[symbol] = (
+                        self._next_trade_cursor(result, from_id=from_ids[symbol], end_ts=end_ts),
+                        end_ts,
+                    )
 
-            raw_data.sort(key=lambda x: x['time'])
+            if markets:
+                break
+            candidates = self._symbols_with_assets(
+                assets=self._symbols_assets(traded_symbols),
+                exclude=queried_symbols,
+            )
 
+        raw_data.sort(key=lambda x: x['time'])
         trades = []
         for raw_trade in raw_data:
             try:
@@ -176,16 +176,17 @@ class ExchangeInterface(CacheableMixIn, LockableQueryMixIn):
                 end_ts=query_end_ts,
             ))
 
-        # make sure to add them to the DB
-        if new_trades != []:
-            self.db.add_trades(new_trades)
-        # and also set the used queried timestamp range for the exchange
-        ranges.update_used_query_range(
-            location_string=f'{self.name}_trades',
-            start_ts=start_ts,
-            end_ts=end_ts,
-            ranges_to_query=ranges_to_query,
-        )
+        with self.db.unit_of_work():
+            # make sure to add them to the DB
+            if new_trades != []:
+                self.db.add_trades(new_trades)
+            # and also set the used queried timestamp range for the exchange
+            ranges.update_used_query_range(
+                location_string=f'{self.name}_trades',
+                start_ts=start_ts,
+                end_ts=end_ts,
+                ranges_to_query=ranges_to_query,
+            )
         # finally append them to the already returned DB trades
         trades.extend(new_trades)
 
@@ -216,16 +217,17 @@ class ExchangeInterface(CacheableMixIn, LockableQueryMixIn):
                 end_ts=query_end_ts,
             ))
 
-        # make sure to add them to the DB
-        if new_positions != []:
-            self.db.add_margin_positions(new_positions)
-        # and also set the last queried timestamp for the exchange
-        ranges.update_used_query_range(
-            location_string=f'{self.name}_margins',
-            start_ts=start_ts,
-            end_ts=end_ts,
-            ranges_to_query=ranges_to_query,
-        )
+        with self.db.unit_of_work():
+            # make sure to add them to the DB
+            if new_positions != []:
+                self.db.add_margin_positions(new_positions)
+            # and also set the last queried timestamp for the exchange
+            ranges.update_used_query_range(
+                location_string=f'{self.name}_margins',
+                start_ts=start_ts,
+                end_ts=end_ts,
+                ranges_to_query=ranges_to_query,
+            )
         # finally append them to the already returned DB margin positions
         margin_positions.extend(new_positions)
 
@@ -264,14 +266,15 @@ class ExchangeInterface(CacheableMixIn, LockableQueryMixIn):
                 end_ts=query_end_ts,
             ))
 
-        if new_movements != []:
-            self.db.add_asset_movements(new_movements)
-        ranges.update_used_query_range(
-            location_string=f'{self.name}_asset_movements',
-            start_ts=start_ts,
-            end_ts=end_ts,
-            ranges_to_query=ranges_to_query,
-        )
+        with self.db.unit_of_work():
+            if new_movements != []:
+                self.db.add_asset_movements(new_movements)
+            ranges.update_used_query_range(
+                location_string=f'{self.name}_asset_movements',
+                start_ts=start_ts,
+                end_ts=end_ts,
+                ranges_to_query=ranges_to_query,
+            )
         asset_movements.extend(new_movements)
 
         return asset_movements
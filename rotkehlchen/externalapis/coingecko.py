@@ -1,5 +1,6 @@
 import json
 import logging
+from collections import defaultdict
 from pathlib import Path
 from typing import Any, Dict, List, NamedTuple, Optional, Union, overload
 from urllib.parse import urlencode
@@ -24,6 +25,8 @@ logger = logging.getLogger(__name__)
 log = RotkehlchenLogsAdapter(logger)
 
 COINGECKO_QUERY_RETRY_TIMES = 4
+# Number of coingecko ids queried at once in the simple/price endpoint. Keeps the URL short.
+COINGECKO_SIMPLE_PRICE_IDS_PER_QUERY = 100
 
 
 class CoingeckoImageURLs(NamedTuple):
@@ -433,6 +436,64 @@ class Coingecko():
             )
             return Price(ZERO)
 
+    def query_multiple_current_prices(
+            self,
+            from_assets: List[Asset],
+            to_asset: Asset,
+    ) -> Dict[Asset, Price]:
+        """Returns the simple prices of many assets to to_asset in coingecko
+
+        Uses the simple/price endpoint of coingecko with many ids per query. Assets
+        not supported in coingecko or for which coingecko returned no price are
+        not in the result.
+
+        May raise:
+        - RemoteError if there is a problem querying coingecko
+        """
+        vs_currency = to_asset.identifier.lower()
+        if vs_currency not in COINGECKO_SIMPLE_VS_CURRENCIES:
+            log.warning(
+                f'Tried to query coingecko simple prices to {to_asset.identifier}. '
+                f'But to_asset is not supported',
+            )
+            return {}
+
+        id_to_assets: Dict[str, List[Asset]] = defaultdict(list)
+        for from_asset in from_assets:
+            try:
+                id_to_assets[from_asset.to_coingecko()].append(from_asset)
+            except UnsupportedAsset:
+                log.warning(
+                    f'Tried to query coingecko simple price from {from_asset.identifier} '
+                    f'to {to_asset.identifier}. But from_asset is not supported in coingecko',
+                )
+
+        prices: Dict[Asset, Price] = {}
+        coingecko_ids = list(id_to_assets.keys())
+        for idx in range(0, len(coingecko_ids), COINGECKO_SIMPLE_PRICE_IDS_PER_QUERY):
+            queried_ids = coingecko_ids[idx:idx + COINGECKO_SIMPLE_PRICE_IDS_PER_QUERY]
+            result = self._query(
+                module='simple/price',
+                options={
+                    'ids': ','.join(queried_ids),
+                    'vs_currencies': vs_currency,
+                })
+            for coingecko_id in queried_ids:
+                try:
+                    price = Price(FVal(result[coingecko_id][vs_currency]))
+                except KeyError as e:
+                    log.warning(
+                        f'Queried coingecko simple price of {coingecko_id} to '
+                        f'{to_asset.identifier}. But got key error for {str(e)} when '
+                        f'processing the result.',
+                    )
+                    continue
+
+                for from_asset in id_to_assets[coingecko_id]:
+                    prices[from_asset] = price
+
+        return prices
+
     def can_query_history(  # pylint: disable=no-self-use
             self,
             from_asset: Asset,  # pylint: disable=unused-argument
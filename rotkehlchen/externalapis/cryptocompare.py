@@ -1,9 +1,19 @@
 import logging
 import os
-from collections import deque
+from collections import defaultdict
 from json.decoder import JSONDecodeError
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 
 import gevent
 import requests
@@ -65,6 +75,8 @@ log = RotkehlchenLogsAdapter(logger)
 RATE_LIMIT_MSG = 'You are over your rate limit please upgrade your account!'
 CRYPTOCOMPARE_QUERY_RETRY_TIMES = 3
 CRYPTOCOMPARE_RATE_LIMIT_WAIT_TIME = 60
+# Maximum length of the comma separated from symbols of a pricemulti query
+CRYPTOCOMPARE_PRICEMULTI_FSYMS_MAX_LENGTH = 300
 CRYPTOCOMPARE_SPECIAL_CASES_MAPPING = {
     Asset('ADADOWN'): A_USDT,
     Asset('ADAUP'): A_USDT,
@@ -242,6 +254,41 @@ def _check_hourly_data_sanity(
         index += 2
 
 
+def _histohour_entries_to_prices(
+        data: List[Dict[str, Any]],
+        from_asset: Asset,
+        to_asset: Asset,
+) -> List[HistoricalPrice]:
+    """Turn histohour entries into the historical prices we store in the DB
+
+    Entries with zero price or that can't be deserialized are skipped
+    """
+    prices = []
+    for entry in data:
+        try:
+            price = Price((deserialize_price(entry['high']) + deserialize_price(entry['low'])) / 2)  # noqa: E501
+            if price == Price(ZERO):
+                continue  # don't write zero prices
+            prices.append(HistoricalPrice(
+                from_asset=from_asset,
+                to_asset=to_asset,
+                source=HistoricalPriceOracle.CRYPTOCOMPARE,
+                timestamp=Timestamp(entry['time']),
+                price=price,
+            ))
+        except (DeserializationError, KeyError) as e:
+            msg = str(e)
+            if isinstance(e, KeyError):
+                msg = f'Missing key entry for {msg}.'
+            log.error(
+                f'{msg}. Error getting price entry from cryptocompare histohour '
+                f'price results. Skipping entry.',
+            )
+            continue
+
+    return prices
+
+
 class Cryptocompare(ExternalServiceWithApiKey):
     def __init__(self, data_directory: Path, database: Optional['DBHandler']) -> None:
         super().__init__(database=database, service_name=ExternalService.CRYPTOCOMPARE)
@@ -506,6 +553,67 @@ class Cryptocompare(ExternalServiceWithApiKey):
 
         return Price(FVal(result[cc_to_asset_symbol]))
 
+    def query_multiple_current_prices(
+            self,
+            from_assets: List[Asset],
+            to_asset: Asset,
+    ) -> Dict[Asset, Price]:
+        """Returns the current prices of many assets compared to another asset
+
+        Uses the pricemulti endpoint with as many assets per query as its limit allows.
+        Assets that need special case handling are queried one by one. Assets not
+        known to cryptocompare or without a price are not in the result.
+
+        - May raise RemoteError if there is a problem reaching the cryptocompare server
+        or with reading the response returned by the server
+        - May raise PriceQueryUnsupportedAsset if to_asset is not known to cryptocompare
+        """
+        try:
+            cc_to_asset_symbol = to_asset.to_cryptocompare()
+        except UnsupportedAsset as e:
+            raise PriceQueryUnsupportedAsset(e.asset_name) from e
+
+        prices: Dict[Asset, Price] = {}
+        symbol_to_assets: Dict[str, List[Asset]] = defaultdict(list)
+        for from_asset in from_assets:
+            if from_asset in CRYPTOCOMPARE_SPECIAL_CASES or to_asset in CRYPTOCOMPARE_SPECIAL_CASES:  # noqa: E501
+                try:
+                    price = self.query_current_price(from_asset=from_asset, to_asset=to_asset)
+                except PriceQueryUnsupportedAsset:
+                    continue
+                if price != Price(ZERO):
+                    prices[from_asset] = price
+                continue
+
+            try:
+                symbol_to_assets[from_asset.to_cryptocompare()].append(from_asset)
+            except UnsupportedAsset:
+                continue
+
+        symbol_chunks: List[List[str]] = []
+        fsyms_length = 0
+        for symbol in symbol_to_assets:
+            if len(symbol_chunks) == 0 or fsyms_length + len(symbol) + 1 > CRYPTOCOMPARE_PRICEMULTI_FSYMS_MAX_LENGTH:  # noqa: E501
+                symbol_chunks.append([symbol])
+                fsyms_length = len(symbol)
+            else:
+                symbol_chunks[-1].append(symbol)
+                fsyms_length += len(symbol) + 1
+
+        for queried_symbols in symbol_chunks:
+            query_path = f'pricemulti?fsyms={",".join(queried_symbols)}&tsyms={cc_to_asset_symbol}'  # noqa: E501
+            result = self._api_query(path=query_path)
+            for symbol in queried_symbols:
+                # Symbols cryptocompare has no price for are missing from the result
+                price = result.get(symbol, {}).get(cc_to_asset_symbol)
+                if price is None:
+                    continue
+
+                for from_asset in symbol_to_assets[symbol]:
+                    prices[from_asset] = Price(FVal(price))
+
+        return prices
+
     def query_endpoint_pricehistorical(
             self,
             from_asset: Asset,
@@ -559,27 +667,29 @@ class Cryptocompare(ExternalServiceWithApiKey):
 
         return Price(FVal(result[cc_from_asset_symbol][cc_to_asset_symbol]))
 
-    def _get_histohour_data_for_range(
+    def _iterate_histohour_data_for_range(
             self,
             from_asset: Asset,
             to_asset: Asset,
             from_timestamp: Timestamp,
             to_timestamp: Timestamp,
-    ) -> Deque[Dict[str, Any]]:
+    ) -> Iterator[Tuple[List[Dict[str, Any]], Timestamp]]:
         """Query histohour data from cryptocompare for a time range going backwards in time
 
         Will stop when to_timestamp is reached OR when no more prices are returned
 
-        Returns a list of histohour entries with increasing timestamp. Starting from
-        to_timestamp (or higher) if no data and ending in from_timestamp or lower, if no data
+        Yields one page of histohour entries at a time, each page with increasing timestamps.
+        Pages are yielded going backwards in time, starting from from_timestamp (or higher)
+        and ending after to_timestamp. Along with each page the timestamp from which the
+        next page is queried is yielded, so that an interrupted query can be resumed.
 
         May raise:
         - RemoteError if there is problems with the query
         """
-        msg = '_get_histohour_data_for_range from_timestamp should be bigger than to_timestamp'
+        msg = '_iterate_histohour_data_for_range from_timestamp should be bigger than to_timestamp'  # noqa: E501
         assert from_timestamp >= to_timestamp, msg
 
-        calculated_history: Deque[Dict[str, Any]] = deque()
+        earliest_yielded_ts = None
         end_date = from_timestamp
         while True:
             log.debug(
@@ -616,28 +726,22 @@ class Cryptocompare(ExternalServiceWithApiKey):
                     # just add only the part from the previous timestamp and on
                     resp['Data'] = resp['Data'][diff // 3600:]
 
-            # If last time slot and first new are the same, skip the first new slot
-            last_entry_equal_to_first = (
-                len(calculated_history) != 0 and
-                calculated_history[0]['time'] == resp['Data'][-1]['time']
-            )
-            if last_entry_equal_to_first:
-                resp['Data'] = resp['Data'][:-1]
-            if len(calculated_history) != 0:
-                calculated_history.extendleft(reversed(resp['Data']))
-            else:
-                calculated_history = deque(resp['Data'])
-
-            if end_date - to_timestamp <= 3600:
-                # Ending the loop query. Also pop any extra timestamps
-                while (
-                        len(calculated_history) != 0 and
-                        calculated_history[0]['time'] <= to_timestamp
-                ):
-                    calculated_history.popleft()
-                break
+            page = resp['Data']
+            # If last time slot of the new page and first of the previous one are the
+            # same, skip the last slot of the new page
+            if len(page) != 0 and page[-1]['time'] == earliest_yielded_ts:
+                page = page[:-1]
+
+            reached_end = end_date - to_timestamp <= 3600
+            if reached_end:  # also drop any extra timestamps
+                page = [x for x in page if x['time'] > to_timestamp]
+
+            if len(page) != 0:
+                earliest_yielded_ts = page[0]['time']
+                yield page, end_date
 
-        return calculated_history
+            if reached_end:
+                break
 
     def create_cache(
             self,
@@ -682,6 +786,53 @@ class Cryptocompare(ExternalServiceWithApiKey):
             timestamp=now,
         )
 
+    @staticmethod
+    def _get_backfill_setting_names(from_asset: Asset, to_asset: Asset) -> Tuple[str, str]:
+        """Names of the global DB settings that keep track of an unfinished histohour query
+
+        The first keeps the timestamp from which the next page should be queried
+        and the second the timestamp down to which the query should go.
+        """
+        prefix = f'cc_histohour_backfill_{from_asset.identifier}_{to_asset.identifier}'
+        return f'{prefix}_next', f'{prefix}_until'
+
+    def _query_and_store_histohour_range(
+            self,
+            from_asset: Asset,
+            to_asset: Asset,
+            from_timestamp: Timestamp,
+            to_timestamp: Timestamp,
+    ) -> None:
+        """Query histohour data for a range going backwards in time and store each page
+        in the global DB as soon as it arrives
+
+        After each stored page the point at which the query should continue is saved
+        in the global DB so that if the query is interrupted it can be resumed.
+
+        - May raise RemoteError if there is a problem reaching the cryptocompare server
+        or with reading the response returned by the server
+        """
+        next_setting, until_setting = self._get_backfill_setting_names(from_asset, to_asset)
+        globaldb = GlobalDBHandler()
+        for page, next_end_date in self._iterate_histohour_data_for_range(
+                from_asset=from_asset,
+                to_asset=to_asset,
+                from_timestamp=from_timestamp,
+                to_timestamp=to_timestamp,
+        ):
+            # Let's always check for data sanity for the hourly prices.
+            _check_hourly_data_sanity(page, from_asset, to_asset)
+            globaldb.add_historical_prices(_histohour_entries_to_prices(
+                data=page,
+                from_asset=from_asset,
+                to_asset=to_asset,
+            ))
+            globaldb.add_setting_value(next_setting, next_end_date, commit=False)
+            globaldb.add_setting_value(until_setting, to_timestamp)
+
+        globaldb.delete_setting_value(next_setting)
+        globaldb.delete_setting_value(until_setting)
+
     def query_and_store_historical_data(
             self,
             from_asset: Asset,
@@ -691,6 +842,9 @@ class Cryptocompare(ExternalServiceWithApiKey):
         """
         Get historical hour price data from cryptocompare and populate the global DB
 
+        The data are queried and stored one page at a time. If a previous query
+        for the pair was interrupted it is first resumed from its last stored page.
+
         - May raise RemoteError if there is a problem reaching the cryptocompare server
         or with reading the response returned by the server
         - May raise UnsupportedAsset if from/to asset is not supported by cryptocompare
@@ -705,6 +859,24 @@ class Cryptocompare(ExternalServiceWithApiKey):
         now_ts = ts_now()
         # save time at start of the query, in case the query does not complete due to rate limit
         self.last_histohour_query_ts = now_ts
+        next_setting, until_setting = self._get_backfill_setting_names(from_asset, to_asset)
+        resume_from_ts = GlobalDBHandler().get_setting_value(next_setting, -1)
+        if resume_from_ts != -1:
+            resume_until_ts = GlobalDBHandler().get_setting_value(until_setting, 0)
+            log.debug(
+                'Resuming interrupted cryptocompare histohour query',
+                from_asset=from_asset,
+                to_asset=to_asset,
+                from_timestamp=resume_from_ts,
+                to_timestamp=resume_until_ts,
+            )
+            self._query_and_store_histohour_range(
+                from_asset=from_asset,
+                to_asset=to_asset,
+                from_timestamp=Timestamp(resume_from_ts),
+                to_timestamp=Timestamp(resume_until_ts),
+            )
+
         range_result = GlobalDBHandler().get_historical_price_range(
             from_asset=from_asset,
             to_asset=to_asset,
@@ -715,7 +887,7 @@ class Cryptocompare(ExternalServiceWithApiKey):
             first_cached_ts, last_cached_ts = range_result
             if timestamp > last_cached_ts:
                 # We have a cache but the requested timestamp does not hit it
-                new_data = self._get_histohour_data_for_range(
+                self._query_and_store_histohour_range(
                     from_asset=from_asset,
                     to_asset=to_asset,
                     from_timestamp=now_ts,
@@ -723,7 +895,7 @@ class Cryptocompare(ExternalServiceWithApiKey):
                 )
             else:
                 # only other possibility, timestamp < cached start_time
-                new_data = self._get_histohour_data_for_range(
+                self._query_and_store_histohour_range(
                     from_asset=from_asset,
                     to_asset=to_asset,
                     from_timestamp=first_cached_ts,
@@ -731,45 +903,13 @@ class Cryptocompare(ExternalServiceWithApiKey):
                 )
 
         else:
-            new_data = self._get_histohour_data_for_range(
+            self._query_and_store_histohour_range(
                 from_asset=from_asset,
                 to_asset=to_asset,
                 from_timestamp=now_ts,
                 to_timestamp=Timestamp(0),
             )
 
-        calculated_history = list(new_data)
-
-        if len(calculated_history) == 0:
-            return
-
-        # Let's always check for data sanity for the hourly prices.
-        _check_hourly_data_sanity(calculated_history, from_asset, to_asset)
-        # Turn them into the format we will enter in the DB
-        prices = []
-        for entry in calculated_history:
-            try:
-                price = Price((deserialize_price(entry['high']) + deserialize_price(entry['low'])) / 2)  # noqa: E501
-                if price == Price(ZERO):
-                    continue  # don't write zero prices
-                prices.append(HistoricalPrice(
-                    from_asset=from_asset,
-                    to_asset=to_asset,
-                    source=HistoricalPriceOracle.CRYPTOCOMPARE,
-                    timestamp=Timestamp(entry['time']),
-                    price=price,
-                ))
-            except (DeserializationError, KeyError) as e:
-                msg = str(e)
-                if isinstance(e, KeyError):
-                    msg = f'Missing key entry for {msg}.'
-                log.error(
-                    f'{msg}. Error getting price entry from cryptocompare histohour '
-                    f'price results. Skipping entry.',
-                )
-                continue
-
-        GlobalDBHandler().add_historical_prices(prices)
         self.last_histohour_query_ts = ts_now()  # also save when last query finished
 
     @staticmethod
@@ -91,6 +91,9 @@ class Etherscan(ExternalServiceWithApiKey):
         self.warning_given = False
         self.session.headers.update({'User-Agent': 'rotkehlchen'})
 
+    def has_api_key(self) -> bool:
+        return self._get_api_key() is not None
+
     @overload
     def _query(  # pylint: disable=no-self-use
             self,
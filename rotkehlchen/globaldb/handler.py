@@ -3,7 +3,18 @@ import shutil
 import sqlite3
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union, cast, overload
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+    overload,
+)
 
 from typing_extensions import Literal
 
@@ -16,6 +27,13 @@ from rotkehlchen.chain.ethereum.typing import (
 )
 from rotkehlchen.constants.resolver import ethaddress_to_identifier
 from rotkehlchen.errors import DeserializationError, InputError, UnknownAsset
+from rotkehlchen.globaldb.price_cache import (
+    DEFAULT_PRICE_SERIES_CACHE_BYTES,
+    PriceSeries,
+    PriceSeriesCache,
+    price_series_entry,
+    price_series_key,
+)
 from rotkehlchen.globaldb.upgrades.v1_v2 import upgrade_ethereum_asset_ids
 from rotkehlchen.history.typing import HistoricalPrice, HistoricalPriceOracle
 from rotkehlchen.typing import ChecksumEthAddress, Timestamp
@@ -29,6 +47,8 @@ if TYPE_CHECKING:
 log = logging.getLogger(__name__)
 
 GLOBAL_DB_VERSION = 2
+# The tables holding the data returned for each asset by iterate_all_asset_data()
+ASSET_DATA_TABLES = ('assets', 'ethereum_tokens', 'common_asset_details')
 
 
 def _get_setting_value(cursor: sqlite3.Cursor, name: str, default_value: int) -> int:
@@ -51,6 +71,30 @@ def _initialize_temp_db_directory() -> TemporaryDirectory:
     return tempdir
 
 
+def _bump_assets_version() -> None:
+    GlobalDBHandler._assets_version += 1
+
+
+def _track_asset_changes(connection: sqlite3.Connection) -> None:
+    """Bump the assets version at every write to the asset data tables
+
+    The temporary triggers call back into python so that the version keeps increasing
+    across connections and is not reverted by a rollback. A rolled back write then
+    only costs a spurious change of the version.
+    """
+    connection.create_function('asset_data_changed', 0, _bump_assets_version)
+    script = ''
+    for table in ASSET_DATA_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            script += (
+                f'CREATE TEMP TRIGGER IF NOT EXISTS {table}_{event.lower()}_tracker '
+                f'AFTER {event} ON {table} BEGIN SELECT asset_data_changed(); END;'
+            )
+    connection.executescript(script)
+    # A new connection may be to a DB with different assets
+    _bump_assets_version()
+
+
 def _initialize_globaldb(dbpath: Path) -> sqlite3.Connection:
     connection = sqlite3.connect(dbpath)
     connection.executescript(DB_SCRIPT_CREATE_TABLES)
@@ -69,6 +113,7 @@ def _initialize_globaldb(dbpath: Path) -> sqlite3.Connection:
         ('version', str(GLOBAL_DB_VERSION)),
     )
     connection.commit()
+    _track_asset_changes(connection)
     return connection
 
 
@@ -90,6 +135,8 @@ class GlobalDBHandler():
     _data_directory: Optional[Path] = None
     _temp_db_directory: Optional[TemporaryDirectory] = None
     _conn: sqlite3.Connection
+    _price_series_cache: Optional[PriceSeriesCache] = None
+    _assets_version: int = 0
 
     def __new__(
             cls,
@@ -112,6 +159,8 @@ class GlobalDBHandler():
                     GlobalDBHandler.__instance._temp_db_directory.cleanup()
                     GlobalDBHandler.__instance._temp_db_directory = None
                     GlobalDBHandler.__instance._data_directory = data_dir
+                    if GlobalDBHandler.__instance._price_series_cache is not None:
+                        GlobalDBHandler.__instance._price_series_cache.clear()
                     # and initialize it in the proper place
                     GlobalDBHandler.__instance._conn = _initialize_global_db_directory(data_dir)
 
@@ -154,6 +203,14 @@ class GlobalDBHandler():
         if commit:
             connection.commit()
 
+    @staticmethod
+    def delete_setting_value(name: str) -> None:
+        """Delete a setting, which makes it revert to its default value"""
+        connection = GlobalDBHandler()._conn
+        cursor = connection.cursor()
+        cursor.execute('DELETE FROM settings WHERE name=?', (name,))
+        connection.commit()
+
     @staticmethod
     def add_asset(
             asset_id: str,
@@ -242,11 +299,25 @@ class GlobalDBHandler():
         If mapping is True, return them as a Dict of identifier to data
         If mapping is False, return them as a List of AssetData
         """
-        result: Union[List[AssetData], Dict[str, Dict[str, Any]]]
+        assets = GlobalDBHandler().iterate_all_asset_data()
         if mapping:
-            result = {}
-        else:
-            result = []
+            return {x.identifier: x.serialize() for x in assets}
+        return list(assets)
+
+    @staticmethod
+    def get_assets_version() -> Optional[int]:
+        """Returns a number that increases whenever the data of any asset changes
+
+        Returns None while there are uncommitted writes, since the data read
+        then may still be rolled back.
+        """
+        if GlobalDBHandler()._conn.in_transaction:
+            return None
+        return GlobalDBHandler._assets_version
+
+    @staticmethod
+    def iterate_all_asset_data() -> Iterator[AssetData]:
+        """Yields the data of all assets as they are read from the DB"""
         cursor = GlobalDBHandler()._conn.cursor()
         querystr = """
         SELECT A.identifier, A.type, B.address, B.decimals, A.name, A.symbol, A.started, null, A.swapped_for, A.coingecko, A.cryptocompare, B.protocol from assets as A LEFT OUTER JOIN ethereum_tokens as B
@@ -264,7 +335,7 @@ class GlobalDBHandler():
                 ethereum_address = string_to_ethereum_address(entry[2])
             else:
                 ethereum_address = None
-            data = AssetData(
+            yield AssetData(
                 identifier=entry[0],
                 asset_type=asset_type,
                 ethereum_address=ethereum_address,
@@ -278,12 +349,6 @@ class GlobalDBHandler():
                 cryptocompare=entry[10],
                 protocol=entry[11],
             )
-            if mapping:
-                result[entry[0]] = data.serialize()  # type: ignore
-            else:
-                result.append(data)  # type: ignore
-
-        return result
 
     @staticmethod
     def get_asset_data(
@@ -926,29 +991,148 @@ class GlobalDBHandler():
     ) -> Optional['HistoricalPrice']:
         """Gets the price around a particular timestamp
 
+        The closest entry is found with two probes, one for the latest entry at or before
+        the timestamp and one for the earliest entry at or after it, so that the lookup
+        is a range scan over the pair's timestamp index instead of a full scan.
+
+        If the price series cache is enabled the lookup is answered from the in-memory
+        series of the pair instead, loading it from the DB if needed.
+
         If no price can be found returns None
         """
+        if GlobalDBHandler()._price_series_cache is not None:
+            return GlobalDBHandler()._get_cached_historical_price(
+                from_asset=from_asset,
+                to_asset=to_asset,
+                timestamp=timestamp,
+                max_seconds_distance=max_seconds_distance,
+                source=source,
+            )
+
         connection = GlobalDBHandler()._conn
         cursor = connection.cursor()
         querystr = (
             'SELECT from_asset, to_asset, source_type, timestamp, price FROM price_history '
-            'WHERE from_asset=? AND to_asset=? AND ABS(timestamp - ?) <= ? '
+            'WHERE from_asset=? AND to_asset=?'
         )
-        querylist = [from_asset.identifier, to_asset.identifier, timestamp, max_seconds_distance]
+        querylist: List[Union[str, int]] = [from_asset.identifier, to_asset.identifier]
         if source is not None:
             querystr += ' AND source_type=?'
             querylist.append(source.serialize_for_db())
 
-        querystr += 'ORDER BY ABS(timestamp - ?) ASC LIMIT 1'
-        querylist.append(timestamp)
+        before_result = cursor.execute(
+            querystr + ' AND timestamp <= ? AND timestamp >= ? ORDER BY timestamp DESC LIMIT 1',
+            (*querylist, timestamp, timestamp - max_seconds_distance),
+        ).fetchone()
+        after_result = cursor.execute(
+            querystr + ' AND timestamp >= ? AND timestamp <= ? ORDER BY timestamp ASC LIMIT 1',
+            (*querylist, timestamp, timestamp + max_seconds_distance),
+        ).fetchone()
 
-        query = cursor.execute(querystr, tuple(querylist))
-        result = query.fetchone()
-        if result is None:
+        if before_result is None and after_result is None:
             return None
+        if before_result is None:
+            result = after_result
+        elif after_result is None:
+            result = before_result
+        elif after_result[3] - timestamp < timestamp - before_result[3]:
+            result = after_result
+        else:
+            result = before_result
 
         return HistoricalPrice.deserialize_from_db(result)
 
+    @staticmethod
+    def enable_price_series_cache(max_bytes: int = DEFAULT_PRICE_SERIES_CACHE_BYTES) -> None:
+        """Start answering historical price lookups from in-memory price series
+
+        Each pair's series is loaded from the DB once at its first lookup and kept
+        in memory until evicted by the LRU policy once max_bytes are exceeded.
+        """
+        instance = GlobalDBHandler()
+        if instance._price_series_cache is None:
+            instance._price_series_cache = PriceSeriesCache(max_bytes=max_bytes)
+        else:
+            instance._price_series_cache.max_bytes = max_bytes
+
+    @staticmethod
+    def disable_price_series_cache() -> None:
+        """Stop using the price series cache and free its memory"""
+        instance = GlobalDBHandler()
+        if instance._price_series_cache is not None:
+            instance._price_series_cache.clear()
+            instance._price_series_cache = None
+
+    @staticmethod
+    def price_series_cache_enabled() -> bool:
+        return GlobalDBHandler()._price_series_cache is not None
+
+    @staticmethod
+    def load_price_series(from_asset: 'Asset', to_asset: 'Asset') -> None:
+        """Load all the price series of a pair in the price series cache with a single query
+
+        This populates the series of each source and the one of all sources combined,
+        so that any later lookup of the pair is answered from memory.
+        """
+        instance = GlobalDBHandler()
+        cache = instance._price_series_cache
+        assert cache is not None, 'Should only be called with the price series cache enabled'
+        cursor = instance._conn.cursor()
+        query = cursor.execute(
+            'SELECT timestamp, source_type, price FROM price_history '
+            'WHERE from_asset=? AND to_asset=? ORDER BY timestamp ASC',
+            (from_asset.identifier, to_asset.identifier),
+        )
+        rows = query.fetchall()
+        cache.add(
+            price_series_key(from_asset=from_asset, to_asset=to_asset, source=None),
+            PriceSeries.from_db_rows(rows),
+        )
+        for source in HistoricalPriceOracle:
+            serialized_source = source.serialize_for_db()
+            cache.add(
+                price_series_key(from_asset=from_asset, to_asset=to_asset, source=source),
+                PriceSeries.from_db_rows([x for x in rows if x[1] == serialized_source]),
+            )
+
+    @staticmethod
+    def _get_cached_historical_price(
+            from_asset: 'Asset',
+            to_asset: 'Asset',
+            timestamp: Timestamp,
+            max_seconds_distance: int,
+            source: Optional[HistoricalPriceOracle],
+    ) -> Optional['HistoricalPrice']:
+        instance = GlobalDBHandler()
+        cache = instance._price_series_cache
+        assert cache is not None, 'Should only be called with the price series cache enabled'
+        key = price_series_key(from_asset=from_asset, to_asset=to_asset, source=source)
+        series = cache.get(key)
+        if series is None:
+            querystr = (
+                'SELECT timestamp, source_type, price FROM price_history '
+                'WHERE from_asset=? AND to_asset=?'
+            )
+            querylist = [from_asset.identifier, to_asset.identifier]
+            if source is not None:
+                querystr += ' AND source_type=?'
+                querylist.append(source.serialize_for_db())
+            cursor = instance._conn.cursor()
+            query = cursor.execute(querystr + ' ORDER BY timestamp ASC', tuple(querylist))
+            series = PriceSeries.from_db_rows(query.fetchall())
+            cache.add(key, series)
+
+        index = series.closest_index(timestamp, max_seconds_distance)
+        if index is None:
+            return None
+
+        return price_series_entry(
+            series=series,
+            index=index,
+            from_asset=from_asset,
+            to_asset=to_asset,
+        )
+
     @staticmethod
     def add_historical_prices(entries: List['HistoricalPrice']) -> None:
         """Adds the given historical price entries in the DB
@@ -956,6 +1140,11 @@ class GlobalDBHandler():
         If any addition causes a DB error it's skipped and an error is logged
         """
         connection = GlobalDBHandler()._conn
+        cache = GlobalDBHandler()._price_series_cache
+        if cache is not None:
+            for pair in {(x.from_asset.identifier, x.to_asset.identifier) for x in entries}:
+                cache.invalidate_pair(*pair)
+
         cursor = connection.cursor()
         try:
             cursor.executemany(
@@ -992,6 +1181,10 @@ class GlobalDBHandler():
             source: Optional[HistoricalPriceOracle] = None,
     ) -> None:
         connection = GlobalDBHandler()._conn
+        cache = GlobalDBHandler()._price_series_cache
+        if cache is not None:
+            cache.invalidate_pair(from_asset.identifier, to_asset.identifier)
+
         cursor = connection.cursor()
         querystr = 'DELETE FROM price_history WHERE from_asset=? AND to_asset=?'
         query_list = [from_asset.identifier, to_asset.identifier]
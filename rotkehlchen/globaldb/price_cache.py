@@ -0,0 +1,153 @@
+"""An in-memory cache of whole price_history series of asset pairs
+
+Loading the entire series of a pair once and answering nearest timestamp lookups
+with a bisect is a lot faster than a DB roundtrip per lookup when the same pairs
+are queried thousands of times, as happens during PnL report processing.
+"""
+import sys
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Tuple
+
+from rotkehlchen.history.deserialization import deserialize_price
+from rotkehlchen.history.typing import HistoricalPrice, HistoricalPriceOracle
+from rotkehlchen.typing import Timestamp
+
+if TYPE_CHECKING:
+    from rotkehlchen.assets.asset import Asset
+
+# 256 MB by default
+DEFAULT_PRICE_SERIES_CACHE_BYTES = 256 * 1024 * 1024
+
+# (from_asset identifier, to_asset identifier, serialized source or None for all sources)
+PriceSeriesKey = Tuple[str, str, Optional[str]]
+
+
+def price_series_key(
+        from_asset: 'Asset',
+        to_asset: 'Asset',
+        source: Optional[HistoricalPriceOracle],
+) -> PriceSeriesKey:
+    """The price_history asset columns are case insensitive so the key is lowercased"""
+    return (
+        from_asset.identifier.lower(),
+        to_asset.identifier.lower(),
+        None if source is None else source.serialize_for_db(),
+    )
+
+
+class PriceSeries(NamedTuple):
+    """The price history of a pair in columnar form, sorted by timestamp"""
+    timestamps: array
+    sources: List[str]
+    prices: List[str]
+    size_bytes: int
+
+    @classmethod
+    def from_db_rows(cls, rows: List[Tuple[int, str, str]]) -> 'PriceSeries':
+        """Create a series out of (timestamp, source_type, price) rows sorted by timestamp"""
+        timestamps = array('q', (x[0] for x in rows))
+        sources = [x[1] for x in rows]
+        prices = [x[2] for x in rows]
+        size_bytes = (
+            sys.getsizeof(timestamps) +
+            sys.getsizeof(sources) +
+            sys.getsizeof(prices) +
+            sum(sys.getsizeof(x) for x in prices)
+        )
+        return cls(timestamps=timestamps, sources=sources, prices=prices, size_bytes=size_bytes)
+
+    def closest_index(self, timestamp: Timestamp, max_seconds_distance: int) -> Optional[int]:
+        """Find the index of the entry closest to timestamp within max_seconds_distance
+
+        On equal distance the entry before the timestamp is preferred, same as the DB lookup.
+        """
+        after_idx = bisect_right(self.timestamps, timestamp)
+        before_idx = after_idx - 1
+        # bisect_right puts all entries equal to the timestamp before after_idx
+        if before_idx >= 0 and self.timestamps[before_idx] == timestamp:
+            return before_idx
+
+        best_idx = None
+        best_distance = max_seconds_distance + 1
+        if before_idx >= 0:
+            best_distance = timestamp - self.timestamps[before_idx]
+            best_idx = before_idx
+        if after_idx < len(self.timestamps):
+            distance = self.timestamps[after_idx] - timestamp
+            if distance < best_distance:
+                best_distance = distance
+                best_idx = after_idx
+
+        if best_distance > max_seconds_distance:
+            return None
+        return best_idx
+
+
+class PriceSeriesCache():
+    """LRU cache of price series bounded by the total estimated memory of the series"""
+
+    def __init__(self, max_bytes: int = DEFAULT_PRICE_SERIES_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._series: 'OrderedDict[PriceSeriesKey, PriceSeries]' = OrderedDict()
+
+    def __contains__(self, key: PriceSeriesKey) -> bool:
+        return key in self._series
+
+    def get(self, key: PriceSeriesKey) -> Optional[PriceSeries]:
+        series = self._series.get(key)
+        if series is not None:
+            self._series.move_to_end(key)
+        return series
+
+    def add(self, key: PriceSeriesKey, series: PriceSeries) -> None:
+        """Add a series, evicting the least recently used ones if over the memory limit
+
+        A series that alone would not fit in the memory limit is not cached at all
+        """
+        self.invalidate_key(key)
+        if series.size_bytes > self.max_bytes:
+            return
+
+        self._series[key] = series
+        self.total_bytes += series.size_bytes
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._series.popitem(last=False)
+            self.total_bytes -= evicted.size_bytes
+
+    def invalidate_key(self, key: PriceSeriesKey) -> None:
+        series = self._series.pop(key, None)
+        if series is not None:
+            self.total_bytes -= series.size_bytes
+
+    def invalidate_pair(self, from_identifier: str, to_identifier: str) -> None:
+        """Drop all series of a pair, for any source"""
+        from_id, to_id = from_identifier.lower(), to_identifier.lower()
+        for key in [x for x in self._series if x[0] == from_id and x[1] == to_id]:
+            self.invalidate_key(key)
+
+    def clear(self) -> None:
+        self._series.clear()
+        self.total_bytes = 0
+
+
+def price_series_entry(
+        series: PriceSeries,
+        index: int,
+        from_asset: 'Asset',
+        to_asset: 'Asset',
+) -> HistoricalPrice:
+    """Turn the entry of a series at the given index into a HistoricalPrice
+
+    May raise:
+    - DeserializationError
+    """
+    return HistoricalPrice(
+        from_asset=from_asset,
+        to_asset=to_asset,
+        source=HistoricalPriceOracle.deserialize_from_db(series.sources[index]),
+        timestamp=Timestamp(series.timestamps[index]),
+        price=deserialize_price(series.prices[index]),
+    )
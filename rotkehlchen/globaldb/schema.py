@@ -148,10 +148,17 @@ CREATE TABLE IF NOT EXISTS price_history (
 );
 """
 
+# The primary key covers lookups for a specific source. This index covers
+# the nearest timestamp lookups across all sources of a pair
+DB_CREATE_PRICE_HISTORY_PAIR_TIMESTAMP_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_price_history_pair_timestamp
+ON price_history(from_asset, to_asset, timestamp);
+"""
+
 DB_SCRIPT_CREATE_TABLES = """
 PRAGMA foreign_keys=off;
 BEGIN TRANSACTION;
-{}{}{}{}{}{}{}{}{}
+{}{}{}{}{}{}{}{}{}{}
 COMMIT;
 PRAGMA foreign_keys=on;
 """.format(
@@ -164,4 +171,5 @@ PRAGMA foreign_keys=on;
     DB_CREATE_USER_OWNED_ASSETS,
     DB_CREATE_PRICE_HISTORY_SOURCE_TYPES,
     DB_CREATE_PRICE_HISTORY,
+    DB_CREATE_PRICE_HISTORY_PAIR_TIMESTAMP_INDEX,
 )
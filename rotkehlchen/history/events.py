@@ -1,9 +1,26 @@
 import logging
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, List, Optional, Tuple, Union, cast
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
+
+import gevent
+from gevent.pool import Pool
 
 from rotkehlchen.chain.ethereum.trades import AMMTRADE_LOCATION_NAMES, AMMTrade, AMMTradeLocations
 from rotkehlchen.constants.misc import ZERO
+from rotkehlchen.db.filtering import LEDGER_ACTIONS_FILTER_TABLE, HistoryFilterQuery
 from rotkehlchen.db.ledger_actions import DBLedgerActions
 from rotkehlchen.errors import RemoteError
 from rotkehlchen.exchanges.data_structures import AssetMovement, Loan, MarginPosition, Trade
@@ -21,24 +38,16 @@ if TYPE_CHECKING:
     from rotkehlchen.accounting.structures import DefiEvent
     from rotkehlchen.chain.manager import ChainManager
     from rotkehlchen.db.dbhandler import DBHandler
+    from rotkehlchen.exchanges.exchange import ExchangeInterface
 
 logger = logging.getLogger(__name__)
 log = RotkehlchenLogsAdapter(logger)
 
 
-# Number of steps excluding the connected exchanges. Current query steps:
-# eth transactions
-# ledger actions
-# external trades: balancer, uniswap
-# makerdao dsr
-# makerdao vaults
-# yearn vaults
-# compound
-# adex staking
-# aave lending
-# eth2
-# Please, update this number each time a history query step is either added or removed
-NUM_HISTORY_QUERY_STEPS_EXCL_EXCHANGES = 11
+# How many history sources (exchanges, modules etc.) to query at the same time
+HISTORY_QUERY_CONCURRENCY = 12
+# Seconds after which the query of a single history source is abandoned
+HISTORY_SOURCE_TIMEOUT = 3600
 FREE_LEDGER_ACTIONS_LIMIT = 50
 
 HistoryResult = Tuple[
@@ -52,6 +61,32 @@ HistoryResult = Tuple[
 ]
 
 
+class HistorySource(NamedTuple):
+    """A source of history events and the function that queries it into its parts"""
+    name: str
+    query: Callable[['HistorySourceParts'], None]
+
+
+@dataclass
+class HistorySourceParts():
+    """The part of the history result returned by a single history source"""
+    history: List[Union[Trade, MarginPosition, AMMTrade]] = field(default_factory=list)
+    loans: List[Loan] = field(default_factory=list)
+    asset_movements: List[AssetMovement] = field(default_factory=list)
+    eth_transactions: List[EthereumTransaction] = field(default_factory=list)
+    defi_events: List['DefiEvent'] = field(default_factory=list)
+    ledger_actions: List['LedgerAction'] = field(default_factory=list)
+    error: str = ''
+
+    def clear(self) -> None:
+        self.history = []
+        self.loans = []
+        self.asset_movements = []
+        self.eth_transactions = []
+        self.defi_events = []
+        self.ledger_actions = []
+
+
 def limit_trade_list_to_period(
         trades_list: List[Union[Trade, MarginPosition]],
         start_ts: Timestamp,
@@ -105,15 +140,13 @@ class EventsHistorian():
     def _reset_variables(self) -> None:
         self.processing_state_name = 'Starting query of historical events'
         self.progress = ZERO
+        # Mapping of the name of each history source to the state of its query
+        self.source_states: Dict[str, str] = {}
+        self.finished_sources = 0
         db_settings = self.db.get_settings()
         self.dateformat = db_settings.date_display_format
         self.datelocaltime = db_settings.display_date_in_localtime
 
-    def _increase_progress(self, step: int, total_steps: int) -> int:
-        step += 1
-        self.progress = FVal(step / total_steps) * 100
-        return step
-
     def query_ledger_actions(
             self,
             has_premium: bool,
@@ -136,27 +169,167 @@ class EventsHistorian():
 
         return actions, original_length
 
-    def get_history(
+    def query_filtered_ledger_actions(
+            self,
+            filter_query: HistoryFilterQuery,
+            has_premium: bool,
+    ) -> Tuple[List['LedgerAction'], int]:
+        """Queries the page of ledger actions matching the filter query and how many
+        ledger actions match it
+
+        Without premium only the first FREE_LEDGER_ACTIONS_LIMIT matching ledger actions
+        can be returned.
+        """
+        db = DBLedgerActions(self.db, self.msg_aggregator)
+        page_query = filter_query
+        if has_premium is False:
+            page_query = filter_query.restrict_to_first(FREE_LEDGER_ACTIONS_LIMIT)
+        entries_found = self.db.count_filtered_entries(
+            table=LEDGER_ACTIONS_FILTER_TABLE,
+            filter_query=filter_query,
+        )
+        return db.get_filtered_ledger_actions(page_query), entries_found
+
+    def _query_history_source(self, source: 'HistorySource', parts: 'HistorySourceParts') -> None:
+        """Runs the query of a single history source and records its progress
+
+        May raise whatever the source's query raises except for gevent.Timeout
+        """
+        self.source_states[source.name] = 'querying'
+        self._update_processing_state()
+        try:
+            with gevent.Timeout(HISTORY_SOURCE_TIMEOUT):
+                source.query(parts)
+        except gevent.Timeout:
+            msg = (
+                f'Querying {source.name} history timed out after {HISTORY_SOURCE_TIMEOUT} '
+                f'seconds. The final history result will not include it'
+            )
+            self.msg_aggregator.add_error(msg)
+            parts.clear()
+            parts.error = msg
+            self.source_states[source.name] = 'timed out'
+        except Exception:
+            self.source_states[source.name] = 'failed'
+            raise
+        else:
+            self.source_states[source.name] = 'failed' if parts.error else 'done'
+        finally:
+            self.finished_sources += 1
+            self.progress = FVal(self.finished_sources / len(self.source_states)) * 100
+            self._update_processing_state()
+
+    def _update_processing_state(self) -> None:
+        querying = [x for x, state in self.source_states.items() if state == 'querying']
+        if len(querying) != 0:
+            self.processing_state_name = f'Querying {", ".join(querying)} history'
+
+    def _history_sources(
             self,
             start_ts: Timestamp,
             end_ts: Timestamp,
             has_premium: bool,
-    ) -> HistoryResult:
-        """Creates trades and loans history from start_ts to end_ts"""
-        self._reset_variables()
-        step = 0
-        total_steps = len(self.exchange_manager.connected_exchanges) + NUM_HISTORY_QUERY_STEPS_EXCL_EXCHANGES  # noqa: E501
-        log.info(
-            'Get/create trade history',
-            start_ts=start_ts,
-            end_ts=end_ts,
-        )
-        # start creating the all trades history list
-        history: List[Union[Trade, MarginPosition, AMMTrade]] = []
-        asset_movements = []
-        loans = []
-        empty_or_error = ''
+    ) -> List['HistorySource']:
+        """Returns all sources of history events to query in the order their results merge"""
+        sources = []
+        for name, exchange in self.exchange_manager.connected_exchanges.items():
+            sources.append(HistorySource(
+                name=f'{name} exchange',
+                query=partial(self._query_exchange_history, exchange=exchange, end_ts=end_ts),
+            ))
+
+        sources.append(HistorySource(
+            name='ethereum transactions',
+            query=partial(self._query_ethereum_transactions, end_ts=end_ts),
+        ))
+        sources.append(HistorySource(
+            name='external trades',
+            query=partial(self._query_external_trades, end_ts=end_ts),
+        ))
+        sources.append(HistorySource(
+            name='ledger actions',
+            query=partial(self._query_ledger_actions, end_ts=end_ts, has_premium=has_premium),
+        ))
+        if not has_premium:
+            return sources
+
+        # include AMM trades: balancer, uniswap
+        for amm_location in AMMTradeLocations:
+            amm_module_name = cast(AMMTRADE_LOCATION_NAMES, str(amm_location))
+            amm_module = self.chain_manager.get_module(amm_module_name)
+            if amm_module is not None:
+                sources.append(HistorySource(
+                    name=f'{amm_module_name} trade',
+                    query=partial(
+                        self._query_amm_trades,
+                        amm_module=amm_module,
+                        amm_module_name=amm_module_name,
+                        end_ts=end_ts,
+                    ),
+                ))
+
+        # Include makerdao DSR gains and vault events. We need to process them from history start
+        defi_modules: List[Tuple[str, Any, Timestamp, Optional[Dict[str, Any]]]] = [
+            ('makerDAO DSR', self.chain_manager.get_module('makerdao_dsr'), Timestamp(0), None),
+            ('makerDAO vaults', self.chain_manager.get_module('makerdao_vaults'), Timestamp(0), None),  # noqa: E501
+        ]
+        # include yearn vault, compound, adex and aave events
+        defi_modules.append((
+            'yearn vaults',
+            self.chain_manager.get_module('yearn_vaults'),
+            Timestamp(0),
+            {'addresses': self.chain_manager.queried_addresses_for_module('yearn_vaults')},
+        ))
+        defi_modules.append((
+            'compound',
+            self.chain_manager.get_module('compound'),
+            Timestamp(0),
+            {'addresses': self.chain_manager.queried_addresses_for_module('compound')},
+        ))
+        defi_modules.append((
+            'adex staking',
+            self.chain_manager.get_module('adex'),
+            start_ts,
+            {'addresses': self.chain_manager.queried_addresses_for_module('adex')},
+        ))
+        defi_modules.append((
+            'aave',
+            self.chain_manager.get_module('aave'),
+            start_ts,
+            {'addresses': self.chain_manager.queried_addresses_for_module('aave')},
+        ))
+        for source_name, module, from_ts, extra_kwargs in defi_modules:
+            if module is None:
+                continue
+            sources.append(HistorySource(
+                name=source_name,
+                query=partial(
+                    self._query_defi_events,
+                    method=module.get_history_events,
+                    from_timestamp=from_ts,
+                    to_timestamp=end_ts,
+                    **(extra_kwargs or {}),
+                ),
+            ))
 
+        # include eth2 staking events
+        sources.append(HistorySource(
+            name='ETH2 staking',
+            query=partial(
+                self._query_defi_events,
+                method=self.chain_manager.get_eth2_history_events,
+                from_timestamp=start_ts,
+                to_timestamp=end_ts,
+            ),
+        ))
+        return sources
+
+    def _query_exchange_history(
+            self,
+            parts: 'HistorySourceParts',
+            exchange: 'ExchangeInterface',
+            end_ts: Timestamp,
+    ) -> None:
         def populate_history_cb(
                 trades_history: List[Trade],
                 margin_history: List[MarginPosition],
@@ -164,14 +337,14 @@ class EventsHistorian():
                 exchange_specific_data: Any,
         ) -> None:
             """This callback will run for succesfull exchange history query"""
-            history.extend(trades_history)
-            history.extend(margin_history)
-            asset_movements.extend(result_asset_movements)
+            parts.history.extend(trades_history)
+            parts.history.extend(margin_history)
+            parts.asset_movements.extend(result_asset_movements)
 
             if exchange_specific_data:
                 # This can only be poloniex at the moment
                 polo_loans_data = exchange_specific_data
-                loans.extend(process_polo_loans(
+                parts.loans.extend(process_polo_loans(
                     msg_aggregator=self.msg_aggregator,
                     data=polo_loans_data,
                     # We need to have history of loans since before the range
@@ -181,23 +354,23 @@ class EventsHistorian():
 
         def fail_history_cb(error_msg: str) -> None:
             """This callback will run for failure in exchange history query"""
-            nonlocal empty_or_error
-            empty_or_error += '\n' + error_msg
+            parts.error += '\n' + error_msg
 
-        for name, exchange in self.exchange_manager.connected_exchanges.items():
-            self.processing_state_name = f'Querying {name} exchange history'
-            exchange.query_history_with_callbacks(
-                # We need to have history of exchanges since before the range
-                start_ts=Timestamp(0),
-                end_ts=end_ts,
-                success_callback=populate_history_cb,
-                fail_callback=fail_history_cb,
-            )
-            step = self._increase_progress(step, total_steps)
+        exchange.query_history_with_callbacks(
+            # We need to have history of exchanges since before the range
+            start_ts=Timestamp(0),
+            end_ts=end_ts,
+            success_callback=populate_history_cb,
+            fail_callback=fail_history_cb,
+        )
 
+    def _query_ethereum_transactions(
+            self,
+            parts: 'HistorySourceParts',
+            end_ts: Timestamp,
+    ) -> None:
         try:
-            self.processing_state_name = 'Querying ethereum transactions history'
-            eth_transactions = self.chain_manager.ethereum.transactions.query(
+            parts.eth_transactions = self.chain_manager.ethereum.transactions.query(
                 addresses=None,  # all addresses
                 # We need to have history of transactions since before the range
                 from_ts=Timestamp(0),
@@ -206,120 +379,104 @@ class EventsHistorian():
                 recent_first=False,  # for history processing we need oldest first
             )
         except RemoteError as e:
-            eth_transactions = []
             msg = str(e)
             self.msg_aggregator.add_error(
                 f'There was an error when querying etherscan for ethereum transactions: {msg}'
                 f'The final history result will not include ethereum transactions',
             )
-            empty_or_error += '\n' + msg
-        step = self._increase_progress(step, total_steps)
+            parts.error += '\n' + msg
 
-        # Include the external trades in the history
-        self.processing_state_name = 'Querying external trades history'
-        external_trades = self.db.get_trades(
+    def _query_external_trades(self, parts: 'HistorySourceParts', end_ts: Timestamp) -> None:
+        parts.history.extend(self.db.get_trades(
             # We need to have history of trades since before the range
             from_ts=Timestamp(0),
             to_ts=end_ts,
             location=Location.EXTERNAL,
-        )
-        history.extend(external_trades)
-        step = self._increase_progress(step, total_steps)
-
-        # include the ledger actions
-        self.processing_state_name = 'Querying ledger actions history'
-        ledger_actions, _ = self.query_ledger_actions(has_premium, from_ts=None, to_ts=end_ts)
-        step = self._increase_progress(step, total_steps)
-
-        # include AMM trades: balancer, uniswap
-        for amm_location in AMMTradeLocations:
-            amm_module_name = cast(AMMTRADE_LOCATION_NAMES, str(amm_location))
-            amm_module = self.chain_manager.get_module(amm_module_name)
-            if has_premium and amm_module:
-                self.processing_state_name = f'Querying {amm_module_name} trade history'
-                amm_module_trades = amm_module.get_trades(
-                    addresses=self.chain_manager.queried_addresses_for_module(amm_module_name),
-                    from_timestamp=Timestamp(0),
-                    to_timestamp=end_ts,
-                    only_cache=False,
-                )
-                history.extend(amm_module_trades)
-            step = self._increase_progress(step, total_steps)
+        ))
 
-        # Include makerdao DSR gains
-        defi_events = []
-        makerdao_dsr = self.chain_manager.get_module('makerdao_dsr')
-        if makerdao_dsr and has_premium:
-            self.processing_state_name = 'Querying makerDAO DSR history'
-            defi_events.extend(makerdao_dsr.get_history_events(
-                from_timestamp=Timestamp(0),  # we need to process all events from history start
-                to_timestamp=end_ts,
-            ))
-        step = self._increase_progress(step, total_steps)
-
-        # Include makerdao vault events
-        makerdao_vaults = self.chain_manager.get_module('makerdao_vaults')
-        if makerdao_vaults and has_premium:
-            self.processing_state_name = 'Querying makerDAO vaults history'
-            defi_events.extend(makerdao_vaults.get_history_events(
-                from_timestamp=Timestamp(0),  # we need to process all events from history start
-                to_timestamp=end_ts,
-            ))
-        step = self._increase_progress(step, total_steps)
-
-        # include yearn vault events
-        yearn_vaults = self.chain_manager.get_module('yearn_vaults')
-        if yearn_vaults and has_premium:
-            self.processing_state_name = 'Querying yearn vaults history'
-            defi_events.extend(yearn_vaults.get_history_events(
-                from_timestamp=Timestamp(0),  # we need to process all events from history start
-                to_timestamp=end_ts,
-                addresses=self.chain_manager.queried_addresses_for_module('yearn_vaults'),
-            ))
-        step = self._increase_progress(step, total_steps)
-
-        # include compound events
-        compound = self.chain_manager.get_module('compound')
-        if compound and has_premium:
-            self.processing_state_name = 'Querying compound history'
-            defi_events.extend(compound.get_history_events(
-                from_timestamp=Timestamp(0),  # we need to process all events from history start
-                to_timestamp=end_ts,
-                addresses=self.chain_manager.queried_addresses_for_module('compound'),
-            ))
-        step = self._increase_progress(step, total_steps)
+    def _query_ledger_actions(
+            self,
+            parts: 'HistorySourceParts',
+            end_ts: Timestamp,
+            has_premium: bool,
+    ) -> None:
+        parts.ledger_actions, _ = self.query_ledger_actions(
+            has_premium=has_premium,
+            from_ts=None,
+            to_ts=end_ts,
+        )
 
-        # include adex events
-        adex = self.chain_manager.get_module('adex')
-        if adex is not None and has_premium:
-            self.processing_state_name = 'Querying adex staking history'
-            defi_events.extend(adex.get_history_events(
-                from_timestamp=start_ts,
-                to_timestamp=end_ts,
-                addresses=self.chain_manager.queried_addresses_for_module('adex'),
-            ))
-        step = self._increase_progress(step, total_steps)
+    def _query_amm_trades(
+            self,
+            parts: 'HistorySourceParts',
+            amm_module: Any,
+            amm_module_name: AMMTRADE_LOCATION_NAMES,
+            end_ts: Timestamp,
+    ) -> None:
+        parts.history.extend(amm_module.get_trades(
+            addresses=self.chain_manager.queried_addresses_for_module(amm_module_name),
+            from_timestamp=Timestamp(0),
+            to_timestamp=end_ts,
+            only_cache=False,
+        ))
+
+    @staticmethod
+    def _query_defi_events(
+            parts: 'HistorySourceParts',
+            method: Callable[..., List['DefiEvent']],
+            **kwargs: Any,
+    ) -> None:
+        parts.defi_events.extend(method(**kwargs))
 
-        # include aave events
-        aave = self.chain_manager.get_module('aave')
-        if aave is not None and has_premium:
-            self.processing_state_name = 'Querying aave history'
-            defi_events.extend(aave.get_history_events(
-                from_timestamp=start_ts,
-                to_timestamp=end_ts,
-                addresses=self.chain_manager.queried_addresses_for_module('aave'),
-            ))
-        self._increase_progress(step, total_steps)
+    def get_history(
+            self,
+            start_ts: Timestamp,
+            end_ts: Timestamp,
+            has_premium: bool,
+    ) -> HistoryResult:
+        """Creates trades and loans history from start_ts to end_ts
 
-        # include eth2 staking events
-        if has_premium:
-            self.processing_state_name = 'Querying ETH2 staking history'
-            defi_events.extend(self.chain_manager.get_eth2_history_events(
-                from_timestamp=start_ts,
-                to_timestamp=end_ts,
-            ))
-        self._increase_progress(step, total_steps)
+        All history sources are queried concurrently, at most HISTORY_QUERY_CONCURRENCY
+        at a time. Their results are merged in the order of the sources so that the
+        result does not depend on which source finished first.
+        """
+        self._reset_variables()
+        log.info(
+            'Get/create trade history',
+            start_ts=start_ts,
+            end_ts=end_ts,
+        )
+        sources = self._history_sources(start_ts=start_ts, end_ts=end_ts, has_premium=has_premium)
+        self.source_states = {x.name: 'pending' for x in sources}
+        all_parts = [HistorySourceParts() for _ in sources]
+        pool = Pool(size=HISTORY_QUERY_CONCURRENCY)
+        greenlets = [
+            pool.spawn(self._query_history_source, source, parts)
+            for source, parts in zip(sources, all_parts)
+        ]
+        try:
+            gevent.joinall(greenlets, raise_error=True)
+        finally:
+            pool.kill()
 
+        # start creating the all trades history list
+        history: List[Union[Trade, MarginPosition, AMMTrade]] = []
+        loans = []
+        asset_movements = []
+        eth_transactions = []
+        defi_events = []
+        ledger_actions = []
+        empty_or_error = ''
+        for parts in all_parts:
+            history.extend(parts.history)
+            loans.extend(parts.loans)
+            asset_movements.extend(parts.asset_movements)
+            eth_transactions.extend(parts.eth_transactions)
+            defi_events.extend(parts.defi_events)
+            ledger_actions.extend(parts.ledger_actions)
+            empty_or_error += parts.error
+
+        self.progress = FVal(100)
         history.sort(key=action_get_timestamp)
         return (
             empty_or_error,
@@ -1,12 +1,14 @@
 import logging
 from pathlib import Path
-from typing import TYPE_CHECKING, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 from rotkehlchen.assets.asset import Asset
 from rotkehlchen.constants.assets import A_USD
 from rotkehlchen.constants.misc import ZERO
+from rotkehlchen.constants.timing import DAY_IN_SECONDS, HOUR_IN_SECONDS
 from rotkehlchen.errors import NoPriceForGivenTimestamp, PriceQueryUnsupportedAsset, RemoteError
 from rotkehlchen.fval import FVal
+from rotkehlchen.globaldb.handler import GlobalDBHandler
 from rotkehlchen.inquirer import Inquirer
 from rotkehlchen.logging import RotkehlchenLogsAdapter
 from rotkehlchen.typing import Price, Timestamp
@@ -23,6 +25,75 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 log = RotkehlchenLogsAdapter(logger)
 
+# (from_asset, to_asset, timestamp)
+HistoricalPriceQuery = Tuple[Asset, Asset, Timestamp]
+# (from_asset, to_asset, oracle, price period of the oracle)
+PriceMemoKey = Tuple[Asset, Asset, HistoricalPriceOracle, int]
+
+# The oracles that have prices in price periods, in order of finest resolution first
+PRICE_MEMO_ORACLES = (
+    HistoricalPriceOracle.CRYPTOCOMPARE,
+    HistoricalPriceOracle.COINGECKO,
+    HistoricalPriceOracle.XRATESCOM,
+)
+
+
+def oracle_price_period(oracle: HistoricalPriceOracle, timestamp: Timestamp) -> int:
+    """Get the price period of the oracle in which the timestamp falls
+
+    Cryptocompare has hourly prices and the price of the closest hour is used.
+    Coingecko and xratescom have daily prices and the price of the timestamp's day is used.
+    """
+    if oracle == HistoricalPriceOracle.CRYPTOCOMPARE:
+        return (timestamp + HOUR_IN_SECONDS // 2) // HOUR_IN_SECONDS
+    return timestamp // DAY_IN_SECONDS
+
+
+class HistoricalPriceMemo():
+    """Remembers historical prices for the price period of the oracle that returned them
+
+    All timestamps in the same price period of an oracle would get the same price
+    from it, so a price is only queried once per pair and period. Prices of a fallback
+    oracle, used since a preferred oracle could not give a price at the time, are not
+    remembered. Meant to live only as long as a single run, such as a PnL report,
+    since it is never invalidated.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._prices: Dict[PriceMemoKey, Price] = {}
+
+    def get(self, from_asset: Asset, to_asset: Asset, timestamp: Timestamp) -> Optional[Price]:
+        for oracle in PRICE_MEMO_ORACLES:
+            price = self._prices.get(
+                (from_asset, to_asset, oracle, oracle_price_period(oracle, timestamp)),
+            )
+            if price is not None:
+                self.hits += 1
+                return price
+
+        self.misses += 1
+        return None
+
+    def add(
+            self,
+            from_asset: Asset,
+            to_asset: Asset,
+            timestamp: Timestamp,
+            oracle: Optional[HistoricalPriceOracle],
+            price: Price,
+    ) -> None:
+        """Remember a price. Prices without an oracle, such as those of a fallback
+        oracle, or of an unknown price period are not remembered"""
+        if oracle is None or oracle not in PRICE_MEMO_ORACLES:
+            return
+        key = (from_asset, to_asset, oracle, oracle_price_period(oracle, timestamp))
+        self._prices[key] = price
+
+    def serialize(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses}
+
 
 def query_usd_price_or_use_default(
         asset: Asset,
@@ -116,6 +187,7 @@ class PriceHistorian():
     _coingecko: 'Coingecko'
     _oracles: Optional[List[HistoricalPriceOracle]] = None
     _oracle_instances: Optional[List[HistoricalPriceOracleInstance]] = None
+    _price_memo: Optional[HistoricalPriceMemo] = None
 
     def __new__(
             cls,
@@ -145,6 +217,19 @@ class PriceHistorian():
         instance._oracles = oracles
         instance._oracle_instances = [getattr(instance, f'_{str(oracle)}') for oracle in oracles]
 
+    @staticmethod
+    def enable_price_memo() -> None:
+        """Start remembering historical prices by price period, with a fresh memo"""
+        PriceHistorian()._price_memo = HistoricalPriceMemo()
+
+    @staticmethod
+    def disable_price_memo() -> None:
+        PriceHistorian()._price_memo = None
+
+    @staticmethod
+    def get_price_memo() -> Optional[HistoricalPriceMemo]:
+        return PriceHistorian()._price_memo
+
     @staticmethod
     def query_historical_price(
             from_asset: Asset,
@@ -162,10 +247,49 @@ class PriceHistorian():
                       know the price.
             timestamp: The timestamp at which to query the price
 
+        If the price memo is enabled, a price already found for the same price period
+        is returned from it and any newly found price is remembered in it.
+
         May raise:
         - NoPriceForGivenTimestamp if we can't find a price for the asset in the given
         timestamp from the external service.
         """
+        memo = PriceHistorian()._price_memo
+        if memo is not None and from_asset != to_asset:
+            price = memo.get(from_asset=from_asset, to_asset=to_asset, timestamp=timestamp)
+            if price is not None:
+                return price
+
+        price, oracle = PriceHistorian()._query_historical_price_and_oracle(
+            from_asset=from_asset,
+            to_asset=to_asset,
+            timestamp=timestamp,
+        )
+        if memo is not None:
+            memo.add(
+                from_asset=from_asset,
+                to_asset=to_asset,
+                timestamp=timestamp,
+                oracle=oracle,
+                price=price,
+            )
+        return price
+
+    @staticmethod
+    def _query_historical_price_and_oracle(
+            from_asset: Asset,
+            to_asset: Asset,
+            timestamp: Timestamp,
+    ) -> Tuple[Price, Optional[HistoricalPriceOracle]]:
+        """Query the historical price and also return the oracle that gave it
+
+        The oracle is None if no oracle was needed or if the price came from a fallback
+        oracle because a preferred one could not give a price right now, for example
+        due to rate limiting or a remote error. Such a price must not be remembered for
+        the price period, since the preferred oracle may give a price next time.
+
+        Same errors as query_historical_price
+        """
         log.debug(
             'Querying historical price',
             from_asset=from_asset,
@@ -173,7 +297,7 @@ class PriceHistorian():
             timestamp=timestamp,
         )
         if from_asset == to_asset:
-            return Price(FVal('1'))
+            return Price(FVal('1')), None
 
         # Querying historical forex data is attempted first via the external apis
         # and then via any price oracle that has fiat to fiat.
@@ -184,7 +308,7 @@ class PriceHistorian():
                 timestamp=timestamp,
             )
             if price is not None:
-                return price
+                return price, HistoricalPriceOracle.XRATESCOM
             # else cryptocompare also has historical fiat to fiat data
 
         instance = PriceHistorian()
@@ -193,6 +317,9 @@ class PriceHistorian():
         assert isinstance(oracles, list) and isinstance(oracle_instances, list), (
             'PriceHistorian should never be called before the setting the oracles'
         )
+        # The price is from a fallback oracle if a preferred one was skipped for a reason
+        # that may not hold next time. Only not supporting the asset always holds.
+        is_fallback = False
         for oracle, oracle_instance in zip(oracles, oracle_instances):
             can_query_history = oracle_instance.can_query_history(
                 from_asset=from_asset,
@@ -200,6 +327,7 @@ class PriceHistorian():
                 timestamp=timestamp,
             )
             if can_query_history is False:
+                is_fallback = True
                 continue
 
             try:
@@ -216,6 +344,8 @@ class PriceHistorian():
                     to_asset=to_asset,
                     timestamp=timestamp,
                 )
+                if not isinstance(e, PriceQueryUnsupportedAsset):
+                    is_fallback = True
                 continue
 
             if price != Price(ZERO):
@@ -226,10 +356,67 @@ class PriceHistorian():
                     to_asset=to_asset,
                     timestamp=timestamp,
                 )
-                return price
+                return price, None if is_fallback else oracle
+
+            is_fallback = True
 
         raise NoPriceForGivenTimestamp(
             from_asset=from_asset,
             to_asset=to_asset,
             date=timestamp_to_date(timestamp, formatstr='%d/%m/%Y, %H:%M:%S', treat_as_local=True),
         )
+
+    @staticmethod
+    def query_historical_prices(
+            queries: List[HistoricalPriceQuery],
+            errors: Optional[Dict[HistoricalPriceQuery, Exception]] = None,
+    ) -> Dict[HistoricalPriceQuery, Price]:
+        """Query the historical prices of many (from_asset, to_asset, timestamp) entries
+
+        The queries are deduplicated and grouped by pair. The cached prices of each
+        pair are loaded from the global DB with a single query so that only the entries
+        missing from the cache end up being sent to the price oracles.
+
+        Returns a mapping of each query to its price. Queries for which no price could
+        be found are missing from the result. Nothing is raised for them. If errors is
+        given the error of each of them is recorded in it so that the caller can raise it
+        when it needs the price, without querying the oracles again.
+        """
+        unique_queries = list(dict.fromkeys(queries))
+        pairs = dict.fromkeys((x[0], x[1]) for x in unique_queries if x[0] != x[1])
+        log.debug(
+            'Querying historical prices in bulk',
+            queries_num=len(queries),
+            unique_queries_num=len(unique_queries),
+            pairs_num=len(pairs),
+        )
+        cache_was_enabled = GlobalDBHandler().price_series_cache_enabled()
+        if not cache_was_enabled:
+            GlobalDBHandler().enable_price_series_cache()
+
+        prices = {}
+        try:
+            for from_asset, to_asset in pairs:
+                GlobalDBHandler().load_price_series(from_asset=from_asset, to_asset=to_asset)
+
+            for query in unique_queries:
+                try:
+                    prices[query] = PriceHistorian().query_historical_price(
+                        from_asset=query[0],
+                        to_asset=query[1],
+                        timestamp=query[2],
+                    )
+                except (NoPriceForGivenTimestamp, PriceQueryUnsupportedAsset, RemoteError) as e:
+                    log.debug(
+                        f'Could not find a historical price during bulk query: {str(e)}',
+                        from_asset=query[0],
+                        to_asset=query[1],
+                        timestamp=query[2],
+                    )
+                    if errors is not None:
+                        errors[query] = e
+        finally:
+            if not cache_was_enabled:
+                GlobalDBHandler().disable_price_series_cache()
+
+        return prices
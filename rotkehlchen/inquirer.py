@@ -1,9 +1,21 @@
 from __future__ import unicode_literals  # isort:skip
 
 import logging
+from collections import OrderedDict
 from enum import Enum
 from pathlib import Path
-from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from rotkehlchen.assets.asset import Asset, EthereumToken
 from rotkehlchen.chain.ethereum.defi.price import handle_defi_price_query
@@ -71,6 +83,7 @@ from rotkehlchen.utils.network import request_get_dict
 
 if TYPE_CHECKING:
     from rotkehlchen.chain.ethereum.manager import EthereumManager
+    from rotkehlchen.greenlets import GreenletManager
     from rotkehlchen.externalapis.coingecko import Coingecko
     from rotkehlchen.externalapis.cryptocompare import Cryptocompare
 
@@ -79,6 +92,9 @@ logger = logging.getLogger(__name__)
 log = RotkehlchenLogsAdapter(logger)
 
 CURRENT_PRICE_CACHE_SECS = 300  # 5 mins
+# How long after it expired a cached price is still served while it is refreshed
+CURRENT_PRICE_MAX_STALE_SECS = 3600
+CURRENT_PRICE_CACHE_MAX_ENTRIES = 10000
 
 ASSETS_UNDERLYING_BTC = (
     A_YV1_RENWSBTC,
@@ -91,6 +107,7 @@ ASSETS_UNDERLYING_BTC = (
 
 
 CurrentPriceOracleInstance = Union['Coingecko', 'Cryptocompare']
+T = TypeVar('T', bound=Asset)
 
 
 class CurrentPriceOracle(Enum):
@@ -186,14 +203,50 @@ class CachedPriceEntry(NamedTuple):
     time: Timestamp
 
 
+class CurrentPriceCache():
+    """LRU cache of current prices bounded by its number of entries
+
+    Entries older than CURRENT_PRICE_CACHE_SECS are stale. The Inquirer may still serve
+    a stale entry while the pair is in pending_refresh, waiting to be refreshed in the
+    background. The counters keep track of how the lookups were answered.
+    """
+
+    def __init__(self, max_entries: int = CURRENT_PRICE_CACHE_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple[Asset, Asset], CachedPriceEntry]' = OrderedDict()
+        self.pending_refresh: Set[Tuple[Asset, Asset]] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple[Asset, Asset]) -> Optional[CachedPriceEntry]:
+        """Returns the entry of the pair no matter how old it is"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def add(self, key: Tuple[Asset, Asset], price: Price) -> None:
+        """Add the current price of a pair, evicting the least recently used pairs if full"""
+        self._entries[key] = CachedPriceEntry(price=price, time=ts_now())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
 class Inquirer():
     __instance: Optional['Inquirer'] = None
     _cached_forex_data: Dict
-    _cached_current_price: Dict  # Can't use CacheableMixIn due to Singleton
+    _cached_current_price: CurrentPriceCache  # Can't use CacheableMixIn due to Singleton
     _data_directory: Path
     _cryptocompare: 'Cryptocompare'
     _coingecko: 'Coingecko'
     _ethereum: Optional['EthereumManager'] = None
+    _greenlet_manager: Optional['GreenletManager'] = None
     _oracles: Optional[List[CurrentPriceOracle]] = None
     _oracle_instances: Optional[List[CurrentPriceOracleInstance]] = None
     special_tokens: List[EthereumToken]
@@ -203,7 +256,10 @@ class Inquirer():
             data_dir: Path = None,
             cryptocompare: 'Cryptocompare' = None,
             coingecko: 'Coingecko' = None,
+            greenlet_manager: Optional['GreenletManager'] = None,
     ) -> 'Inquirer':
+        """If a greenlet manager is given, stale current prices are served while they
+        are refreshed in the background instead of being queried again right away"""
         if Inquirer.__instance is not None:
             return Inquirer.__instance
 
@@ -216,7 +272,8 @@ class Inquirer():
         Inquirer.__instance._data_directory = data_dir
         Inquirer._cryptocompare = cryptocompare
         Inquirer._coingecko = coingecko
-        Inquirer._cached_current_price = {}
+        Inquirer._greenlet_manager = greenlet_manager
+        Inquirer._cached_current_price = CurrentPriceCache()
         Inquirer.special_tokens = [
             A_YV1_DAIUSDCTBUSD,
             A_CRVP_DAIUSDCTBUSD,
@@ -263,11 +320,70 @@ class Inquirer():
 
     @staticmethod
     def get_cached_current_price_entry(cache_key: Tuple[Asset, Asset]) -> Optional[CachedPriceEntry]:  # noqa: E501
-        cache = Inquirer()._cached_current_price.get(cache_key, None)
-        if cache is None or ts_now() - cache.time > CURRENT_PRICE_CACHE_SECS:
+        """Returns the cached price entry of the pair if it can be used
+
+        A stale entry is used only if it can be refreshed in the background and has
+        not been stale for more than CURRENT_PRICE_MAX_STALE_SECS. Its refresh is then
+        scheduled.
+        """
+        instance = Inquirer()
+        cache = instance._cached_current_price
+        entry = cache.get(cache_key)
+        if entry is None:
+            cache.misses += 1
             return None
 
-        return cache
+        age = ts_now() - entry.time
+        if age <= CURRENT_PRICE_CACHE_SECS:
+            cache.hits += 1
+            return entry
+
+        if instance._greenlet_manager is None or age > CURRENT_PRICE_CACHE_SECS + CURRENT_PRICE_MAX_STALE_SECS:  # noqa: E501
+            cache.misses += 1
+            return None
+
+        cache.stale_hits += 1
+        if len(cache.pending_refresh) == 0:
+            instance._greenlet_manager.spawn_and_track(
+                after_seconds=None,
+                task_name='Refresh stale current prices',
+                exception_is_error=True,
+                method=instance._refresh_stale_prices,
+            )
+        cache.pending_refresh.add(cache_key)
+        return entry
+
+    @staticmethod
+    def _refresh_stale_prices() -> None:
+        """Queries again the current prices of the pairs whose stale entries were served
+
+        Pairs added while a refresh is running are refreshed in the next round. The USD
+        prices of each round are queried at once.
+        """
+        cache = Inquirer()._cached_current_price
+        try:
+            while len(cache.pending_refresh) != 0:
+                pairs = list(cache.pending_refresh)
+                Inquirer().find_usd_prices(
+                    assets=[from_asset for from_asset, to_asset in pairs if to_asset == A_USD],
+                    ignore_cache=True,
+                )
+                for from_asset, to_asset in pairs:
+                    if to_asset != A_USD:
+                        Inquirer().find_price(from_asset, to_asset, ignore_cache=True)
+
+                cache.refreshes += len(pairs)
+                cache.pending_refresh.difference_update(pairs)
+                log.debug(
+                    f'Refreshed {len(pairs)} stale current prices',
+                    hits=cache.hits,
+                    stale_hits=cache.stale_hits,
+                    misses=cache.misses,
+                    refreshes=cache.refreshes,
+                )
+        finally:
+            # If the refresh failed the pairs are refreshed again when next served stale
+            cache.pending_refresh.clear()
 
     @staticmethod
     def set_oracles_order(oracles: List[CurrentPriceOracle]) -> None:
@@ -316,9 +432,62 @@ class Inquirer():
                 )
                 break
 
-        Inquirer._cached_current_price[cache_key] = CachedPriceEntry(price=price, time=ts_now())
+        Inquirer._cached_current_price.add(cache_key, price)
         return price
 
+    @staticmethod
+    def _query_oracle_instances_multiple(
+            from_assets: List[T],
+            to_asset: Asset,
+    ) -> Dict[T, Price]:
+        """Like _query_oracle_instances() but for many assets at once
+
+        Each oracle is queried for all the assets the oracles before it had no price for.
+        """
+        instance = Inquirer()
+        oracles = instance._oracles
+        oracle_instances = instance._oracle_instances
+        assert isinstance(oracles, list) and isinstance(oracle_instances, list), (
+            'Inquirer should never be called before the setting the oracles'
+        )
+        prices: Dict[T, Price] = {}
+        missing_assets = from_assets
+        for oracle, oracle_instance in zip(oracles, oracle_instances):
+            if len(missing_assets) == 0:
+                break
+            if oracle_instance.rate_limited_in_last() is True:
+                continue
+
+            try:
+                oracle_prices = oracle_instance.query_multiple_current_prices(
+                    from_assets=missing_assets,  # type: ignore  # a List[T] is a List[Asset]
+                    to_asset=to_asset,
+                )
+            except (PriceQueryUnsupportedAsset, RemoteError) as e:
+                log.error(
+                    f'Current price oracle {oracle} failed to request {to_asset.identifier} '
+                    f'prices for {len(missing_assets)} assets due to: {str(e)}.',
+                )
+                continue
+
+            found_assets = []
+            for from_asset in missing_assets:
+                price = oracle_prices.get(from_asset, Price(ZERO))
+                if price != Price(ZERO):
+                    prices[from_asset] = price
+                    found_assets.append(from_asset)
+            log.debug(
+                f'Current price oracle {oracle} got {len(found_assets)} out of '
+                f'{len(missing_assets)} {to_asset.identifier} prices',
+            )
+            missing_assets = [x for x in missing_assets if x not in prices]
+
+        for from_asset in from_assets:
+            price = prices.setdefault(from_asset, Price(ZERO))
+            Inquirer._cached_current_price.add((from_asset, to_asset), price)
+
+        return prices
+
     @staticmethod
     def find_price(
             from_asset: Asset,
@@ -385,11 +554,59 @@ class Inquirer():
             else:
                 price = Price(usd_price)
 
-            Inquirer._cached_current_price[cache_key] = CachedPriceEntry(price=price, time=ts_now())  # noqa: E501
+            Inquirer._cached_current_price.add(cache_key, price)
             return price
 
         return instance._query_oracle_instances(from_asset=asset, to_asset=A_USD)
 
+    @staticmethod
+    def find_usd_prices(
+            assets: Iterable[T],
+            ignore_cache: bool = False,
+    ) -> Dict[T, Price]:
+        """Returns the current USD price of each of the assets
+
+        The prices not in the cache are queried from each oracle for all assets at once,
+        instead of one asset at a time as find_usd_price() would do. Fiat currencies and
+        special tokens are still priced one by one as in find_usd_price().
+
+        Assets whose price could not be found have a price of zero and errors are
+        logged in the logs
+        """
+        instance = Inquirer()
+        prices: Dict[T, Price] = {}
+        query_assets = []
+        for asset in dict.fromkeys(assets):  # deduplicate keeping the order
+            if asset == A_USD:
+                prices[asset] = Price(FVal(1))
+                continue
+
+            if ignore_cache is False:
+                cache = instance.get_cached_current_price_entry(cache_key=(asset, A_USD))
+                if cache is not None:
+                    prices[asset] = cache.price
+                    continue
+
+            if asset.is_fiat() or asset in instance.special_tokens:
+                try:
+                    prices[asset] = instance.find_usd_price(asset=asset, ignore_cache=ignore_cache)
+                except RemoteError as e:
+                    log.error(
+                        f'Failed to find the USD price of {asset.identifier} due to {str(e)}',
+                    )
+                    prices[asset] = Price(ZERO)
+                continue
+
+            query_assets.append(asset)
+
+        if len(query_assets) != 0:
+            prices.update(instance._query_oracle_instances_multiple(
+                from_assets=query_assets,
+                to_asset=A_USD,
+            ))
+
+        return prices
+
     @staticmethod
     def get_fiat_usd_exchange_rates(currencies: Iterable[Asset]) -> Dict[Asset, Price]:
         """Gets the USD exchange rate of any of the given assets
@@ -7,8 +7,9 @@ from base64 import b64decode, b64encode
 from binascii import Error as BinasciiError
 from enum import Enum
 from http import HTTPStatus
-from typing import Any, Dict, NamedTuple, Optional, Tuple
-from urllib.parse import urlencode
+from pathlib import Path
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+from urllib.parse import quote_plus, urlencode
 
 import requests
 from typing_extensions import Literal
@@ -20,11 +21,14 @@ from rotkehlchen.errors import (
     PremiumAuthenticationError,
     RemoteError,
 )
-from rotkehlchen.typing import B64EncodedBytes, Timestamp
+from rotkehlchen.typing import Timestamp
 from rotkehlchen.utils.serialization import jsonloads_dict
 
 logger = logging.getLogger(__name__)
 
+# Size of the chunks of the DB data blob read when uploading it
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 HANDLABLE_STATUS_CODES = [
     HTTPStatus.OK,
     HTTPStatus.NOT_FOUND,
@@ -174,8 +178,6 @@ class Premium():
             return False
 
     def sign(self, method: str, **kwargs: Any) -> Tuple[hmac.HMAC, Dict]:
-        urlpath = '/api/' + self.apiversion + '/' + method
-
         req = kwargs
         if method != 'watchers':
             # the watchers endpoint accepts json and not url query data
@@ -183,35 +185,54 @@ class Premium():
             req['nonce'] = int(1000 * time.time())
         post_data = urlencode(req)
         hashable = post_data.encode()
-        message = urlpath.encode() + hashlib.sha256(hashable).digest()
-        signature = hmac.new(
+        return self._sign_data_hash(method, hashlib.sha256(hashable).digest()), req
+
+    def _sign_data_hash(self, method: str, data_hash: bytes) -> hmac.HMAC:
+        urlpath = '/api/' + self.apiversion + '/' + method
+        message = urlpath.encode() + data_hash
+        return hmac.new(
             self.credentials.api_secret,
             message,
             hashlib.sha512,
         )
-        return signature, req
 
     def upload_data(
             self,
-            data_blob: B64EncodedBytes,
+            data_blob_path: Path,
             our_hash: str,
             last_modify_ts: Timestamp,
             compression_type: Literal['zlib'],
     ) -> Dict:
-        """Uploads data to the server and returns the response dict
+        """Uploads the b64 encoded data blob saved in the given file to the server
+        and returns the response dict
+
+        The url encoded request data are streamed from the file with chunked transfer
+        encoding, once to sign them and once to send them, so that the blob is never
+        kept in memory.
 
         Raises RemoteError if there are problems reaching the server or if
         there is an error returned by the server
         """
-        signature, data = self.sign(
-            'save_data',
-            data_blob=data_blob,
-            original_hash=our_hash,
-            last_modify_ts=last_modify_ts,
-            index=0,
-            length=len(data_blob),
-            compression=compression_type,
-        )
+        other_data = urlencode({
+            'original_hash': our_hash,
+            'last_modify_ts': last_modify_ts,
+            'index': 0,
+            'length': data_blob_path.stat().st_size,
+            'compression': compression_type,
+            'nonce': int(1000 * time.time()),
+        })
+
+        def stream_data() -> Iterator[bytes]:
+            yield b'data_blob='
+            with open(data_blob_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+                    yield quote_plus(chunk).encode()
+            yield b'&' + other_data.encode()
+
+        hasher = hashlib.sha256()
+        for chunk in stream_data():
+            hasher.update(chunk)
+        signature = self._sign_data_hash('save_data', hasher.digest())
         self.session.headers.update({
             'API-SIGN': base64.b64encode(signature.digest()),  # type: ignore
         })
@@ -219,7 +240,8 @@ class Premium():
         try:
             response = self.session.put(
                 self.uri + 'save_data',
-                data=data,
+                data=stream_data(),
+                headers={'Content-Type': 'application/x-www-form-urlencoded'},
                 timeout=ROTKEHLCHEN_SERVER_TIMEOUT * 10,
             )
         except requests.exceptions.RequestException as e:
@@ -1,7 +1,8 @@
-import base64
 import logging
 import shutil
+import tempfile
 from enum import Enum
+from pathlib import Path
 from typing import Any, Dict, NamedTuple, Optional, Tuple
 
 from typing_extensions import Literal
@@ -56,8 +57,6 @@ class PremiumSyncManager():
         if self.premium is None:
             return SyncCheckResult(can_sync=CanSync.NO, message='', payload=None)
 
-        b64_encoded_data, our_hash = self.data.compress_and_encrypt_db(self.password)
-
         try:
             metadata = self.premium.query_last_data_metadata()
         except RemoteError as e:
@@ -71,6 +70,7 @@ class PremiumSyncManager():
             # If it's not a new account and the db setting for premium syncing is off stop
             return SyncCheckResult(can_sync=CanSync.NO, message='', payload=None)
 
+        our_hash, data_bytes_size = self.data.get_db_hash_and_size(self.password)
         log.debug(
             'CAN_PULL',
             ours=our_hash,
@@ -82,8 +82,6 @@ class PremiumSyncManager():
             return SyncCheckResult(can_sync=CanSync.NO, message='', payload=None)
 
         our_last_write_ts = self.data.db.get_last_write_ts()
-        data_bytes_size = len(base64.b64decode(b64_encoded_data))
-
         local_more_recent = our_last_write_ts >= metadata.last_modify_ts
         local_bigger = data_bytes_size >= metadata.data_size
 
@@ -162,17 +160,6 @@ class PremiumSyncManager():
         except RemoteError as e:
             log.debug('upload to server -- fetching metadata error', error=str(e))
             return False
-        b64_encoded_data, our_hash = self.data.compress_and_encrypt_db(self.password)
-
-        log.debug(
-            'CAN_PUSH',
-            ours=our_hash,
-            theirs=metadata.data_hash,
-        )
-        if our_hash == metadata.data_hash and not force_upload:
-            log.debug('upload to server stopped -- same hash')
-            # same hash -- no need to upload anything
-            return False
 
         our_last_write_ts = self.data.db.get_last_write_ts()
         if our_last_write_ts <= metadata.last_modify_ts and not force_upload:
@@ -183,26 +170,46 @@ class PremiumSyncManager():
             )
             return False
 
-        data_bytes_size = len(base64.b64decode(b64_encoded_data))
-        if data_bytes_size < metadata.data_size and not force_upload:
-            # Let's be conservative.
-            # TODO: Here perhaps prompt user in the future
+        # If the data did not change since it was last exported compare that hash
+        # before exporting the DB again only to find out the server already has it
+        cached_data_hash = self.data.db.get_cached_data_hash()
+        if not force_upload and cached_data_hash is not None:
+            if cached_data_hash[0] == metadata.data_hash:
+                log.debug('upload to server stopped -- same hash as unchanged local data')
+                return False
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            blob_path = Path(tmpdirname) / 'blob'
+            our_hash, data_bytes_size = self.data.export_encrypted_db(self.password, blob_path)
             log.debug(
-                f'upload to server stopped -- remote db({metadata.data_size}) '
-                f'bigger than local({data_bytes_size})',
+                'CAN_PUSH',
+                ours=our_hash,
+                theirs=metadata.data_hash,
             )
-            return False
+            if our_hash == metadata.data_hash and not force_upload:
+                log.debug('upload to server stopped -- same hash')
+                # same hash -- no need to upload anything
+                return False
+
+            if data_bytes_size < metadata.data_size and not force_upload:
+                # Let's be conservative.
+                # TODO: Here perhaps prompt user in the future
+                log.debug(
+                    f'upload to server stopped -- remote db({metadata.data_size}) '
+                    f'bigger than local({data_bytes_size})',
+                )
+                return False
 
-        try:
-            self.premium.upload_data(
-                data_blob=b64_encoded_data,
-                our_hash=our_hash,
-                last_modify_ts=our_last_write_ts,
-                compression_type='zlib',
-            )
-        except RemoteError as e:
-            log.debug('upload to server -- upload error', error=str(e))
-            return False
+            try:
+                self.premium.upload_data(
+                    data_blob_path=blob_path,
+                    our_hash=our_hash,
+                    last_modify_ts=our_last_write_ts,
+                    compression_type='zlib',
+                )
+            except RemoteError as e:
+                log.debug('upload to server -- upload error', error=str(e))
+                return False
 
         # update the last data upload value
         self.last_data_upload_ts = ts_now()
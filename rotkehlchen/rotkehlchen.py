@@ -16,16 +16,16 @@ from typing import (
     Tuple,
     Union,
     cast,
-    overload,
 )
 
 import gevent
 from gevent.lock import Semaphore
+from gevent.pool import Group
 from typing_extensions import Literal
 
 from rotkehlchen.accounting.accountant import Accountant
-from rotkehlchen.accounting.structures import Balance
-from rotkehlchen.assets.asset import Asset
+from rotkehlchen.accounting.structures import ActionType, Balance
+from rotkehlchen.assets.asset import Asset, EthereumToken
 from rotkehlchen.balances.manual import account_for_manually_tracked_balances
 from rotkehlchen.chain.ethereum.manager import (
     ETHEREUM_NODES_TO_CONNECT_AT_START,
@@ -41,6 +41,11 @@ from rotkehlchen.config import default_data_directory
 from rotkehlchen.constants.misc import ZERO
 from rotkehlchen.data.importer import DataImporter
 from rotkehlchen.data_handler import DataHandler
+from rotkehlchen.db.filtering import (
+    ASSET_MOVEMENTS_FILTER_TABLE,
+    TRADES_FILTER_TABLE,
+    HistoryFilterQuery,
+)
 from rotkehlchen.db.settings import DBSettings, ModifiableDBSettings
 from rotkehlchen.errors import (
     EthSyncError,
@@ -60,7 +65,7 @@ from rotkehlchen.fval import FVal
 from rotkehlchen.globaldb import GlobalDBHandler
 from rotkehlchen.globaldb.updates import AssetsUpdater
 from rotkehlchen.greenlets import GreenletManager
-from rotkehlchen.history.events import FREE_LEDGER_ACTIONS_LIMIT, EventsHistorian
+from rotkehlchen.history.events import EventsHistorian
 from rotkehlchen.history.price import PriceHistorian
 from rotkehlchen.history.typing import HistoricalPriceOracle
 from rotkehlchen.icons import IconManager
@@ -73,7 +78,6 @@ from rotkehlchen.logging import (
 )
 from rotkehlchen.premium.premium import Premium, PremiumCredentials, premium_create_and_verify
 from rotkehlchen.premium.sync import PremiumSyncManager
-from rotkehlchen.serialization.deserialize import deserialize_location
 from rotkehlchen.tasks.manager import DEFAULT_MAX_TASKS_NUM, TaskManager
 from rotkehlchen.typing import (
     ApiKey,
@@ -86,6 +90,7 @@ from rotkehlchen.typing import (
 )
 from rotkehlchen.usage_analytics import maybe_submit_usage_analytics
 from rotkehlchen.user_messages import MessagesAggregator
+from rotkehlchen.utils.misc import ts_now
 
 if TYPE_CHECKING:
     from rotkehlchen.chain.bitcoin.xpub import XpubData
@@ -97,19 +102,25 @@ MAIN_LOOP_SECS_DELAY = 10
 FREE_TRADES_LIMIT = 25000
 FREE_ASSET_MOVEMENTS_LIMIT = 10000
 
-LIMITS_MAPPING = {
-    'trade': FREE_TRADES_LIMIT,
-    'asset_movement': FREE_ASSET_MOVEMENTS_LIMIT,
-    'ledger_action': FREE_LEDGER_ACTIONS_LIMIT,
-}
-
 ICONS_BATCH_SIZE = 5
 ICONS_QUERY_SLEEP = 10
+# Seconds after which the balances query of a single exchange is abandoned
+EXCHANGE_BALANCES_TIMEOUT = 180
 
 
 TRADES_LIST = List[Union[Trade, AMMTrade]]
 
 
+def _trade_sort_key(trade: Union[Trade, AMMTrade], attribute: str) -> Tuple[Any, Timestamp]:
+    """Sorts trades by the given attribute the same way the DB orders them"""
+    value = getattr(trade, attribute)
+    if attribute in ('location', 'trade_type'):
+        value = value.serialize_for_db()
+    elif attribute in ('base_asset', 'quote_asset'):
+        value = value.identifier if isinstance(value, Asset) else value.symbol
+    return value, trade.timestamp
+
+
 class Rotkehlchen():
     def __init__(self, args: argparse.Namespace) -> None:
         """Initialize the Rotkehlchen object
@@ -145,7 +156,11 @@ class Rotkehlchen():
         self.exchange_manager = ExchangeManager(msg_aggregator=self.msg_aggregator)
         # Initialize the GlobalDBHandler singleton. Has to be initialized BEFORE asset resolver
         GlobalDBHandler(data_dir=self.data_dir)
-        self.data = DataHandler(self.data_dir, self.msg_aggregator)
+        self.data = DataHandler(
+            data_directory=self.data_dir,
+            msg_aggregator=self.msg_aggregator,
+            sqlite_wal=args.sqlite_wal,
+        )
         self.cryptocompare = Cryptocompare(data_directory=self.data_dir, database=None)
         self.coingecko = Coingecko(data_directory=self.data_dir)
         self.icon_manager = IconManager(data_dir=self.data_dir, coingecko=self.coingecko)
@@ -163,13 +178,8 @@ class Rotkehlchen():
             data_dir=self.data_dir,
             cryptocompare=self.cryptocompare,
             coingecko=self.coingecko,
+            greenlet_manager=self.greenlet_manager,
         )
-        # Keeps how many trades we have found per location. Used for free user limiting
-        self.actions_per_location: Dict[str, Dict[Location, int]] = {
-            'trade': defaultdict(int),
-            'asset_movement': defaultdict(int),
-        }
-
         self.lock.release()
         self.task_manager: Optional[TaskManager] = None
         self.shutdown_event = gevent.event.Event()
@@ -324,6 +334,7 @@ class Rotkehlchen():
             premium_sync_manager=self.premium_sync_manager,
             chain_manager=self.chain_manager,
             exchange_manager=self.exchange_manager,
+            cryptocompare_prefetch_concurrency=settings.cryptocompare_prefetch_concurrency,
         )
         self.user_is_logged_in = True
         log.debug('User unlocking complete')
@@ -536,7 +547,7 @@ class Rotkehlchen():
         self.data.db.remove_blockchain_accounts(blockchain, accounts)
         return balances_update
 
-    def get_history_query_status(self) -> Dict[str, str]:
+    def get_history_query_status(self) -> Dict[str, Any]:
         if self.events_historian.progress < FVal('100'):
             processing_state = self.events_historian.processing_state_name
             progress = self.events_historian.progress / 2
@@ -556,7 +567,16 @@ class Rotkehlchen():
                 FVal(self.accountant.currently_processing_timestamp - start_ts) /
                 FVal(diff) / 2)
 
-        return {'processing_state': str(processing_state), 'total_progress': str(progress)}
+        return {
+            'processing_state': str(processing_state),
+            'total_progress': str(progress),
+            'sources': dict(self.events_historian.source_states),
+        }
+
+    def get_cryptocompare_prefetch_status(self) -> Dict[str, Any]:
+        if self.task_manager is None:
+            return {}
+        return self.task_manager.cryptocompare_prefetcher.get_progress()
 
     def process_history(
             self,
@@ -576,189 +596,169 @@ class Rotkehlchen():
             end_ts=end_ts,
             has_premium=True,
         )
-        result = self.accountant.process_history(
-            start_ts=start_ts,
-            end_ts=end_ts,
-            trade_history=history,
-            loan_history=loan_history,
-            asset_movements=asset_movements,
-            eth_transactions=eth_transactions,
-            defi_events=defi_events,
-            ledger_actions=ledger_actions,
-        )
+        # Processing queries historical prices of the same few pairs over and over.
+        # Keep their price series and found prices in memory only for the duration
+        # of the processing.
+        GlobalDBHandler().enable_price_series_cache()
+        PriceHistorian().enable_price_memo()
+        try:
+            result = self.accountant.process_history(
+                start_ts=start_ts,
+                end_ts=end_ts,
+                trade_history=history,
+                loan_history=loan_history,
+                asset_movements=asset_movements,
+                eth_transactions=eth_transactions,
+                defi_events=defi_events,
+                ledger_actions=ledger_actions,
+            )
+        finally:
+            PriceHistorian().disable_price_memo()
+            GlobalDBHandler().disable_price_series_cache()
         return result, error_or_empty
 
-    @overload
-    def _apply_actions_limit(
-            self,
-            location: Location,
-            action_type: Literal['trade'],
-            location_actions: TRADES_LIST,
-            all_actions: TRADES_LIST,
-    ) -> TRADES_LIST:
-        ...
-
-    @overload
-    def _apply_actions_limit(
-            self,
-            location: Location,
-            action_type: Literal['asset_movement'],
-            location_actions: List[AssetMovement],
-            all_actions: List[AssetMovement],
-    ) -> List[AssetMovement]:
-        ...
-
-    def _apply_actions_limit(
-            self,
-            location: Location,
-            action_type: Literal['trade', 'asset_movement'],
-            location_actions: Union[TRADES_LIST, List[AssetMovement]],
-            all_actions: Union[TRADES_LIST, List[AssetMovement]],
-    ) -> Union[TRADES_LIST, List[AssetMovement]]:
-        """Take as many actions from location actions and add them to all actions as the limit permits
-
-        Returns the modified (or not) all_actions
-        """
-        # If we are already at or above the limit return current actions disregarding this location
-        actions_mapping = self.actions_per_location[action_type]
-        current_num_actions = sum(x for _, x in actions_mapping.items())
-        limit = LIMITS_MAPPING[action_type]
-        if current_num_actions >= limit:
-            return all_actions
+    def _exchanges_for_location(self, location: Optional[Location]) -> List[ExchangeInterface]:
+        """Returns all connected exchanges if no location is given or else the connected
+        exchange of the location if there is one"""
+        if location is None:
+            return list(self.exchange_manager.connected_exchanges.values())
 
-        # Find out how many more actions can we return, and depending on that get
-        # the number of actions from the location actions and add them to the total
-        remaining_num_actions = limit - current_num_actions
-        if remaining_num_actions < 0:
-            remaining_num_actions = 0
+        exchange = self.exchange_manager.get(str(location))
+        return [] if exchange is None else [exchange]
 
-        num_actions_to_take = min(len(location_actions), remaining_num_actions)
+    def _query_amm_trades(
+            self,
+            filter_query: HistoryFilterQuery,
+            only_cache: bool,
+    ) -> List[AMMTrade]:
+        """Queries the AMM trades matching the filters of the filter query
 
-        actions_mapping[location] = num_actions_to_take
-        all_actions.extend(location_actions[0:num_actions_to_take])  # type: ignore
-        return all_actions
+        AMM trades are only available to premium users. They are not saved in the trades
+        table so their filters are applied here instead of in the DB query.
+        """
+        if self.premium is None:
+            return []
+        if filter_query.location is None:
+            locations = list(AMMTradeLocations)
+        elif filter_query.location in AMMTradeLocations:
+            locations = [filter_query.location]
+        else:
+            return []
+
+        mapping = self.data.db.get_ignored_action_ids(ActionType.TRADE)
+        ignored_ids = set(mapping.get(ActionType.TRADE, []))
+        trades = []
+        for location in locations:
+            amm_module_name = cast(AMMTRADE_LOCATION_NAMES, str(location))
+            amm_module = self.chain_manager.get_module(amm_module_name)
+            if amm_module is None:
+                continue
+
+            location_trades = amm_module.get_trades(
+                addresses=self.chain_manager.queried_addresses_for_module(amm_module_name),
+                from_timestamp=Timestamp(0) if filter_query.from_ts is None else filter_query.from_ts,  # noqa: E501
+                to_timestamp=ts_now() if filter_query.to_ts is None else filter_query.to_ts,
+                only_cache=only_cache,
+            )
+            for trade in location_trades:
+                if filter_query.asset is not None and not any(
+                    isinstance(x, EthereumToken) and x == filter_query.asset
+                    for x in (trade.base_asset, trade.quote_asset)
+                ):
+                    continue
+                if filter_query.entry_type is not None and trade.trade_type != filter_query.entry_type:  # noqa: E501
+                    continue
+                if filter_query.ignored is not None and (trade.identifier in ignored_ids) != filter_query.ignored:  # noqa: E501
+                    continue
+                trades.append(trade)
+
+        return trades
 
     def query_trades(
             self,
-            from_ts: Timestamp,
-            to_ts: Timestamp,
-            location: Optional[Location],
+            filter_query: HistoryFilterQuery,
             only_cache: bool,
-    ) -> TRADES_LIST:
-        """Queries trades for the given location and time range.
-        If no location is given then all external, all exchange and DEX trades are queried.
-
-        If only_cache is given then only trades cached in the DB are returned.
-        No service is queried.
+    ) -> Tuple[TRADES_LIST, int]:
+        """Queries the page of trades matching the filter query and how many trades match it
 
-        DEX Trades are queried only if the user has premium
-        If the user does not have premium then a trade limit is applied.
+        Unless only_cache is True the connected exchanges of the filter's location are
+        first queried for any trades of the filter's time range that are not yet in the DB.
+        DEX Trades are queried only if the user has premium. If the user does not have
+        premium then only the first FREE_TRADES_LIMIT matching trades can be returned.
 
         May raise:
         - RemoteError: If there are problems connecting to any of the remote exchanges
         """
-        trades: TRADES_LIST
-        if location is not None:
-            trades = self.query_location_trades(from_ts, to_ts, location, only_cache)
-        else:
-            trades = self.query_location_trades(from_ts, to_ts, Location.EXTERNAL, only_cache)
-            # crypto.com is not an API key supported exchange but user can import from CSV
-            trades.extend(self.query_location_trades(
-                from_ts=from_ts,
-                to_ts=to_ts,
-                location=Location.CRYPTOCOM,
-                only_cache=only_cache,
-            ))
-            for name, exchange in self.exchange_manager.connected_exchanges.items():
-                exchange_trades = exchange.query_trade_history(
-                    start_ts=from_ts,
-                    end_ts=to_ts,
-                    only_cache=only_cache,
+        if not only_cache:
+            for exchange in self._exchanges_for_location(filter_query.location):
+                exchange.query_trade_history(
+                    start_ts=Timestamp(0) if filter_query.from_ts is None else filter_query.from_ts,  # noqa: E501
+                    end_ts=ts_now() if filter_query.to_ts is None else filter_query.to_ts,
+                    only_cache=False,
                 )
-                if self.premium is not None:
-                    trades = self._apply_actions_limit(
-                        location=deserialize_location(name),
-                        action_type='trade',
-                        location_actions=exchange_trades,
-                        all_actions=trades,
-                    )
-                else:
-                    trades.extend(exchange_trades)
-
-            # for all trades we also need the trades from the amm protocols
-            if self.premium is not None:
-                for amm_location in AMMTradeLocations:
-                    amm_module_name = cast(AMMTRADE_LOCATION_NAMES, str(amm_location))
-                    amm_module = self.chain_manager.get_module(amm_module_name)
-                    if amm_module is not None:
-                        trades.extend(
-                            amm_module.get_trades(
-                                addresses=self.chain_manager.queried_addresses_for_module(amm_module_name),  # noqa: E501
-                                from_timestamp=from_ts,
-                                to_timestamp=to_ts,
-                                only_cache=only_cache,
-                            ),
-                        )
-        # return trades with most recent first
-        trades.sort(key=lambda x: x.timestamp, reverse=True)
-        return trades
 
-    def query_location_trades(
-            self,
-            from_ts: Timestamp,
-            to_ts: Timestamp,
-            location: Location,
-            only_cache: bool,
-    ) -> TRADES_LIST:
-        # clear the trades queried for this location
-        self.actions_per_location['trade'][location] = 0
-
-        location_trades: TRADES_LIST
-        if location in (Location.EXTERNAL, Location.CRYPTOCOM):
-            location_trades = self.data.db.get_trades(  # type: ignore  # list invariance
-                from_ts=from_ts,
-                to_ts=to_ts,
-                location=location,
+        amm_trades = self._query_amm_trades(filter_query=filter_query, only_cache=only_cache)
+        page_query = filter_query
+        if self.premium is None:
+            page_query = filter_query.restrict_to_first(FREE_TRADES_LIMIT)
+        entries_found = len(amm_trades)
+        db_trades: List[Trade] = []
+        if filter_query.location not in AMMTradeLocations:
+            entries_found += self.data.db.count_filtered_entries(
+                table=TRADES_FILTER_TABLE,
+                filter_query=filter_query,
             )
-        elif location in AMMTradeLocations:
-            if self.premium is not None:
-                amm_module_name = cast(AMMTRADE_LOCATION_NAMES, str(location))
-                amm_module = self.chain_manager.get_module(amm_module_name)
-                if amm_module is not None:
-                    location_trades = amm_module.get_trades(  # type: ignore  # list invariance
-                        addresses=self.chain_manager.queried_addresses_for_module(amm_module_name),
-                        from_timestamp=from_ts,
-                        to_timestamp=to_ts,
-                        only_cache=only_cache,
-                    )
-        else:
-            # should only be an exchange
-            exchange = self.exchange_manager.get(str(location))
-            if not exchange:
-                logger.warning(
-                    f'Tried to query trades from {location} which is either not an '
-                    f'exchange or not an exchange the user has connected to',
-                )
-                return []
+            if len(amm_trades) == 0:
+                return self.data.db.get_filtered_trades(page_query), entries_found  # type: ignore  # list invariance  # noqa: E501
 
-            location_trades = exchange.query_trade_history(
-                start_ts=from_ts,
-                end_ts=to_ts,
-                only_cache=only_cache,
-            )
+            # The page has to be taken after merging the DB trades with the AMM trades
+            db_trades = self.data.db.get_filtered_trades(page_query._replace(
+                offset=0,
+                limit=None if page_query.limit is None else page_query.offset + page_query.limit,  # noqa: E501
+            ))
 
-        trades: TRADES_LIST = []
-        if self.premium is not None:
-            trades = self._apply_actions_limit(
-                location=location,
-                action_type='trade',
-                location_actions=location_trades,
-                all_actions=trades,
+        trades: TRADES_LIST = [*db_trades, *amm_trades]
+        trades.sort(
+            key=lambda x: _trade_sort_key(x, filter_query.order_by_attribute),
+            reverse=not filter_query.ascending,
+        )
+        end = None if page_query.limit is None else page_query.offset + page_query.limit
+        return trades[page_query.offset:end], entries_found
+
+    @staticmethod
+    def _query_exchange_balances(
+            exchange: ExchangeInterface,
+            ignore_cache: bool,
+    ) -> Optional[Dict[Asset, Balance]]:
+        """Returns the balances of the exchange or None if its query failed or timed out"""
+        try:
+            with gevent.Timeout(EXCHANGE_BALANCES_TIMEOUT):
+                exchange_balances, _ = exchange.query_balances(ignore_cache=ignore_cache)
+        except gevent.Timeout:
+            log.error(
+                f'Querying {exchange.name} balances timed out after '
+                f'{EXCHANGE_BALANCES_TIMEOUT} seconds',
             )
-        else:
-            trades = location_trades
+            return None
 
-        return trades
+        if not isinstance(exchange_balances, dict):
+            return None
+        return exchange_balances
+
+    def _query_blockchain_balances(
+            self,
+            ignore_cache: bool,
+    ) -> Optional[BlockchainBalancesUpdate]:
+        """Returns the balances of all blockchains or None if their query failed"""
+        try:
+            return self.chain_manager.query_balances(
+                blockchain=None,
+                force_token_detection=ignore_cache,
+                ignore_cache=ignore_cache,
+            )
+        except (RemoteError, EthSyncError) as e:
+            log.error(f'Querying blockchain balances failed due to: {str(e)}')
+            return None
 
     def query_balances(
             self,
@@ -776,34 +776,44 @@ class Rotkehlchen():
         to be saved in the DB
         If ignore_cache is True then all underlying calls that have a cache ignore it
 
+        The connected exchanges and the blockchains are queried concurrently. If any
+        of them fails or an exchange does not respond within EXCHANGE_BALANCES_TIMEOUT
+        its balances are left out and the result is not saved.
+
         Returns a dictionary with the queried balances.
         """
         log.info('query_balances called', requested_save_data=requested_save_data)
 
+        # All exchanges and the blockchains are queried at the same time
+        group = Group()
+        exchange_greenlets = [
+            (exchange.name, group.spawn(self._query_exchange_balances, exchange, ignore_cache))
+            for exchange in self.exchange_manager.connected_exchanges.values()
+        ]
+        blockchain_greenlet = group.spawn(self._query_blockchain_balances, ignore_cache)
+        try:
+            group.join(raise_error=True)
+        finally:
+            group.kill()
+
         balances: Dict[str, Dict[Asset, Balance]] = {}
         problem_free = True
-        for _, exchange in self.exchange_manager.connected_exchanges.items():
-            exchange_balances, _ = exchange.query_balances(ignore_cache=ignore_cache)
+        for name, greenlet in exchange_greenlets:
             # If we got an error, disregard that exchange but make sure we don't save data
-            if not isinstance(exchange_balances, dict):
+            if greenlet.value is None:
                 problem_free = False
             else:
-                balances[exchange.name] = exchange_balances
+                balances[name] = greenlet.value
 
         liabilities: Dict[Asset, Balance]
-        try:
-            blockchain_result = self.chain_manager.query_balances(
-                blockchain=None,
-                force_token_detection=ignore_cache,
-                ignore_cache=ignore_cache,
-            )
+        if blockchain_greenlet.value is None:
+            problem_free = False
+            liabilities = {}
+        else:
+            blockchain_result = blockchain_greenlet.value
             if len(blockchain_result.totals.assets) != 0:
                 balances[str(Location.BLOCKCHAIN)] = blockchain_result.totals.assets
             liabilities = blockchain_result.totals.liabilities
-        except (RemoteError, EthSyncError) as e:
-            problem_free = False
-            liabilities = {}
-            log.error(f'Querying blockchain balances failed due to: {str(e)}')
 
         # retrieve loopring balances if module is activated
         if self.chain_manager.get_module('loopring'):
@@ -876,110 +886,38 @@ class Rotkehlchen():
 
         return result_dict
 
-    def _query_exchange_asset_movements(
-            self,
-            from_ts: Timestamp,
-            to_ts: Timestamp,
-            all_movements: List[AssetMovement],
-            exchange: Union[ExchangeInterface, Location],
-            only_cache: bool,
-    ) -> List[AssetMovement]:
-        if isinstance(exchange, ExchangeInterface):
-            location = deserialize_location(exchange.name)
-            # clear the asset movements queried for this exchange
-            self.actions_per_location['asset_movement'][location] = 0
-            location_movements = exchange.query_deposits_withdrawals(
-                start_ts=from_ts,
-                end_ts=to_ts,
-                only_cache=only_cache,
-            )
-        else:
-            assert isinstance(exchange, Location), 'only a location should make it here'
-            assert exchange == Location.CRYPTOCOM, 'only cryptocom should make it here'
-            location = exchange
-            # cryptocom has no exchange integration but we may have DB entries
-            self.actions_per_location['asset_movement'][location] = 0
-            location_movements = self.data.db.get_asset_movements(
-                from_ts=from_ts,
-                to_ts=to_ts,
-                location=location,
-            )
-
-        movements: List[AssetMovement] = []
-        if self.premium is not None:
-            movements = self._apply_actions_limit(
-                location=location,
-                action_type='asset_movement',
-                location_actions=location_movements,
-                all_actions=all_movements,
-            )
-        else:
-            all_movements.extend(location_movements)
-            movements = all_movements
-
-        return movements
-
     def query_asset_movements(
             self,
-            from_ts: Timestamp,
-            to_ts: Timestamp,
-            location: Optional[Location],
+            filter_query: HistoryFilterQuery,
             only_cache: bool,
-    ) -> List[AssetMovement]:
-        """Queries AssetMovements for the given location and time range.
+    ) -> Tuple[List[AssetMovement], int]:
+        """Queries the page of asset movements matching the filter query and how many
+        asset movements match it
+
+        Unless only_cache is True the connected exchanges of the filter's location are
+        first queried for any asset movements of the filter's time range that are not yet
+        in the DB. If the user does not have premium then only the first
+        FREE_ASSET_MOVEMENTS_LIMIT matching asset movements can be returned.
 
-        If no location is given then all exchange asset movements are queried.
-        If only_cache is True then only what is already in the DB is returned.
-        If the user does not have premium then a limit is applied.
         May raise:
         - RemoteError: If there are problems connecting to any of the remote exchanges
         """
-        movements: List[AssetMovement] = []
-        if location is not None:
-            if location == Location.CRYPTOCOM:
-                movements = self._query_exchange_asset_movements(
-                    from_ts=from_ts,
-                    to_ts=to_ts,
-                    all_movements=movements,
-                    exchange=Location.CRYPTOCOM,
-                    only_cache=only_cache,
-                )
-            else:
-                exchange = self.exchange_manager.get(str(location))
-                if not exchange:
-                    logger.warning(
-                        f'Tried to query deposits/withdrawals from {location} which is either '
-                        f'not at exchange or not an exchange the user has connected to',
-                    )
-                    return []
-                movements = self._query_exchange_asset_movements(
-                    from_ts=from_ts,
-                    to_ts=to_ts,
-                    all_movements=movements,
-                    exchange=exchange,
-                    only_cache=only_cache,
-                )
-        else:
-            # cryptocom has no exchange integration but we may have DB entries due to csv import
-            movements = self._query_exchange_asset_movements(
-                from_ts=from_ts,
-                to_ts=to_ts,
-                all_movements=movements,
-                exchange=Location.CRYPTOCOM,
-                only_cache=only_cache,
-            )
-            for _, exchange in self.exchange_manager.connected_exchanges.items():
-                self._query_exchange_asset_movements(
-                    from_ts=from_ts,
-                    to_ts=to_ts,
-                    all_movements=movements,
-                    exchange=exchange,
-                    only_cache=only_cache,
+        if not only_cache:
+            for exchange in self._exchanges_for_location(filter_query.location):
+                exchange.query_deposits_withdrawals(
+                    start_ts=Timestamp(0) if filter_query.from_ts is None else filter_query.from_ts,  # noqa: E501
+                    end_ts=ts_now() if filter_query.to_ts is None else filter_query.to_ts,
+                    only_cache=False,
                 )
 
-        # return movements with most recent first
-        movements.sort(key=lambda x: x.timestamp, reverse=True)
-        return movements
+        page_query = filter_query
+        if self.premium is None:
+            page_query = filter_query.restrict_to_first(FREE_ASSET_MOVEMENTS_LIMIT)
+        entries_found = self.data.db.count_filtered_entries(
+            table=ASSET_MOVEMENTS_FILTER_TABLE,
+            filter_query=filter_query,
+        )
+        return self.data.db.get_filtered_asset_movements(page_query), entries_found
 
     def set_settings(self, settings: ModifiableDBSettings) -> Tuple[bool, str]:
         """Tries to set new settings. Returns True in success or False with message if error"""
@@ -1010,6 +948,14 @@ class Rotkehlchen():
             if settings.active_modules is not None:
                 self.chain_manager.process_new_modules_list(settings.active_modules)
 
+            if settings.cryptocompare_prefetch_concurrency is not None and self.task_manager is not None:  # noqa: E501
+                self.task_manager.cryptocompare_prefetcher.set_concurrency(
+                    settings.cryptocompare_prefetch_concurrency,
+                )
+
+            if settings.pnl_checkpoint_frequency == 0:
+                self.data.db.delete_pnl_checkpoints()
+
             self.data.db.set_settings(settings)
             return True, ''
 
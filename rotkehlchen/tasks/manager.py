@@ -9,12 +9,14 @@ from rotkehlchen.assets.asset import Asset
 from rotkehlchen.chain.bitcoin.xpub import XpubManager
 from rotkehlchen.chain.manager import ChainManager
 from rotkehlchen.db.dbhandler import DBHandler
+from rotkehlchen.db.settings import DEFAULT_CRYPTOCOMPARE_PREFETCH_CONCURRENCY
 from rotkehlchen.exchanges.manager import ExchangeManager
 from rotkehlchen.externalapis.cryptocompare import Cryptocompare
 from rotkehlchen.globaldb.handler import GlobalDBHandler
 from rotkehlchen.greenlets import GreenletManager
 from rotkehlchen.history.typing import HistoricalPriceOracle
 from rotkehlchen.premium.sync import PremiumSyncManager
+from rotkehlchen.tasks.price_prefetch import CryptocompareHistoryPrefetcher
 from rotkehlchen.typing import ChecksumEthAddress
 from rotkehlchen.utils.misc import ts_now
 
@@ -54,6 +56,7 @@ class TaskManager():
             premium_sync_manager: PremiumSyncManager,
             chain_manager: ChainManager,
             exchange_manager: ExchangeManager,
+            cryptocompare_prefetch_concurrency: int = DEFAULT_CRYPTOCOMPARE_PREFETCH_CONCURRENCY,
     ) -> None:
         self.max_tasks_num = max_tasks_num
         self.greenlet_manager = greenlet_manager
@@ -63,6 +66,10 @@ class TaskManager():
         self.exchange_manager = exchange_manager
         self.premium_sync_manager = premium_sync_manager
         self.cryptocompare_queries: Set[CCHistoQuery] = set()
+        self.cryptocompare_prefetcher = CryptocompareHistoryPrefetcher(
+            cryptocompare=cryptocompare,
+            concurrency=cryptocompare_prefetch_concurrency,
+        )
         self.chain_manager = chain_manager
         self.last_xpub_derivation_ts = 0
         self.last_eth_tx_query_ts: DefaultDict[ChecksumEthAddress, int] = defaultdict(int)
@@ -127,7 +134,7 @@ class TaskManager():
         self.prepared_cryptocompare_query = True
 
     def _maybe_schedule_cryptocompare_query(self) -> bool:
-        """Schedules a cryptocompare query for a single asset history"""
+        """Schedules the concurrent cryptocompare prefetch of all prepared asset histories"""
         if self.prepared_cryptocompare_query is False:
             return False
 
@@ -147,17 +154,16 @@ class TaskManager():
         if now_ts - self.cryptocompare.last_histohour_query_ts <= CRYPTOCOMPARE_HISTOHOUR_FREQUENCY:  # noqa: E501
             return False
 
-        query = self.cryptocompare_queries.pop()
-        task_name = f'Cryptocompare historical prices {query.from_asset} / {query.to_asset} query'
+        queries = list(self.cryptocompare_queries)
+        self.cryptocompare_queries.clear()
+        task_name = f'Cryptocompare historical prices prefetch of {len(queries)} pairs'
         logger.debug(f'Scheduling task for {task_name}')
         self.greenlet_manager.spawn_and_track(
             after_seconds=None,
             task_name=task_name,
             exception_is_error=False,
-            method=self.cryptocompare.query_and_store_historical_data,
-            from_asset=query.from_asset,
-            to_asset=query.to_asset,
-            timestamp=now_ts,
+            method=self.cryptocompare_prefetcher.prefetch,
+            queries=queries,
         )
         return True
 
@@ -0,0 +1,133 @@
+import logging
+from typing import TYPE_CHECKING, Any, Dict, List, Set
+
+import gevent
+from gevent.pool import Pool
+
+from rotkehlchen.errors import RemoteError, UnsupportedAsset
+from rotkehlchen.logging import RotkehlchenLogsAdapter
+from rotkehlchen.utils.misc import ts_now
+
+if TYPE_CHECKING:
+    from rotkehlchen.externalapis.cryptocompare import Cryptocompare
+    from rotkehlchen.tasks.manager import CCHistoQuery
+
+logger = logging.getLogger(__name__)
+log = RotkehlchenLogsAdapter(logger)
+
+MAX_CRYPTOCOMPARE_PREFETCH_CONCURRENCY = 10
+PREFETCH_MIN_BACKOFF_SECS = 5
+PREFETCH_MAX_BACKOFF_SECS = 300
+PREFETCH_POLL_SECS = 0.5
+
+
+class CryptocompareHistoryPrefetcher():
+    """Warms the cryptocompare historical price cache of many asset pairs concurrently
+
+    Up to `concurrency` pairs are queried at the same time. The number of concurrent
+    queries adapts to cryptocompare's rate limiting. Each time a new rate limit is seen
+    the allowed concurrency is halved and spawning new queries backs off for an
+    exponentially growing period. Every pair queried without getting rate limited
+    allows one more concurrent query again, up to the configured budget.
+    """
+
+    def __init__(self, cryptocompare: 'Cryptocompare', concurrency: int) -> None:
+        self.cryptocompare = cryptocompare
+        self.concurrency = concurrency
+        self.allowed_concurrency = concurrency
+        self.backoff_seconds = 0
+        self.running = False
+        self.total_pairs = 0
+        self.completed_pairs = 0
+        self.failed_pairs = 0
+        self.pairs_in_progress: Set[str] = set()
+        self._last_seen_rate_limit = cryptocompare.last_rate_limit
+
+    def set_concurrency(self, concurrency: int) -> None:
+        """Change the concurrency budget. Takes effect for the next spawned query"""
+        self.concurrency = concurrency
+        self.allowed_concurrency = min(self.allowed_concurrency, concurrency)
+        if not self.running:
+            self.allowed_concurrency = concurrency
+
+    def get_progress(self) -> Dict[str, Any]:
+        return {
+            'running': self.running,
+            'total_pairs': self.total_pairs,
+            'completed_pairs': self.completed_pairs,
+            'failed_pairs': self.failed_pairs,
+            'pairs_in_progress': sorted(self.pairs_in_progress),
+            'concurrency': self.allowed_concurrency,
+            'backoff_seconds': self.backoff_seconds,
+        }
+
+    def _check_for_new_rate_limit(self) -> None:
+        last_rate_limit = self.cryptocompare.last_rate_limit
+        if last_rate_limit == self._last_seen_rate_limit:
+            return
+
+        self._last_seen_rate_limit = last_rate_limit
+        self.allowed_concurrency = max(1, self.allowed_concurrency // 2)
+        self.backoff_seconds = min(
+            PREFETCH_MAX_BACKOFF_SECS,
+            max(PREFETCH_MIN_BACKOFF_SECS, self.backoff_seconds * 2),
+        )
+        log.debug(
+            f'Cryptocompare prefetch got rate limited. Reducing concurrency to '
+            f'{self.allowed_concurrency} and backing off for {self.backoff_seconds} seconds',
+        )
+
+    def _wait_for_slot(self, pool: Pool) -> None:
+        """Wait until there is no rate limit backoff and the pool has an allowed free slot"""
+        while True:
+            self._check_for_new_rate_limit()
+            rate_limited = (
+                self.backoff_seconds != 0 and
+                self.cryptocompare.rate_limited_in_last(self.backoff_seconds)
+            )
+            if not rate_limited and len(pool) < self.allowed_concurrency:
+                return
+
+            gevent.sleep(PREFETCH_POLL_SECS)
+
+    def _prefetch_pair(self, query: 'CCHistoQuery') -> None:
+        pair_name = f'{query.from_asset.identifier}/{query.to_asset.identifier}'
+        self.pairs_in_progress.add(pair_name)
+        start_ts = ts_now()
+        try:
+            self.cryptocompare.query_and_store_historical_data(
+                from_asset=query.from_asset,
+                to_asset=query.to_asset,
+                timestamp=start_ts,
+            )
+        except (RemoteError, UnsupportedAsset) as e:
+            log.warning(f'Failed to prefetch cryptocompare historical prices of {pair_name}: {str(e)}')  # noqa: E501
+            self.failed_pairs += 1
+            return
+        finally:
+            self.pairs_in_progress.discard(pair_name)
+
+        self.completed_pairs += 1
+        if self.cryptocompare.last_rate_limit < start_ts:
+            # no rate limit during this pair's query. Slowly ramp back up
+            self.allowed_concurrency = min(self.concurrency, self.allowed_concurrency + 1)
+            self.backoff_seconds //= 2
+
+    def prefetch(self, queries: List['CCHistoQuery']) -> None:
+        """Query and store the historical prices of all given pairs. Blocks until all finish"""
+        self.running = True
+        self.total_pairs = len(queries)
+        self.completed_pairs = 0
+        self.failed_pairs = 0
+        self.allowed_concurrency = self.concurrency
+        self.backoff_seconds = 0
+        self._last_seen_rate_limit = self.cryptocompare.last_rate_limit
+        pool = Pool(size=MAX_CRYPTOCOMPARE_PREFETCH_CONCURRENCY)
+        try:
+            for query in queries:
+                self._wait_for_slot(pool)
+                pool.spawn(self._prefetch_pair, query)
+            pool.join()
+        finally:
+            pool.kill()
+            self.running = False
@@ -6,13 +6,70 @@ import requests
 
 from rotkehlchen.balances.manual import ManuallyTrackedBalance
 from rotkehlchen.fval import FVal
-from rotkehlchen.tests.utils.api import api_url_for, assert_error_response, assert_proper_response
+from rotkehlchen.tests.utils.api import (
+    api_url_for,
+    assert_error_response,
+    assert_proper_response,
+    assert_proper_response_with_result,
+)
 from rotkehlchen.tests.utils.constants import A_EUR, A_GNO, A_RDN
 from rotkehlchen.tests.utils.factories import UNIT_BTC_ADDRESS1, UNIT_BTC_ADDRESS2
 from rotkehlchen.tests.utils.rotkehlchen import setup_balances
 from rotkehlchen.typing import Location
 
 
+def test_query_all_assets(rotkehlchen_api_server, globaldb):
+    """Test that the all assets endpoint streams the data of all assets"""
+    response = requests.get(api_url_for(rotkehlchen_api_server, 'allassetsresource'))
+    assert response.headers['Transfer-Encoding'] == 'chunked'
+    result = assert_proper_response_with_result(response)
+    assert result == globaldb.get_all_asset_data(mapping=True)
+    assert result['ETH']['name'] == 'Ethereum'
+    assert result['BTC']['symbol'] == 'BTC'
+
+
+def test_query_all_assets_etag(rotkehlchen_api_server, globaldb):
+    """Test that the all assets are sent again from memory and not at all if the client
+    has them, until an asset changes"""
+    url = api_url_for(rotkehlchen_api_server, 'allassetsresource')
+    response = requests.get(url)
+    result = assert_proper_response_with_result(response)
+    etag = response.headers['ETag']
+
+    # The body kept in memory is sent as is
+    response = requests.get(url)
+    assert 'Transfer-Encoding' not in response.headers
+    assert response.headers['ETag'] == etag
+    assert assert_proper_response_with_result(response) == result
+    response = requests.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.content == b''
+
+    # After an asset is added the client gets all assets again
+    response = requests.put(url, json={'asset_type': 'own chain', 'name': 'foo', 'symbol': 'FOO'})
+    identifier = assert_proper_response_with_result(response)['identifier']
+    response = requests.get(url, headers={'If-None-Match': etag})
+    result = assert_proper_response_with_result(response)
+    assert result[identifier]['name'] == 'foo'
+    assert result == globaldb.get_all_asset_data(mapping=True)
+    assert response.headers['ETag'] != etag
+    etag = response.headers['ETag']
+
+    # and the same after it is edited
+    response = requests.patch(url, json={
+        'identifier': identifier,
+        'asset_type': 'own chain',
+        'name': 'boo',
+        'symbol': 'FOO',
+    })
+    assert_proper_response(response)
+    response = requests.get(url, headers={'If-None-Match': etag})
+    assert assert_proper_response_with_result(response)[identifier]['name'] == 'boo'
+    etag = response.headers['ETag']
+    response = requests.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+
 @pytest.mark.parametrize('number_of_eth_accounts', [2])
 @pytest.mark.parametrize('btc_accounts', [[UNIT_BTC_ADDRESS1, UNIT_BTC_ADDRESS2]])
 @pytest.mark.parametrize('added_exchanges', [('binance', 'poloniex')])
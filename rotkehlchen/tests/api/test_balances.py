@@ -7,6 +7,7 @@ import gevent
 import pytest
 import requests
 
+from rotkehlchen.accounting.structures import Balance
 from rotkehlchen.balances.manual import ManuallyTrackedBalance
 from rotkehlchen.chain.bitcoin import get_bitcoin_addresses_balances
 from rotkehlchen.constants.assets import A_BTC, A_ETH
@@ -442,6 +443,53 @@ def test_query_all_balances_errors(rotkehlchen_api_server):
     )
 
 
+@pytest.mark.parametrize('number_of_eth_accounts', [0])
+@pytest.mark.parametrize('btc_accounts', [[]])
+@pytest.mark.parametrize('added_exchanges', [('binance', 'poloniex')])
+def test_query_all_balances_exchanges_concurrently(rotkehlchen_api_server_with_exchanges):
+    """Test that the exchanges are queried at the same time and that an exchange whose
+    query times out is left out of the balances, which are then not saved"""
+    rotki = rotkehlchen_api_server_with_exchanges.rest_api.rotkehlchen
+    binance = rotki.exchange_manager.connected_exchanges['binance']
+    poloniex = rotki.exchange_manager.connected_exchanges['poloniex']
+    running = 0
+    max_running = 0
+
+    def mock_query_balances(sleep_secs, **kwargs):  # pylint: disable=unused-argument
+        nonlocal running, max_running
+        running += 1
+        max_running = max(running, max_running)
+        gevent.sleep(sleep_secs)
+        running -= 1
+        return {A_BTC: Balance(amount=FVal(1), usd_value=FVal(1))}, ''
+
+    with ExitStack() as stack:
+        stack.enter_context(patch('rotkehlchen.rotkehlchen.EXCHANGE_BALANCES_TIMEOUT', new=1))
+        stack.enter_context(patch.object(
+            binance,
+            'query_balances',
+            side_effect=lambda **kwargs: mock_query_balances(0.2, **kwargs),
+        ))
+        poloniex_patch = stack.enter_context(patch.object(
+            poloniex,
+            'query_balances',
+            side_effect=lambda **kwargs: mock_query_balances(0.2, **kwargs),
+        ))
+        result = rotki.query_balances(requested_save_data=True)
+        assert max_running == 2
+        assert set(result['location'].keys()) == {'binance', 'poloniex'}
+        assert FVal(result['assets'][A_BTC]['amount']) == 2
+        last_save_timestamp = rotki.data.db.get_last_balance_save_time()
+        assert last_save_timestamp != 0
+
+        gevent.sleep(1)  # so that a save would get a new timestamp
+        poloniex_patch.side_effect = lambda **kwargs: mock_query_balances(5, **kwargs)
+        result = rotki.query_balances(requested_save_data=True)
+        assert set(result['location'].keys()) == {'binance'}
+        assert FVal(result['assets'][A_BTC]['amount']) == 1
+        assert rotki.data.db.get_last_balance_save_time() == last_save_timestamp
+
+
 @pytest.mark.parametrize('number_of_eth_accounts', [2])
 @pytest.mark.parametrize('btc_accounts', [[UNIT_BTC_ADDRESS1, UNIT_BTC_ADDRESS2]])
 @pytest.mark.parametrize('separate_blockchain_calls', [True, False])
@@ -440,3 +440,12 @@ def test_query_asset_types(rotkehlchen_api_server):
     result = assert_proper_response_with_result(response)
     assert result == [str(x) for x in AssetType]
     assert all(isinstance(AssetType.deserialize(x), AssetType) for x in result)
+
+    response = requests.get(
+        api_url_for(
+            rotkehlchen_api_server,
+            'assetstypesresource',
+        ),
+        headers={'If-None-Match': response.headers['ETag']},
+    )
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
@@ -145,6 +145,29 @@ def test_add_and_query_ledger_actions(rotkehlchen_api_server):
     result = [x['entry'] for x in result['entries']]
     assert result == actions[1:2]
 
+    # filter by asset and ignored status, most recent first
+    response = requests.get(
+        api_url_for(
+            rotkehlchen_api_server,
+            "ledgeractionsresource",
+        ), json={'asset': 'EUR', 'ignored_in_accounting': True, 'ascending': False},
+    )
+    result = assert_proper_response_with_result(response)
+    assert result['entries_found'] == 2
+    assert result['entries_total'] == 4
+    assert [x['entry'] for x in result['entries']] == [actions[3], actions[2]]
+
+    # and paginate
+    response = requests.get(
+        api_url_for(
+            rotkehlchen_api_server,
+            "ledgeractionsresource",
+        ) + '?offset=1&limit=2',
+    )
+    result = assert_proper_response_with_result(response)
+    assert result['entries_found'] == 4
+    assert [x['entry'] for x in result['entries']] == actions[1:3]
+
 
 @pytest.mark.parametrize('number_of_eth_accounts', [0])
 def test_edit_ledger_actions(rotkehlchen_api_server):
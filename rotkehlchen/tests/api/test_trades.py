@@ -1,9 +1,10 @@
 from http import HTTPStatus
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 import pytest
 import requests
 
+from rotkehlchen.accounting.structures import ActionType
 from rotkehlchen.api.v1.encoding import TradeSchema
 from rotkehlchen.constants.assets import A_BTC, A_WETH, A_AAVE, A_DAI
 from rotkehlchen.exchanges.data_structures import Trade
@@ -21,7 +22,7 @@ from rotkehlchen.tests.utils.history import (
     assert_poloniex_trades_result,
     mock_history_processing_and_exchanges,
 )
-from rotkehlchen.typing import Location, TradeType
+from rotkehlchen.typing import Location, Timestamp, TradeType
 
 
 @pytest.mark.parametrize('added_exchanges', [('binance', 'poloniex')])
@@ -222,6 +223,100 @@ def test_query_trades_over_limit(rotkehlchen_api_server_with_exchanges, start_wi
             assert result['entries_found'] == all_trades_num
 
 
+def test_query_trades_pagination_and_filters(rotkehlchen_api_server):
+    """Test that the trades endpoint filters, orders and paginates trades in the DB"""
+    rotki = rotkehlchen_api_server.rest_api.rotkehlchen
+    trades = [Trade(
+        timestamp=Timestamp(1600000000 + x),
+        location=Location.EXTERNAL if x % 2 == 0 else Location.CRYPTOCOM,
+        base_asset=A_BTC if x < 6 else A_DAI,
+        quote_asset=A_EUR,
+        trade_type=TradeType.BUY if x % 3 != 0 else TradeType.SELL,
+        amount=FVal(x + 1),
+        rate=FVal(1),
+        fee=FVal(0),
+        fee_currency=A_EUR,
+        link='',
+        notes='') for x in range(10)
+    ]
+    rotki.data.db.add_trades(trades)
+    rotki.data.db.add_to_ignored_action_ids(
+        action_type=ActionType.TRADE,
+        identifiers=[trades[1].identifier, trades[4].identifier],
+    )
+
+    def query(**kwargs: Any) -> Dict[str, Any]:
+        response = requests.get(
+            api_url_for(rotkehlchen_api_server, 'tradesresource'),
+            json=kwargs,
+        )
+        result = assert_proper_response_with_result(response)
+        assert result['entries_total'] == 10
+        return result
+
+    def timestamps(result: Dict[str, Any]) -> List[int]:
+        return [x['entry']['timestamp'] - 1600000000 for x in result['entries']]
+
+    # by default all trades are returned with the most recent first
+    result = query()
+    assert timestamps(result) == list(range(9, -1, -1))
+    assert result['entries_found'] == 10
+    assert [x['ignored_in_accounting'] for x in result['entries']] == [x in (1, 4) for x in range(9, -1, -1)]  # noqa: E501
+
+    # get the pages one by one
+    for offset in (0, 4, 8):
+        result = query(offset=offset, limit=4)
+        assert timestamps(result) == list(range(9 - offset, max(5 - offset, -1), -1))
+        assert result['entries_found'] == 10
+
+    result = query(offset=3, limit=2, ascending=True)
+    assert timestamps(result) == [3, 4]
+
+    result = query(location='cryptocom', asset=A_BTC.identifier)
+    assert timestamps(result) == [5, 3, 1]
+    assert result['entries_found'] == 3
+
+    result = query(trade_type='sell', limit=2)
+    assert timestamps(result) == [9, 6]
+    assert result['entries_found'] == 4
+
+    result = query(ignored_in_accounting=True)
+    assert timestamps(result) == [4, 1]
+    assert all(x['ignored_in_accounting'] for x in result['entries'])
+    result = query(ignored_in_accounting=False, asset=A_BTC.identifier)
+    assert timestamps(result) == [5, 3, 2, 0]
+
+    # order by another attribute with the timestamp as tiebreaker
+    result = query(order_by_attribute='base_asset', ascending=True, limit=3)
+    assert timestamps(result) == [0, 1, 2]
+    assert result['entries_found'] == 10
+
+    # also with query arguments
+    response = requests.get(
+        api_url_for(rotkehlchen_api_server, 'tradesresource') +
+        '?offset=1&limit=2&trade_type=sell&ignored_in_accounting=false',
+    )
+    result = assert_proper_response_with_result(response)
+    assert timestamps(result) == [6, 3]
+    assert result['entries_found'] == 4
+
+    for data, msg in (
+            ({'offset': -1}, 'Must be greater than or equal to 0'),
+            ({'limit': 0}, 'Must be greater than or equal to 1'),
+            ({'order_by_attribute': 'rate'}, 'Must be one of'),
+            ({'trade_type': 'foo'}, 'Failed to deserialize trade type'),
+    ):
+        response = requests.get(
+            api_url_for(rotkehlchen_api_server, 'tradesresource'),
+            json=data,
+        )
+        assert_error_response(
+            response=response,
+            contained_in_msg=msg,
+            status_code=HTTPStatus.BAD_REQUEST,
+        )
+
+
 def test_add_trades(rotkehlchen_api_server):
     """Test that adding trades to the trades endpoint works as expected"""
     new_trades = [{  # own chain to fiat
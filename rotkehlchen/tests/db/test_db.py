@@ -23,14 +23,17 @@ from rotkehlchen.db.settings import (
     DEFAULT_BALANCE_SAVE_FREQUENCY,
     DEFAULT_BTC_DERIVATION_GAP_LIMIT,
     DEFAULT_CALCULATE_PAST_COST_BASIS,
+    DEFAULT_CRYPTOCOMPARE_PREFETCH_CONCURRENCY,
     DEFAULT_CURRENT_PRICE_ORACLES,
     DEFAULT_DATE_DISPLAY_FORMAT,
     DEFAULT_DISPLAY_DATE_IN_LOCALTIME,
+    DEFAULT_FIXED_POINT_COST_BASIS,
     DEFAULT_HISTORICAL_PRICE_ORACLES,
     DEFAULT_INCLUDE_CRYPTO2CRYPTO,
     DEFAULT_INCLUDE_GAS_COSTS,
     DEFAULT_KRAKEN_ACCOUNT_TYPE,
     DEFAULT_MAIN_CURRENCY,
+    DEFAULT_PNL_CHECKPOINT_FREQUENCY,
     DEFAULT_TAXABLE_LEDGER_ACTIONS,
     DEFAULT_UI_FLOATING_PRECISION,
     ROTKEHLCHEN_DB_VERSION,
@@ -125,6 +128,8 @@ TABLES_AT_INIT = [
     'action_type',
     'balancer_pools',
     'balancer_events',
+    'pnl_checkpoints',
+    'binance_trade_cursors',
 ]
 
 
@@ -219,6 +224,130 @@ def test_export_import_db(data_dir, username):
     assert balances == [starting_balance]
 
 
+def test_data_hash_cached_until_data_changes(data_dir, username):
+    """Test that the DB is exported to compute its data hash only if its data changed"""
+    msg_aggregator = MessagesAggregator()
+    data = DataHandler(data_dir, msg_aggregator)
+    data.unlock(username, '123', create_new=True)
+
+    patched_export = patch.object(
+        data,
+        'export_encrypted_db',
+        wraps=data.export_encrypted_db,
+    )
+    with patched_export as export_mock:
+        data_hash = data.get_db_hash_and_size('123')
+        assert export_mock.call_count == 1
+        # writing the last write and upload timestamps does not count as a change
+        data.db.update_last_data_upload_ts(Timestamp(1))
+        assert data.db.get_changed_tables() == []
+        assert data.get_db_hash_and_size('123') == data_hash
+        assert export_mock.call_count == 1
+
+        data.db.add_manually_tracked_balances([ManuallyTrackedBalance(
+            asset=A_EUR,
+            label='foo',
+            amount=FVal(10),
+            location=Location.BANKS,
+            tags=None,
+        )])
+        assert data.db.get_changed_tables() == ['manually_tracked_balances']
+        assert data.db.get_cached_data_hash() is None
+        new_data_hash = data.get_db_hash_and_size('123')
+        assert export_mock.call_count == 2
+        assert new_data_hash[0] != data_hash[0]
+        assert data.db.get_changed_tables() == []
+
+    # The unchanged data hash is kept across logins
+    data.logout()
+    data.unlock(username, '123', create_new=False)
+    assert data.db.get_cached_data_hash() == new_data_hash
+    assert data.compress_and_encrypt_db('123')[1] == new_data_hash[0]
+
+    # but not if the data changed before logging out
+    data.db.set_settings(ModifiableDBSettings(main_currency=A_BTC))
+    data.logout()
+    data.unlock(username, '123', create_new=False)
+    assert data.db.get_cached_data_hash() is None
+
+
+def test_unit_of_work(data_dir, username):
+    """Test that the writes inside a unit of work are committed together at its end"""
+    msg_aggregator = MessagesAggregator()
+    data = DataHandler(data_dir, msg_aggregator)
+    data.unlock(username, '123', create_new=True)
+    trades = [Trade(
+        timestamp=Timestamp(1451606400 + idx),
+        location=Location.KRAKEN,
+        base_asset=A_ETH,
+        quote_asset=A_BTC,
+        trade_type=TradeType.BUY,
+        amount=FVal(1),
+        rate=FVal(idx + 1),
+        fee=FVal('0.001'),
+        fee_currency=A_BTC,
+        link=str(idx),
+    ) for idx in range(3)]
+
+    last_write_ts = data.db.get_last_write_ts()
+    with patch('rotkehlchen.db.dbhandler.ts_now', return_value=last_write_ts + 10):
+        with data.db.unit_of_work():
+            data.db.add_trades(trades[:1])
+            with data.db.unit_of_work():
+                data.db.add_trades(trades[1:])
+            data.db.update_used_query_range(
+                name='kraken_trades',
+                start_ts=Timestamp(0),
+                end_ts=Timestamp(1451606402),
+            )
+            assert data.db.conn.in_transaction
+            # the last write is deferred to the commit but known in memory
+            assert data.db.get_last_write_ts() == last_write_ts
+            assert data.db.last_write_ts == last_write_ts + 10
+
+    assert not data.db.conn.in_transaction
+    assert data.db.get_last_write_ts() == last_write_ts + 10
+    assert data.db.get_trades() == trades
+    assert data.db.get_used_query_range('kraken_trades') == (0, 1451606402)
+
+    # what was written before an exception is still committed
+    with pytest.raises(ValueError):
+        with data.db.unit_of_work():
+            data.db.update_used_query_range(
+                name='kraken_trades',
+                start_ts=Timestamp(0),
+                end_ts=Timestamp(1451606403),
+            )
+            raise ValueError('something went wrong')
+    assert not data.db.conn.in_transaction
+    assert data.db.get_used_query_range('kraken_trades') == (0, 1451606403)
+
+    # and without a unit of work each write is committed on its own
+    data.db.add_trades([trades[0]._replace(link='new')])
+    assert not data.db.conn.in_transaction
+
+
+def test_sqlite_wal(data_dir, username):
+    """Test that the DB uses the WAL journal mode only when asked to"""
+    msg_aggregator = MessagesAggregator()
+    data = DataHandler(data_dir, msg_aggregator, sqlite_wal=True)
+    data.unlock(username, '123', create_new=True)
+    cursor = data.db.conn.cursor()
+    assert cursor.execute('PRAGMA journal_mode;').fetchone()[0] == 'wal'
+    # synchronous=NORMAL
+    assert cursor.execute('PRAGMA synchronous;').fetchone()[0] == 1
+    data.db.update_used_query_range('foo', Timestamp(1), Timestamp(2))
+    data.db.checkpoint_wal()
+    assert os.path.getsize(data_dir / username / 'rotkehlchen.db-wal') == 0
+    data.logout()
+
+    data = DataHandler(data_dir, msg_aggregator)
+    data.unlock(username, '123', create_new=False)
+    cursor = data.db.conn.cursor()
+    assert cursor.execute('PRAGMA journal_mode;').fetchone()[0] == 'delete'
+    assert data.db.get_used_query_range('foo') == (1, 2)
+
+
 def test_writing_fetching_data(data_dir, username):
     msg_aggregator = MessagesAggregator()
     data = DataHandler(data_dir, msg_aggregator)
@@ -314,6 +443,9 @@ def test_writing_fetching_data(data_dir, username):
         'current_price_oracles': DEFAULT_CURRENT_PRICE_ORACLES,
         'historical_price_oracles': DEFAULT_HISTORICAL_PRICE_ORACLES,
         'taxable_ledger_actions': DEFAULT_TAXABLE_LEDGER_ACTIONS,
+        'cryptocompare_prefetch_concurrency': DEFAULT_CRYPTOCOMPARE_PREFETCH_CONCURRENCY,
+        'fixed_point_cost_basis': DEFAULT_FIXED_POINT_COST_BASIS,
+        'pnl_checkpoint_frequency': DEFAULT_PNL_CHECKPOINT_FREQUENCY,
     }
     assert len(expected_dict) == len(DBSettings()), 'One or more settings are missing'
 
@@ -807,7 +939,7 @@ def test_add_trades(data_dir, username, caplog):
     # Add the last 2 trades. Since trade2 already exists in the DB it should be
     # ignored and a warning should be logged
     data.db.add_trades([trade2, trade3])
-    assert 'Did not add "buy trade with id a1ed19c8284940b4e59bdac941db2fd3c0ed004ddb10fdd3b9ef0a3a9b2c97bc' in caplog.text  # noqa: E501
+    assert 'Did not add 1 out of 2 "trade" entries to the DB' in caplog.text
     returned_trades = data.db.get_trades()
     assert returned_trades == [trade1, trade2, trade3]
 
@@ -867,10 +999,7 @@ def test_add_margin_positions(data_dir, username, caplog):
     # Add the last 2 margins. Since margin2 already exists in the DB it should be
     # ignored and a warning should be logged
     data.db.add_margin_positions([margin2, margin3])
-    assert (
-        'Did not add "Margin position with id 0a57acc1f4c09da0f194c59c4cd240e6'
-        '8e2d36e56c05b3f7115def9b8ee3943f'
-    ) in caplog.text
+    assert 'Did not add 1 out of 2 "margin_position" entries to the DB' in caplog.text
     returned_margins = data.db.get_margin_positions()
     assert returned_margins == [margin1, margin2, margin3]
 
@@ -933,10 +1062,7 @@ def test_add_asset_movements(data_dir, username, caplog):
     # Add the last 2 movements. Since movement2 already exists in the DB it should be
     # ignored and a warning should be logged
     data.db.add_asset_movements([movement2, movement3])
-    assert (
-        'Did not add "withdrawal of ETH with id 94405f38c7b86dd2e7943164d'
-        '67ff44a32d56cef25840b3f5568e23c037fae0a'
-    ) in caplog.text
+    assert 'Did not add 1 out of 2 "asset_movement" entries to the DB' in caplog.text
     returned_movements = data.db.get_asset_movements()
     assert returned_movements == [movement1, movement2, movement3]
 
@@ -1010,6 +1136,62 @@ def test_add_ethereum_transactions(data_dir, username):
     assert returned_transactions == [tx1, tx2, tx3]
 
 
+def test_add_etherscan_internal_transactions(data_dir, username):
+    """Test that etherscan internal transactions with the same hash are all kept
+
+    They have no nonce so the ones after the first get an increasingly negative nonce
+    """
+    msg_aggregator = MessagesAggregator()
+    data = DataHandler(data_dir, msg_aggregator)
+    data.unlock(username, '123', create_new=True)
+
+    internal_txs = [EthereumTransaction(
+        tx_hash=b'1',
+        timestamp=Timestamp(1451606400),
+        block_number=1,
+        from_address=ETH_ADDRESS1,
+        to_address=ETH_ADDRESS2,
+        value=FVal(value),
+        gas=FVal('5000000'),
+        gas_price=FVal('2000000000'),
+        gas_used=FVal('25000000'),
+        input_data=MOCK_INPUT_DATA,
+        nonce=-1,
+    ) for value in (1, 2, 3)]
+    data.db.add_ethereum_transactions(internal_txs[:1], from_etherscan=True)
+    data.db.add_ethereum_transactions(internal_txs[1:], from_etherscan=True)
+    returned_transactions = data.db.get_ethereum_transactions()
+    assert {(x.nonce, x.value) for x in returned_transactions} == {(-1, 1), (-2, 2), (-3, 3)}
+
+    # not from etherscan they are just duplicates
+    data.db.add_ethereum_transactions(internal_txs[1:], from_etherscan=False)
+    assert len(data.db.get_ethereum_transactions()) == 3
+
+
+def test_write_tuples_rejects_constraint_violations(data_dir, username, caplog):
+    """Test that tuples violating a constraint other than uniqueness are rejected
+    and logged without affecting the rest of the batch and not skipped as duplicates"""
+    msg_aggregator = MessagesAggregator()
+    data = DataHandler(data_dir, msg_aggregator)
+    data.unlock(username, '123', create_new=True)
+
+    trade_tuple = ('id1', 1, 'A', 'ETH', 'BTC', 'A', '1', '1', '0', 'BTC', '', '')
+    invalid_location_tuple = ('id2', 1, '?', 'ETH', 'BTC', 'A', '1', '1', '0', 'BTC', '', '')
+    null_time_tuple = ('id3', None, 'A', 'ETH', 'BTC', 'A', '1', '1', '0', 'BTC', '', '')
+    query = (
+        'INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT(id) DO NOTHING'
+    )
+    data.db.write_tuples(
+        tuple_type='trade',
+        query=query,
+        tuples=[trade_tuple, invalid_location_tuple, null_time_tuple, trade_tuple],
+    )
+    assert f'Did not add "trade" {invalid_location_tuple} to the DB due to FOREIGN KEY' in caplog.text  # noqa: E501
+    assert f'Did not add "trade" {null_time_tuple} to the DB due to NOT NULL' in caplog.text
+    assert len(data.db.get_trades()) == 1
+
+
 @pytest.mark.parametrize('ethereum_accounts', [[]])
 def test_non_checksummed_eth_account_in_db(database):
     """
@@ -1116,6 +1298,33 @@ def test_timed_balances_primary_key_works(user_data_dir):
     assert len(balances) == 2
 
 
+def test_new_db_has_history_indexes(user_data_dir):
+    """New DBs get the history table indexes that existing DBs get via the upgrade"""
+    index_query = (
+        "SELECT name FROM sqlite_master WHERE type='index' AND "
+        "name NOT LIKE 'sqlite_autoindex%' ORDER BY name;"
+    )
+    db = DBHandler(user_data_dir, '123', MessagesAggregator(), None)
+    indexes = [x[0] for x in db.conn.cursor().execute(index_query)]
+    assert indexes == [
+        'amm_swaps_address_timestamp',
+        'amm_swaps_location_timestamp',
+        'asset_movements_location_time',
+        'asset_movements_time',
+        'ethereum_transactions_from_timestamp',
+        'ethereum_transactions_timestamp',
+        'ethereum_transactions_to_timestamp',
+        'margin_positions_location_close_time',
+        'timed_balances_currency_time',
+        'trades_location_time',
+        'trades_time',
+    ]
+    del db
+
+    db = DBHandler(user_data_dir, '123', MessagesAggregator(), None)
+    assert [x[0] for x in db.conn.cursor().execute(index_query)] == indexes
+
+
 def test_multiple_location_data_and_balances_same_timestamp(user_data_dir):
     """Test that adding location and balance data with same timestamp does not crash.
 
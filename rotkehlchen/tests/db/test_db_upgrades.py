@@ -30,9 +30,11 @@ from rotkehlchen.tests.utils.database import mock_dbhandler_update_owned_assets
 from rotkehlchen.tests.utils.factories import make_ethereum_address
 from rotkehlchen.user_messages import MessagesAggregator
 
-creation_patch = patch(
-    'rotkehlchen.db.dbhandler.DB_SCRIPT_CREATE_TABLES',
-    new=OLD_DB_SCRIPT_CREATE_TABLES,
+# New DBs with the old tables should not get the indexes of the latest tables
+creation_patch = patch.multiple(
+    'rotkehlchen.db.dbhandler',
+    DB_SCRIPT_CREATE_TABLES=OLD_DB_SCRIPT_CREATE_TABLES,
+    DB_SCRIPT_CREATE_INDEXES='',
 )
 
 
@@ -1759,6 +1761,68 @@ def test_upgrade_db_24_to_25(user_data_dir):  # pylint: disable=unused-argument
     assert db.get_version() == 25
 
 
+def test_upgrade_db_25_to_26(user_data_dir):  # pylint: disable=unused-argument
+    """Test upgrading the DB from version 25 to version 26.
+
+    - Creates the secondary indexes of the history tables
+    """
+    msg_aggregator = MessagesAggregator()
+    _use_prepared_db(user_data_dir, 'v24_rotkehlchen.db')
+    db_v25 = _init_db_with_target_version(
+        target_version=25,
+        user_data_dir=user_data_dir,
+        msg_aggregator=msg_aggregator,
+    )
+    cursor = db_v25.conn.cursor()
+    index_query = (
+        "SELECT name, tbl_name FROM sqlite_master WHERE type='index' AND "
+        "name NOT LIKE 'sqlite_autoindex%' ORDER BY name;"
+    )
+    assert cursor.execute(index_query).fetchall() == []
+    trades_before = db_v25.get_trades()
+    del db_v25
+
+    db = _init_db_with_target_version(
+        target_version=26,
+        user_data_dir=user_data_dir,
+        msg_aggregator=msg_aggregator,
+    )
+    # check the indexes right after the upgrade, before the DB is opened again
+    cursor = db.conn.cursor()
+    indexes = cursor.execute(index_query).fetchall()
+    assert indexes == [
+        ('amm_swaps_address_timestamp', 'amm_swaps'),
+        ('amm_swaps_location_timestamp', 'amm_swaps'),
+        ('asset_movements_location_time', 'asset_movements'),
+        ('asset_movements_time', 'asset_movements'),
+        ('ethereum_transactions_from_timestamp', 'ethereum_transactions'),
+        ('ethereum_transactions_timestamp', 'ethereum_transactions'),
+        ('ethereum_transactions_to_timestamp', 'ethereum_transactions'),
+        ('margin_positions_location_close_time', 'margin_positions'),
+        ('timed_balances_currency_time', 'timed_balances'),
+        ('trades_location_time', 'trades'),
+        ('trades_time', 'trades'),
+    ]
+    # the location filtered time range query uses the index
+    plan = cursor.execute(
+        'EXPLAIN QUERY PLAN SELECT id FROM trades WHERE location=? AND time >= ? '
+        'ORDER BY time ASC;',
+        ('B', 1500000000),
+    ).fetchall()
+    assert 'trades_location_time' in plan[0][-1]
+    assert db.get_trades() == trades_before
+    assert db.get_version() == 26
+    del db
+
+    # opening the upgraded DB again keeps the same indexes
+    db = _init_db_with_target_version(
+        target_version=26,
+        user_data_dir=user_data_dir,
+        msg_aggregator=msg_aggregator,
+    )
+    assert db.conn.cursor().execute(index_query).fetchall() == indexes
+
+
 def test_db_newer_than_software_raises_error(data_dir, username):
     """
     If the DB version is greater than the current known version in the
@@ -115,6 +115,23 @@ def test_get_last_consecutive_xpub_derived_indices(setup_db_for_xpub_tests):
     assert change_idx == 0
 
 
+def test_get_last_consecutive_xpub_derived_indices_unordered(setup_db_for_xpub_tests):
+    """Test that the indices are found consecutive even if not inserted in order"""
+    db, _, _, xpub3, all_addresses = setup_db_for_xpub_tests
+    db.ensure_xpub_mappings_exist(
+        xpub=xpub3.xpub.xpub,
+        derivation_path=xpub3.derivation_path,
+        derived_addresses_data=[
+            XpubDerivedAddressData(0, 2, all_addresses[2], ZERO),
+            XpubDerivedAddressData(0, 0, all_addresses[0], ZERO),
+            XpubDerivedAddressData(0, 1, all_addresses[1], ZERO),
+        ],
+    )
+    receiving_idx, change_idx = db.get_last_consecutive_xpub_derived_indices(xpub3)
+    assert receiving_idx == 2
+    assert change_idx == 0
+
+
 def test_get_addresses_to_xpub_mapping(setup_db_for_xpub_tests):
     db, xpub1, xpub2, _, all_addresses = setup_db_for_xpub_tests
     # Also add a non-existing address in there for fun
@@ -1,5 +1,6 @@
 import hashlib
 import hmac
+import json
 import warnings as test_warnings
 from contextlib import ExitStack
 from datetime import datetime
@@ -26,6 +27,7 @@ from rotkehlchen.tests.utils.constants import A_ADA, A_BUSD, A_DOT, A_RDN, A_XMR
 from rotkehlchen.tests.utils.exchanges import (
     BINANCE_MYTRADES_RESPONSE,
     mock_binance_balance_response,
+    mock_binance_trade_candidates_response,
 )
 from rotkehlchen.tests.utils.factories import make_api_key, make_api_secret
 from rotkehlchen.tests.utils.mock import MockResponse
@@ -221,6 +223,9 @@ def test_binance_query_trade_history(function_scope_binance):
     binance = function_scope_binance
 
     def mock_my_trades(url):  # pylint: disable=unused-argument
+        response = mock_binance_trade_candidates_response(url)
+        if response is not None:
+            return response
         if 'symbol=BNBBTC' in url:
             text = BINANCE_MYTRADES_RESPONSE
         else:
@@ -248,12 +253,66 @@ def test_binance_query_trade_history(function_scope_binance):
     assert trades[0] == expected_trade
 
 
+def test_binance_query_trade_history_cursors(function_scope_binance):
+    """Test that only the markets of held or traded assets are queried and that a
+    repeated query continues from the saved trade cursor of each market"""
+    binance = function_scope_binance
+    queried_urls = []
+
+    def make_trades(symbol, *trades):
+        raw_trade = json.loads(BINANCE_MYTRADES_RESPONSE)[0]
+        return json.dumps([
+            {**raw_trade, 'symbol': symbol, 'id': x, 'time': y * 1000, 'commissionAsset': 'BTC'}
+            for x, y in trades
+        ])
+
+    def mock_my_trades(url):
+        response = mock_binance_trade_candidates_response(url)
+        if response is not None:
+            return response
+        queried_urls.append(url)
+        if 'symbol=ADABTC&fromId=0&' in url:
+            # the second trade is after the end of the first query
+            return MockResponse(200, make_trades('ADABTC', (5, 1600000000), (6, 1610000000)))
+        if 'symbol=ADABTC&fromId=6&' in url:
+            return MockResponse(200, make_trades('ADABTC', (6, 1610000000)))
+        if 'symbol=ADAUSDT&fromId=0&' in url:
+            return MockResponse(200, make_trades('ADAUSDT', (10, 1600000001)))
+        return MockResponse(200, '[]')
+
+    with patch.object(binance.session, 'get', side_effect=mock_my_trades):
+        trades = binance.query_trade_history(start_ts=0, end_ts=1605000000, only_cache=False)
+
+    assert [x.link for x in trades] == ['5', '10']
+    queried_symbols = {x.split('symbol=')[1].split('&')[0] for x in queried_urls}
+    # ADA is found in the ADABTC trades and USDT in the ADAUSDT ones
+    assert {'ADABTC', 'ETHBTC', 'ADAUSDT', 'BNBUSDT'}.issubset(queried_symbols)
+    # neither XMR nor BNB are held, deposited or traded
+    assert 'XMRBNB' not in queried_symbols
+    assert binance.db.get_binance_trade_cursors(binance.name) == {
+        'ADABTC': (6, 1605000000),
+        'ADAUSDT': (11, 1605000000),
+    }
+
+    queried_urls = []
+    with patch.object(binance.session, 'get', side_effect=mock_my_trades):
+        trades = binance.query_trade_history(start_ts=0, end_ts=1615000000, only_cache=False)
+
+    assert [x.link for x in trades] == ['5', '10', '6']
+    assert any('symbol=ADABTC&fromId=6&' in x for x in queried_urls)
+    assert any('symbol=ADAUSDT&fromId=11&' in x for x in queried_urls)
+    assert binance.db.get_binance_trade_cursors(binance.name)['ADABTC'] == (7, 1615000000)
+
+
 def test_binance_query_trade_history_unexpected_data(function_scope_binance):
     """Test that turning a binance trade that contains unexpected data is handled gracefully"""
     binance = function_scope_binance
     binance.cache_ttl_secs = 0
 
     def mock_my_trades(url):  # pylint: disable=unused-argument
+        response = mock_binance_trade_candidates_response(url)
+        if response is not None:
+            return response
         if 'symbol=BNBBTC' in url or 'symbol=doesnotexist' in url:
             text = BINANCE_MYTRADES_RESPONSE
         else:
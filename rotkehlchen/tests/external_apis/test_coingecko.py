@@ -1,7 +1,9 @@
+from unittest.mock import patch
+
 import pytest
 
 from rotkehlchen.assets.asset import EthereumToken
-from rotkehlchen.constants.assets import A_BTC, A_ETH, A_YFI
+from rotkehlchen.constants.assets import A_BTC, A_ETH, A_USD, A_YFI
 from rotkehlchen.errors import UnsupportedAsset
 from rotkehlchen.externalapis.coingecko import CoingeckoAssetData, CoingeckoImageURLs
 from rotkehlchen.fval import FVal
@@ -62,3 +64,26 @@ def test_coingecko_historical_price(session_coingecko):
         timestamp=1483056100,
     )
     assert price == Price(FVal('7.7478028375650725'))
+
+
+def test_coingecko_query_multiple_current_prices(session_coingecko):
+    """Test that the current prices of many assets are queried with few simple price queries"""
+    assets = [A_BTC, A_ETH, A_YFI, A_EUR]
+    queried_ids = []
+
+    def mock_query(module, options):
+        assert module == 'simple/price'
+        assert options['vs_currencies'] == 'usd'
+        ids = options['ids'].split(',')
+        queried_ids.append(ids)
+        return {x: {'usd': len(x)} for x in ids if x != 'yearn-finance'}
+
+    with patch(
+        'rotkehlchen.externalapis.coingecko.COINGECKO_SIMPLE_PRICE_IDS_PER_QUERY',
+        new=2,
+    ), patch.object(session_coingecko, '_query', side_effect=mock_query):
+        prices = session_coingecko.query_multiple_current_prices(assets, A_USD)
+
+    # EUR is not supported in coingecko and the response had no YFI price
+    assert queried_ids == [['bitcoin', 'ethereum'], ['yearn-finance']]
+    assert prices == {A_BTC: Price(FVal(7)), A_ETH: Price(FVal(8))}
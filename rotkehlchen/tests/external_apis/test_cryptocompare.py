@@ -21,6 +21,7 @@ from rotkehlchen.constants.assets import (
     A_USDT,
 )
 from rotkehlchen.constants.misc import ZERO
+from rotkehlchen.errors import RemoteError
 from rotkehlchen.externalapis.cryptocompare import (
     A_COMP,
     CRYPTOCOMPARE_HOURQUERYLIMIT,
@@ -209,6 +210,59 @@ def test_empty_histohour(data_dir, database, freezer):
     assert len(result) == 0
 
 
+def _make_histohour_mock(first_price_ts, fail_at_call=None):
+    """Mock the histohour endpoint. Prices are non-zero from first_price_ts and on"""
+    calls = []
+
+    def mock_query_endpoint_histohour(from_asset, to_asset, limit, to_timestamp):  # pylint: disable=unused-argument  # noqa: E501
+        calls.append(to_timestamp)
+        if len(calls) == fail_at_call:
+            raise RemoteError('Cryptocompare went away')
+        time_to = to_timestamp - to_timestamp % 3600
+        time_from = time_to - limit * 3600
+        data = []
+        for ts in range(time_from, time_to + 1, 3600):
+            price = 5 if ts >= first_price_ts else 0
+            data.append({'time': ts, 'high': price, 'low': price, 'close': price})
+        return {'TimeFrom': time_from, 'TimeTo': time_to, 'Data': data}
+
+    return mock_query_endpoint_histohour, calls
+
+
+@pytest.mark.freeze_time
+@pytest.mark.parametrize('use_clean_caching_directory', [True])
+def test_histohour_query_resumes_after_interruption(data_dir, database, freezer):
+    """Test that histohour pages are stored as they arrive and that an interrupted
+    query resumes from the last stored page"""
+    first_price_ts = 1499997600
+    now_ts = first_price_ts + 3600 * CRYPTOCOMPARE_HOURQUERYLIMIT * 4 + 1234
+    last_hour_ts = now_ts - now_ts % 3600
+    freezer.move_to(datetime.fromtimestamp(now_ts))
+    cc = Cryptocompare(data_directory=data_dir, database=database)
+
+    histohour_mock, calls = _make_histohour_mock(first_price_ts, fail_at_call=3)
+    with patch.object(cc, 'query_endpoint_histohour', side_effect=histohour_mock):
+        with pytest.raises(RemoteError):
+            cc.query_and_store_historical_data(A_BTC, A_USD, Timestamp(now_ts))
+
+    # the two pages that made it before the error are already stored
+    result = get_globaldb_cache_entries(from_asset=A_BTC, to_asset=A_USD)
+    assert len(result) == CRYPTOCOMPARE_HOURQUERYLIMIT * 2 + 1
+    assert result[-1].timestamp == last_hour_ts
+
+    histohour_mock, calls = _make_histohour_mock(first_price_ts)
+    with patch.object(cc, 'query_endpoint_histohour', side_effect=histohour_mock):
+        cc.query_and_store_historical_data(A_BTC, A_USD, Timestamp(now_ts))
+
+    # the query continued from where the interrupted one stopped
+    assert calls[0] == now_ts - 3600 * CRYPTOCOMPARE_HOURQUERYLIMIT * 2
+    result = get_globaldb_cache_entries(from_asset=A_BTC, to_asset=A_USD)
+    assert [x.timestamp for x in result] == list(range(first_price_ts, last_hour_ts + 1, 3600))
+    assert all(x.price == Price(FVal(5)) for x in result)
+    next_setting, _ = cc._get_backfill_setting_names(A_BTC, A_USD)
+    assert GlobalDBHandler().get_setting_value(next_setting, -1) == -1
+
+
 def test_cryptocompare_dao_query(cryptocompare):
     """
     Test that querying the DAO token for cryptocompare historical prices works. At some point
@@ -407,3 +461,35 @@ def test_cryptocompare_query_with_api_key(cryptocompare):
     # call to endpoint with args
     price = cryptocompare.query_current_price(A_ETH, A_USD)
     assert price is not None
+
+
+def test_cryptocompare_query_multiple_current_prices(cryptocompare):
+    """Test that the current prices of many assets are queried with pricemulti queries
+    within the length limit of their from symbols"""
+    assets = [Asset(x) for x in ('BTC', 'ETH', 'XMR', 'ZEC', 'DASH', 'LTC')] + [A_ETH]
+    queried_paths = []
+
+    def mock_api_query(path):
+        queried_paths.append(path)
+        symbols = path.split('fsyms=')[1].split('&')[0].split(',')
+        # cryptocompare omits the symbols it has no price for
+        return {x: {'USD': len(x)} for x in symbols if x != 'ZEC'}
+
+    with patch(
+        'rotkehlchen.externalapis.cryptocompare.CRYPTOCOMPARE_PRICEMULTI_FSYMS_MAX_LENGTH',
+        new=8,
+    ), patch.object(cryptocompare, '_api_query', side_effect=mock_api_query):
+        prices = cryptocompare.query_multiple_current_prices(assets, A_USD)
+
+    assert queried_paths == [
+        'pricemulti?fsyms=BTC,ETH&tsyms=USD',
+        'pricemulti?fsyms=XMR,ZEC&tsyms=USD',
+        'pricemulti?fsyms=DASH,LTC&tsyms=USD',
+    ]
+    assert prices == {
+        A_BTC: Price(FVal(3)),
+        A_ETH: Price(FVal(3)),
+        A_XMR: Price(FVal(3)),
+        Asset('DASH'): Price(FVal(4)),
+        Asset('LTC'): Price(FVal(3)),
+    }
@@ -193,6 +193,14 @@ def create_inquirer(
 
     inquirer.find_usd_price = mock_find_usd_price  # type: ignore
 
+    def mock_find_usd_prices(
+            assets,
+            ignore_cache: bool = False,  # pylint: disable=unused-argument
+    ):
+        return {x: mocked_prices.get(x, FVal('1.5')) for x in assets}
+
+    inquirer.find_usd_prices = mock_find_usd_prices  # type: ignore
+
     def mock_query_fiat_pair(base, quote):  # pylint: disable=unused-argument
         return FVal(1)
 
@@ -1,8 +1,13 @@
-from base64 import b64decode
+import hashlib
+import hmac
+import zlib
+from base64 import b64decode, b64encode
 from unittest.mock import patch
+from urllib.parse import parse_qs
 
 import pytest
 
+from rotkehlchen.crypto import decrypt
 from rotkehlchen.db.settings import ModifiableDBSettings
 from rotkehlchen.errors import (
     IncorrectApiKeyFormat,
@@ -44,17 +49,34 @@ def test_upload_data_to_server(rotkehlchen_instance, username, db_password, db_s
     def mock_succesfull_upload_data_to_server(
             url,  # pylint: disable=unused-argument
             data,
+            headers,
             timeout,  # pylint: disable=unused-argument
     ):
+        # The data are streamed url encoded in chunks
+        post_data = b''.join(data)
+        assert headers['Content-Type'] == 'application/x-www-form-urlencoded'
+        # and signed as if they were sent at once
+        premium = rotkehlchen_instance.premium
+        signature = hmac.new(
+            premium.credentials.api_secret,
+            b'/api/1/save_data' + hashlib.sha256(post_data).digest(),
+            hashlib.sha512,
+        )
+        assert premium.session.headers['API-SIGN'] == b64encode(signature.digest())
+
+        data = {k: v[0] for k, v in parse_qs(post_data.decode()).items()}
         # Can't compare data blobs as they are encrypted and as such can be
         # different each time
         assert 'data_blob' in data
         assert data['original_hash'] == our_hash
-        assert data['last_modify_ts'] == last_write_ts
+        assert data['last_modify_ts'] == str(last_write_ts)
         assert 'index' in data
-        assert len(data['data_blob']) == data['length']
+        assert len(data['data_blob']) == int(data['length'])
         assert 'nonce' in data
         assert data['compression'] == 'zlib'
+        # and the blob decrypts to the plaintext DB
+        plaintext_db = zlib.decompress(decrypt(db_password.encode(), data['data_blob']))
+        assert plaintext_db.startswith(b'SQLite format 3')
 
         return MockResponse(200, '{"success": true}')
 
@@ -120,10 +142,17 @@ def test_upload_data_to_server_same_hash(rotkehlchen_instance, db_password):
         saved_data='foo',
     )
 
-    with patched_get, patched_put as put_mock:
+    patched_export = patch.object(
+        rotkehlchen_instance.data,
+        'export_encrypted_db',
+        wraps=rotkehlchen_instance.data.export_encrypted_db,
+    )
+    with patched_get, patched_put as put_mock, patched_export as export_mock:
         rotkehlchen_instance.premium_sync_manager.maybe_upload_data_to_server()
         # The upload mock should not have been called since the hash is the same
         assert not put_mock.called
+        # and the DB should not have been exported again since its data did not change
+        assert not export_mock.called
 
 
 @pytest.mark.parametrize('start_with_valid_premium', [True])
@@ -1,8 +1,11 @@
 import pytest
 
 from rotkehlchen.constants.assets import A_BTC, A_ETH
+from rotkehlchen.db.settings import ModifiableDBSettings
+from rotkehlchen.errors import NoPriceForGivenTimestamp
 from rotkehlchen.exchanges.data_structures import AssetMovement, MarginPosition
 from rotkehlchen.fval import FVal
+from rotkehlchen.history.price import PriceHistorian
 from rotkehlchen.tests.utils.accounting import accounting_history_process
 from rotkehlchen.tests.utils.constants import A_DASH
 from rotkehlchen.tests.utils.history import prices
@@ -379,6 +382,36 @@ def test_big_taxfree_period(accountant):
     assert accountant.taxable_trade_pl.is_close('0')
 
 
+@pytest.mark.parametrize('mocked_price_queries', [prices])
+@pytest.mark.parametrize('db_settings', [{
+    'pnl_checkpoint_frequency': 30,
+}])
+def test_resume_from_pnl_checkpoint(accountant):
+    """Test that a repeated PnL report resumes from a checkpoint with the same results"""
+    first = accounting_history_process(accountant, 1436979735, 1519693374, history5)
+    assert first['resumed_from_checkpoint'] is False
+    cursor = accountant.db.conn.cursor()
+    assert cursor.execute('SELECT COUNT(*) FROM pnl_checkpoints').fetchone()[0] != 0
+
+    second = accounting_history_process(accountant, 1436979735, 1519693374, history5)
+    assert second['resumed_from_checkpoint'] is True
+    assert second['overview'] == first['overview']
+    assert second['events_processed'] == first['events_processed']
+    assert second['all_events'] == first['all_events']
+
+    # changing an accounting setting invalidates the checkpoints
+    accountant.db.set_settings(ModifiableDBSettings(include_crypto2crypto=False))
+    third = accounting_history_process(accountant, 1436979735, 1519693374, history5)
+    assert third['resumed_from_checkpoint'] is False
+
+
+@pytest.mark.parametrize('mocked_price_queries', [prices])
+def test_no_pnl_checkpoints_by_default(accountant):
+    accounting_history_process(accountant, 1436979735, 1519693374, history5)
+    cursor = accountant.db.conn.cursor()
+    assert cursor.execute('SELECT COUNT(*) FROM pnl_checkpoints').fetchone()[0] == 0
+
+
 @pytest.mark.parametrize('mocked_price_queries', [prices])
 def test_buy_event_creation(accountant):
     history = [{
@@ -747,3 +780,48 @@ def test_not_calculate_past_cost_basis(accountant, db_settings):
     assert FVal(result['overview']['taxable_trade_profit_loss']).is_close(expected)
     assert FVal(result['overview']['total_taxable_profit_loss']).is_close(expected)
     assert FVal(result['overview']['total_profit_loss']).is_close(expected)
+
+
+@pytest.mark.parametrize('mocked_price_queries', [prices])
+def test_prefetch_only_needed_rates_once(accountant):
+    """Test that rates are prefetched only for what processing needs and that a rate
+    the prefetch could not find is not queried again for each event needing it"""
+    historian = PriceHistorian()
+    mocked_query = historian.query_historical_price
+    queried = []
+
+    def query_historical_price(from_asset, to_asset, timestamp):
+        queried.append((from_asset, timestamp))
+        if from_asset == A_BTC and timestamp == 1473505138:
+            raise NoPriceForGivenTimestamp(from_asset, to_asset, str(timestamp))
+        return mocked_query(from_asset=from_asset, to_asset=to_asset, timestamp=timestamp)
+
+    historian.query_historical_price = query_historical_price
+    history = [{
+        'timestamp': 1446979735,
+        'base_asset': 'BTC',
+        'quote_asset': 'EUR',
+        'trade_type': 'buy',
+        'rate': 268.678317859,
+        'fee': 0,
+        'fee_currency': 'EUR',
+        'amount': 5,
+        'location': 'kraken',
+    }] + [{
+        'timestamp': 1473505138,
+        'base_asset': 'ETH',
+        'quote_asset': 'BTC',
+        'trade_type': 'buy',
+        'rate': 0.01858275,
+        'fee': 0,
+        'fee_currency': 'ETH',
+        'amount': 10,
+        'location': 'poloniex',
+    }] * 2
+    accounting_history_process(accountant, 1436979735, 1495751688, history)
+
+    # the BTC rate of the BTC/EUR buy comes from the trade itself
+    assert (A_BTC, 1446979735) not in queried
+    # the BTC rate without a price is queried once for both trades needing it
+    assert queried.count((A_BTC, 1473505138)) == 1
+    assert len(accountant.msg_aggregator.consume_errors()) == 2
@@ -1,5 +1,10 @@
+import time
+from unittest.mock import patch
+
+import gevent
 import pytest
 
+from rotkehlchen.chain.bitcoin import get_bitcoin_addresses_balances, have_bitcoin_transactions
 from rotkehlchen.chain.bitcoin.hdkey import HDKey, XpubType
 from rotkehlchen.chain.bitcoin.utils import (
     is_valid_btc_address,
@@ -10,14 +15,25 @@ from rotkehlchen.chain.bitcoin.utils import (
     scriptpubkey_to_p2pkh_address,
     scriptpubkey_to_p2sh_address,
 )
-from rotkehlchen.chain.bitcoin.xpub import XpubData
-from rotkehlchen.errors import XPUBError
+from rotkehlchen.chain.bitcoin.xpub import (
+    XpubData,
+    _derive_address,
+    _derive_addresses_from_xpub_data,
+)
+from rotkehlchen.constants.timing import QUERY_RETRY_TIMES
+from rotkehlchen.errors import RemoteError, XPUBError
+from rotkehlchen.fval import FVal
+from rotkehlchen.tests.utils.blockchain import mock_bitcoin_balances_query
 from rotkehlchen.tests.utils.ens import ENS_BRUNO_BTC_ADDR, ENS_BRUNO_BTC_BYTES
 from rotkehlchen.tests.utils.factories import (
     UNIT_BTC_ADDRESS1,
     UNIT_BTC_ADDRESS2,
     UNIT_BTC_ADDRESS3,
 )
+from rotkehlchen.tests.utils.mock import MockResponse
+
+BECH32_ADDRESS1 = 'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4'
+BECH32_ADDRESS2 = 'bc1qar0srrr7xfkvy5l643lydnw9re59gtzzwf5mdq'
 
 
 def test_is_valid_btc_address():
@@ -342,3 +358,128 @@ def test_scriptpubkey_to_p2sh_address():
 def test_scriptpubkey_to_bech32_address(scriptpubkey, expected_address):
     address = scriptpubkey_to_bech32_address(bytes.fromhex(scriptpubkey))
     assert address == expected_address
+
+
+def test_bitcoin_balances_split_by_address_type():
+    """Test that only the bech32 addresses are queried from blockstream while the rest
+    are queried from blockchain.info in multiaddr batches that fit the URL length limit"""
+    accounts = [UNIT_BTC_ADDRESS1, BECH32_ADDRESS1, UNIT_BTC_ADDRESS2, UNIT_BTC_ADDRESS3, BECH32_ADDRESS2]  # noqa: E501
+    btc_map = {UNIT_BTC_ADDRESS1: '100000000', UNIT_BTC_ADDRESS3: '50000000', BECH32_ADDRESS2: '200000000'}  # noqa: E501
+    # room for two legacy addresses per multiaddr URL
+    max_url_length = len('https://blockchain.info/multiaddr?active=') + 2 * 35
+    with mock_bitcoin_balances_query(btc_map=btc_map, original_requests_get=None) as mock_get:
+        with patch('rotkehlchen.chain.bitcoin.BLOCKCHAININFO_MAX_URL_LENGTH', new=max_url_length):
+            balances = get_bitcoin_addresses_balances(accounts)
+
+    assert balances == {
+        UNIT_BTC_ADDRESS1: FVal(1),
+        UNIT_BTC_ADDRESS2: FVal(0),
+        UNIT_BTC_ADDRESS3: FVal('0.5'),
+        BECH32_ADDRESS1: FVal(0),
+        BECH32_ADDRESS2: FVal(2),
+    }
+    urls = [call[1]['url'] for call in mock_get.call_args_list]
+    assert len(urls) == 4
+    assert set(urls) == {
+        f'https://blockchain.info/multiaddr?active={UNIT_BTC_ADDRESS1}|{UNIT_BTC_ADDRESS2}',
+        f'https://blockchain.info/multiaddr?active={UNIT_BTC_ADDRESS3}',
+        f'https://blockstream.info/api/address/{BECH32_ADDRESS1}',
+        f'https://blockstream.info/api/address/{BECH32_ADDRESS2}',
+    }
+
+
+def test_have_bitcoin_transactions_blockstream_shared_backoff():
+    """Test that the concurrent blockstream queries back off together after a 429"""
+    accounts = [BECH32_ADDRESS1, BECH32_ADDRESS2, UNIT_BTC_ADDRESS1]
+    rate_limited = set()
+
+    def mock_requests_get(url, *args, **kwargs):  # pylint: disable=unused-argument
+        if 'blockchain.info' in url:
+            return MockResponse(200, f'{{"addresses":[{{"address":"{UNIT_BTC_ADDRESS1}","final_balance":0,"n_tx":0}}]}}')  # noqa: E501
+
+        address = url.rsplit('/', 1)[1]
+        gevent.sleep(0.01)  # so that both queries are in flight when the 429s come
+        if address not in rate_limited:
+            rate_limited.add(address)
+            return MockResponse(429, 'rate limited')
+        tx_count = 1 if address == BECH32_ADDRESS1 else 0
+        return MockResponse(200, f'{{"chain_stats":{{"funded_txo_sum":100000000,"spent_txo_sum":0,"tx_count":{tx_count}}}}}')  # noqa: E501
+
+    backoff = 0.2
+    with patch('rotkehlchen.utils.network.requests.get', side_effect=mock_requests_get):
+        with patch('rotkehlchen.chain.bitcoin.BLOCKSTREAM_BACKOFF_SECONDS', new=backoff):
+            start = time.time()
+            result = have_bitcoin_transactions(accounts)
+            elapsed = time.time() - start
+
+    assert result == {
+        BECH32_ADDRESS1: (True, FVal(1)),
+        BECH32_ADDRESS2: (False, FVal(1)),
+        UNIT_BTC_ADDRESS1: (False, FVal(0)),
+    }
+    # both addresses got a 429 but the backoff happened only once for both of them
+    assert rate_limited == {BECH32_ADDRESS1, BECH32_ADDRESS2}
+    assert backoff <= elapsed < 2 * backoff
+
+
+@pytest.mark.parametrize('status_code', [429, 500])
+def test_have_bitcoin_transactions_blockstream_errors(status_code):
+    """Test that blockstream error responses raise and that a query that keeps
+    getting rate limited is tried exactly QUERY_RETRY_TIMES times"""
+    queries = []
+
+    def mock_requests_get(url, *args, **kwargs):  # pylint: disable=unused-argument
+        queries.append(url)
+        return MockResponse(status_code, 'error')
+
+    with patch('rotkehlchen.utils.network.requests.get', side_effect=mock_requests_get):
+        with patch('rotkehlchen.chain.bitcoin.BLOCKSTREAM_BACKOFF_SECONDS', new=0):
+            with pytest.raises(RemoteError):
+                have_bitcoin_transactions([BECH32_ADDRESS1])
+
+    assert len(queries) == (QUERY_RETRY_TIMES if status_code == 429 else 1)
+
+
+def test_derive_addresses_from_xpub_data_incremental():
+    """Test that the addresses without transactions before the last used index are
+    returned even if they are in earlier batches, and that checking again from the
+    last used index does not derive the already derived addresses again"""
+    xpub = 'xpub68V4ZQQ62mea7ZUKn2urQu47Bdn2Wr7SxrBxBDDwE3kjytj361YBGSKDT4WoBrE5htrSB8eAMe59NPnKrcAbiv2veN5GQUmfdjRddD1Hxrk'  # noqa: E501
+    xpub_data = XpubData(xpub=HDKey.from_xpub(xpub=xpub, path='m'))
+    root = xpub_data.xpub.derive_child(0)
+    used_addresses = {root.derive_child(idx).address() for idx in (0, 3, 25)}
+    queried_addresses = []
+
+    def mock_have_bitcoin_transactions(accounts):
+        queried_addresses.append(accounts)
+        return {x: (x in used_addresses, FVal(0)) for x in accounts}
+
+    _derive_address.cache_clear()
+    with patch(
+        'rotkehlchen.chain.bitcoin.xpub.have_bitcoin_transactions',
+        side_effect=mock_have_bitcoin_transactions,
+    ):
+        addresses = _derive_addresses_from_xpub_data(
+            xpub_data=xpub_data,
+            start_receiving_index=0,
+            start_change_index=0,
+            gap_limit=20,
+        )
+        # 3 batches of the receiving addresses and one of the change addresses
+        assert [len(x) for x in queried_addresses] == [20, 20, 20, 20]
+        assert [x.derived_index for x in addresses] == list(range(26))
+        assert all(x.account_index == 0 for x in addresses)
+        assert addresses[2].address == '16zNpyv8KxChtjXnE5nYcPqcXcrSQXX2JW'
+
+        with patch.object(HDKey, 'derive_child', wraps=HDKey.derive_child, autospec=True) as derive_mock:  # noqa: E501
+            addresses = _derive_addresses_from_xpub_data(
+                xpub_data=xpub_data,
+                start_receiving_index=25,
+                start_change_index=0,
+                gap_limit=20,
+            )
+        # only indices 60-64 of the batch after the last used index are new
+        assert derive_mock.call_count == 5
+        assert [len(x) for x in queried_addresses[4:]] == [20, 20, 20]
+
+    assert [x.derived_index for x in addresses] == [25]
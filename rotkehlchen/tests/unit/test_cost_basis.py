@@ -1,6 +1,10 @@
+import random
+
 import pytest
 
-from rotkehlchen.accounting.cost_basis import AssetAcquisitionEvent
+from rotkehlchen.accounting.cost_basis import AssetAcquisitionEvent, CostBasisCalculator
+from rotkehlchen.accounting.fixed_point_cost_basis import FixedPointCostBasisCalculator
+from rotkehlchen.constants.assets import A_BTC, A_ETH
 from rotkehlchen.fval import FVal
 from rotkehlchen.typing import Location
 from rotkehlchen.constants.misc import ZERO
@@ -427,3 +431,92 @@ def test_reduce_asset_amount_more_that_bought(accountant):
     assert not accountant.events.cost_basis.reduce_asset_amount(asset, FVal(3))
     acquisitions_num = len(accountant.events.cost_basis.events[asset].acquisitions)
     assert acquisitions_num == 0, 'all buys should be used'
+
+
+def _random_amount(rng: random.Random) -> FVal:
+    choice = rng.randrange(5)
+    if choice == 0:
+        return FVal(rng.randint(1, 20))
+    if choice == 1:
+        return FVal(f'{rng.randint(1, 2000) / 100:.2f}')
+    if choice == 2:
+        return FVal(f'0.{rng.randint(1, 999999):06d}')
+    if choice == 3:
+        return FVal(f'{rng.randint(1, 9)}E+{rng.randint(0, 2)}')
+    # more decimals than the fixed-point engine can represent
+    return FVal(f'{rng.randint(1, 9)}.{rng.randint(10 ** 19, 10 ** 20)}')
+
+
+def _cost_basis_state(calculator, asset):
+    return (
+        str(calculator.get_calculated_asset_amount(asset)),
+        [(x.timestamp, str(x.remaining_amount)) for x in calculator.events[asset].acquisitions],
+        [x.timestamp for x in calculator.events[asset].used_acquisitions],
+    )
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2, 3])
+@pytest.mark.parametrize('taxfree_after_period', [None, 50])
+def test_fixed_point_cost_basis_matches_cost_basis(accountant, seed, taxfree_after_period):
+    """Test that the fixed-point engine gives byte-identical results to CostBasisCalculator
+
+    Runs the same random sequence of acquisitions, spends and reductions through both
+    """
+    rng = random.Random(seed)
+    calculators = [
+        calculator_class(
+            accountant.csvexporter,
+            accountant.events.cost_basis.profit_currency,
+            accountant.msg_aggregator,
+        ) for calculator_class in (CostBasisCalculator, FixedPointCostBasisCalculator)
+    ]
+    for calculator in calculators:
+        calculator.taxfree_after_period = taxfree_after_period
+    # only the first 2 seeds get amounts the fixed-point engine has to fall back for
+    allow_fallback = seed < 2
+
+    for timestamp in range(1, 500):
+        asset = rng.choice((A_BTC, A_ETH))
+        action = rng.random()
+        amount = _random_amount(rng)
+        while not allow_fallback and len(str(amount)) > 20:
+            amount = _random_amount(rng)
+        rate = FVal(rng.randint(1, 1000)) / FVal(7)
+
+        results = []
+        for calculator in calculators:
+            if action < 0.55:
+                calculator.obtain_asset(
+                    location=Location.EXTERNAL,
+                    timestamp=timestamp,
+                    description='trade',
+                    asset=asset,
+                    amount=amount,
+                    rate=rate,
+                    fee_in_profit_currency=FVal('0.3'),
+                )
+                result = None
+            elif action < 0.85:
+                cinfo = calculator.calculate_spend_cost_basis(
+                    spending_amount=amount,
+                    spending_asset=asset,
+                    timestamp=timestamp,
+                )
+                result = (
+                    str(cinfo.taxable_amount),
+                    str(cinfo.taxable_bought_cost),
+                    str(cinfo.taxfree_bought_cost),
+                    cinfo.is_complete,
+                    [(str(x.amount), x.event.serialize()) for x in cinfo.matched_acquisitions],
+                )
+            else:
+                result = calculator.reduce_asset_amount(asset=asset, amount=amount)
+            results.append((result, _cost_basis_state(calculator, asset)))
+
+        assert results[0] == results[1], f'Mismatch at timestamp {timestamp}'
+
+    details = [
+        {k: (str(x), str(y)) for k, (x, y) in calculator.calculate_asset_details(taxfree_after_period).items()}  # noqa: E501
+        for calculator in calculators
+    ]
+    assert details[0] == details[1]
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from rotkehlchen.crypto import (
+    b64decode_stream,
+    b64encode_stream,
+    decrypt,
+    decrypt_stream,
+    encrypt,
+    encrypt_stream,
+)
+from rotkehlchen.errors import UnableToDecryptRemoteData
+
+
+def _chunks(data: bytes, size: int):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+@pytest.mark.parametrize('data_size', [0, 1, 16, 33, 5000])
+@pytest.mark.parametrize('chunk_size', [1, 7, 16, 4096])
+def test_encrypt_decrypt_streams(data_size, chunk_size):
+    """Test that the streams give the same results as the whole data encryption
+    no matter how the data is split in chunks"""
+    data = os.urandom(data_size)
+    encoded = b''.join(b64encode_stream(encrypt_stream(b'password', _chunks(data, chunk_size))))
+    assert decrypt(b'password', encoded.decode()) == data
+
+    encoded = encrypt(b'password', data).encode()
+    decrypted = decrypt_stream(b'password', b64decode_stream(_chunks(encoded, chunk_size)))
+    assert b''.join(decrypted) == data
+
+
+@pytest.mark.parametrize('encrypted', [b'', b'0' * 15, b'0' * 33])
+def test_decrypt_stream_invalid_data(encrypted):
+    with pytest.raises(UnableToDecryptRemoteData):
+        b''.join(decrypt_stream(b'password', [encrypted]))
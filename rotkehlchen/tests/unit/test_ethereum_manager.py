@@ -1,9 +1,11 @@
 import os
+from unittest.mock import patch
 
 import pytest
 
 from rotkehlchen.chain.ethereum.manager import (
     ETHEREUM_NODES_TO_CONNECT_AT_START,
+    ETHERSCAN_LOGS_LIMIT,
     OPEN_NODES,
     OPEN_NODES_WEIGHT_MAP,
     NodeName,
@@ -15,6 +17,7 @@ from rotkehlchen.constants.ethereum import (
     ZERO_ADDRESS,
 )
 from rotkehlchen.constants.misc import ONE, ZERO
+from rotkehlchen.errors import RemoteError
 from rotkehlchen.fval import FVal
 from rotkehlchen.tests.utils.checks import assert_serialized_dicts_equal
 from rotkehlchen.tests.utils.ethereum import (
@@ -203,6 +206,79 @@ def test_get_log_and_receipt_etherscan_bad_tx_index(
     assert all(x['transactionIndex'] == 0 for x in result['logs'])
 
 
+def test_get_etherscan_logs_splits_capped_windows(ethereum_manager):
+    """Test that etherscan log windows hitting the result cap are split and re-queried
+
+    Every block divisible by 50 has 3 logs, so all initial windows hit the cap of etherscan.
+    A block with more logs than the cap is also included.
+    """
+    def mock_get_logs(contract_address, topics, from_block, to_block):  # pylint: disable=unused-argument  # noqa: E501
+        logs = []
+        for block in range(from_block + (-from_block % 50), to_block + 1, 50):
+            logs_num = ETHERSCAN_LOGS_LIMIT + 5 if block == 555550 else 3
+            for log_index in range(logs_num):
+                logs.append({
+                    'address': ZERO_ADDRESS,
+                    'blockNumber': hex(block),
+                    'timeStamp': hex(1600000000 + block),
+                    'gasPrice': '0x1',
+                    'gasUsed': '0x1',
+                    'logIndex': hex(log_index),
+                    'transactionHash': f'0x{block:064x}',
+                    'transactionIndex': '0x0',
+                })
+            if len(logs) >= ETHERSCAN_LOGS_LIMIT:
+                break
+        return logs[:ETHERSCAN_LOGS_LIMIT]
+
+    get_logs_patch = patch.object(
+        ethereum_manager.etherscan,
+        'get_logs',
+        side_effect=mock_get_logs,
+    )
+    api_key_patch = patch.object(ethereum_manager.etherscan, 'has_api_key', return_value=True)
+    rate_patch = patch('rotkehlchen.chain.ethereum.manager.ETHERSCAN_CALLS_PER_SECOND', new=1000)
+    with get_logs_patch, api_key_patch, rate_patch:
+        events = ethereum_manager._get_etherscan_logs(
+            contract_address=ZERO_ADDRESS,
+            topics=[],
+            from_block=0,
+            to_block=700000,
+        )
+
+    expected = []
+    for block in range(0, 700001, 50):
+        logs_num = ETHERSCAN_LOGS_LIMIT if block == 555550 else 3
+        expected.extend((block, log_index) for log_index in range(logs_num))
+    assert [(x['blockNumber'], x['logIndex']) for x in events] == expected
+
+
+@pytest.mark.parametrize('exception', [RemoteError('etherscan error'), ValueError('bug')])
+def test_get_etherscan_logs_raises_window_errors(ethereum_manager, exception):
+    """Test that an error in any of the etherscan log windows is raised instead of
+    returning the logs of the other windows"""
+    def mock_get_logs(contract_address, topics, from_block, to_block):  # pylint: disable=unused-argument  # noqa: E501
+        if from_block <= 300000 <= to_block:
+            raise exception
+        return []
+
+    get_logs_patch = patch.object(
+        ethereum_manager.etherscan,
+        'get_logs',
+        side_effect=mock_get_logs,
+    )
+    api_key_patch = patch.object(ethereum_manager.etherscan, 'has_api_key', return_value=True)
+    rate_patch = patch('rotkehlchen.chain.ethereum.manager.ETHERSCAN_CALLS_PER_SECOND', new=1000)
+    with get_logs_patch, api_key_patch, rate_patch:
+        with pytest.raises(type(exception)):
+            ethereum_manager._get_etherscan_logs(
+                contract_address=ZERO_ADDRESS,
+                topics=[],
+                from_block=0,
+                to_block=700000,
+            )
+
+
 def test_nodes_weight_map():
     """Test the weight map has no duplicates and adds to 100%"""
     nodes_set = set()
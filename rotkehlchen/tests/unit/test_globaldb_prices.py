@@ -1,5 +1,6 @@
 from rotkehlchen.constants.assets import A_BAL, A_BTC, A_ETH, A_USD
 from rotkehlchen.fval import FVal
+from rotkehlchen.globaldb.price_cache import price_series_key
 from rotkehlchen.history.typing import HistoricalPrice, HistoricalPriceOracle
 from rotkehlchen.tests.utils.constants import A_EUR
 from rotkehlchen.typing import Price, Timestamp
@@ -89,6 +90,15 @@ def test_get_historical_price(globaldb, historical_price_test_data):  # pylint:
     )
     assert price_entry is None
 
+    # an entry exactly at the max distance is still returned
+    price_entry = globaldb.get_historical_price(
+        from_asset=A_ETH,
+        to_asset=A_EUR,
+        timestamp=1511627623,
+        max_seconds_distance=1000,
+    )
+    assert expected_entry == price_entry
+
     # nothing in a small distance
     price_entry = globaldb.get_historical_price(
         from_asset=A_ETH,
@@ -131,3 +141,87 @@ def test_get_historical_price(globaldb, historical_price_test_data):  # pylint:
         max_seconds_distance=3600,
     )
     assert price_entry is None
+
+
+def test_price_series_cache_matches_db(globaldb, historical_price_test_data):  # pylint: disable=unused-argument  # noqa: E501
+    """Test that lookups from the price series cache give the same results as the DB"""
+    queries = []
+    for from_asset, to_asset in ((A_ETH, A_EUR), (A_BTC, A_EUR), (A_ETH, A_USD)):
+        for timestamp in (1428994442, 1511626000, 1511627623, 1539713117, 1618481099, 1618481150):  # noqa: E501
+            for source in (None, HistoricalPriceOracle.COINGECKO, HistoricalPriceOracle.CRYPTOCOMPARE):  # noqa: E501
+                for max_seconds_distance in (10, 1000, 3600):
+                    queries.append((from_asset, to_asset, timestamp, max_seconds_distance, source))
+
+    expected = [globaldb.get_historical_price(*x) for x in queries]
+    globaldb.enable_price_series_cache()
+    try:
+        assert [globaldb.get_historical_price(*x) for x in queries] == expected
+    finally:
+        globaldb.disable_price_series_cache()
+
+
+def test_price_series_cache_invalidation(globaldb, historical_price_test_data):  # pylint: disable=unused-argument  # noqa: E501
+    globaldb.enable_price_series_cache()
+    try:
+        price_entry = globaldb.get_historical_price(
+            from_asset=A_BTC,
+            to_asset=A_EUR,
+            timestamp=1600000000,
+            max_seconds_distance=3600,
+        )
+        assert price_entry is None
+
+        # adding a price for the pair should be seen by the next lookup
+        new_entry = HistoricalPrice(
+            from_asset=A_BTC,
+            to_asset=A_EUR,
+            source=HistoricalPriceOracle.MANUAL,
+            timestamp=Timestamp(1600000100),
+            price=Price(FVal(9000)),
+        )
+        globaldb.add_historical_prices([new_entry])
+        price_entry = globaldb.get_historical_price(
+            from_asset=A_BTC,
+            to_asset=A_EUR,
+            timestamp=1600000000,
+            max_seconds_distance=3600,
+        )
+        assert price_entry == new_entry
+
+        # and so should deleting the prices of the pair
+        globaldb.delete_historical_prices(from_asset=A_BTC, to_asset=A_EUR)
+        price_entry = globaldb.get_historical_price(
+            from_asset=A_BTC,
+            to_asset=A_EUR,
+            timestamp=1600000000,
+            max_seconds_distance=3600,
+        )
+        assert price_entry is None
+    finally:
+        globaldb.disable_price_series_cache()
+
+
+def test_price_series_cache_eviction(globaldb, historical_price_test_data):  # pylint: disable=unused-argument  # noqa: E501
+    eth_key = price_series_key(A_ETH, A_EUR, None)
+    btc_key = price_series_key(A_BTC, A_EUR, None)
+    globaldb.enable_price_series_cache()
+    try:
+        cache = globaldb._price_series_cache
+        globaldb.get_historical_price(A_ETH, A_EUR, Timestamp(1618481099), 3600)
+        globaldb.get_historical_price(A_BTC, A_EUR, Timestamp(1618481099), 3600)
+        assert eth_key in cache and btc_key in cache
+        eth_bytes = cache.get(eth_key).size_bytes
+        btc_bytes = cache.get(btc_key).size_bytes
+
+        # with room for only the bigger of the two series the least recently used is evicted
+        globaldb.disable_price_series_cache()
+        globaldb.enable_price_series_cache(max_bytes=max(eth_bytes, btc_bytes))
+        cache = globaldb._price_series_cache
+        globaldb.get_historical_price(A_ETH, A_EUR, Timestamp(1618481099), 3600)
+        globaldb.get_historical_price(A_BTC, A_EUR, Timestamp(1618481099), 3600)
+        assert eth_key not in cache
+        assert btc_key in cache
+        assert cache.total_bytes == btc_bytes
+    finally:
+        globaldb.disable_price_series_cache()
+    assert globaldb._price_series_cache is None
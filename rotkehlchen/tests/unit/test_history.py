@@ -1,3 +1,7 @@
+import time
+from unittest.mock import patch
+
+import gevent
 import pytest
 
 from rotkehlchen.accounting.ledger_actions import LedgerAction, LedgerActionType
@@ -5,7 +9,7 @@ from rotkehlchen.constants.assets import A_BTC, A_ETH, A_USDC
 from rotkehlchen.db.ledger_actions import DBLedgerActions
 from rotkehlchen.exchanges.data_structures import Trade
 from rotkehlchen.fval import FVal
-from rotkehlchen.history.events import limit_trade_list_to_period
+from rotkehlchen.history.events import HistorySource, limit_trade_list_to_period
 from rotkehlchen.history.typing import HistoricalPriceOracle
 from rotkehlchen.typing import Location, Timestamp, TradeType
 
@@ -130,6 +134,68 @@ def test_query_ledger_actions(events_historian, function_scope_messages_aggregat
     assert length == 2
 
 
+def test_get_history_queries_sources_concurrently(events_historian):
+    """Test that history sources are merged in source order whatever order they finish
+    in and that a source that times out is skipped with an error"""
+    def make_trade(timestamp, link):
+        return Trade(
+            timestamp=timestamp,
+            location=Location.KRAKEN,
+            base_asset=A_ETH,
+            quote_asset=A_BTC,
+            trade_type=TradeType.BUY,
+            amount=FVal(1),
+            rate=FVal(1),
+            fee=FVal('0.1'),
+            fee_currency=A_ETH,
+            link=link,
+        )
+
+    def slow_source(parts):
+        gevent.sleep(0.3)
+        parts.history.append(make_trade(5, 'slow'))
+
+    def fast_source(parts):
+        parts.history.append(make_trade(5, 'fast'))
+        parts.history.append(make_trade(1, 'fast_first'))
+
+    def hanging_source(parts):
+        parts.history.append(make_trade(3, 'hanging'))
+        gevent.sleep(10)
+
+    def failing_source(parts):
+        parts.error += '\nfailed query'
+
+    sources = [
+        HistorySource(name='slow', query=slow_source),
+        HistorySource(name='fast', query=fast_source),
+        HistorySource(name='hanging', query=hanging_source),
+        HistorySource(name='failing', query=failing_source),
+    ]
+    sources_patch = patch.object(events_historian, '_history_sources', return_value=sources)
+    timeout_patch = patch('rotkehlchen.history.events.HISTORY_SOURCE_TIMEOUT', new=1)
+    with sources_patch, timeout_patch:
+        start = time.monotonic()
+        result = events_historian.get_history(start_ts=0, end_ts=10, has_premium=True)
+        elapsed = time.monotonic() - start
+
+    assert elapsed < 1.5, 'sources should be queried concurrently'
+    error, history = result[0], result[1]
+    # equal timestamps keep the order of their sources
+    assert [x.link for x in history] == ['fast_first', 'slow', 'fast']
+    assert 'hanging history timed out' in error
+    assert error.endswith('failed query')
+    assert events_historian.source_states == {
+        'slow': 'done',
+        'fast': 'done',
+        'hanging': 'timed out',
+        'failing': 'failed',
+    }
+    assert events_historian.progress == 100
+    errors = events_historian.msg_aggregator.consume_errors()
+    assert len(errors) == 1 and 'hanging history timed out' in errors[0]
+
+
 @pytest.mark.parametrize('value,result', [
     ('manual', HistoricalPriceOracle.MANUAL),
     ('coingecko', HistoricalPriceOracle.COINGECKO),
@@ -2,27 +2,32 @@ import os
 from datetime import datetime
 from unittest.mock import MagicMock, patch
 
+import gevent
 import pytest
 import requests
 
 from rotkehlchen.assets.asset import Asset, EthereumToken
 from rotkehlchen.constants import ZERO
-from rotkehlchen.constants.assets import A_BTC, A_ETH, A_USD
+from rotkehlchen.constants.assets import A_BTC, A_DAI, A_ETH, A_USD
 from rotkehlchen.errors import RemoteError
 from rotkehlchen.externalapis.coingecko import Coingecko
 from rotkehlchen.externalapis.cryptocompare import Cryptocompare
 from rotkehlchen.fval import FVal
 from rotkehlchen.globaldb.handler import GlobalDBHandler
+from rotkehlchen.greenlets import GreenletManager
 from rotkehlchen.history.typing import HistoricalPrice, HistoricalPriceOracle
 from rotkehlchen.inquirer import (
     CURRENT_PRICE_CACHE_SECS,
+    CURRENT_PRICE_MAX_STALE_SECS,
     DEFAULT_CURRENT_PRICE_ORACLES_ORDER,
+    CurrentPriceCache,
     CurrentPriceOracle,
     _query_currency_converterapi,
 )
 from rotkehlchen.tests.utils.constants import A_CNY, A_EUR, A_JPY
 from rotkehlchen.tests.utils.mock import MockResponse
 from rotkehlchen.typing import Price, Timestamp
+from rotkehlchen.user_messages import MessagesAggregator
 from rotkehlchen.utils.misc import ts_now
 
 
@@ -195,6 +200,68 @@ def test_find_usd_price_cache(inquirer, freezer):  # pylint: disable=unused-argu
         assert price == Price(FVal('2'))
 
 
+@pytest.mark.parametrize('should_mock_current_price_queries', [False])
+def test_find_usd_price_stale_while_revalidate(inquirer, freezer):
+    """Test that with a greenlet manager stale prices are served while they are
+    refreshed in the background"""
+    greenlet_manager = GreenletManager(msg_aggregator=MessagesAggregator())
+    inquirer._greenlet_manager = greenlet_manager
+    inquirer.set_oracles_order(oracles=[CurrentPriceOracle.CRYPTOCOMPARE])
+    cache = inquirer._cached_current_price
+    cc_patch = patch.object(
+        inquirer._cryptocompare,
+        'query_current_price',
+        side_effect=[Price(FVal('1')), Price(FVal('3'))],
+    )
+    cc_multiple_patch = patch.object(
+        inquirer._cryptocompare,
+        'query_multiple_current_prices',
+        return_value={A_ETH: Price(FVal('2'))},
+    )
+
+    with cc_patch as cc, cc_multiple_patch as cc_multiple:
+        assert inquirer.find_usd_price(A_ETH) == Price(FVal('1'))
+        assert cc.call_count == 1
+        assert cache.misses == 1
+
+        # After the price expires it is still served while it is refreshed
+        freezer.move_to(datetime.fromtimestamp(ts_now() + CURRENT_PRICE_CACHE_SECS + 1))
+        assert inquirer.find_usd_price(A_ETH) == Price(FVal('1'))
+        assert inquirer.find_usd_prices([A_ETH]) == {A_ETH: Price(FVal('1'))}
+        assert cache.stale_hits == 2
+        assert cache.pending_refresh == {(A_ETH, A_USD)}
+        assert cc.call_count == 1
+        gevent.joinall(greenlet_manager.greenlets)
+        assert cc_multiple.call_count == 1
+        assert cache.refreshes == 1
+        assert len(cache.pending_refresh) == 0
+
+        assert inquirer.find_usd_price(A_ETH) == Price(FVal('2'))
+        assert cache.hits == 1
+
+        # A price that has been stale for too long is not served
+        freezer.move_to(datetime.fromtimestamp(
+            ts_now() + CURRENT_PRICE_CACHE_SECS + CURRENT_PRICE_MAX_STALE_SECS + 1,
+        ))
+        assert inquirer.find_usd_price(A_ETH) == Price(FVal('3'))
+        assert cc.call_count == 2
+        assert cache.misses == 2
+        assert cc_multiple.call_count == 1
+
+
+def test_current_price_cache_lru():
+    cache = CurrentPriceCache(max_entries=2)
+    cache.add((A_BTC, A_USD), Price(FVal('1')))
+    cache.add((A_ETH, A_USD), Price(FVal('2')))
+    assert cache.get((A_BTC, A_USD)).price == Price(FVal('1'))
+    cache.add((A_DAI, A_USD), Price(FVal('3')))
+    # ETH was the least recently used
+    assert len(cache) == 2
+    assert cache.get((A_ETH, A_USD)) is None
+    assert cache.get((A_BTC, A_USD)).price == Price(FVal('1'))
+    assert cache.get((A_DAI, A_USD)).price == Price(FVal('3'))
+
+
 def test_all_common_methods_implemented():
     """Test all current price oracles implement the expected methods.
     """
@@ -214,6 +281,9 @@ def test_all_common_methods_implemented():
         # Check 'query_historical_price' method exists
         assert hasattr(instance, 'query_current_price')
         assert callable(instance.query_current_price)
+        # Check 'query_multiple_current_prices' method exists
+        assert hasattr(instance, 'query_multiple_current_prices')
+        assert callable(instance.query_multiple_current_prices)
 
 
 def test_set_oracles_order(inquirer):
@@ -277,3 +347,64 @@ def test_find_usd_price_via_second_oracle(inquirer):
     assert price == expected_price
     for oracle_instance in inquirer._oracle_instances[0:2]:
         assert oracle_instance.query_current_price.call_count == 1
+
+
+@pytest.mark.parametrize('use_clean_caching_directory', [True])
+@pytest.mark.parametrize('should_mock_current_price_queries', [False])
+def test_find_usd_prices(inquirer):
+    """Test that the prices of many assets are queried at once from each oracle and
+    that only the assets missing a price are queried from the next oracle
+    """
+    inquirer._oracle_instances = [MagicMock() for _ in inquirer._oracles]
+    inquirer._oracle_instances[0].rate_limited_in_last.return_value = False
+    inquirer._oracle_instances[0].query_multiple_current_prices.return_value = {
+        A_BTC: Price(FVal('30000')),
+        A_ETH: Price(ZERO),
+    }
+    inquirer._oracle_instances[1].rate_limited_in_last.return_value = False
+    inquirer._oracle_instances[1].query_multiple_current_prices.return_value = {
+        A_ETH: Price(FVal('2000')),
+    }
+
+    prices = inquirer.find_usd_prices([A_BTC, A_ETH, A_DAI, A_USD, A_BTC])
+
+    assert prices == {
+        A_BTC: Price(FVal('30000')),
+        A_ETH: Price(FVal('2000')),
+        A_DAI: Price(ZERO),
+        A_USD: Price(FVal('1')),
+    }
+    first_call = inquirer._oracle_instances[0].query_multiple_current_prices.call_args
+    assert first_call[1]['from_assets'] == [A_BTC, A_ETH, A_DAI]
+    second_call = inquirer._oracle_instances[1].query_multiple_current_prices.call_args
+    assert second_call[1]['from_assets'] == [A_ETH, A_DAI]
+    for oracle_instance in inquirer._oracle_instances:
+        assert oracle_instance.query_multiple_current_prices.call_count == 1
+        assert oracle_instance.query_current_price.call_count == 0
+
+    # All prices, including the ones not found, are now cached
+    assert inquirer.find_usd_prices([A_DAI, A_ETH]) == {A_DAI: Price(ZERO), A_ETH: Price(FVal('2000'))}  # noqa: E501
+    assert inquirer.find_usd_price(A_BTC) == Price(FVal('30000'))
+    for oracle_instance in inquirer._oracle_instances:
+        assert oracle_instance.query_multiple_current_prices.call_count == 1
+        assert oracle_instance.query_current_price.call_count == 0
+
+
+@pytest.mark.parametrize('use_clean_caching_directory', [True])
+@pytest.mark.parametrize('should_mock_current_price_queries', [False])
+def test_find_usd_prices_via_second_oracle(inquirer):
+    """Test that all assets are queried from the second oracle when the first fails"""
+    inquirer._oracle_instances = [MagicMock() for _ in inquirer._oracles]
+    inquirer._oracle_instances[0].rate_limited_in_last.return_value = False
+    inquirer._oracle_instances[0].query_multiple_current_prices.side_effect = RemoteError
+    inquirer._oracle_instances[1].rate_limited_in_last.return_value = False
+    inquirer._oracle_instances[1].query_multiple_current_prices.return_value = {
+        A_BTC: Price(FVal('30000')),
+        A_ETH: Price(FVal('2000')),
+    }
+
+    prices = inquirer.find_usd_prices([A_BTC, A_ETH])
+
+    assert prices == {A_BTC: Price(FVal('30000')), A_ETH: Price(FVal('2000'))}
+    second_call = inquirer._oracle_instances[1].query_multiple_current_prices.call_args
+    assert second_call[1]['from_assets'] == [A_BTC, A_ETH]
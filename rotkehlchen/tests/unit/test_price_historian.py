@@ -5,7 +5,11 @@ import pytest
 
 from rotkehlchen.constants.assets import A_BTC, A_USD
 from rotkehlchen.constants.misc import ZERO
-from rotkehlchen.errors import NoPriceForGivenTimestamp, PriceQueryUnsupportedAsset
+from rotkehlchen.errors import (
+    NoPriceForGivenTimestamp,
+    PriceQueryUnsupportedAsset,
+    RemoteError,
+)
 from rotkehlchen.externalapis.coingecko import Coingecko
 from rotkehlchen.externalapis.cryptocompare import Cryptocompare
 from rotkehlchen.fval import FVal
@@ -142,3 +146,101 @@ def test_token_to_fiat_via_second_oracle(fake_price_historian):
     assert price == expected_price
     for oracle_instance in price_historian._oracle_instances[0:2]:
         assert oracle_instance.query_historical_price.call_count == 1
+
+
+def test_query_historical_prices_deduplicates(fake_price_historian, globaldb):  # pylint: disable=unused-argument  # noqa: E501
+    """Test that the bulk query asks the oracles only once per unique query and
+    omits the queries for which no price could be found"""
+    price_historian = fake_price_historian
+    oracle_instance = price_historian._oracle_instances[0]
+
+    def mock_query_historical_price(from_asset, to_asset, timestamp):  # pylint: disable=unused-argument  # noqa: E501
+        if timestamp == 3:
+            raise NoPriceForGivenTimestamp(from_asset, to_asset, 'some date')
+        return Price(FVal(timestamp))
+
+    oracle_instance.query_historical_price.side_effect = mock_query_historical_price
+    for other_instance in price_historian._oracle_instances[1:]:
+        other_instance.can_query_history.return_value = False
+
+    queries = [
+        (A_BTC, A_USD, Timestamp(1)),
+        (A_BTC, A_USD, Timestamp(2)),
+        (A_BTC, A_USD, Timestamp(1)),
+        (A_BTC, A_USD, Timestamp(3)),
+        (A_USD, A_USD, Timestamp(2)),
+    ]
+    prices = price_historian.query_historical_prices(queries)
+    assert prices == {
+        (A_BTC, A_USD, Timestamp(1)): Price(FVal(1)),
+        (A_BTC, A_USD, Timestamp(2)): Price(FVal(2)),
+        (A_USD, A_USD, Timestamp(2)): Price(FVal(1)),
+    }
+    assert oracle_instance.query_historical_price.call_count == 3
+    # the price series cache is only used for the duration of the bulk query
+    assert globaldb.price_series_cache_enabled() is False
+
+
+def test_price_memo_buckets_by_oracle_resolution(fake_price_historian):
+    """Test that with the price memo enabled a price is queried from the oracles only
+    once per pair and price period of the oracle that returned it"""
+    price_historian = fake_price_historian
+    cryptocompare, coingecko = price_historian._oracle_instances[0:2]
+    cryptocompare.query_historical_price.side_effect = lambda from_asset, to_asset, timestamp: Price(FVal(timestamp))  # noqa: E501
+    coingecko.query_historical_price.side_effect = lambda from_asset, to_asset, timestamp: Price(FVal(timestamp))  # noqa: E501
+    hour_ts = Timestamp(1611594000)  # 25/01/2021 17:00:00 UTC
+
+    price_historian.enable_price_memo()
+    try:
+        # all timestamps closest to the same hour get the price of the first query
+        for timestamp in (hour_ts, hour_ts + 1799, hour_ts - 1800):
+            price = price_historian.query_historical_price(A_BTC, A_USD, Timestamp(timestamp))
+            assert price == Price(FVal(hour_ts))
+        assert cryptocompare.query_historical_price.call_count == 1
+        # the next hour is a new price period for cryptocompare
+        price = price_historian.query_historical_price(A_BTC, A_USD, Timestamp(hour_ts + 1800))
+        assert price == Price(FVal(hour_ts + 1800))
+        assert cryptocompare.query_historical_price.call_count == 2
+
+        # coingecko prices are remembered for the whole day
+        cryptocompare.query_historical_price.side_effect = PriceQueryUnsupportedAsset('BTC')
+        price = price_historian.query_historical_price(A_BTC, A_GBP, hour_ts)
+        assert price == Price(FVal(hour_ts))
+        price = price_historian.query_historical_price(A_BTC, A_GBP, Timestamp(hour_ts + 20000))  # noqa: E501
+        assert price == Price(FVal(hour_ts))
+        price = price_historian.query_historical_price(A_BTC, A_GBP, Timestamp(hour_ts + 30000))  # noqa: E501
+        assert price == Price(FVal(hour_ts + 30000))
+        assert coingecko.query_historical_price.call_count == 2
+
+        assert price_historian.get_price_memo().serialize() == {'hits': 3, 'misses': 4}
+    finally:
+        price_historian.disable_price_memo()
+
+    assert price_historian.get_price_memo() is None
+    price = price_historian.query_historical_price(A_BTC, A_GBP, Timestamp(hour_ts + 20000))
+    assert price == Price(FVal(hour_ts + 20000))
+    assert coingecko.query_historical_price.call_count == 3
+
+
+def test_price_memo_skips_fallback_oracle_prices(fake_price_historian):
+    """Test that a price of a fallback oracle, used since the preferred oracle failed
+    for a reason that may not hold next time, is not remembered for its price period"""
+    price_historian = fake_price_historian
+    cryptocompare, coingecko = price_historian._oracle_instances[0:2]
+    cryptocompare.query_historical_price.side_effect = RemoteError('cryptocompare down')
+    coingecko.query_historical_price.return_value = Price(FVal(2))
+    hour_ts = Timestamp(1611594000)
+
+    price_historian.enable_price_memo()
+    try:
+        assert price_historian.query_historical_price(A_BTC, A_USD, hour_ts) == Price(FVal(2))
+        cryptocompare.query_historical_price.side_effect = None
+        cryptocompare.query_historical_price.return_value = Price(FVal(1))
+        # the same day is queried again and now gets the price of cryptocompare
+        price = price_historian.query_historical_price(A_BTC, A_USD, Timestamp(hour_ts + 7200))
+        assert price == Price(FVal(1))
+        assert cryptocompare.query_historical_price.call_count == 2
+        assert coingecko.query_historical_price.call_count == 1
+        assert price_historian.get_price_memo().serialize() == {'hits': 0, 'misses': 2}
+    finally:
+        price_historian.disable_price_memo()
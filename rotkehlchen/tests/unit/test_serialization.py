@@ -1,5 +1,8 @@
+import json
+
 import pytest
 
+from rotkehlchen.api.rest import StreamedEntries, streamed_api_response
 from rotkehlchen.balances.manual import ManuallyTrackedBalance, add_manually_tracked_balances
 from rotkehlchen.constants.assets import A_BTC, A_ETH
 from rotkehlchen.errors import DeserializationError
@@ -38,6 +41,42 @@ def test_pretty_json_dumps():
     assert result
 
 
+def test_streamed_api_response():
+    """Test that streamed responses have the same body json.dumps() gives in one go"""
+    data = {
+        'result': {
+            'entries': [{'a': 1, 'b': [None, True]}, {'c': 1.5}] * 2000,
+            'entries_found': 4000,
+            5: {'nested': {}},
+        },
+        'message': '',
+    }
+    response = streamed_api_response(data)
+    chunks = list(response.response)
+    assert len(chunks) > 1
+    assert b''.join(chunks).decode() == json.dumps(data)
+
+    streamed_data = {
+        'result': {
+            'entries': StreamedEntries(x for x in data['result']['entries']),
+            'entries_found': 4000,
+            5: {'nested': {}},
+        },
+        'message': '',
+    }
+    assert streamed_api_response(streamed_data).get_data().decode() == json.dumps(data)
+
+    mapping = {'ETH': {'name': 'Ethereum'}, 'BTC': {'name': 'Bitcoin'}}
+    streamed_data = {
+        'result': StreamedEntries(((k, v) for k, v in mapping.items()), is_mapping=True),
+        'message': '',
+    }
+    expected = json.dumps({'result': mapping, 'message': ''})
+    assert streamed_api_response(streamed_data).get_data().decode() == expected
+    empty_data = {'result': StreamedEntries(iter([])), 'message': ''}
+    assert streamed_api_response(empty_data).get_data() == b'{"result": [], "message": ""}'
+
+
 def test_deserialize_trade_type():
     assert deserialize_trade_type('buy') == TradeType.BUY
     assert deserialize_trade_type('sell') == TradeType.SELL
@@ -6,8 +6,10 @@ import pytest
 
 from rotkehlchen.chain.bitcoin.hdkey import HDKey
 from rotkehlchen.chain.bitcoin.xpub import XpubData
+from rotkehlchen.constants.assets import A_BTC, A_DAI, A_ETH, A_USD
 from rotkehlchen.exchanges.manager import ExchangeManager
-from rotkehlchen.tasks.manager import TaskManager
+from rotkehlchen.tasks.manager import CCHistoQuery, TaskManager
+from rotkehlchen.tests.utils.constants import A_EUR, A_XMR
 from rotkehlchen.utils.misc import ts_now
 
 
@@ -151,3 +153,92 @@ def test_maybe_schedule_exchange_query(task_manager, exchange_manager, poloniex)
 
     except gevent.Timeout as e:
         raise AssertionError(f'exchange query was not scheduled within {timeout} seconds') from e  # noqa: E501
+
+
+def _make_tracking_histodata_mock(task_manager, calls, rate_limit_on_call=None):
+    """Mock histohour query that keeps track of how many queries run at the same time"""
+    running = {'now': 0, 'max': 0}
+    prefetcher = task_manager.cryptocompare_prefetcher
+
+    def mock_query_and_store_historical_data(from_asset, to_asset, timestamp):  # pylint: disable=unused-argument  # noqa: E501
+        calls.append((from_asset, to_asset, prefetcher.allowed_concurrency))
+        call_number = len(calls)
+        running['now'] += 1
+        running['max'] = max(running['max'], running['now'])
+        gevent.sleep(.2)
+        if call_number == rate_limit_on_call:
+            task_manager.cryptocompare.last_rate_limit = ts_now()
+        running['now'] -= 1
+
+    return mock_query_and_store_historical_data, running
+
+
+def test_maybe_schedule_cryptocompare_prefetch(task_manager):
+    """Test that all prepared cryptocompare queries are prefetched concurrently in one task"""
+    task_manager.potential_tasks = [task_manager._maybe_schedule_cryptocompare_query]
+    queries = {CCHistoQuery(from_asset=x, to_asset=A_USD) for x in (A_BTC, A_ETH, A_DAI, A_EUR, A_XMR)}  # noqa: E501
+    task_manager.cryptocompare_queries = set(queries)
+    task_manager.prepared_cryptocompare_query = True
+    task_manager.cryptocompare.last_histohour_query_ts = 0
+    task_manager.cryptocompare_prefetcher.set_concurrency(2)
+    calls = []
+    mock_fn, running = _make_tracking_histodata_mock(task_manager, calls)
+    cc_patch = patch.object(
+        task_manager.cryptocompare,
+        'query_and_store_historical_data',
+        wraps=mock_fn,
+    )
+
+    prefetcher = task_manager.cryptocompare_prefetcher
+    timeout = 8
+    try:
+        with gevent.Timeout(timeout):
+            with cc_patch:
+                task_manager.schedule()
+                while prefetcher.completed_pairs != len(queries) or prefetcher.running:
+                    gevent.sleep(.2)
+    except gevent.Timeout as e:
+        raise AssertionError(f'cryptocompare prefetch did not finish within {timeout} seconds') from e  # noqa: E501
+
+    assert {CCHistoQuery(from_asset=x[0], to_asset=x[1]) for x in calls} == queries
+    assert running['max'] == 2
+    assert len(task_manager.cryptocompare_queries) == 0
+    assert prefetcher.get_progress() == {
+        'running': False,
+        'total_pairs': 5,
+        'completed_pairs': 5,
+        'failed_pairs': 0,
+        'pairs_in_progress': [],
+        'concurrency': 2,
+        'backoff_seconds': 0,
+    }
+
+
+def test_cryptocompare_prefetch_backs_off_when_rate_limited(task_manager):
+    prefetcher = task_manager.cryptocompare_prefetcher
+    prefetcher.set_concurrency(4)
+    calls = []
+    mock_fn, running = _make_tracking_histodata_mock(
+        task_manager=task_manager,
+        calls=calls,
+        rate_limit_on_call=1,
+    )
+    cc_patch = patch.object(
+        task_manager.cryptocompare,
+        'query_and_store_historical_data',
+        wraps=mock_fn,
+    )
+    backoff_patch = patch('rotkehlchen.tasks.price_prefetch.PREFETCH_MIN_BACKOFF_SECS', 1)
+    queries = [CCHistoQuery(from_asset=x, to_asset=A_USD) for x in (A_BTC, A_ETH, A_DAI, A_EUR, A_XMR)]  # noqa: E501
+    with gevent.Timeout(10), cc_patch, backoff_patch:
+        prefetcher.prefetch(queries)
+
+    assert len(calls) == 5
+    # the first 4 queries all started before the rate limit happened
+    assert running['max'] == 4
+    assert [x[2] for x in calls[:4]] == [4, 4, 4, 4]
+    # the last query only started after the backoff, with halved concurrency
+    assert calls[4][2] == 2
+    # and since it was not rate limited the concurrency increases again
+    assert prefetcher.allowed_concurrency == 3
+    assert prefetcher.backoff_seconds == 0
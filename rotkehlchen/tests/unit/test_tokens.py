@@ -3,7 +3,11 @@ from unittest.mock import patch
 import pytest
 import requests
 
-from rotkehlchen.chain.ethereum.tokens import EthTokens
+from rotkehlchen.chain.ethereum.tokens import (
+    MAX_TOKEN_BALANCE_CHECKS,
+    EthTokens,
+    get_token_chunk_sizes,
+)
 from rotkehlchen.chain.ethereum.utils import token_normalized_value
 from rotkehlchen.constants.assets import A_BAT, A_MKR
 from rotkehlchen.fval import FVal
@@ -68,15 +72,16 @@ def test_detected_tokens_cache(ethtokens, inquirer):  # pylint: disable=unused-a
         result1, _ = ethtokens.query_tokens_for_addresses([addr1, addr2], False)
         initial_call_count = etherscan_mock.call_count
 
-        # Then in second call autodetect queries should not have been made, and DB cache used
+        # Then in second call autodetect queries should not have been made, and DB cache used.
+        # The saved tokens of both addresses are queried in a single call
         result2, _ = ethtokens.query_tokens_for_addresses([addr1, addr2], False)
         call_count = etherscan_mock.call_count
-        assert call_count == initial_call_count + 2
+        assert call_count == initial_call_count + 1
 
         # In the third call force re-detection
         result3, _ = ethtokens.query_tokens_for_addresses([addr1, addr2], True)
         call_count = etherscan_mock.call_count
-        assert call_count == initial_call_count + 2 + initial_call_count
+        assert call_count == initial_call_count + 1 + initial_call_count
 
         assert result1 == result2 == result3
         assert len(result1) == len(eth_map)
@@ -85,3 +90,25 @@ def test_detected_tokens_cache(ethtokens, inquirer):  # pylint: disable=unused-a
             assert len(entry) == len(eth_map_entry)
             for token, val in entry.items():
                 assert token_normalized_value(eth_map_entry[token], token) == val
+
+
+@pytest.mark.parametrize('accounts_num, tokens_num, max_tokens, max_addresses, expected', [
+    (1, 1100, 590, None, (1, 590)),
+    (1, 1100, 120, 121, (1, 120)),
+    (200, 30, 590, None, (67, 30)),
+    (200, 1100, 590, None, (25, 100)),
+    (200, 30, 120, 121, (67, 30)),
+    (200, 1100, 120, 121, (50, 50)),
+])
+def test_get_token_chunk_sizes(accounts_num, tokens_num, max_tokens, max_addresses, expected):
+    accounts_chunk, tokens_chunk = get_token_chunk_sizes(
+        accounts_num=accounts_num,
+        tokens_num=tokens_num,
+        max_tokens=max_tokens,
+        max_addresses=max_addresses,
+    )
+    assert tokens_chunk <= max_tokens
+    assert accounts_chunk * tokens_chunk <= MAX_TOKEN_BALANCE_CHECKS
+    if max_addresses is not None:
+        assert accounts_chunk + tokens_chunk <= max_addresses
+    assert (accounts_chunk, tokens_chunk) == expected
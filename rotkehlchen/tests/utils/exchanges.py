@@ -309,6 +309,20 @@ def mock_binance_balance_response(url):
     return MockResponse(200, BINANCE_BALANCES_RESPONSE)
 
 
+def mock_binance_trade_candidates_response(url: str) -> Optional[MockResponse]:
+    """Mocks the binance queries that find the markets to query the trades of
+
+    Returns None for any other query"""
+    if '/account?' in url:
+        return MockResponse(200, BINANCE_BALANCES_RESPONSE)
+    if 'depositHistory.html' in url:
+        return MockResponse(200, '{"success": true, "depositList": []}')
+    if 'withdrawHistory.html' in url:
+        return MockResponse(200, '{"success": true, "withdrawList": []}')
+
+    return None
+
+
 def patch_binance_balances_query(binance: 'Binance'):
     def mock_binance_asset_return(url, *args):  # pylint: disable=unused-argument
         if 'futures' in url:
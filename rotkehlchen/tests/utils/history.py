@@ -28,7 +28,10 @@ from rotkehlchen.tests.utils.constants import (
     TX_HASH_STR2,
     TX_HASH_STR3,
 )
-from rotkehlchen.tests.utils.exchanges import POLONIEX_MOCK_DEPOSIT_WITHDRAWALS_RESPONSE
+from rotkehlchen.tests.utils.exchanges import (
+    BINANCE_BALANCES_RESPONSE,
+    POLONIEX_MOCK_DEPOSIT_WITHDRAWALS_RESPONSE,
+)
 from rotkehlchen.tests.utils.kraken import MockKraken
 from rotkehlchen.tests.utils.mock import MockResponse
 from rotkehlchen.typing import (
@@ -212,6 +215,8 @@ def mock_exchange_responses(rotki: Rotkehlchen, remote_errors: bool):
             payload = '{"success": true, "depositList": []}'
         elif 'withdrawHistory.html' in url:
             payload = '{"success": true, "withdrawList": []}'
+        elif '/account?' in url:
+            payload = BINANCE_BALANCES_RESPONSE
         else:
             raise RuntimeError(f'Binance test mock got unexpected/unmocked url {url}')
 
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""Benchmark querying the balances of many BTC addresses against a local mock server
+
+The mock server stands in for blockchain.info and blockstream and answers every
+request after a fixed latency. Measures the previous way of querying balances, where
+a single bech32 address made all addresses be queried from blockstream one by one,
+and get_bitcoin_addresses_balances which queries only the bech32 addresses from
+blockstream, a few at a time, and the rest in multiaddr batches from blockchain.info.
+"""
+from gevent import monkey  # isort:skip # noqa
+monkey.patch_all()  # isort:skip # noqa
+import argparse
+import json
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from threading import Thread
+from typing import Dict, List
+from unittest.mock import patch
+from urllib.parse import unquote
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from rotkehlchen.chain.bitcoin import get_bitcoin_addresses_balances  # noqa: E402
+from rotkehlchen.fval import FVal  # noqa: E402
+from rotkehlchen.typing import BTCAddress  # noqa: E402
+from rotkehlchen.utils.misc import satoshis_to_btc  # noqa: E402
+from rotkehlchen.utils.network import request_get_dict  # noqa: E402
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(latency: float) -> type:
+
+    class MockHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self) -> None:  # noqa: N802
+            time.sleep(latency)
+            path = unquote(self.path)
+            if path.startswith('/multiaddr?active='):
+                addresses = path.split('multiaddr?active=')[1].split('|')
+                data = {'addresses': [
+                    {'address': x, 'final_balance': 100000, 'n_tx': 1} for x in addresses
+                ]}
+            else:
+                data = {'chain_stats': {'funded_txo_sum': 100000, 'spent_txo_sum': 0, 'tx_count': 1}}  # noqa: E501
+            body = json.dumps(data).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: object) -> None:
+            pass
+
+    return MockHandler
+
+
+def make_accounts(legacy: int, bech32: int) -> List[BTCAddress]:
+    accounts = [BTCAddress(f'1{idx:033d}') for idx in range(legacy)]
+    accounts.extend(BTCAddress(f'bc1q{idx:038d}') for idx in range(bech32))
+    return accounts
+
+
+def query_previous(accounts: List[BTCAddress], base_url: str) -> Dict[BTCAddress, FVal]:
+    """How get_bitcoin_addresses_balances queried if any of the accounts was bech32"""
+    balances = {}
+    for account in accounts:
+        response_data = request_get_dict(
+            url=f'{base_url}/api/address/{account}',
+            handle_429=True,
+            backoff_in_seconds=4,
+        )
+        stats = response_data['chain_stats']
+        balance = int(stats['funded_txo_sum']) - int(stats['spent_txo_sum'])
+        balances[account] = satoshis_to_btc(balance)
+
+    return balances
+
+
+def query_current(accounts: List[BTCAddress], base_url: str) -> Dict[BTCAddress, FVal]:
+    with patch('rotkehlchen.chain.bitcoin.BLOCKCHAININFO_BASE_URL', new=base_url):
+        with patch('rotkehlchen.chain.bitcoin.BLOCKSTREAM_BASE_URL', new=f'{base_url}/api'):
+            return get_bitcoin_addresses_balances(accounts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark BTC balance queries')
+    parser.add_argument(
+        '--legacy',
+        type=int,
+        default=400,
+        help='Number of legacy addresses',
+    )
+    parser.add_argument(
+        '--bech32',
+        type=int,
+        default=100,
+        help='Number of bech32 addresses',
+    )
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0.05,
+        help='Seconds the mock server takes to answer each request',
+    )
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(args.latency))
+    Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    accounts = make_accounts(legacy=args.legacy, bech32=args.bech32)
+
+    print(
+        f'Querying {args.legacy} legacy and {args.bech32} bech32 addresses '
+        f'with {args.latency}s of latency per request',
+    )
+    print(f'{"method":>10} {"seconds":>8}')
+    for name, query in (('previous', query_previous), ('current', query_current)):
+        start = time.perf_counter()
+        balances = query(accounts, base_url)
+        elapsed = time.perf_counter() - start
+        assert len(balances) == len(accounts)
+        print(f'{name:>10} {elapsed:>8.2f}')
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""Benchmark the peak memory of exporting and importing the user DB for the premium sync
+
+Creates user DBs of the given sizes with synthetic trades and measures with tracemalloc
+the peak memory of compressing, encrypting and b64 encoding each one as the whole DB
+was processed in memory before and as DataHandler.export_encrypted_db streams it now.
+The same is done for decoding, decrypting and decompressing the blob back. The streamed
+peaks are checked to stay within a bound that does not depend on the DB size.
+"""
+import argparse
+import base64
+import hashlib
+import random
+import sys
+import tracemalloc
+import zlib
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from rotkehlchen.crypto import decrypt, encrypt  # noqa: E402
+from rotkehlchen.data_handler import STREAM_CHUNK_SIZE, DataHandler  # noqa: E402
+from rotkehlchen.globaldb import GlobalDBHandler  # noqa: E402
+from rotkehlchen.typing import B64EncodedString  # noqa: E402
+from rotkehlchen.user_messages import MessagesAggregator  # noqa: E402
+
+PASSWORD = '123'
+# Generous allowance for the chunks alive at once in the stream stages and the
+# memory of everything else going on
+STREAMED_PEAK_BOUND = 16 * STREAM_CHUNK_SIZE
+
+
+def populate_trades(data: DataHandler, size_mb: int) -> None:
+    """Add trades with random notes until the DB file has about the given size"""
+    rng = random.Random(42)
+    cursor = data.db.conn.cursor()
+    db_path = data.db.user_data_dir / 'rotkehlchen.db'
+    idx = 0
+    while db_path.stat().st_size < size_mb * 1024 * 1024:
+        batch = []
+        for _ in range(10000):
+            batch.append((
+                f'{idx:064x}',
+                1483228800 + idx,
+                'B',
+                'ETH',
+                'BTC',
+                'A',
+                str(rng.randint(1, 1000)),
+                '0.03',
+                '0.001',
+                'BTC',
+                f'link{idx}',
+                rng.getrandbits(1600).to_bytes(200, 'big').hex(),
+            ))
+            idx += 1
+        cursor.executemany('INSERT INTO trades VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);', batch)  # noqa: E501
+        data.db.conn.commit()
+
+
+def export_in_memory(data: DataHandler) -> Tuple[bytes, str]:
+    """The export as it was done before streaming, with all copies of the DB in memory"""
+    with TemporaryDirectory() as tmpdirname:
+        tempdb = Path(tmpdirname) / 'temp.db'
+        data.db.export_unencrypted(tempdb)
+        with open(tempdb, 'rb') as f:
+            data_blob = f.read()
+
+    original_data_hash = base64.b64encode(hashlib.sha256(data_blob).digest()).decode()
+    compressed_data = zlib.compress(data_blob, level=9)
+    encrypted_data = encrypt(PASSWORD.encode(), compressed_data)
+    return encrypted_data.encode(), original_data_hash
+
+
+def decrypt_in_memory(encrypted_data: str) -> int:
+    """The decryption as it was done before streaming, returns the plaintext DB size"""
+    decrypted_data = decrypt(PASSWORD.encode(), encrypted_data)
+    return len(zlib.decompress(decrypted_data))
+
+
+def measure_peak(function: Callable[[], object]) -> float:
+    """Returns the peak memory allocated while running the function in MB"""
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark premium sync DB export memory')
+    parser.add_argument(
+        '--sizes-mb',
+        type=int,
+        nargs='+',
+        default=[10, 50, 200],
+        help='Sizes of the user DBs to export and import in MB',
+    )
+    args = parser.parse_args()
+
+    print(f'{"DB MB":>6} {"export MB":>10} {"streamed MB":>12} {"import MB":>10} {"streamed MB":>12}')  # noqa: E501
+    for size_mb in args.sizes_mb:
+        with TemporaryDirectory() as tmpdir:
+            GlobalDBHandler(data_dir=Path(tmpdir))
+            data = DataHandler(Path(tmpdir), MessagesAggregator())
+            data.unlock('bench', PASSWORD, create_new=True)
+            populate_trades(data, size_mb)
+
+            blob_path = Path(tmpdir) / 'blob'
+            export_peak = measure_peak(lambda: export_in_memory(data))
+            streamed_export_peak = measure_peak(
+                lambda: data.export_encrypted_db(PASSWORD, blob_path),
+            )
+            encrypted_data = B64EncodedString(blob_path.read_text())
+            # The blob received from the server is in memory in both cases
+            import_peak = measure_peak(lambda: decrypt_in_memory(encrypted_data))
+            streamed_import_peak = measure_peak(
+                lambda: data.decompress_and_decrypt_db(PASSWORD, encrypted_data),
+            )
+            print(f'{size_mb:>6} {export_peak:>10.1f} {streamed_export_peak:>12.1f} {import_peak:>10.1f} {streamed_import_peak:>12.1f}')  # noqa: E501
+            bound_mb = STREAMED_PEAK_BOUND / (1024 * 1024)
+            assert streamed_export_peak < bound_mb, 'Streamed export memory is not bounded'
+            assert streamed_import_peak < bound_mb, 'Streamed import memory is not bounded'
+            data.logout()
+
+    print(f'Streamed peaks stayed below {STREAMED_PEAK_BOUND / (1024 * 1024):.0f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""Benchmark the token balance queries of EthTokens against a local mock ethereum node
+
+The mock node answers the eth_call requests to the ETH_SCAN contract after a configurable
+delay that simulates the network roundtrip to a real node. For each given number of
+addresses the balances of all known tokens are queried with one tokensBalance call per
+address and token chunk and with the batched tokensBalances calls and both are timed.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from web3 import Web3  # noqa: E402
+
+from rotkehlchen.chain.ethereum.manager import EthereumManager, NodeName  # noqa: E402
+from rotkehlchen.chain.ethereum.tokens import (  # noqa: E402
+    MAX_TOKEN_BALANCE_CHECKS,
+    OTHER_MAX_TOKEN_CHUNK_LENGTH,
+    EthTokens,
+)
+from rotkehlchen.chain.ethereum.utils import token_normalized_value  # noqa: E402
+from rotkehlchen.constants.ethereum import ETH_SCAN  # noqa: E402
+from rotkehlchen.globaldb import GlobalDBHandler  # noqa: E402
+from rotkehlchen.tests.utils.factories import make_ethereum_address  # noqa: E402
+from rotkehlchen.user_messages import MessagesAggregator  # noqa: E402
+from rotkehlchen.utils.misc import get_chunks  # noqa: E402
+
+TOKENS_BALANCE_SELECTOR = '0xe5da1b68'
+TOKENS_BALANCES_SELECTOR = '0x06187b4f'
+
+
+def mock_balance(account: str, token: str) -> int:
+    """Give about one in 40 account/token pairs a balance"""
+    if (int(account[-4:], 16) + int(token[-4:], 16)) % 40 != 0:
+        return 0
+    return int(account[-6:], 16) * 10**12
+
+
+class MockNode():
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls = 0
+        self.codec = Web3().codec
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:  # noqa: N802
+                length = int(self.headers['Content-Length'])
+                request = json.loads(self.rfile.read(length))
+                response = json.dumps(node.respond(request)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def respond(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        method = request['method']
+        if method == 'web3_clientVersion':
+            result: Any = 'MockNode/v1.0'
+        elif method == 'eth_chainId':
+            result = '0x1'
+        elif method == 'eth_call':
+            self.calls += 1
+            time.sleep(self.latency)
+            result = self.eth_call(request['params'][0])
+        else:
+            raise AssertionError(f'Unexpected mock node request {method}')
+
+        return {'jsonrpc': '2.0', 'id': request['id'], 'result': result}
+
+    def eth_call(self, transaction: Dict[str, str]) -> str:
+        assert transaction['to'] == ETH_SCAN.address
+        data = transaction['data']
+        selector, arguments = data[:10], bytes.fromhex(data[10:])
+        if selector == TOKENS_BALANCE_SELECTOR:
+            account, tokens = self.codec.decode_abi(['address', 'address[]'], arguments)
+            output = [mock_balance(account, x) for x in tokens]
+            return '0x' + self.codec.encode_abi(['uint256[]'], [output]).hex()
+
+        assert selector == TOKENS_BALANCES_SELECTOR
+        accounts, tokens = self.codec.decode_abi(['address[]', 'address[]'], arguments)
+        assert len(accounts) * len(tokens) <= MAX_TOKEN_BALANCE_CHECKS, 'Out of gas'
+        outputs = [[mock_balance(account, x) for x in tokens] for account in accounts]
+        return '0x' + self.codec.encode_abi(['uint256[][]'], [outputs]).hex()
+
+
+def query_per_address(ethtokens: EthTokens, addresses: List, tokens: List) -> Dict:
+    """The token balance query as it was done before batching accounts
+
+    One tokensBalance call per address and token chunk, as in the revision before
+    the batched tokensBalances calls were introduced.
+    """
+    result = {}
+    for address in addresses:
+        balances = {}
+        for chunk in get_chunks(tokens, n=OTHER_MAX_TOKEN_CHUNK_LENGTH):
+            amounts = ETH_SCAN.call(
+                ethereum=ethtokens.ethereum,
+                method_name='tokensBalance',
+                arguments=[address, [x.address for x in chunk]],
+                call_order=[NodeName.OWN],
+            )
+            for token, amount in zip(chunk, amounts):
+                if amount != 0:
+                    balances[token.identifier] = token_normalized_value(amount, token)
+        result[address] = balances
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark ethereum token balance queries')
+    parser.add_argument(
+        '--addresses',
+        type=int,
+        nargs='+',
+        default=[1, 10, 50, 200],
+        help='Number of ethereum addresses to query the token balances of',
+    )
+    parser.add_argument(
+        '--latency-ms',
+        type=float,
+        default=50,
+        help='Simulated roundtrip time of each call to the mock node in milliseconds',
+    )
+    args = parser.parse_args()
+
+    node = MockNode(latency=args.latency_ms / 1000)
+    with TemporaryDirectory() as tmpdir:
+        GlobalDBHandler(data_dir=Path(tmpdir))
+        tokens = GlobalDBHandler().get_ethereum_tokens()
+        ethereum = EthereumManager(
+            ethrpc_endpoint=node.url,
+            etherscan=None,  # type: ignore
+            database=None,  # type: ignore
+            msg_aggregator=MessagesAggregator(),
+            greenlet_manager=None,  # type: ignore
+            connect_at_start=[],
+        )
+        connected, message = ethereum.attempt_connect(
+            name=NodeName.OWN,
+            ethrpc_endpoint=node.url,
+            mainnet_check=False,
+        )
+        assert connected, message
+        ethtokens = EthTokens(database=None, ethereum=ethereum)  # type: ignore
+
+        print(f'Querying {len(tokens)} tokens with {args.latency_ms}ms latency per call')
+        print(f'{"addresses":>10} {"calls":>7} {"secs":>8} {"batched calls":>14} {"batched secs":>13}')  # noqa: E501
+        for addresses_num in args.addresses:
+            addresses = [make_ethereum_address() for _ in range(addresses_num)]
+            node.calls = 0
+            start = time.perf_counter()
+            old_result = query_per_address(ethtokens, addresses, tokens)
+            old_secs = time.perf_counter() - start
+            old_calls = node.calls
+
+            node.calls = 0
+            start = time.perf_counter()
+            new_result = ethtokens._get_tokens_balances(addresses=addresses, tokens=tokens)
+            new_secs = time.perf_counter() - start
+            for address in addresses:
+                assert {x.identifier: y for x, y in new_result[address].items()} == old_result[address]  # noqa: E501
+            print(f'{addresses_num:>10} {old_calls:>7} {old_secs:>8.2f} {node.calls:>14} {new_secs:>13.2f}')  # noqa: E501
+
+    node.server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
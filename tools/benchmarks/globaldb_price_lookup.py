@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""Benchmark the nearest timestamp lookup of GlobalDBHandler.get_historical_price
+
+For each given size the price_history table is filled with that many hourly
+entries of a single pair and the average latency of random lookups is measured.
+The old ABS(timestamp - ?) scan is also timed with raw SQL for comparison.
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from rotkehlchen.constants.assets import A_BTC, A_USD  # noqa: E402
+from rotkehlchen.globaldb import GlobalDBHandler  # noqa: E402
+from rotkehlchen.history.typing import HistoricalPriceOracle  # noqa: E402
+
+START_TS = 1279936800  # 2010-07-24
+HOUR = 3600
+OLD_QUERY = (
+    'SELECT from_asset, to_asset, source_type, timestamp, price FROM price_history '
+    'WHERE from_asset=? AND to_asset=? AND ABS(timestamp - ?) <= ? '
+    'ORDER BY ABS(timestamp - ?) ASC LIMIT 1'
+)
+
+
+def fill_price_history(globaldb: GlobalDBHandler, size: int) -> None:
+    connection = globaldb._conn
+    cursor = connection.cursor()
+    cursor.execute('DELETE FROM price_history')
+    source = HistoricalPriceOracle.CRYPTOCOMPARE.serialize_for_db()
+    cursor.executemany(
+        'INSERT INTO price_history(from_asset, to_asset, source_type, timestamp, price) '
+        'VALUES (?, ?, ?, ?, ?)',
+        (
+            (A_BTC.identifier, A_USD.identifier, source, START_TS + i * HOUR, str(i))
+            for i in range(size)
+        ),
+    )
+    connection.commit()
+
+
+def time_lookups(globaldb: GlobalDBHandler, size: int, lookups: int) -> float:
+    timestamps = [START_TS + random.randint(0, size * HOUR) for _ in range(lookups)]
+    start = time.perf_counter()
+    for timestamp in timestamps:
+        globaldb.get_historical_price(
+            from_asset=A_BTC,
+            to_asset=A_USD,
+            timestamp=timestamp,  # type: ignore
+            max_seconds_distance=HOUR,
+        )
+    return (time.perf_counter() - start) / lookups
+
+
+def time_old_lookups(globaldb: GlobalDBHandler, size: int, lookups: int) -> float:
+    cursor = globaldb._conn.cursor()
+    timestamps = [START_TS + random.randint(0, size * HOUR) for _ in range(lookups)]
+    start = time.perf_counter()
+    for timestamp in timestamps:
+        cursor.execute(
+            OLD_QUERY,
+            (A_BTC.identifier, A_USD.identifier, timestamp, HOUR, timestamp),
+        ).fetchone()
+    return (time.perf_counter() - start) / lookups
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark historical price lookups')
+    parser.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=[1000, 10000, 100000, 500000],
+        help='Number of price_history rows to benchmark against',
+    )
+    parser.add_argument(
+        '--lookups',
+        type=int,
+        default=1000,
+        help='Number of random lookups to time per size',
+    )
+    parser.add_argument(
+        '--skip-old',
+        action='store_true',
+        help='Do not time the old ABS() based full scan query',
+    )
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmpdir:
+        globaldb = GlobalDBHandler(data_dir=Path(tmpdir))
+        print(f'{"rows":>10} {"lookup (us)":>14} {"old lookup (us)":>17}')
+        for size in args.sizes:
+            fill_price_history(globaldb, size)
+            new_latency = time_lookups(globaldb, size, args.lookups) * 1e6
+            old_latency = '-'
+            if not args.skip_old:
+                old_latency = f'{time_old_lookups(globaldb, size, args.lookups) * 1e6:.1f}'
+            print(f'{size:>10} {new_latency:>14.1f} {old_latency:>17}')
+        globaldb._conn.close()
+
+
+if __name__ == '__main__':
+    main()
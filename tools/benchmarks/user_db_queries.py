@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""Benchmark the time range queries of the user DB history tables with and without indexes
+
+Creates a user DB with the given number of synthetic trades spread over several
+locations and years and times DBHandler.get_trades for some typical filters first
+without the secondary indexes of the trades table and then with them. The SQL query
+alone is timed separately since get_trades also deserializes every returned trade.
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from rotkehlchen.db.dbhandler import DBHandler  # noqa: E402
+from rotkehlchen.db.filtering import TRADES_FILTER_TABLE, HistoryFilterQuery  # noqa: E402
+from rotkehlchen.globaldb import GlobalDBHandler  # noqa: E402
+from rotkehlchen.typing import Location, Timestamp  # noqa: E402
+from rotkehlchen.user_messages import MessagesAggregator  # noqa: E402
+
+START_TS = 1483228800  # 01/01/2017
+END_TS = 1609459200  # 01/01/2021
+LOCATIONS = (
+    Location.KRAKEN,
+    Location.BINANCE,
+    Location.POLONIEX,
+    Location.BITTREX,
+    Location.COINBASE,
+    Location.EXTERNAL,
+)
+TRADES_INDEXES = ('trades_time', 'trades_location_time')
+
+
+def populate_trades(db: DBHandler, trades_num: int) -> None:
+    rng = random.Random(42)
+    cursor = db.conn.cursor()
+    batch = []
+    for idx in range(trades_num):
+        location = LOCATIONS[idx % len(LOCATIONS)] if idx % 10 != 0 else Location.KRAKEN
+        batch.append((
+            f'{idx:064x}',
+            rng.randint(START_TS, END_TS),
+            location.serialize_for_db(),
+            'ETH',
+            'BTC',
+            'A' if idx % 2 == 0 else 'B',
+            str(rng.randint(1, 1000)),
+            '0.03',
+            '0.001',
+            'BTC',
+            f'link{idx}',
+            None,
+        ))
+        if len(batch) == 50000:
+            cursor.executemany('INSERT INTO trades VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);', batch)  # noqa: E501
+            batch = []
+    cursor.executemany('INSERT INTO trades VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);', batch)
+    db.conn.commit()
+
+
+def time_query(
+        db: DBHandler,
+        filters: Dict[str, Any],
+        repeats: int,
+) -> Tuple[float, float, int]:
+    """Time DBHandler.get_trades and only the SQL query it runs with the given filters"""
+    trades: List = []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        trades = db.get_trades(**filters)
+    get_trades_secs = (time.perf_counter() - start) / repeats
+
+    query, bindings = HistoryFilterQuery(**filters).prepare(TRADES_FILTER_TABLE)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        db.conn.cursor().execute('SELECT * FROM trades ' + query, bindings).fetchall()
+    sql_secs = (time.perf_counter() - start) / repeats
+
+    return sql_secs, get_trades_secs, len(trades)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark user DB history queries')
+    parser.add_argument('--trades', type=int, default=1000000, help='Number of trades')
+    parser.add_argument('--repeats', type=int, default=3, help='Repeats of each query')
+    args = parser.parse_args()
+
+    month = 30 * 24 * 3600
+    queries: Dict[str, Dict[str, Any]] = {
+        'one month of coinbase': {
+            'from_ts': Timestamp(END_TS - month),
+            'to_ts': Timestamp(END_TS),
+            'location': Location.COINBASE,
+        },
+        'one month of all locations': {
+            'from_ts': Timestamp(END_TS - month),
+            'to_ts': Timestamp(END_TS),
+        },
+        'one year of kraken': {
+            'from_ts': Timestamp(END_TS - 12 * month),
+            'to_ts': Timestamp(END_TS),
+            'location': Location.KRAKEN,
+        },
+        'all of coinbase': {'location': Location.COINBASE},
+    }
+    with TemporaryDirectory() as tmpdir:
+        GlobalDBHandler(data_dir=Path(tmpdir))
+        user_dir = Path(tmpdir) / 'user'
+        user_dir.mkdir()
+        db = DBHandler(
+            user_data_dir=user_dir,
+            password='123',
+            msg_aggregator=MessagesAggregator(),
+            initial_settings=None,
+        )
+        print(f'Populating the DB with {args.trades} trades')
+        populate_trades(db, args.trades)
+
+        results = {}
+        cursor = db.conn.cursor()
+        for name in TRADES_INDEXES:
+            cursor.execute(f'DROP INDEX {name};')
+        for name, filters in queries.items():
+            results[name] = [time_query(db, filters, args.repeats)]
+
+        cursor.execute('CREATE INDEX trades_time ON trades(time);')
+        cursor.execute('CREATE INDEX trades_location_time ON trades(location, time);')
+        for name, filters in queries.items():
+            results[name].append(time_query(db, filters, args.repeats))
+
+        print(
+            f'{"query":<28} {"trades":>8} {"SQL ms":>10} {"indexed":>8} '
+            f'{"get_trades ms":>14} {"indexed":>8}',
+        )
+        for name, ((sql, get_trades, trades_num), (indexed_sql, indexed_get_trades, _)) in results.items():  # noqa: E501
+            print(
+                f'{name:<28} {trades_num:>8} {sql * 1000:>10.1f} {indexed_sql * 1000:>8.1f} '
+                f'{get_trades * 1000:>14.1f} {indexed_get_trades * 1000:>8.1f}',
+            )
+
+        del db
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""Benchmark the trades per second written to the user DB
+
+Adds trades to the user DB in small batches, as they come in from paginated exchange
+queries, with and without a DBHandler unit of work wrapping all of the batches and
+with the DB in the default rollback journal mode or in WAL mode. Each batch is a
+separate add_trades() call which without a unit of work commits on its own.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from rotkehlchen.constants.assets import A_BTC, A_ETH  # noqa: E402
+from rotkehlchen.data_handler import DataHandler  # noqa: E402
+from rotkehlchen.exchanges.data_structures import Trade  # noqa: E402
+from rotkehlchen.fval import FVal  # noqa: E402
+from rotkehlchen.globaldb import GlobalDBHandler  # noqa: E402
+from rotkehlchen.typing import Location, Timestamp, TradeType  # noqa: E402
+from rotkehlchen.user_messages import MessagesAggregator  # noqa: E402
+
+
+def make_trades(number: int) -> List[Trade]:
+    return [Trade(
+        timestamp=Timestamp(1483228800 + idx),
+        location=Location.KRAKEN,
+        base_asset=A_ETH,
+        quote_asset=A_BTC,
+        trade_type=TradeType.BUY,
+        amount=FVal(idx + 1),
+        rate=FVal('0.03'),
+        fee=FVal('0.001'),
+        fee_currency=A_BTC,
+        link=str(idx),
+    ) for idx in range(number)]
+
+
+def measure(trades: List[Trade], batch_size: int, sqlite_wal: bool, unit_of_work: bool) -> float:
+    """Returns the trades written per second"""
+    with TemporaryDirectory() as tmpdir:
+        GlobalDBHandler(data_dir=Path(tmpdir))
+        data = DataHandler(Path(tmpdir), MessagesAggregator(), sqlite_wal=sqlite_wal)
+        data.unlock('bench', '123', create_new=True)
+        batches = [trades[i:i + batch_size] for i in range(0, len(trades), batch_size)]
+
+        start = time.perf_counter()
+        if unit_of_work:
+            with data.db.unit_of_work():
+                for batch in batches:
+                    data.db.add_trades(batch)
+        else:
+            for batch in batches:
+                data.db.add_trades(batch)
+        elapsed = time.perf_counter() - start
+
+        assert len(data.db.get_trades()) == len(trades)
+        data.logout()
+
+    return len(trades) / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark user DB trade writes')
+    parser.add_argument(
+        '--trades',
+        type=int,
+        default=5000,
+        help='Number of trades to write',
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=10,
+        help='Number of trades written by each add_trades() call',
+    )
+    args = parser.parse_args()
+
+    trades = make_trades(args.trades)
+    print(f'Writing {args.trades} trades in batches of {args.batch_size}')
+    print(f'{"journal":>8} {"unit of work":>13} {"trades/sec":>11}')
+    for sqlite_wal in (False, True):
+        for unit_of_work in (False, True):
+            rate = measure(
+                trades=trades,
+                batch_size=args.batch_size,
+                sqlite_wal=sqlite_wal,
+                unit_of_work=unit_of_work,
+            )
+            journal = 'WAL' if sqlite_wal else 'DELETE'
+            print(f'{journal:>8} {"yes" if unit_of_work else "no":>13} {rate:>11.0f}')
+
+
+if __name__ == '__main__':
+    main()
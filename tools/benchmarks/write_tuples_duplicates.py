@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""Benchmark the throughput of writing trades to the user DB with DBHandler.write_tuples
+
+Writes a batch of fresh trades and then the same batch again, so that all of its
+trades are duplicates. Both are timed for write_tuples and for the previous way of
+handling duplicates, where a batch hitting a constraint was written again one tuple
+at a time, rejecting each duplicate by its IntegrityError.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, List, Tuple
+
+from pysqlcipher3 import dbapi2 as sqlcipher
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from rotkehlchen.data_handler import DataHandler  # noqa: E402
+from rotkehlchen.db.dbhandler import DBHandler  # noqa: E402
+from rotkehlchen.globaldb import GlobalDBHandler  # noqa: E402
+from rotkehlchen.user_messages import MessagesAggregator  # noqa: E402
+
+QUERY = 'INSERT INTO trades VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO NOTHING'  # noqa: E501
+PREVIOUS_QUERY = 'INSERT INTO trades VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+
+
+def make_trade_tuples(number: int) -> List[Tuple[Any, ...]]:
+    return [(
+        f'{idx:064x}',
+        1483228800 + idx,
+        'B',
+        'ETH',
+        'BTC',
+        'A',
+        str(idx + 1),
+        '0.03',
+        '0.001',
+        'BTC',
+        f'link{idx}',
+        '',
+    ) for idx in range(number)]
+
+
+def write_previous(db: DBHandler, tuples: List[Tuple[Any, ...]]) -> None:
+    """How write_tuples handled duplicates before skipping them with ON CONFLICT"""
+    cursor = db.conn.cursor()
+    try:
+        cursor.executemany(PREVIOUS_QUERY, tuples)
+    except sqlcipher.IntegrityError:  # pylint: disable=no-member
+        for entry in tuples:
+            try:
+                cursor.execute(PREVIOUS_QUERY, entry)
+            except sqlcipher.IntegrityError:  # pylint: disable=no-member
+                logging.warning(f'Did not add "trade with id {entry[0]}" to the DB.')
+    db.conn.commit()
+    db.update_last_write()
+
+
+def write_current(db: DBHandler, tuples: List[Tuple[Any, ...]]) -> None:
+    db.write_tuples(tuple_type='trade', query=QUERY, tuples=tuples)
+
+
+def measure(tuples: List[Tuple[Any, ...]], previous: bool) -> Tuple[float, float]:
+    """Returns the tuples written per second for a fresh and a duplicate batch"""
+    write = write_previous if previous else write_current
+    with TemporaryDirectory() as tmpdir:
+        GlobalDBHandler(data_dir=Path(tmpdir))
+        data = DataHandler(Path(tmpdir), MessagesAggregator())
+        data.unlock('bench', '123', create_new=True)
+        rates = []
+        for _ in range(2):
+            start = time.perf_counter()
+            write(data.db, tuples)
+            rates.append(len(tuples) / (time.perf_counter() - start))
+            count = data.db.conn.execute('SELECT COUNT(*) FROM trades').fetchone()[0]
+            assert count == len(tuples)
+        data.logout()
+
+    return rates[0], rates[1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark write_tuples duplicate handling')
+    parser.add_argument(
+        '--tuples',
+        type=int,
+        default=100000,
+        help='Number of trades in the batch',
+    )
+    args = parser.parse_args()
+    # The log entries of the duplicates are part of the cost but should not flood stdout
+    logging.basicConfig(filename=os.devnull)
+
+    tuples = make_trade_tuples(args.tuples)
+    print(f'Writing a batch of {args.tuples} trades')
+    print(f'{"method":>10} {"fresh/sec":>11} {"duplicate/sec":>14}')
+    for previous in (True, False):
+        fresh, duplicate = measure(tuples, previous)
+        method = 'previous' if previous else 'current'
+        print(f'{method:>10} {fresh:>11.0f} {duplicate:>14.0f}')
+
+
+if __name__ == '__main__':
+    main()